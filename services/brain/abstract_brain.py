@@ -1,14 +1,327 @@
+import os
+import threading
+import time
 from abc import ABC
+from typing import Any, Iterable, NamedTuple, Optional
 
-from services.shared_libs.RabbitMQ import RabbitMQConsumer, RabbitMQProducer, RMQ_HOST, RMQ_PORT
+import pika
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.channel import Channel
+from pika.exceptions import AMQPChannelError, AMQPConnectionError
+from pika.spec import Basic, BasicProperties
+
+from services.brain.response_cache import ResponseCache, cache_key, record
+from services.shared_libs.RabbitMQ import RabbitMQConsumer, RabbitMQProducer
+from services.shared_libs.RabbitMQ.RabbitMQConsumer import _SettlementWatchingChannel
+from services.shared_libs.RabbitMQ.const import RMQ_PREFETCH_COUNT
+from services.shared_libs.RabbitMQ.publishing import with_priority
+from services.shared_libs.RabbitMQ.streaming import renewed
+
+# Response cache, see response_cache.py. Unset size disables it; the context lists message headers, comma-separated.
+BRAIN_CACHE_SIZE = int(os.getenv('BRAIN_CACHE_SIZE', 0))
+BRAIN_CACHE_TTL = float(os.getenv('BRAIN_CACHE_TTL', 300))
+BRAIN_CACHE_CONTEXT = [key for key in os.getenv('BRAIN_CACHE_CONTEXT', '').split(',') if key]
+# Batch consuming, see AbstractBrain. Unset size disables it.
+BRAIN_INPUT_BATCH_SIZE = int(os.getenv('BRAIN_INPUT_BATCH_SIZE', 0))
+BRAIN_INPUT_BATCH_TIMEOUT_MS = float(os.getenv('BRAIN_INPUT_BATCH_TIMEOUT_MS', 50))
+BRAIN_RESULTS_ROUTING_KEY = os.getenv('BRAIN_RESULTS_ROUTING_KEY', 'brain_to_mouth')
+
+
+class BatchMessage(NamedTuple):
+    """A delivery handed to :meth:`AbstractBrain._batch_callback`."""
+    method: Basic.Deliver
+    properties: BasicProperties
+    body: Any  # Decoded according to its content type, like for `_callback`.
 
 
 class AbstractBrain(RabbitMQConsumer, RabbitMQProducer, ABC):
-    def __init__(self,
-                 queue_name: str,
-                 host: str = RMQ_HOST,
-                 port: int = RMQ_PORT,
-                 connection_attempts: int = 5,
-                 retry_delay: float = 5):
-        RabbitMQConsumer.__init__(self, queue_name, host, port, connection_attempts, retry_delay)
-        RabbitMQProducer.__init__(self, host, port, connection_attempts, retry_delay)
+    """
+    Consumes from one queue and publishes its results.
+
+    Consuming and publishing share one connection but use separate channels. Keyword arguments beyond the connection
+    settings configure the consumer (e.g. `workers`, `prefetch_count`) and the producer (e.g. `publisher_confirms`).
+
+    With `cache_size` set, the messages the callback publishes for an input are cached (see
+    :mod:`~services.brain.response_cache`). A later message with the same normalized payload is answered from the
+    cache: the cached messages are published again and the message is acked without running the callback. Responses
+    of callbacks that raised, nacked or rejected their message are not cached.
+
+    With `input_batch_size` set, deliveries are collected until that many arrived or the first of them waited
+    `input_batch_timeout_ms`, and handed to :meth:`_batch_callback` together, e.g. to run a model on all of them at
+    once. It returns one result per message: the results are published with one :meth:`publish_many` call to
+    `results_routing_key` and the messages acked with one ack. A result of None publishes nothing; an exception
+    settles its message like a callback that raised (see :class:`RabbitMQConsumer`), without affecting the others.
+    Batches run on the connection's thread, so they cannot be combined with workers or the response cache.
+    """
+
+    def __init__(self, *args, cache_size: int = BRAIN_CACHE_SIZE, cache_ttl: float = BRAIN_CACHE_TTL,
+                 cache_context: Iterable[str] = BRAIN_CACHE_CONTEXT, input_batch_size: int = BRAIN_INPUT_BATCH_SIZE,
+                 input_batch_timeout_ms: float = BRAIN_INPUT_BATCH_TIMEOUT_MS,
+                 results_routing_key: str = BRAIN_RESULTS_ROUTING_KEY, **kwargs):
+        """
+        :param args: The queue and connection settings, see :class:`RabbitMQConsumer`.
+        :param cache_size: The maximum number of cached responses. 0 disables the cache.
+        :param cache_ttl: The seconds a response stays cached.
+        :param cache_context: Message headers whose values are part of the cache key besides the payload, e.g. a
+                              conversation ID.
+        :param input_batch_size: The maximum number of deliveries handed to :meth:`_batch_callback` at once. 0 passes
+                                 every delivery to :meth:`_callback` instead. Unless `prefetch_count` is given, it
+                                 defaults to twice this, so that the broker delivers enough messages to fill a batch.
+        :param input_batch_timeout_ms: The maximum time in milliseconds a delivery waits for its batch to fill up.
+        :param results_routing_key: The routing key the results of :meth:`_batch_callback` are published with.
+        :param kwargs: The consumer and producer settings.
+        """
+        if not isinstance(cache_size, int) or isinstance(cache_size, bool):
+            raise TypeError("cache_size must be a non-negative integer.")
+        elif cache_size < 0:
+            raise ValueError("cache_size must be a non-negative integer.")
+
+        if not isinstance(input_batch_size, int) or isinstance(input_batch_size, bool):
+            raise TypeError("input_batch_size must be a non-negative integer.")
+        elif input_batch_size < 0:
+            raise ValueError("input_batch_size must be a non-negative integer.")
+
+        if not isinstance(input_batch_timeout_ms, int | float) or isinstance(input_batch_timeout_ms, bool):
+            raise TypeError("input_batch_timeout_ms must be a positive number.")
+        elif input_batch_timeout_ms <= 0:
+            raise ValueError("input_batch_timeout_ms must be a positive number.")
+
+        if not isinstance(results_routing_key, str):
+            raise TypeError("results_routing_key must be a string.")
+
+        if input_batch_size:
+            if cache_size:
+                raise ValueError("The response cache cannot be used with input batches.")
+            if kwargs.get('workers'):
+                raise ValueError("Input batches run on the connection's thread and cannot be used with workers.")
+            if kwargs.get('prefetch_count', RMQ_PREFETCH_COUNT) is None:
+                kwargs['prefetch_count'] = 2 * input_batch_size
+
+        self._response_cache = ResponseCache(cache_size, cache_ttl) if cache_size else None
+        self._cache_context = tuple(cache_context)
+        self._recording = threading.local()  # The responses of the callback running on this thread.
+        self._input_batch_size = input_batch_size
+        self._input_batch_timeout = input_batch_timeout_ms / 1000
+        self._results_routing_key = results_routing_key
+        self._input_batch: list[tuple[Channel, BatchMessage, bytes]] = []  # (channel, message, body as received)
+        self._input_batch_timer = None
+        self._input_batch_handler: callable = self._batch_callback
+        self._input_batch_auto_ack = False
+        super().__init__(*args, **kwargs)
+        if self._response_cache is not None and self._workers and self._worker_mode == 'process':
+            raise ValueError("The response cache cannot be used with 'process' workers.")
+        if input_batch_size and self._prefetch_count and self._prefetch_count < input_batch_size:
+            self.logger.warning("prefetch_count %s is lower than input_batch_size %s; batches will not fill up.",
+                                self._prefetch_count, input_batch_size)
+
+    def consume(self, auto_ack: bool = False, callback: Optional[callable] = None,
+                restart_if_running: bool = True) -> None:
+        """
+        Starts consuming, see :meth:`RabbitMQConsumer.consume`. With `input_batch_size` set, `callback` replaces
+        :meth:`_batch_callback`.
+        """
+        if self._input_batch_size:
+            if callback is not None and not callable(callback):
+                raise TypeError("callback must be a callable object or None.")
+            if self._metrics is not None:
+                self._m_input_batch_size = self._metrics.histogram(
+                    'brain_input_batch_size', "Deliveries handed to the batch callback at once.", ('client',),
+                    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)).labels(self.__class__.__name__)
+            self._input_batch_handler = callback or self._batch_callback
+            self._input_batch_auto_ack = auto_ack
+            callback = self._collecting_batch
+        elif self._response_cache is not None:
+            if self._metrics is not None:
+                lookups = self._metrics.counter('brain_response_cache_lookups_total',
+                                                "Response cache lookups of the Brain, by outcome.",
+                                                ('client', 'outcome'))
+                self._m_cache_hits = lookups.labels(self.__class__.__name__, 'hit')
+                self._m_cache_misses = lookups.labels(self.__class__.__name__, 'miss')
+            callback = self._caching(callback or self._callback, auto_ack)
+        super().consume(auto_ack, callback, restart_if_running)
+
+    def publish(self, message: Any, routing_key: str, exchange: str = '', durable: bool = True,
+                properties: pika.BasicProperties = None, priority: int | None = None):
+        properties = with_priority(properties, priority)  # Recorded with the properties, for the cache replay.
+        responses = getattr(self._recording, 'responses', None)
+        if responses is not None:
+            responses.append(record('publish', (message, routing_key, exchange, durable, properties)))
+        return super().publish(message, routing_key, exchange, durable, properties)
+
+    def publish_many(self, messages: Iterable[Any], routing_key: str, exchange: str = '', durable: bool = True,
+                     properties: pika.BasicProperties = None, priority: int | None = None):
+        properties = with_priority(properties, priority)
+        responses = getattr(self._recording, 'responses', None)
+        if responses is not None:
+            messages = list(messages)
+            responses.append(record('publish_many', (messages, routing_key, exchange, durable, properties)))
+        return super().publish_many(messages, routing_key, exchange, durable, properties)
+
+    def _caching(self, callback: callable, auto_ack: bool) -> callable:
+        """Wraps the callback to answer repeated inputs from the response cache and to cache new responses."""
+
+        def on_message(ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: Any) -> Any:
+            key = cache_key(body, properties, self._cache_context)
+            responses = self._response_cache.get(key)
+            if responses is not None:
+                self.logger.debug("Answering message %s from the response cache.", method.delivery_tag)
+                if self._metrics is not None:
+                    self._m_cache_hits.inc()
+                stream_ids = {}  # A replayed stream needs an ID of its own; consumers drop chunks of ended streams.
+                for name, (message, routing_key, exchange, durable, properties) in responses:
+                    getattr(self, name)(message, routing_key, exchange, durable, renewed(properties, stream_ids))
+                if not auto_ack:
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                return None
+
+            if self._metrics is not None:
+                self._m_cache_misses.inc()
+            ch = _SettlementWatchingChannel(ch)
+            self._recording.responses = []
+            try:
+                result = callback(ch, method, properties, body)
+            finally:
+                responses, self._recording.responses = self._recording.responses, None
+            if not ch.requeued and not ch.rejected:
+                self._response_cache.put(key, responses)
+            return result
+
+        return on_message
+
+    def stop_consuming(self) -> None:
+        if self._input_batch and self._ready():
+            self._flush_input_batch()  # The deliveries are ours already; handle them rather than have them redelivered.
+        super().stop_consuming()
+
+    def disconnect(self):
+        self._drop_input_batch()
+        super().disconnect()
+
+    def _on_reconnected(self) -> None:
+        self._drop_input_batch()  # The broker redelivers them on the new channel.
+        super()._on_reconnected()
+
+    def _decoding(self, callback: callable, auto_ack: bool) -> callable:
+        if self._input_batch_size:
+            return callback  # _collecting_batch decodes, keeping the bodies as received to retry failed messages with.
+        return super()._decoding(callback, auto_ack)
+
+    def _timed(self, callback: callable) -> callable:
+        if not self._input_batch_size:
+            return super()._timed(callback)
+
+        def on_message(ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+            if self._metrics is not None:
+                self._count_delivery(method)  # Latencies and settlements are recorded per batch.
+            callback(ch, method, properties, body)
+
+        return on_message
+
+    def _collecting_batch(self, ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+        """The delivery callback in batch mode: adds a delivery to the batch and flushes it once it is full."""
+        try:
+            decoded = self._codecs.decode(body, properties)
+        except Exception as e:
+            self.logger.error("Cannot decode message %s with content type '%s': %s",
+                              method.delivery_tag, properties.content_type, e)
+            if not self._input_batch_auto_ack:
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+
+        self._input_batch.append((self._channel, BatchMessage(method, properties, decoded), body))
+        if len(self._input_batch) >= self._input_batch_size:
+            self._flush_input_batch()
+        elif len(self._input_batch) == 1:
+            self._input_batch_timer = self._connection.call_later(self._input_batch_timeout,
+                                                                  self._on_input_batch_timeout)
+
+    def _on_input_batch_timeout(self) -> None:
+        self._input_batch_timer = None
+        if self._input_batch:
+            self.logger.debug("Input batch timeout reached with %s message(s).", len(self._input_batch))
+            self._flush_input_batch()
+
+    def _flush_input_batch(self) -> None:
+        """Hands the collected deliveries to the batch callback, publishes its results and settles the messages."""
+        self._cancel_input_batch_timer()
+        batch, self._input_batch = self._input_batch, []
+        messages = [message for _, message, _ in batch]
+        started = time.perf_counter()
+        try:
+            results = list(self._input_batch_handler(messages))
+            if len(results) != len(messages):
+                raise ValueError(f"The batch callback returned {len(results)} results for {len(messages)} messages.")
+        except (AMQPChannelError, AMQPConnectionError):
+            raise  # The broker's failure, not the messages'; consume() handles it.
+        except Exception as e:
+            self.logger.error("Error in batch callback: %s", e)
+            results = [e] * len(messages)
+        duration = time.perf_counter() - started
+        for _ in messages:
+            self._record_latency(duration / len(messages))
+        if self._metrics is not None:
+            self._m_input_batch_size.observe(len(messages))
+
+        replies = [result for result in results if result is not None and not isinstance(result, Exception)]
+        if replies:
+            try:
+                self.publish_many(replies, self._results_routing_key)
+            except (AMQPChannelError, AMQPConnectionError):
+                raise
+            except Exception as e:
+                self.logger.error("Cannot publish the results of a batch: %s", e)
+                results = [e] * len(messages)
+        self._settle_input_batch(batch, results)
+
+    def _settle_input_batch(self, batch: list[tuple[Channel, BatchMessage, bytes]], results: list) -> None:
+        """Acks the messages of a batch with one ack where possible and settles the failed ones one by one."""
+        acked = None  # Consecutive acks are coalesced into one `multiple` ack.
+        for (channel, message, body), result in zip(batch, results):
+            error = result if isinstance(result, Exception) else None
+            if error is not None and self._dedup is not None:
+                self._dedup.discard(message.properties.message_id)  # Failed, so a retry must not count as a repeat.
+            if self._input_batch_auto_ack:
+                continue
+            if channel is not self._channel:
+                self.logger.debug("Not settling delivery %s from a previous channel.", message.method.delivery_tag)
+                continue
+            name, kwargs = ('basic_ack', {}) if error is None else \
+                self._on_callback_error(self._channel, message.method, message.properties, body, error)
+            if self._metrics is not None:
+                self._m_settled[name].inc()
+            if name == 'basic_ack':
+                acked = message.method.delivery_tag
+                continue
+            if acked is not None:
+                self._channel.basic_ack(delivery_tag=acked, multiple=True)
+                acked = None
+            getattr(self._channel, name)(delivery_tag=message.method.delivery_tag, **kwargs)
+        if acked is not None:
+            self._channel.basic_ack(delivery_tag=acked, multiple=True)
+
+    def _cancel_input_batch_timer(self) -> None:
+        if self._input_batch_timer is not None and self._connection is not None and self._connection.is_open:
+            self._connection.remove_timeout(self._input_batch_timer)
+        self._input_batch_timer = None
+
+    def _drop_input_batch(self) -> None:
+        """Forgets the collected deliveries of a lost channel; the broker delivers them again."""
+        self._cancel_input_batch_timer()
+        if self._dedup is not None:
+            for _, message, _ in self._input_batch:
+                self._dedup.discard(message.properties.message_id)
+        self._input_batch = []
+
+    def _batch_callback(self, messages: list[BatchMessage]) -> list[Any]:
+        """
+        Subclasses that consume in batches (`input_batch_size`) override this method to handle several messages at
+        once. It runs on the connection's thread, so it may publish.
+
+        :param messages: The deliveries of the batch, in delivery order.
+        :return: One result per message, in the same order: a message to publish to `results_routing_key`, None to
+                 publish nothing, or an exception to settle the message as failed.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not implement _batch_callback.")
+
+    def _open_publish_channel(self) -> BlockingChannel:
+        return self._connection.channel()
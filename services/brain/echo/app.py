@@ -1,39 +1,45 @@
+import os
 import sys
 
 from pika import BasicProperties
 from pika.channel import Channel
 from pika.spec import Basic
 
-from services.brain.abstract_brain import AbstractBrain
+from services.brain.abstract_brain import AbstractBrain, BatchMessage
 from services.shared_libs.RabbitMQ import RMQ_HOST, RMQ_PORT
 
 
 class EchoBrain(AbstractBrain):
     def _setup(self):
-        self._channel.queue_declare(queue=self._queue)
+        for queue in self.queues:
+            if queue not in self._topology:  # Declared with its arguments by the topology otherwise.
+                self._channel.queue_declare(queue=queue)
 
-    def _callback(self, ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
-        received_text = body.decode()
-        print(f" [x] Brain received '{received_text}'")
-
-        processed_text = f"Brain echoed: {received_text}"  # Simple echo logic
-        self.publish(processed_text.encode(), 'brain_to_mouth', properties=properties)
+    def _callback(self, ch: Channel, method: Basic.Deliver, properties: BasicProperties, body) -> None:
+        processed_text = self._echo(body)
+        self.publish(processed_text, 'brain_to_mouth')
         print(f" [x] Brain sent '{processed_text}' to Mouth")
 
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
-    def _handle_unacknowledged_messages(self, un_acknowledged) -> None:
-        pass
-
-    def _on_connection_blocked(self, blocked):
-        self.logger.warning(f"Connection blocked: {blocked.reason}")
+    def _batch_callback(self, messages: list[BatchMessage]) -> list[str]:
+        processed = [self._echo(message.body) for message in messages]
+        print(f" [x] Brain sends {len(processed)} echoes to Mouth")
+        return processed
+
+    @staticmethod
+    def _echo(body) -> str:
+        if isinstance(body, dict):  # JSON event, e.g. a chat message with its author
+            received_text = f"Message from {body['author']}: {body['content']}"
+        else:
+            received_text = body if isinstance(body, str) else bytes(body).decode()
+        print(f" [x] Brain received '{received_text}'")
 
-    def _on_connection_unblocked(self, unblocked):
-        self.logger.info(f"Connection unblocked.")
+        return f"Brain echoed: {received_text}"  # Simple echo logic
 
 
 def main():
-    consumer = EchoBrain('ear_to_brain', RMQ_HOST, RMQ_PORT)
+    consumer = EchoBrain(os.getenv('BRAIN_QUEUES', 'ear_to_brain').split(','), RMQ_HOST, RMQ_PORT)
     success = consumer.connect()
     if success:
         print(' [*] Brain waiting for messages. To exit press CTRL+C')
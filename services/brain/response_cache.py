@@ -0,0 +1,100 @@
+"""
+A cache of Brain responses by normalized input, see :class:`ResponseCache` and
+:class:`~services.brain.abstract_brain.AbstractBrain`.
+
+A response is everything the Brain published while handling a message. A later message with the same normalized
+payload (and the same values of the configured context headers) gets the same messages published again without the
+Brain logic running.
+"""
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from pika import BasicProperties
+
+# A recorded publish: the name of the producer method and its arguments.
+Response = tuple[str, tuple]
+
+
+class ResponseCache:
+    """
+    Responses by cache key, bounded in number (the least recently used are evicted first) and in age.
+
+    Thread-safe, since callbacks may run on a thread pool.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        """
+        :param max_size: The maximum number of cached responses.
+        :param ttl: The seconds a response stays cached.
+        """
+        if not isinstance(max_size, int) or isinstance(max_size, bool):
+            raise TypeError("cache_size must be a positive integer.")
+        elif max_size <= 0:
+            raise ValueError("cache_size must be a positive integer.")
+
+        if not isinstance(ttl, int | float) or isinstance(ttl, bool):
+            raise TypeError("cache_ttl must be a positive number.")
+        elif ttl <= 0:
+            raise ValueError("cache_ttl must be a positive number.")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, list[Response]]] = OrderedDict()  # key -> (expiry, responses)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: str) -> list[Response] | None:
+        """Returns the cached responses for `key`, or None if there are none or they expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, responses: list[Response]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, responses)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+def cache_key(body: Any, properties: BasicProperties, context_keys: Iterable[str] = ()) -> str:
+    """
+    Returns the cache key of a decoded message: a hash of its normalized payload and the values of the message
+    headers named in `context_keys` (e.g. a conversation ID). Normalizing collapses runs of whitespace in strings and
+    ignores the order of mapping keys.
+    """
+    headers = properties.headers or {}
+    normalized = [_normalize(body), [headers.get(key) for key in context_keys]]
+    encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'), default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def record(name: str, args: tuple) -> Response:
+    """Returns a publish as a response, copied so that later changes of its arguments do not alter the cache."""
+    return name, copy.deepcopy(args)
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, bytes | bytearray):
+        return {'bytes': bytes(value).hex()}
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, list | tuple):
+        return [_normalize(item) for item in value]
+    return value
@@ -1,7 +1,12 @@
 from abc import ABC
 
-from services.shared_libs.RabbitMQ import RabbitMQProducer
+from services.shared_libs.RabbitMQ import AsyncRabbitMQProducer, RabbitMQProducer
 
 
 class AbstractEar(RabbitMQProducer, ABC):
     pass
+
+
+class AbstractAsyncEar(AsyncRabbitMQProducer, ABC):
+    """Ear that runs on an asyncio event loop (e.g. a chat bot) and publishes without blocking it."""
+    pass
@@ -3,19 +3,26 @@ Discord Chat Ear
 ================
 
 The Discord Chat Ear is a RMQ Publisher that listens to Discord messages and forwards them to Brain via ``ear_to_brain``.
+With ``RMQ_SHARDS`` set, every channel's messages go to the same shard of ``ear_to_brain``, so one Brain replica sees
+the whole conversation; otherwise, with ``RMQ_LANE_WEIGHTS`` set, they go to the interactive lane of ``ear_to_brain``
+and overtake bulk traffic such as heartbeats.
 """
 
+import asyncio
 import os
 
-from discord import Message, Interaction, CustomActivity
+from discord import Message, Interaction, CustomActivity, utils
 
-from services.ear.abstract_ear import AbstractEar
+from services.ear.abstract_ear import AbstractAsyncEar
 from services.ear.discordpy_chat.bot import Bot
+from services.shared_libs.RabbitMQ import lanes
+from services.shared_libs.RabbitMQ.const import RMQ_LANE_WEIGHTS, RMQ_SHARDS
+from services.shared_libs.RabbitMQ.sharding import routing_key
 
 
-class DiscordEar(AbstractEar):
+class DiscordEar(AbstractAsyncEar):
     def __init__(self):
-        AbstractEar.__init__(self)
+        AbstractAsyncEar.__init__(self)
 
         self._bot = Bot(self._on_message)
         self._setup_commands()
@@ -23,14 +30,33 @@ class DiscordEar(AbstractEar):
         self._listening = False
 
     def run(self):
-        """Start the services discord bot."""
-        self._bot.run(os.getenv('DISCORD_TOKEN'))
-
-    def _on_message(self, message: Message):
-        """Forward Discord messages to Brain."""
+        """Connect to RabbitMQ and start the services discord bot on the same event loop."""
+        # Client.run() used to configure discord.py's logging; Client.start() does not.
+        utils.setup_logging(root=False)
+        asyncio.run(self._run())
+
+    async def _run(self):
+        connected = await self.connect()
+        if not connected:
+            return
+        try:
+            async with self._bot:
+                await self._bot.start(os.getenv('DISCORD_TOKEN'))
+        finally:
+            await self.disconnect()
+
+    async def _on_message(self, message: Message):
+        """
+        Forward Discord messages to Brain with interactive priority, to the shard of their channel if ``ear_to_brain``
+        is sharded or else to its interactive lane if it has priority lanes.
+        """
         if self._listening:
-            msg = f"Message from {message.author.name}: {message.content}"
-            self.publish(msg.encode(), 'ear_to_brain')
+            if RMQ_SHARDS:
+                queue = routing_key('ear_to_brain', message.channel.id, RMQ_SHARDS)
+            else:
+                queue = lanes.routing_key('ear_to_brain', lanes.INTERACTIVE, len(RMQ_LANE_WEIGHTS))
+            await self.publish({'author': message.author.name, 'content': message.content}, queue,
+                               priority=lanes.INTERACTIVE)
 
     def _setup_commands(self):
         """Setup commands for the bot."""
@@ -55,19 +81,11 @@ class DiscordEar(AbstractEar):
     def _setup(self) -> None:
         pass
 
-    def _on_connection_blocked(self, blocked):
-        pass
-
-    def _on_connection_unblocked(self, unblocked):
-        pass
-
 
 def main():
     """Start the service."""
     ear = DiscordEar()
-    connected = ear.connect()
-    if connected:
-        ear.run()  # Blocking call.
+    ear.run()  # Blocking call.
 
 
 if __name__ == '__main__':
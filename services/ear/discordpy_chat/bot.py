@@ -5,7 +5,7 @@ Discord Chat Bot
 Discord Chat Bot is a simple Discord bot that listens to messages and passes them to ``on_message``.
 """
 import os
-from typing import Callable
+from typing import Awaitable, Callable
 
 from discord import Client, app_commands, Object, Message, Intents
 
@@ -16,10 +16,10 @@ class Bot(Client):
     """
     Simple Discord bot.
 
-    :param on_message: Callback function to handle messages.
+    :param on_message: Coroutine function to handle messages.
     """
 
-    def __init__(self, on_message: Callable[[Message], None]):
+    def __init__(self, on_message: Callable[[Message], Awaitable[None]]):
         intents = Intents.default()
         intents.message_content = True
         super().__init__(intents=intents)
@@ -47,4 +47,4 @@ class Bot(Client):
             return
         elif message.author.bot:
             return
-        self._on_message(message)
+        await self._on_message(message)
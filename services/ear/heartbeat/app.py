@@ -1,7 +1,6 @@
-import time
-
 from services.ear.abstract_ear import AbstractEar
-from services.shared_libs.RabbitMQ import RMQ_HOST, RMQ_PORT
+from services.shared_libs.RabbitMQ import RMQ_HOST, RMQ_PORT, lanes
+from services.shared_libs.RabbitMQ.const import RMQ_LANE_WEIGHTS
 
 
 class HeartbeatEar(AbstractEar):
@@ -14,22 +13,17 @@ class HeartbeatEar(AbstractEar):
             while True:
                 i += 1
                 user_input = f"Message Nr.{i}"
-                message = user_input.encode()
-                self.publish(message, 'ear_to_brain')
+                # Background traffic: with priority lanes, chat messages overtake a backlog of heartbeats.
+                self.publish(user_input, lanes.routing_key('ear_to_brain', lanes.BACKGROUND, len(RMQ_LANE_WEIGHTS)),
+                             priority=lanes.BACKGROUND)
                 print(f" [x] Ear sent '{user_input}' to Brain")
-                time.sleep(1)
+                self._connection.sleep(1)  # Keeps processing I/O (confirms, heartbeats) while idle.
         except KeyboardInterrupt:
             pass
 
-    def _on_connection_blocked(self, blocked):
-        self.logger.warning(f"Connection blocked: {blocked.reason}")
-
-    def _on_connection_unblocked(self, unblocked):
-        self.logger.info(f"Connection unblocked.")
-
 
 def main():
-    producer = HeartbeatEar(RMQ_HOST, RMQ_PORT)
+    producer = HeartbeatEar(RMQ_HOST, RMQ_PORT, publisher_confirms=True)
     success = producer.connect()
     if success:
         producer.start_listening()
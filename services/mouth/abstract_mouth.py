@@ -1,7 +1,102 @@
+import functools
+import os
 from abc import ABC
+from typing import Any
+
+from pika.channel import Channel
+from pika.spec import Basic, BasicProperties
 
 from services.shared_libs.RabbitMQ import RabbitMQConsumer
+from services.shared_libs.RabbitMQ.streaming import Chunk, Reassembler, chunk_of
+
+# Seconds a streamed reply may wait for a missing chunk before the chunks after it are handed over anyway.
+MOUTH_STREAM_TIMEOUT = float(os.getenv('MOUTH_STREAM_TIMEOUT', 30))
 
 
 class AbstractMouth(RabbitMQConsumer, ABC):
-    pass
+    """
+    Consumes replies to output them.
+
+    Streamed replies (see :mod:`~services.shared_libs.RabbitMQ.streaming`) reach the callback chunk by chunk, in
+    order, as soon as each chunk and its predecessors arrived; :func:`~services.shared_libs.RabbitMQ.streaming.chunk_of`
+    tells the callback where a message belongs. Chunks that arrive early are held back unacknowledged, so a Mouth
+    consuming streams should have a prefetch count that leaves room for them. Repeated chunks are acked and dropped.
+    Chunks are reassembled on the connection's thread, so a Mouth cannot use workers.
+    """
+
+    def __init__(self, *args, stream_timeout: float = MOUTH_STREAM_TIMEOUT, **kwargs):
+        """
+        :param args: The queue and connection settings, see :class:`RabbitMQConsumer`.
+        :param stream_timeout: The seconds a streamed reply may wait for a missing chunk. The chunks held back after
+                               it are then handed over without it.
+        :param kwargs: The consumer settings.
+        """
+        self._reassembler = Reassembler(stream_timeout)
+        self._stream_timer = None
+        self._stream_auto_ack = False
+        super().__init__(*args, **kwargs)
+        if self._workers:
+            raise ValueError("A Mouth reassembles streams on the connection's thread and cannot use workers.")
+
+    def consume(self, auto_ack: bool = False, callback: callable = None, restart_if_running: bool = True) -> None:
+        self._stream_auto_ack = auto_ack
+        super().consume(auto_ack, callback, restart_if_running)
+
+    def stop_consuming(self) -> None:
+        if self._ready():
+            self._requeue_held_chunks()  # Let another consumer have them rather than wait for this channel to close.
+        super().stop_consuming()
+
+    def _on_reconnected(self) -> None:
+        # The held-back chunks belonged to the lost channel; the broker delivers them again.
+        self._reassembler.drop_held()
+        self._stream_timer = None
+        super()._on_reconnected()
+
+    def _handling_errors(self, callback: callable, auto_ack: bool) -> callable:
+        """Reassembles streams in front of the error handling, so that every chunk settles its own delivery."""
+        callback = super()._handling_errors(callback, auto_ack)
+
+        def on_message(ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+            chunk = chunk_of(properties)
+            if chunk is None:
+                callback(ch, method, properties, body)
+                return
+            released, dropped = self._reassembler.add(chunk, (ch, method, functools.partial(
+                callback, ch, method, properties, body)))
+            self._hand_over(released, dropped)
+            if self._reassembler.waiting() and self._stream_timer is None:
+                self._stream_timer = self._connection.call_later(self._reassembler.timeout, self._on_stream_timeout)
+
+        return on_message
+
+    def _on_stream_timeout(self) -> None:
+        self._stream_timer = None
+        released, dropped = self._reassembler.expire()
+        if released:
+            self.logger.warning("Gave up waiting for missing chunks; handing over %s chunk(s) without them.",
+                                len(released))
+        self._hand_over(released, dropped)
+        if self._reassembler.waiting():
+            self._stream_timer = self._connection.call_later(self._reassembler.timeout, self._on_stream_timeout)
+
+    def _hand_over(self, released: list[tuple[Chunk, Any]], dropped: list[tuple[Chunk, Any]]) -> None:
+        """Passes the chunks that are next in their streams to the callback and acks the dropped ones."""
+        for _, (_, _, deliver) in released:
+            deliver()
+        for chunk, (channel, method, _) in dropped:
+            self.logger.info("Dropping chunk %s of stream %s, a repeat or past the end of the stream.", chunk.seq,
+                             chunk.stream_id)
+            if not self._stream_auto_ack:
+                channel.basic_ack(delivery_tag=method.delivery_tag)
+
+    def _requeue_held_chunks(self) -> None:
+        held = self._reassembler.drop_held()
+        if self._stream_timer is not None:
+            self._connection.remove_timeout(self._stream_timer)
+            self._stream_timer = None
+        if not held or self._stream_auto_ack:
+            return
+        for _, (channel, method, _) in held:
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+        self.logger.info("Requeued %s held-back chunk(s).", len(held))
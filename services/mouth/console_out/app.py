@@ -1,3 +1,4 @@
+import os
 import sys
 
 from pika import BasicProperties
@@ -6,23 +7,29 @@ from pika.spec import Basic
 
 from services.mouth.abstract_mouth import AbstractMouth
 from services.shared_libs.RabbitMQ import RMQ_HOST, RMQ_PORT
+from services.shared_libs.RabbitMQ.streaming import chunk_of
 
 
 class ConsoleOutMouth(AbstractMouth):
     def _setup(self):
-        self._channel.queue_declare(queue=self._queue)
-
-    def _callback(self, ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
-        received_text = body.decode()
-        print(f" [x] Mouth received '{received_text}'")
+        for queue in self.queues:
+            if queue not in self._topology:  # Declared with its arguments by the topology otherwise.
+                self._channel.queue_declare(queue=queue)
+
+    def _callback(self, ch: Channel, method: Basic.Deliver, properties: BasicProperties, body) -> None:
+        received_text = body if isinstance(body, str) else bytes(body).decode()
+        chunk = chunk_of(properties)
+        if chunk is None or (chunk.seq == 0 and chunk.end):
+            print(f" [x] Mouth received '{received_text}'")
+        else:  # Print streamed replies chunk by chunk as they arrive
+            prefix = " [x] Mouth received '" if chunk.seq == 0 else ''
+            suffix = "'\n" if chunk.end else ''
+            print(prefix + received_text + suffix, end='', flush=True)
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
-    def _handle_unacknowledged_messages(self, un_acknowledged) -> None:
-        pass
-
 
 def main():
-    consumer = ConsoleOutMouth("brain_to_mouth", RMQ_HOST, RMQ_PORT)
+    consumer = ConsoleOutMouth(os.getenv('MOUTH_QUEUES', 'brain_to_mouth').split(','), RMQ_HOST, RMQ_PORT)
     success = consumer.connect()
     if success:
         print(' [*] Mouth waiting for messages. To exit press CTRL+C')
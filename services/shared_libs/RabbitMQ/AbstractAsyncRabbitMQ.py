@@ -0,0 +1,151 @@
+import asyncio
+import inspect
+import time
+from abc import ABC
+from typing import Any, Callable
+
+from pika.adapters.asyncio_connection import AsyncioConnection
+from pika.channel import Channel
+from pika.exceptions import AMQPConnectionError, ChannelClosed
+
+from services.shared_libs.RabbitMQ.AbstractRabbitMQ import AbstractRabbitMQ
+
+
+class AbstractAsyncRabbitMQ(AbstractRabbitMQ, ABC):
+    """
+    Abstract base class for asyncio-native RabbitMQ clients built on pika's :class:`AsyncioConnection`.
+
+    The broker I/O runs on the caller's event loop, so :meth:`connect` and :meth:`disconnect` are coroutines.
+    Subclasses implement `_setup` just like their blocking counterparts; it may be a plain method or a coroutine.
+    Channel RPCs (e.g. ``queue_declare``) can be awaited with :meth:`_call`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._pending_calls: set[asyncio.Future] = set()
+        self._closed: asyncio.Future | None = None
+        super().__init__(*args, **kwargs)
+
+    async def connect(self) -> bool:
+        """
+        Connects to the RabbitMQ server on the running event loop and returns success.
+
+        :return: True if connection was successful, False otherwise.
+        """
+        loop = asyncio.get_running_loop()
+        self.logger.info("Attempting to connect to RabbitMQ at %s:%s...",
+                         self._message_broker_host, self._message_broker_port)
+
+        opened = loop.create_future()
+        self._closed = loop.create_future()
+        try:
+            self._connection = AsyncioConnection(
+                self._connection_parameters,
+                on_open_callback=lambda connection: _resolve(opened, connection),
+                on_open_error_callback=lambda connection, error: _reject(opened, error),
+                on_close_callback=self._on_connection_closed,
+                custom_ioloop=loop,
+            )
+            await opened
+
+            channel_opened = loop.create_future()
+            self._connection.channel(on_open_callback=lambda channel: _resolve(channel_opened, channel))
+            self._channel = await channel_opened
+            self._channel.add_on_close_callback(self._on_channel_closed)
+
+            for method, kwargs in self._topology.declarations():
+                await self._call(getattr(self._channel, method), **kwargs)
+            result = self._setup()
+            if inspect.isawaitable(result):
+                await result
+            self.logger.info("Connected to RabbitMQ successfully")
+            return True
+        except AMQPConnectionError as e:
+            self.logger.error("Failed to connect to RabbitMQ after attempts.")
+            return False
+        except Exception as e:
+            self.logger.error("Failed to connect to RabbitMQ: %s", e)
+            raise e
+
+    async def disconnect(self):
+        """Closes the RabbitMQ connection and waits until it is closed."""
+        self.logger.info("Closing RabbitMQ connection.")
+        if self._connection and self._connection.is_open:
+            self._connection.close()
+            if self._closed is not None:
+                await self._closed
+            self.logger.debug("Connection closed.")
+        else:
+            self.logger.debug("Connection already closed.")
+
+    async def reconnect(self, max_attempts: int | None = None) -> bool:
+        """
+        Re-establishes a lost connection with the same jittered exponential backoff as the blocking clients.
+
+        :param max_attempts: The maximum number of attempts. None retries until connected.
+        :return: True once reconnected, False if all attempts failed.
+        """
+        attempts = 0
+        while max_attempts is None or attempts < max_attempts:
+            await asyncio.sleep(max(0.0, self._next_reconnect - time.monotonic()))
+            attempts += 1
+            self.logger.info("Reconnecting to RabbitMQ (attempt %s)...", self._reconnect_failures + 1)
+            try:
+                connected = await self.connect()
+            except Exception as e:
+                self.logger.error("Reconnect failed: %s", e)
+                connected = False
+
+            if self._metrics is not None:
+                self._m_reconnects.labels(self.__class__.__name__, 'success' if connected else 'failure').inc()
+            if connected:
+                self._reconnect_failures = 0
+                self._next_reconnect = 0.0
+                self._on_reconnected()
+                return True
+            self._schedule_reconnect()
+        return False
+
+    async def _call(self, method: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Invokes an asynchronous channel method and waits for the broker's reply.
+
+        Example:
+            await self._call(self._channel.queue_declare, queue='my_queue', durable=True)
+
+        :param method: A pika channel method accepting a `callback` keyword argument.
+        :return: The method frame the broker replied with.
+        :raises ChannelClosed: If the channel closes before the broker replies.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending_calls.add(future)
+        future.add_done_callback(self._pending_calls.discard)
+        method(*args, callback=lambda frame: _resolve(future, frame), **kwargs)
+        return await future
+
+    def _on_channel_closed(self, channel: Channel, reason: Exception) -> None:
+        self.logger.warning("Channel closed: %s", reason)
+        for future in list(self._pending_calls):
+            _reject(future, reason if isinstance(reason, ChannelClosed) else ChannelClosed(0, str(reason)))
+
+    def _on_connection_closed(self, connection: AsyncioConnection, reason: Exception) -> None:
+        self.logger.debug("Connection closed: %s", reason)
+        if self._closed is not None:
+            _resolve(self._closed, reason)
+
+    def __del__(self):
+        # Only request the close without awaiting it; the event loop may already be gone (e.g. after asyncio.run).
+        if getattr(self, '_connection', None) is not None and self._connection.is_open:
+            try:
+                self._connection.close()
+            except RuntimeError:
+                pass  # Event loop is closed; the socket is released with the loop.
+
+
+def _resolve(future: asyncio.Future, value: Any) -> None:
+    if not future.done():
+        future.set_result(value)
+
+
+def _reject(future: asyncio.Future, error: BaseException) -> None:
+    if not future.done():
+        future.set_exception(error)
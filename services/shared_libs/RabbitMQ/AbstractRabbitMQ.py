@@ -1,11 +1,19 @@
+import random
+import threading
+import time
 from abc import ABC, abstractmethod
 
 import pika
 from pika.adapters.blocking_connection import BlockingChannel
 from pika.exceptions import AMQPConnectionError
 
-from services.shared_libs.RabbitMQ.const import RMQ_HOST, RMQ_PORT
+from services.shared_libs.RabbitMQ.ConnectionManager import ConnectionManager
+from services.shared_libs.RabbitMQ.const import RMQ_HOST, RMQ_PORT, RMQ_TOPOLOGY, RMQ_TRACING, RMQ_TRANSPORT
+from services.shared_libs.RabbitMQ.serialization import CodecRegistry, codecs as default_codecs
+from services.shared_libs.RabbitMQ.topology import Topology, get_topology
+from services.shared_libs.RabbitMQ.transports import AmqpTransport, Transport, get_transport
 from services.shared_libs.logging_config import setup_logging
+from services.shared_libs.metrics import MetricsRegistry, setup_metrics
 
 
 class RabbitMQConnectionError(Exception):
@@ -14,16 +22,42 @@ class RabbitMQConnectionError(Exception):
 
 
 class AbstractRabbitMQ(ABC):
+    _RECONNECT_BASE_DELAY = 0.5  # Seconds before the second reconnect attempt; doubles with every failure.
+    _RECONNECT_MAX_DELAY = 30  # Upper bound in seconds for the delay between two reconnect attempts.
+
     def __init__(self,
                  host: str = RMQ_HOST,
                  port: int = RMQ_PORT,
                  connection_attempts: int = 5,
-                 retry_delay: float = 5):
+                 retry_delay: float = 5,
+                 connection_manager: ConnectionManager | None = None,
+                 auto_reconnect: bool = False,
+                 codecs: CodecRegistry | None = None,
+                 metrics: MetricsRegistry | None = None,
+                 tracing: bool = RMQ_TRACING,
+                 transport: str | Transport = RMQ_TRANSPORT,
+                 topology: Topology | str | None = RMQ_TOPOLOGY):
         """
         :param host: The hostname or IP address of the RabbitMQ server.
         :param port: The port number on which the RabbitMQ server is listening.
         :param connection_attempts: The maximum number of attempts to connect to the RabbitMQ server.
         :param retry_delay: The interval in seconds between each attempt to connect to the RabbitMQ server.
+        :param connection_manager: Shares its connection with other clients in this process. The connection
+                                   settings above are then taken from the manager. None opens a private connection.
+        :param auto_reconnect: If True, a lost connection is re-established (see :meth:`reconnect`) instead of
+                               surfacing as an error. Consumers resume consuming and producers buffer messages
+                               in the meantime.
+        :param codecs: The codecs used to encode published and decode consumed messages by their ``content_type``.
+                       None uses the built-in JSON, text, binary and (if installed) msgpack codecs.
+        :param metrics: The registry to record metrics in. None uses the process-wide registry if metrics are enabled
+                        through the environment (see :func:`~services.shared_libs.metrics.setup_metrics`).
+        :param tracing: If True, published messages carry trace headers and consumers record the latency of traced
+                        deliveries (see :mod:`~services.shared_libs.RabbitMQ.tracing`).
+        :param transport: The transport, or its name, to exchange messages over if no `connection_manager` is given
+                          (see :mod:`~services.shared_libs.RabbitMQ.transports`). Host and port only apply to 'amqp'.
+        :param topology: The exchanges, queues, bindings and publish routes to declare on every (re)connect before
+                         `_setup` runs, or the YAML/JSON file or inline JSON to load them from (see
+                         :mod:`~services.shared_libs.RabbitMQ.topology`). None declares nothing.
         """
         self.logger = setup_logging(service_name=self.__class__.__name__)
 
@@ -47,8 +81,44 @@ class AbstractRabbitMQ(ABC):
         elif retry_delay <= 0:
             raise ValueError("retry_delay must be a positive float.")
 
+        if connection_manager is not None and not isinstance(connection_manager, ConnectionManager):
+            raise TypeError("connection_manager must be a ConnectionManager or None.")
+
+        if not isinstance(auto_reconnect, bool):
+            raise TypeError("auto_reconnect must be a boolean.")
+
+        if codecs is not None and not isinstance(codecs, CodecRegistry):
+            raise TypeError("codecs must be a CodecRegistry or None.")
+
+        if metrics is not None and not isinstance(metrics, MetricsRegistry):
+            raise TypeError("metrics must be a MetricsRegistry or None.")
+
+        if not isinstance(tracing, bool):
+            raise TypeError("tracing must be a boolean.")
+
+        transport = get_transport(transport)
+        self._topology = get_topology(topology)
+
         self._connection: pika.BlockingConnection | None = None  # TCP connection
         self._channel: BlockingChannel | None = None  #
+        self._connection_thread: int | None = None  # ident of the thread that owns the connection
+        self._holds_connection = False  # Whether this client still has to release its hold on the connection.
+        self._auto_reconnect = auto_reconnect
+        self._disconnect_requested = False
+        self._reconnect_failures = 0
+        self._next_reconnect = 0.0  # time.monotonic() before which no reconnect is attempted
+        self._codecs = codecs if codecs is not None else default_codecs
+        self._metrics = metrics if metrics is not None else setup_metrics()  # None if metrics are disabled
+        self._tracing = tracing
+        if self._metrics is not None:
+            self._init_metrics()
+
+        if connection_manager is not None:
+            self._connection_manager = connection_manager
+            self._connection_parameters = connection_manager.parameters
+            self._message_broker_host = self._connection_parameters.host
+            self._message_broker_port = self._connection_parameters.port
+            return
 
         self._message_broker_host = host
         self._message_broker_port = port
@@ -76,6 +146,10 @@ class AbstractRabbitMQ(ABC):
             # tcp_options,                   # None or a dict of options to pass to the underlying socket
             # **kwargs,
         )
+        self._connection_manager = transport.connection_manager(self._connection_parameters)
+        if not isinstance(transport, AmqpTransport):
+            self._message_broker_host = self._connection_manager.parameters.host
+            self._message_broker_port = self._connection_manager.parameters.port
 
     def connect(self) -> bool:
         """
@@ -85,35 +159,119 @@ class AbstractRabbitMQ(ABC):
         """
 
         # Establish connection with RabbitMQ server
-        self.logger.info(
-            f"Attempting to connect to RabbitMQ at {self._message_broker_host}:{self._message_broker_port}...")
+        self.logger.info("Attempting to connect to RabbitMQ at %s:%s...",
+                         self._message_broker_host, self._message_broker_port)
+        if self._holds_connection:  # Drop the hold on a previous, possibly dead connection.
+            self._holds_connection = False
+            self._connection_manager.release(self._connection)
+        self._disconnect_requested = False
         try:
-            self._connection = pika.BlockingConnection(self._connection_parameters)
+            self._connection = self._connection_manager.acquire()
+            self._holds_connection = True
+            self._connection_thread = threading.get_ident()
             self._channel = self._connection.channel()
+            self._topology.apply(self._channel)
             self._setup()
             self.logger.info("Connected to RabbitMQ successfully")
             return True  # Exit if connection is successful
         except AMQPConnectionError as e:
-            self.logger.error(
-                f"Failed to connect to RabbitMQ after attempts.")
+            self.logger.error("Failed to connect to RabbitMQ after attempts.")
             return False
         except Exception as e:
-            self.logger.error(f"Failed to connect to RabbitMQ: {e}")
+            self.logger.error("Failed to connect to RabbitMQ: %s", e)
             raise e
 
     def disconnect(self):
         """Closes the RabbitMQ connection."""
         self.logger.info("Closing RabbitMQ connection.")
-        if self._connection and self._connection.is_open:
-            self._connection.close()
-            self.logger.debug("Connection closed.")
+        self._disconnect_requested = True
+        if self._connection and self._connection.is_open and self._holds_connection:
+            self._holds_connection = False
+            if self._connection_manager.release(self._connection):
+                self.logger.debug("Connection closed.")
+            else:
+                self._close_channels()
+                self.logger.debug("Channel closed, connection still used by %s other client(s).",
+                                  self._connection_manager.users)
         else:
             self.logger.debug("Connection already closed.")
 
+    def reconnect(self, max_attempts: int | None = None) -> bool:
+        """
+        Re-establishes a lost connection, waiting with exponential backoff and full jitter between attempts so that
+        many services do not hammer a recovering broker in lockstep. Each attempt runs :meth:`connect`, which re-runs
+        `_setup` to redeclare the topology.
+
+        :param max_attempts: The maximum number of attempts. None retries until connected.
+        :return: True once reconnected, False if all attempts failed.
+        """
+        attempts = 0
+        while max_attempts is None or attempts < max_attempts:
+            time.sleep(max(0.0, self._next_reconnect - time.monotonic()))
+            attempts += 1
+            if self._reconnect_once():
+                return True
+        return False
+
+    def _reconnect_once(self) -> bool:
+        """Makes a single reconnect attempt and schedules the next one if it fails."""
+        self.logger.info("Reconnecting to RabbitMQ (attempt %s)...", self._reconnect_failures + 1)
+        try:
+            connected = self.connect()
+        except Exception as e:
+            self.logger.error("Reconnect failed: %s", e)
+            connected = False
+
+        if self._metrics is not None:
+            self._m_reconnects.labels(self.__class__.__name__, 'success' if connected else 'failure').inc()
+        if connected:
+            self._reconnect_failures = 0
+            self._next_reconnect = 0.0
+            self._on_reconnected()
+            return True
+
+        self._schedule_reconnect()
+        return False
+
+    def _schedule_reconnect(self) -> None:
+        backoff = min(self._RECONNECT_MAX_DELAY, self._RECONNECT_BASE_DELAY * 2 ** self._reconnect_failures)
+        delay = random.uniform(0, backoff)
+        self._reconnect_failures += 1
+        self._next_reconnect = time.monotonic() + delay
+        self.logger.warning("Could not reconnect to RabbitMQ, next attempt in %.1fs.", delay)
+
+    def _init_metrics(self) -> None:
+        """
+        Registers the client's metrics. Only called if metrics are enabled; subclasses extend it and keep the metric
+        (or its labelled child) in an ``_m_`` attribute, so the hot path does not look anything up.
+        """
+        self._m_reconnects = self._metrics.counter('rmq_reconnects_total', "Reconnect attempts by outcome.",
+                                                   ('client', 'outcome'))
+
+    def _reconnect_due(self) -> bool:
+        return time.monotonic() >= self._next_reconnect
+
+    def _should_reconnect(self) -> bool:
+        """Whether a missing connection should be re-established rather than reported."""
+        return self._auto_reconnect and not self._disconnect_requested
+
+    def _on_reconnected(self) -> None:
+        """Subclasses may override this method to restore state that outlives a connection, e.g. consumers."""
+        pass
+
+    def _close_channels(self) -> None:
+        """Closes the channels this client opened on a connection that stays open for other clients."""
+        if self._channel and self._channel.is_open:
+            self._channel.close()
+
     def _ready(self) -> bool:
         return (self._connection and self._connection.is_open and
                 self._channel and self._channel.is_open)
 
+    def _in_connection_thread(self) -> bool:
+        """Whether the caller runs on the thread that owns the connection; pika connections are not thread-safe."""
+        return self._connection_thread is None or self._connection_thread == threading.get_ident()
+
     def __del__(self):
         self.logger.debug("Deleting RabbitMQ instance.")
         self.disconnect()
@@ -123,6 +281,6 @@ class AbstractRabbitMQ(ABC):
         """Subclasses should override this method to declare queues, exchanges, bind queues to exchanges, handle dead letter queues, etc.
         Example:
             self._channel.queue_declare(queue='my_queue', durable=True)
-            self._channel.basic_qos(prefetch_count=1) # Set prefetch count for fair dispatch
+        Consumers set their QoS (prefetch) through the RabbitMQConsumer constructor instead of calling basic_qos here.
         """
         pass
@@ -0,0 +1,243 @@
+import asyncio
+import inspect
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from pika.channel import Channel
+from pika.exceptions import AMQPChannelError, AMQPConnectionError, ChannelClosed, ChannelClosedByClient, \
+    ConnectionClosedByClient
+from pika.spec import Basic, BasicProperties
+
+from services.shared_libs.RabbitMQ.AbstractAsyncRabbitMQ import AbstractAsyncRabbitMQ
+from services.shared_libs.RabbitMQ.RabbitMQConsumer import _queue_names
+from services.shared_libs.RabbitMQ import tracing as trace
+from services.shared_libs.RabbitMQ.const import RMQ_HOST, RMQ_PORT, RMQ_TOPOLOGY, RMQ_TRACE_FILE, RMQ_TRACING
+from services.shared_libs.RabbitMQ.serialization import CodecRegistry
+from services.shared_libs.RabbitMQ.topology import Topology
+from services.shared_libs.metrics import MetricsRegistry
+
+
+class AsyncRabbitMQConsumer(AbstractAsyncRabbitMQ, ABC):
+    """
+    Abstract base class for asyncio-native RabbitMQ Consumers.
+    Subclasses must implement the `_setup` and `_callback` methods.
+
+    `_callback` has the same signature as in :class:`RabbitMQConsumer`. It may be a plain method, which runs directly
+    on the event loop, or a coroutine, which is scheduled as a task so slow handlers do not hold up delivery.
+    Errors raised by a coroutine callback are logged; the message stays unacknowledged.
+    Bodies are decompressed and decoded by their ``content_encoding`` and ``content_type`` like in
+    :class:`RabbitMQConsumer`, and several queues can be consumed on one channel like there.
+
+    Unlike :class:`RabbitMQConsumer` there is no `_handle_unacknowledged_messages` hook: pika's asynchronous
+    ``basic_cancel`` does not hand back unacknowledged deliveries, the broker requeues them once the channel closes.
+    """
+
+    def __init__(self,
+                 queue_name: str | list[str],
+                 host: str = RMQ_HOST,
+                 port: int = RMQ_PORT,
+                 connection_attempts: int = 5,
+                 retry_delay: float = 5,
+                 codecs: CodecRegistry | None = None,
+                 metrics: MetricsRegistry | None = None,
+                 tracing: bool = RMQ_TRACING,
+                 topology: Topology | str | None = RMQ_TOPOLOGY):
+
+        self._queues = _queue_names(queue_name)
+        self._queue = self._queues[0]
+        self._consuming = False
+        self._consumer_tags: list[str] = []
+        self._stopped: asyncio.Future | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+        super().__init__(host, port, connection_attempts, retry_delay, codecs=codecs, metrics=metrics, tracing=tracing,
+                         topology=topology)
+        self._tracer = trace.TraceRecorder(self.__class__.__name__, self._metrics, RMQ_TRACE_FILE) if tracing else None
+
+    @property
+    def queue(self) -> str:
+        """The queue to consume from, or the first of them."""
+        return self._queue
+
+    @queue.setter
+    def queue(self, value: str):
+        """
+        Set the queue name, replacing all queues. Active consumers on other queues are stopped in the background.
+        """
+        if not isinstance(value, str):
+            raise TypeError("queue_name must be a string.")
+        elif not value:
+            raise ValueError("queue_name must not be empty.")
+        if [value] != self._queues and self._consumer_tags and self._consuming:
+            asyncio.ensure_future(self.stop_consuming())
+        self._queue = value
+        self._queues = [value]
+        self.logger.info("Queue name set to: %s", self._queue)
+
+    @property
+    def queues(self) -> list[str]:
+        """All queues to consume from."""
+        return list(self._queues)
+
+    async def consume(self, auto_ack: bool = False, callback: Optional[callable] = None,
+                      restart_if_running: bool = True) -> None:
+        """
+        Consumes messages from the specified queues until :meth:`stop_consuming` is called or the connection closes.
+
+        :param auto_ack: If True, messages will be automatically acknowledged.
+                         If False, the callback method must manually acknowledge.
+        :param callback: An optional callback function to handle incoming messages.
+                         If provided, it overrides the default callback method.
+        :param restart_if_running: If True, the consumer will be restarted if it's already consuming messages.
+        :raises RuntimeError: If the AsyncRabbitMQConsumer is not connected.
+        """
+        if not self._ready():
+            msg = "AsyncRabbitMQConsumer is not connected."
+            self.logger.error(msg)
+            raise RuntimeError(msg + " Call connect() first.")
+
+        if self._consuming and not restart_if_running:
+            self.logger.info("Consumer is already consuming messages from the queue.")
+            return
+        elif self._consuming and restart_if_running:
+            self.logger.info("Consumer is already consuming messages from the queue. Restarting...")
+            await self.stop_consuming()
+
+        if (not callable(callback) or not hasattr(callback, '__call__')) and callback is not None:
+            raise TypeError("callback must be a callable object or None.")
+        callback = callback or self._callback  # Use default callback if not provided
+
+        if self._metrics is not None:
+            labels = (self.__class__.__name__, ','.join(self._queues))
+            consumed = self._metrics.counter('rmq_consumed_total', "Messages delivered to the consumer.",
+                                             ('client', 'queue')).labels(*labels)
+            redelivered = self._metrics.counter(
+                'rmq_redelivered_total', "Messages delivered again after an earlier delivery was not acknowledged.",
+                ('client', 'queue')).labels(*labels)
+
+        def on_message(ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+            if self._metrics is not None:
+                consumed.inc()
+                if method.redelivered:
+                    redelivered.inc()
+            try:
+                body = self._codecs.decode(body, properties)
+            except Exception as e:
+                self.logger.error("Cannot decode message %s with content type '%s': %s",
+                                  method.delivery_tag, properties.content_type, e)
+                if not auto_ack:
+                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                return
+            if self._tracer is None:
+                self._dispatch(callback, ch, method, properties, body)
+                return
+            self._tracer.record(properties)
+            token = trace.activate(properties)  # Tasks copy the context, so coroutine callbacks continue the trace.
+            try:
+                self._dispatch(callback, ch, method, properties, body)
+            finally:
+                trace.deactivate(token)
+
+        try:
+            self._stopped = asyncio.get_running_loop().create_future()
+            self._consumer_tags = []
+            for queue in self._queues:
+                self._consumer_tags.append(self._channel.basic_consume(
+                    queue=queue,
+                    on_message_callback=on_message,
+                    auto_ack=auto_ack
+                ))
+            self._consuming = True
+            self.logger.info("Consuming messages from queue(s) '%s'", "', '".join(self._queues))
+            # Resolved by stop_consuming() or a clean disconnect; fails if the broker closes the channel or connection.
+            await self._stopped
+        except AMQPChannelError as e:
+            self.logger.error("AMQP Channel Error during consume: %s", e)
+            raise e
+        except AMQPConnectionError as e:
+            self.logger.error("AMQP Connection Error during consume: %s", e)
+            raise e
+        except Exception as e:
+            self.logger.critical("An unexpected error occurred during consume: %s", e)
+            raise e
+        finally:
+            self._consuming = False
+
+    async def stop_consuming(self) -> None:
+        """
+        Stop consuming messages from the current queues.
+        This cancels the active consumers and waits for running callback tasks to finish.
+        """
+        if self._consumer_tags and self._ready():
+            try:
+                for consumer_tag in self._consumer_tags:
+                    await self._call(self._channel.basic_cancel, consumer_tag)
+                self.logger.info("Stopped consuming messages from queue(s) '%s'", "', '".join(self._queues))
+                if self._tasks:
+                    await asyncio.gather(*self._tasks, return_exceptions=True)
+            except Exception as e:
+                self.logger.error("Error stopping consumer: %s", e)
+                raise e
+            finally:
+                self._consuming = False
+                self._consumer_tags = []
+                self._finish_consuming(None)
+
+    def _on_channel_closed(self, channel: Channel, reason: Exception) -> None:
+        super()._on_channel_closed(channel, reason)
+        if isinstance(reason, ChannelClosedByClient):
+            self._finish_consuming(None)
+        else:
+            self._finish_consuming(reason if isinstance(reason, AMQPChannelError) else ChannelClosed(0, str(reason)))
+
+    def _on_connection_closed(self, connection, reason: Exception) -> None:
+        super()._on_connection_closed(connection, reason)
+        if isinstance(reason, ConnectionClosedByClient):
+            self._finish_consuming(None)
+        else:
+            self._finish_consuming(reason if isinstance(reason, AMQPConnectionError) else AMQPConnectionError(reason))
+
+    def _finish_consuming(self, error: Exception | None) -> None:
+        """Ends a running :meth:`consume`, raising `error` from it if given."""
+        if self._stopped is None or self._stopped.done():
+            return
+        if error is None:
+            self._stopped.set_result(None)
+        else:
+            self._stopped.set_exception(error)
+
+    def _dispatch(self, callback: callable, ch: Channel, method: Basic.Deliver, properties: BasicProperties,
+                  body) -> None:
+        """Calls the callback and schedules the coroutine it returned, if any."""
+        result = callback(ch, method, properties, body)
+        if inspect.isawaitable(result):
+            task = asyncio.ensure_future(result)
+            self._tasks.add(task)
+            task.add_done_callback(self._on_task_done)
+
+    def _on_task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error("Error in message callback: %s", task.exception())
+
+    async def __aenter__(self):
+        """Async context manager entry point."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Async context manager exit point - ensures resources are cleaned up."""
+        await self.stop_consuming()
+        await self.disconnect()
+
+    @abstractmethod
+    def _callback(self, ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+        """
+        Subclasses should override this method to handle incoming messages.
+        This method is called on the event loop when a message is received and may be a coroutine.
+
+        :param ch: The channel object.
+        :param method: The delivery method frame.
+        :param properties: The message properties.
+        :param body: The message body, decoded according to its ``content_type`` (bytes if it has none).
+        """
+        pass
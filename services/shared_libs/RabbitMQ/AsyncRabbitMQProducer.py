@@ -0,0 +1,450 @@
+import asyncio
+import time
+from abc import ABC
+from typing import Any
+
+import pika
+from pika.exceptions import AMQPChannelError, AMQPConnectionError, ChannelWrongStateError
+
+from services.shared_libs.RabbitMQ.AbstractAsyncRabbitMQ import AbstractAsyncRabbitMQ
+from services.shared_libs.RabbitMQ import tracing as trace
+from services.shared_libs.RabbitMQ.const import RMQ_COMPRESSION, RMQ_COMPRESSION_THRESHOLD, RMQ_HOST, RMQ_PORT, \
+    RMQ_TRACING, RMQ_BLOCKED_BUFFER_SIZE, RMQ_OVERFLOW_POLICY, RMQ_SPILL_DIR, RMQ_SPILL_MAX_BYTES, RMQ_SPOOL_DIR, \
+    RMQ_SPOOL_SYNC, RMQ_TOPOLOGY, RMQ_MESSAGE_IDS
+from services.shared_libs.RabbitMQ.publishing import BLOCK, DROP_OLDEST, BlockedBuffer, ConfirmTracker, \
+    build_properties, with_message_id, with_priority
+from services.shared_libs.RabbitMQ.serialization import JSON, CodecRegistry
+from services.shared_libs.RabbitMQ.spool import Spool
+from services.shared_libs.RabbitMQ.topology import Topology
+from services.shared_libs.metrics import MetricsRegistry
+
+
+class AsyncRabbitMQProducer(AbstractAsyncRabbitMQ, ABC):
+    """
+    Abstract base class for asyncio-native RabbitMQ Producers.
+    Subclasses must implement the `_setup` method.
+
+    :meth:`publish` never blocks the event loop. With publisher confirms enabled it resolves once the broker has
+    confirmed the message, and up to `confirm_window` publishes may be in flight concurrently.
+    While the broker blocks the connection, messages are held in a bounded buffer like in :class:`RabbitMQProducer`.
+    """
+
+    _SPOOL_REPLAY_BATCH = 100  # Spooled messages replayed (and, with publisher confirms, confirmed) at a time.
+    _SPOOL_CONFIRM_TIMEOUT = 30  # Seconds a replayed batch may wait for its confirms before it is replayed again.
+    _SPOOL_RETRY_DELAY = 5  # Seconds before a replay that was not confirmed is retried.
+
+    def __init__(self,
+                 host: str = RMQ_HOST,
+                 port: int = RMQ_PORT,
+                 connection_attempts: int = 5,
+                 retry_delay: float = 5,
+                 publisher_confirms: bool = False,
+                 confirm_window: int = 128,
+                 codecs: CodecRegistry | None = None,
+                 content_type: str = JSON,
+                 compression: str | None = RMQ_COMPRESSION,
+                 compression_threshold: int = RMQ_COMPRESSION_THRESHOLD,
+                 metrics: MetricsRegistry | None = None,
+                 tracing: bool = RMQ_TRACING,
+                 blocked_buffer_size: int = RMQ_BLOCKED_BUFFER_SIZE,
+                 overflow_policy: str = RMQ_OVERFLOW_POLICY,
+                 spill_dir: str | None = RMQ_SPILL_DIR,
+                 spill_max_bytes: int = RMQ_SPILL_MAX_BYTES,
+                 spool_dir: str | None = RMQ_SPOOL_DIR,
+                 spool_sync: bool = RMQ_SPOOL_SYNC,
+                 topology: Topology | str | None = RMQ_TOPOLOGY,
+                 message_ids: bool = RMQ_MESSAGE_IDS):
+        """
+        :param host: The hostname or IP address of the RabbitMQ server.
+        :param port: The port number on which the RabbitMQ server is listening.
+        :param connection_attempts: The maximum number of attempts to connect to the RabbitMQ server.
+        :param retry_delay: The interval in seconds between each attempt to connect to the RabbitMQ server.
+        :param publisher_confirms: If True, the channel is put into confirm mode and :meth:`publish` returns whether
+                                   the broker acked (True) or nacked (False) the message.
+        :param confirm_window: The maximum number of unconfirmed messages in flight. Further publishes wait until the
+                               broker confirms older messages.
+        :param codecs: The codecs used to encode published messages. None uses the built-in codecs.
+        :param content_type: The content type of published objects that are neither bytes nor strings (see
+                             :meth:`publish`).
+        :param compression: The content encoding (e.g. 'deflate', 'gzip' or, if installed, 'lz4') to compress bodies
+                            with. Consumers decompress them transparently. None publishes bodies uncompressed.
+        :param compression_threshold: The minimum size in bytes of an encoded body to be compressed. Smaller bodies
+                                      are not worth the CPU time.
+        :param metrics: The registry to record metrics in. None uses the process-wide registry if metrics are enabled.
+        :param tracing: If True, every message is stamped with trace headers (see
+                        :mod:`~services.shared_libs.RabbitMQ.tracing`).
+        :param blocked_buffer_size: The maximum number of messages kept in memory while the broker blocks the
+                                    connection. They are published once it is unblocked.
+        :param overflow_policy: What :meth:`publish` does once that buffer is full: 'block' awaits the unblocking,
+                                'drop-oldest' discards the oldest buffered message (failing its publish) and 'raise'
+                                raises a RuntimeError.
+        :param spill_dir: A directory to spill messages to once the memory buffer is full, before the overflow policy
+                          applies. None keeps the buffer in memory only.
+        :param spill_max_bytes: The maximum size of the messages spilled to disk.
+        :param spool_dir: A directory for a durable spool (see :mod:`~services.shared_libs.RabbitMQ.spool`). Messages
+                          that cannot be published because the broker is unreachable are written to it, and a
+                          background task reconnects and replays them in order. None disables the spool.
+        :param spool_sync: If True, every spooled message is fsynced.
+        :param topology: The topology to declare on every (re)connect, whose publish routes also apply to
+                         :meth:`publish` (see :mod:`~services.shared_libs.RabbitMQ.topology`).
+        :param message_ids: If True, every message without a ``message_id`` gets a unique one, which stays the same
+                            when the message is buffered, spooled or resent, so that consumers can skip redeliveries
+                            (see :mod:`~services.shared_libs.RabbitMQ.dedup`).
+        """
+        if not isinstance(publisher_confirms, bool):
+            raise TypeError("publisher_confirms must be a boolean.")
+
+        if not isinstance(message_ids, bool):
+            raise TypeError("message_ids must be a boolean.")
+
+        if not isinstance(confirm_window, int) or isinstance(confirm_window, bool):
+            raise TypeError("confirm_window must be a positive integer.")
+        elif confirm_window <= 0:
+            raise ValueError("confirm_window must be a positive integer.")
+
+        if compression is not None and not isinstance(compression, str):
+            raise TypeError("compression must be a string or None.")
+
+        if not isinstance(compression_threshold, int) or isinstance(compression_threshold, bool):
+            raise TypeError("compression_threshold must be a non-negative integer.")
+        elif compression_threshold < 0:
+            raise ValueError("compression_threshold must be a non-negative integer.")
+
+        self._publisher_confirms = publisher_confirms
+        self._message_ids = message_ids
+        self._confirm_window = confirm_window
+        self._window: asyncio.Semaphore | None = None
+        self._confirms = ConfirmTracker()
+        self._content_type = content_type
+        self._compression = compression
+        self._compression_threshold = compression_threshold
+        self._blocked = False  # Whether the broker blocks the connection.
+        self._blocked_buffer = BlockedBuffer(blocked_buffer_size, overflow_policy, spill_dir, spill_max_bytes)
+        self._unblocked: asyncio.Event | None = None  # Set while the connection is not blocked.
+
+        if spool_dir is not None and not isinstance(spool_dir, str):
+            raise TypeError("spool_dir must be a string or None.")
+        if not isinstance(spool_sync, bool):
+            raise TypeError("spool_sync must be a boolean.")
+        self._spool_dir = spool_dir
+        self._spool_sync = spool_sync
+        self._spool: Spool | None = None  # Opened by connect(), even if the broker is unreachable.
+        self._replay_task: asyncio.Task | None = None
+
+        super().__init__(host, port, connection_attempts, retry_delay, codecs=codecs, metrics=metrics, tracing=tracing,
+                         topology=topology)
+        self._codecs.get(content_type)  # Fail early on a content type or compression nobody can decode.
+        if compression is not None:
+            self._codecs.get_compressor(compression)
+
+    async def connect(self) -> bool:
+        self._blocked = False
+        self._unblocked = asyncio.Event()
+        self._unblocked.set()
+        if self._spool_dir is not None and self._spool is None:
+            self._spool = Spool(self._spool_dir, sync=self._spool_sync)
+        connected = await super().connect()
+        if connected:
+            self._connection.add_on_connection_blocked_callback(self._on_connection_blocked)
+            self._connection.add_on_connection_unblocked_callback(self._on_connection_unblocked)
+            if self._publisher_confirms:
+                self._window = asyncio.Semaphore(self._confirm_window)
+                self._confirms.reset()
+                await self._call(self._channel.confirm_delivery, self._on_delivery_confirmation)
+        if self._spool:
+            self._start_replay()  # Messages spooled by an earlier process, or a retry if connecting failed.
+
+        return connected
+
+    async def disconnect(self):
+        if self._replay_task is not None and self._replay_task is not asyncio.current_task():
+            self._replay_task.cancel()
+            self._replay_task = None
+        if self._blocked_buffer and not self._blocked and self._ready():
+            try:
+                self._drain_blocked_buffer()
+            except Exception as e:
+                self.logger.error("Failed to publish %s message(s) buffered while blocked on disconnect: %s",
+                                  len(self._blocked_buffer), e)
+        if self._spool is not None:
+            self._spool_pending()  # Keep what could not be published for the next connection.
+        if self._blocked_buffer:
+            self.logger.warning("Dropping %s message(s) buffered while the connection was blocked.",
+                                len(self._blocked_buffer))
+            for future in self._blocked_buffer.clear():
+                if not future.done():
+                    future.set_exception(AMQPConnectionError("Connection closed while the broker blocked it."))
+        await super().disconnect()
+        self._fail_pending_confirms(AMQPConnectionError("Connection closed before the broker confirmed the message."))
+        if self._unblocked is not None:
+            self._unblocked.set()  # Wake publishes waiting for room; they fail on the closed channel.
+        if self._spool is not None:
+            if self._spool:
+                self.logger.info("%s message(s) stay spooled in %s.", len(self._spool), self._spool_dir)
+            self._spool.close()
+            self._spool = None
+
+    @property
+    def blocked(self) -> bool:
+        """Whether the broker currently blocks the connection; publishes are buffered meanwhile."""
+        return self._blocked
+
+    def _on_connection_blocked(self, connection: pika.connection.Connection, frame: pika.frame.Method):
+        """
+        Called when the broker blocks publishing on the connection, with the ``Connection.Blocked`` frame.
+        Subclasses that override this must call the base implementation.
+        """
+        self._blocked = True
+        self._unblocked.clear()
+        self.logger.warning("Connection blocked by the broker: %s. Buffering published messages.",
+                            frame.method.reason)
+
+    def _on_connection_unblocked(self, connection: pika.connection.Connection, frame: pika.frame.Method):
+        """
+        Called when the broker unblocks the connection. Publishes the messages buffered in the meantime.
+        Subclasses that override this must call the base implementation.
+        """
+        self._blocked = False
+        self.logger.info("Connection unblocked, publishing %s buffered message(s).", len(self._blocked_buffer))
+        try:
+            self._drain_blocked_buffer()
+        except Exception as e:
+            self.logger.error("Failed to publish the messages buffered while blocked, keeping %s: %s",
+                              len(self._blocked_buffer), e)
+        self._unblocked.set()
+
+    async def publish(self, message: Any, routing_key: str, exchange: str = '', durable: bool = True,
+                      properties: pika.BasicProperties = None, priority: int | None = None) -> bool | None:
+        """
+        Publishes a message to the specified exchange and routing key.
+        Messages are encoded, compressed and routed like in :meth:`RabbitMQProducer.publish`.
+
+        :param message: The message to publish.
+        :param routing_key: The routing key used to route the message to the correct queue.
+        :param exchange: The exchange to publish the message to. If left blank, the message will be published to the default exchange.
+        :param durable: If True, the message will be persisted to disk. If False, the message will not be persisted.
+        :param properties: The message properties.
+        :param priority: The priority of the message (0-255). None keeps the priority of `properties`.
+        :return: True (ack) or False (nack) if publisher confirms are enabled, None otherwise or if the message was
+                 spooled because the broker is unreachable.
+        :raises RuntimeError: If the AsyncRabbitMQProducer is not connected and has no spool.
+        :raises ValueError: If no codec is registered for the message's content type.
+        """
+        if self._spool is None and not self._ready():
+            msg = "AsyncRabbitMQProducer is not connected."
+            self.logger.error(msg)
+            raise RuntimeError(msg + " Call connect() first.")
+
+        properties = with_priority(properties, priority)
+        if not isinstance(message, bytes):
+            message, properties = self._codecs.encode(message, properties, self._content_type)
+        if self._compression is not None and len(message) >= self._compression_threshold:
+            message, properties = self._codecs.compress(message, properties, self._compression)
+        if self._tracing:
+            properties = trace.inject(properties, self.__class__.__name__)
+        if self._message_ids:
+            properties = with_message_id(properties)
+        properties = build_properties(durable, properties)
+        exchange, routing_key = self._topology.route(exchange, routing_key)
+
+        if self._spool is not None and (self._spool or not self._ready()):
+            self._publish_to_spool(exchange, routing_key, message, properties)
+            return None
+
+        if self._blocked or self._blocked_buffer:
+            future = asyncio.get_running_loop().create_future() if self._publisher_confirms else None
+            await self._publish_while_blocked(exchange, routing_key, message, properties, future)
+            return await future if future is not None else None
+
+        if not self._publisher_confirms:
+            try:
+                self._basic_publish(exchange, routing_key, message, properties)
+            except (AMQPConnectionError, ChannelWrongStateError):
+                if self._spool is None:
+                    raise
+                self._publish_to_spool(exchange, routing_key, message, properties)
+            return None
+
+        async with self._window:
+            future = asyncio.get_running_loop().create_future()
+            tag = self._confirms.register(future)
+            try:
+                self._basic_publish(exchange, routing_key, message, properties)
+            except Exception as e:
+                self._confirms.discard(tag)
+                if self._spool is None or not isinstance(e, (AMQPConnectionError, ChannelWrongStateError)):
+                    raise
+                self._publish_to_spool(exchange, routing_key, message, properties)
+                return None
+            return await future
+
+    def _publish_to_spool(self, exchange: str, routing_key: str, body: bytes,
+                          properties: pika.BasicProperties) -> None:
+        """Writes a message the broker cannot take right now to the spool and makes sure it is being replayed."""
+        self._spool_pending()  # Messages held in memory are older; keep them in front.
+        self._spool.append(exchange, routing_key, body, properties)
+        if self._metrics is not None:
+            self._m_spooled.inc()
+        self.logger.debug("Spooled message to exchange: %s, routing key: %s", exchange, routing_key)
+        self._start_replay()
+
+    def _spool_pending(self) -> None:
+        """Moves the messages buffered while blocked to the spool. Their publishes return None, like spooled ones."""
+        while (entry := self._blocked_buffer.pop()) is not None:
+            exchange, routing_key, body, properties, future = entry
+            self._spool.append(exchange, routing_key, body, properties)
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    def _start_replay(self) -> None:
+        if self._replay_task is None or self._replay_task.done():
+            self._replay_task = asyncio.ensure_future(self._replay_spool())
+
+    async def _replay_spool(self) -> None:
+        """
+        Reconnects with backoff while the broker is unreachable and publishes the spooled messages in order, in
+        batches that are removed from the spool once handed to the channel or, with publisher confirms, once the
+        broker confirmed all of them. Runs in the background until the spool is empty.
+        """
+        loop = asyncio.get_running_loop()
+        while self._spool:
+            if not self._ready():
+                await self.reconnect(max_attempts=1)
+                continue
+            if self._blocked:
+                await self._unblocked.wait()
+                continue
+
+            batch = self._spool.read(self._SPOOL_REPLAY_BATCH)
+            futures = []
+            try:
+                for _, (exchange, routing_key, body, properties) in batch:
+                    if self._publisher_confirms:
+                        futures.append(loop.create_future())
+                        self._confirms.register(futures[-1])
+                    self._basic_publish(exchange, routing_key, body, properties)
+                if futures and not all(await asyncio.wait_for(asyncio.gather(*futures), self._SPOOL_CONFIRM_TIMEOUT)):
+                    self.logger.warning("The broker nacked replayed messages; retrying in %ss.",
+                                        self._SPOOL_RETRY_DELAY)
+                    await asyncio.sleep(self._SPOOL_RETRY_DELAY)
+                    continue
+            except (AMQPConnectionError, AMQPChannelError, asyncio.TimeoutError) as e:
+                self.logger.error("Replaying the spool failed, %s message(s) stay spooled: %s", len(self._spool), e)
+                await asyncio.sleep(self._SPOOL_RETRY_DELAY if self._ready() else 0)
+                continue
+            self._spool.ack(batch[-1][0])
+            self.logger.info("Replayed %s spooled message(s), %s left.", len(batch), len(self._spool))
+
+    async def _publish_while_blocked(self, exchange: str, routing_key: str, body: bytes,
+                                     properties: pika.BasicProperties, future: asyncio.Future | None) -> None:
+        """
+        Buffers a message while the broker blocks the connection, applying the overflow policy if the buffer is full,
+        and publishes the buffer if the connection is unblocked by then.
+
+        :raises RuntimeError: If the buffer is full and the overflow policy is 'raise'.
+        """
+        while not self._blocked_buffer.put(exchange, routing_key, body, properties, future):
+            if not self._blocked:
+                self._drain_blocked_buffer()
+            elif self._blocked_buffer.policy == DROP_OLDEST:
+                dropped = self._blocked_buffer.pop()
+                self.logger.warning("Blocked buffer full, dropping the oldest of %s message(s).",
+                                    len(self._blocked_buffer) + 1)
+                if dropped[-1] is not None and not dropped[-1].done():
+                    dropped[-1].set_exception(RuntimeError("Dropped from the full blocked buffer."))
+                if self._metrics is not None:
+                    self._m_dropped.inc()
+            elif self._blocked_buffer.policy == BLOCK:
+                await self._unblocked.wait()
+                if not self._ready():
+                    raise AMQPConnectionError("Connection closed while waiting for the broker to unblock it.")
+            else:
+                msg = f"The broker blocks the connection and the buffer is full ({len(self._blocked_buffer)} messages)."
+                self.logger.error(msg)
+                raise RuntimeError(msg)
+        if self._metrics is not None:
+            self._m_buffered.inc()
+        if not self._blocked:
+            self._drain_blocked_buffer()
+
+    def _drain_blocked_buffer(self) -> None:
+        """
+        Publishes the messages buffered while blocked, in order. They bypass the confirm window: their publishes
+        are already waiting, and holding them back again would only reorder them behind newer ones.
+        """
+        while self._blocked_buffer and not self._blocked:
+            entry = self._blocked_buffer.pop()
+            exchange, routing_key, body, properties, future = entry
+            tag = self._confirms.register(future) if future is not None else None
+            try:
+                self._basic_publish(exchange, routing_key, body, properties)
+            except Exception:
+                if tag is not None:
+                    self._confirms.discard(tag)
+                self._blocked_buffer.restore(entry)
+                raise
+
+    def _basic_publish(self, exchange: str, routing_key: str, body: bytes, properties: pika.BasicProperties) -> None:
+        started = time.perf_counter() if self._metrics is not None else 0.0
+        try:
+            # Only writes to the connection's output buffer; the event loop flushes it.
+            self._channel.basic_publish(
+                exchange=exchange,
+                routing_key=routing_key,
+                body=body,
+                properties=properties
+            )
+            self.logger.debug("Published message to exchange: %s, routing key: %s", exchange, routing_key)
+        except AMQPChannelError as e:
+            self.logger.error("AMQP Channel Error during publish: %s", e)
+            raise e
+        except AMQPConnectionError as e:
+            self.logger.error("AMQP Connection Error during publish: %s", e)
+            raise e
+        except Exception as e:
+            self.logger.critical("An unexpected error occurred during publish: %s", e)
+            raise e
+        if self._metrics is not None:
+            self._m_published.inc()
+            self._m_publish_seconds.observe(time.perf_counter() - started)
+
+    def _init_metrics(self) -> None:
+        super()._init_metrics()
+        client = self.__class__.__name__
+        self._m_published = self._metrics.counter('rmq_published_total', "Messages handed to the channel.",
+                                                  ('client',)).labels(client)
+        self._m_publish_seconds = self._metrics.histogram(
+            'rmq_publish_seconds', "Time to hand a message to the channel, including waits for the confirm window.",
+            ('client',)).labels(client)
+        self._m_nacked = self._metrics.counter('rmq_publish_nacked_total', "Messages nacked by the broker.",
+                                               ('client',)).labels(client)
+        self._m_buffered = self._metrics.counter('rmq_publish_blocked_buffered_total',
+                                                 "Messages buffered while the broker blocked the connection.",
+                                                 ('client',)).labels(client)
+        self._m_dropped = self._metrics.counter('rmq_publish_blocked_dropped_total',
+                                                "Buffered messages dropped by the 'drop-oldest' overflow policy.",
+                                                ('client',)).labels(client)
+        self._m_spooled = self._metrics.counter('rmq_publish_spooled_total',
+                                                "Messages written to the spool because the broker was unreachable.",
+                                                ('client',)).labels(client)
+
+    def _on_delivery_confirmation(self, method_frame: pika.frame.Method) -> None:
+        """
+        Resolves the futures of all messages covered by a Basic.Ack or Basic.Nack.
+
+        :param method_frame: The Basic.Ack or Basic.Nack method frame sent by the broker.
+        """
+        method = method_frame.method
+        count = self._confirms.confirm(method)
+        if isinstance(method, pika.spec.Basic.Nack):
+            if self._metrics is not None:
+                self._m_nacked.inc(count)
+            self.logger.warning("Broker nacked %s message(s) up to delivery tag %s.", count, method.delivery_tag)
+
+    def _on_channel_closed(self, channel, reason: Exception) -> None:
+        super()._on_channel_closed(channel, reason)
+        self._fail_pending_confirms(AMQPChannelError(f"Channel closed before the broker confirmed the message: "
+                                                     f"{reason}"))
+
+    def _fail_pending_confirms(self, error: Exception) -> None:
+        self._confirms.fail_all(error)
@@ -0,0 +1,64 @@
+import pika
+
+
+class ConnectionManager:
+    """
+    Shares one blocking connection (one TCP socket and one heartbeat) between several RabbitMQ clients.
+
+    Every client opens its own channels on the shared connection; the connection is closed once the last client
+    released it. Like the connection itself, a manager must only be used from a single thread.
+
+    Example:
+        manager = ConnectionManager(pika.ConnectionParameters(host=RMQ_HOST, port=RMQ_PORT))
+        ear = MyEar(connection_manager=manager)
+        mouth = MyMouth('brain_to_mouth', connection_manager=manager)
+    """
+
+    def __init__(self, parameters: pika.ConnectionParameters):
+        """
+        :param parameters: The parameters used to open the shared connection.
+        """
+        if not isinstance(parameters, pika.ConnectionParameters):
+            raise TypeError("parameters must be a pika.ConnectionParameters instance.")
+
+        self.parameters = parameters
+        self._connection: pika.BlockingConnection | None = None
+        self._users = 0
+
+    @property
+    def users(self) -> int:
+        """The number of clients currently holding the connection."""
+        return self._users
+
+    def acquire(self) -> pika.BlockingConnection:
+        """
+        Returns the shared connection, opening it if there is none or it was closed.
+
+        :raises AMQPConnectionError: If the connection could not be opened.
+        """
+        if self._connection is None or not self._connection.is_open:
+            self._connection = self._open()
+            self._users = 0  # Holders of a previous connection release nothing on this one.
+        self._users += 1
+        return self._connection
+
+    def _open(self) -> pika.BlockingConnection:
+        """Opens a new connection. Subclasses may override this to connect to something other than a broker."""
+        return pika.BlockingConnection(self.parameters)
+
+    def release(self, connection: pika.BlockingConnection) -> bool:
+        """
+        Gives up one client's hold on `connection` and closes it once no client holds it anymore.
+
+        :param connection: The connection returned by :meth:`acquire`.
+        :return: True if the connection is closed (or no longer managed), False if other clients still use it.
+        """
+        if connection is not self._connection:
+            return True
+        self._users = max(self._users - 1, 0)
+        if self._users:
+            return False
+        if self._connection.is_open:
+            self._connection.close()
+        self._connection = None
+        return True
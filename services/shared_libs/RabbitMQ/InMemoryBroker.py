@@ -0,0 +1,561 @@
+import itertools
+import threading
+import uuid
+from collections import OrderedDict, deque
+from typing import Any
+
+import pika
+from pika.exceptions import ChannelClosedByBroker, ChannelWrongStateError, ConnectionWrongStateError
+from pika.spec import Basic, BasicProperties
+
+from services.shared_libs.RabbitMQ.ConnectionManager import ConnectionManager
+from services.shared_libs.RabbitMQ.eventloop import EventLoopConnection
+
+EXCHANGE_TYPES = ('direct', 'fanout', 'topic')
+
+
+class InMemoryBroker:
+    """
+    An in-process stand-in for a RabbitMQ broker.
+
+    Clients connect to it through :meth:`connection_manager` and then use their usual `_setup`, `publish` and
+    `consume` code: the connections and channels it hands out implement the parts of pika's ``BlockingConnection``
+    and ``BlockingChannel`` the clients use. The broker supports queues, the default exchange and direct, fanout and
+    topic exchanges, acks, nacks and rejects with requeueing and redelivery, per-consumer prefetch, round-robin
+    delivery to several consumers, single active consumers (``x-single-active-consumer``), priority queues
+    (``x-max-priority``), exclusive queues, publisher confirms and ``connection.blocked``. Nothing is persisted:
+    durable queues and persistent messages live as long as the broker object; exclusive queues as long as the
+    connection that declared them.
+
+    Like with pika, every connection belongs to the thread that uses it. Deliveries, confirms and timers run on that
+    thread whenever it processes I/O (``process_data_events``, ``sleep`` or ``start_consuming``), so a whole pipeline
+    can run in one process with each client on a thread of its own.
+
+    Example:
+        broker = InMemoryBroker()
+        brain = EchoBrain('ear_to_brain', connection_manager=broker.connection_manager())
+        mouth = ConsoleOutMouth('brain_to_mouth', connection_manager=broker.connection_manager())
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._queues: dict[str, _Queue] = {}
+        self._exchanges: dict[str, _Exchange] = {name: _Exchange(name, kind) for name, kind in
+                                                 (('amq.direct', 'direct'), ('amq.fanout', 'fanout'),
+                                                  ('amq.topic', 'topic'))}
+        self._connections: set[_InMemoryConnection] = set()
+        self._blocked: str | None = None
+
+    def connection_manager(self) -> ConnectionManager:
+        """Returns a connection manager that opens connections to this broker. Share it to share a connection."""
+        return _InMemoryConnectionManager(self)
+
+    def connect(self) -> '_InMemoryConnection':
+        """Opens a new connection, the stand-in for ``pika.BlockingConnection(parameters)``."""
+        connection = _InMemoryConnection(self)
+        with self._lock:
+            self._connections.add(connection)
+            if self._blocked is not None:
+                connection._post(connection._notify_blocked, self._blocked)
+        return connection
+
+    def queue(self, name: str) -> list[tuple[BasicProperties, bytes]]:
+        """
+        Returns the ready (undelivered) messages of a queue, e.g. to inspect them in tests.
+
+        :raises ValueError: If the queue does not exist.
+        """
+        with self._lock:
+            if name not in self._queues:
+                raise ValueError(f"Queue '{name}' does not exist.")
+            return [(message.properties, message.body) for message in self._queues[name].messages]
+
+    def block(self, reason: str = 'low on memory') -> None:
+        """Sends ``connection.blocked`` to every connection, like RabbitMQ does when it hits a resource alarm."""
+        with self._lock:
+            self._blocked = reason
+            for connection in self._connections:
+                connection._post(connection._notify_blocked, reason)
+
+    def unblock(self) -> None:
+        """Sends ``connection.unblocked`` to every connection."""
+        with self._lock:
+            if self._blocked is None:
+                return
+            self._blocked = None
+            for connection in self._connections:
+                connection._post(connection._notify_unblocked)
+
+    def _declare_queue(self, name: str, passive: bool, durable: bool, arguments: dict | None,
+                       connection: '_InMemoryConnection | None' = None, exclusive: bool = False) -> '_Queue':
+        with self._lock:
+            if not name:
+                name = f'amq.gen-{uuid.uuid4().hex}'
+            queue = self._queues.get(name)
+            if queue is not None and queue.owner is not None and queue.owner is not connection:
+                raise ChannelClosedByBroker(405, f"RESOURCE_LOCKED - cannot obtain exclusive access to locked queue "
+                                                 f"'{name}'")
+            if queue is None:
+                if passive:
+                    raise _not_found(f"no queue '{name}'")
+                queue = self._queues[name] = _Queue(name, durable, dict(arguments or {}),
+                                                    connection if exclusive else None)
+            elif not passive and (queue.durable != durable or queue.arguments != dict(arguments or {})):
+                raise ChannelClosedByBroker(406, f"PRECONDITION_FAILED - inequivalent arg 'durable' or arguments for "
+                                                 f"queue '{name}'")
+            return queue
+
+    def _delete_queue(self, name: str) -> int:
+        with self._lock:
+            queue = self._queues.pop(name, None)
+            if queue is None:
+                return 0
+            for exchange in self._exchanges.values():
+                exchange.bindings = [(bound, key) for bound, key in exchange.bindings if bound is not queue]
+            for consumer in list(queue.consumers):
+                consumer.channel._forget_consumer(consumer)
+            return len(queue.messages)
+
+    def _declare_exchange(self, name: str, kind: str, passive: bool) -> None:
+        with self._lock:
+            exchange = self._exchanges.get(name)
+            if exchange is None:
+                if passive:
+                    raise _not_found(f"no exchange '{name}'")
+                if kind not in EXCHANGE_TYPES:
+                    raise ValueError(f"exchange_type must be one of {EXCHANGE_TYPES}.")
+                self._exchanges[name] = _Exchange(name, kind)
+            elif not passive and exchange.kind != kind:
+                raise ChannelClosedByBroker(406, f"PRECONDITION_FAILED - inequivalent arg 'type' for exchange "
+                                                 f"'{name}': received '{kind}' but current is '{exchange.kind}'")
+
+    def _bind(self, queue: str, exchange: str, routing_key: str) -> None:
+        with self._lock:
+            if exchange not in self._exchanges:
+                raise _not_found(f"no exchange '{exchange}'")
+            if queue not in self._queues:
+                raise _not_found(f"no queue '{queue}'")
+            binding = (self._queues[queue], routing_key)
+            if binding not in self._exchanges[exchange].bindings:
+                self._exchanges[exchange].bindings.append(binding)
+
+    def _unbind(self, queue: str, exchange: str, routing_key: str) -> None:
+        with self._lock:
+            if exchange in self._exchanges and queue in self._queues:
+                bindings = self._exchanges[exchange].bindings
+                if (self._queues[queue], routing_key) in bindings:
+                    bindings.remove((self._queues[queue], routing_key))
+
+    def _route(self, exchange: str, routing_key: str, properties: BasicProperties, body: bytes) -> int:
+        """Routes a published message to its queues and returns the number of queues it reached."""
+        with self._lock:
+            if exchange == '':
+                queues = [self._queues[routing_key]] if routing_key in self._queues else []
+            elif exchange in self._exchanges:
+                queues = self._exchanges[exchange].route(routing_key)
+            else:
+                raise _not_found(f"no exchange '{exchange}'")
+            for queue in queues:
+                queue.put(_Message(exchange, routing_key, properties, body))
+                self._dispatch(queue)
+            return len(queues)
+
+    def _requeue(self, queue: '_Queue', messages: list['_Message']) -> None:
+        """
+        Puts messages back at the head of their queue (of their priority, in a priority queue), in their original
+        order, marked as redelivered.
+        """
+        with self._lock:
+            if self._queues.get(queue.name) is not queue:
+                return  # The queue was deleted in the meantime.
+            for message in reversed(messages):
+                message.redelivered = True
+                queue.put(message, front=True)
+            self._dispatch(queue)
+
+    def _dispatch(self, queue: '_Queue') -> None:
+        """
+        Hands ready messages to consumers with free prefetch capacity, round-robin, or only to the oldest consumer of
+        a queue with a single active consumer.
+        """
+        with self._lock:
+            if queue.arguments.get('x-single-active-consumer'):
+                while queue.messages and queue.consumers and queue.consumers[0].has_capacity():
+                    queue.consumers[0].channel._deliver(queue.consumers[0], queue.messages.popleft())
+                return
+            while queue.messages and queue.consumers:
+                for _ in range(len(queue.consumers)):
+                    consumer = queue.consumers[0]
+                    queue.consumers.rotate(-1)
+                    if consumer.has_capacity():
+                        break
+                else:
+                    return  # Every consumer is at its prefetch limit.
+                consumer.channel._deliver(consumer, queue.messages.popleft())
+
+    def _disconnected(self, connection: '_InMemoryConnection') -> None:
+        with self._lock:
+            self._connections.discard(connection)
+            for queue in [queue for queue in self._queues.values() if queue.owner is connection]:
+                self._delete_queue(queue.name)  # Exclusive queues go away with their connection.
+
+
+class _InMemoryConnectionManager(ConnectionManager):
+    """Hands out connections to an :class:`InMemoryBroker` instead of opening TCP connections."""
+
+    def __init__(self, broker: InMemoryBroker):
+        super().__init__(pika.ConnectionParameters(host='in-memory'))
+        self.broker = broker
+
+    def _open(self) -> '_InMemoryConnection':
+        return self.broker.connect()
+
+
+class _Message:
+    __slots__ = ('exchange', 'routing_key', 'properties', 'body', 'redelivered')
+
+    def __init__(self, exchange: str, routing_key: str, properties: BasicProperties, body: bytes):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.properties = properties if properties is not None else BasicProperties()
+        self.body = body
+        self.redelivered = False
+
+
+class _Queue:
+    def __init__(self, name: str, durable: bool, arguments: dict, owner: '_InMemoryConnection | None' = None):
+        self.name = name
+        self.durable = durable
+        self.arguments = arguments
+        self.owner = owner  # The connection of an exclusive queue.
+        self.messages: deque[_Message] = deque()
+        self.consumers: deque[_Consumer] = deque()
+        self.max_priority: int = arguments.get('x-max-priority') or 0
+
+    def put(self, message: _Message, front: bool = False) -> None:
+        """
+        Adds a message at the tail of the queue, or at its head if `front` is set. In a priority queue, messages of
+        higher priority stay ahead: the message goes to the tail or head of the messages of its own priority.
+        """
+        if not self.max_priority:
+            self.messages.appendleft(message) if front else self.messages.append(message)
+            return
+        priority = self.priority(message)
+        if front:
+            index = next((index for index, queued in enumerate(self.messages) if self.priority(queued) <= priority),
+                         len(self.messages))
+        else:
+            index = next((index for index, queued in enumerate(reversed(self.messages))
+                          if self.priority(queued) >= priority), len(self.messages))
+            index = len(self.messages) - index
+        self.messages.insert(index, message)
+
+    def priority(self, message: _Message) -> int:
+        """The priority a message has in this queue; priorities above the maximum count as the maximum."""
+        return min(message.properties.priority or 0, self.max_priority)
+
+
+class _Exchange:
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self.kind = kind
+        self.bindings: list[tuple[_Queue, str]] = []
+
+    def route(self, routing_key: str) -> list[_Queue]:
+        queues = []
+        for queue, key in self.bindings:
+            if queue in queues:
+                continue
+            if self.kind == 'fanout' or (self.kind == 'direct' and key == routing_key) or \
+                    (self.kind == 'topic' and _topic_matches(key, routing_key)):
+                queues.append(queue)
+        return queues
+
+
+def _topic_matches(pattern: str, routing_key: str) -> bool:
+    """Matches a routing key against a topic binding, where ``*`` stands for one word and ``#`` for zero or more."""
+
+    def matches(words: list[str], keys: list[str]) -> bool:
+        if not words:
+            return not keys
+        if words[0] == '#':
+            return any(matches(words[1:], keys[index:]) for index in range(len(keys) + 1))
+        return bool(keys) and words[0] in ('*', keys[0]) and matches(words[1:], keys[1:])
+
+    return matches(pattern.split('.'), routing_key.split('.'))
+
+
+class _Consumer:
+    def __init__(self, tag: str, channel: '_InMemoryChannel', queue: _Queue, callback: callable, auto_ack: bool,
+                 prefetch_count: int):
+        self.tag = tag
+        self.channel = channel
+        self.queue = queue
+        self.callback = callback
+        self.auto_ack = auto_ack
+        self.prefetch_count = prefetch_count
+        self.unacked = 0
+        self.active = True
+
+    def has_capacity(self) -> bool:
+        return self.auto_ack or not self.prefetch_count or self.unacked < self.prefetch_count
+
+
+class _InMemoryConnection(EventLoopConnection):
+    """The stand-in for ``pika.BlockingConnection``. Use it only from the thread that opened it."""
+
+    def __init__(self, broker: InMemoryBroker):
+        super().__init__()
+        self._broker = broker
+        self._channels: list[_InMemoryChannel] = []
+        self._channel_numbers = itertools.count(1)
+
+    def channel(self, channel_number: int | None = None) -> '_InMemoryChannel':
+        self._check_open()
+        channel = _InMemoryChannel(self, channel_number or next(self._channel_numbers))
+        self._channels.append(channel)
+        return channel
+
+    def close(self, reply_code: int = 200, reply_text: str = 'Normal shutdown') -> None:
+        if not self.is_open:
+            raise ConnectionWrongStateError('Connection is already closed.')
+        for channel in list(self._channels):
+            if channel.is_open:
+                channel.close()
+        self._shut_down()
+        self._broker._disconnected(self)
+
+
+class _InMemoryChannel:
+    """The stand-in for ``pika.adapters.blocking_connection.BlockingChannel``."""
+
+    def __init__(self, connection: _InMemoryConnection, channel_number: int):
+        self.connection = connection
+        self.channel_number = channel_number
+        self.is_open = True
+        self._broker = connection._broker
+        self._consumers: dict[str, _Consumer] = {}
+        # delivery tag -> (consumer or None for basic_get, queue, message)
+        self._unacked: OrderedDict[int, tuple[_Consumer | None, _Queue, _Message]] = OrderedDict()
+        self._delivery_tags = itertools.count(1)
+        self._prefetch_count = 0
+        self._confirm_callback: callable | None = None
+        self._publish_tags = itertools.count(1)
+        self._impl = self  # The producer enables pipelined confirms on the channel implementation.
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    @property
+    def consumer_tags(self) -> list[str]:
+        return list(self._consumers)
+
+    def close(self, reply_code: int = 0, reply_text: str = 'Normal shutdown') -> None:
+        if not self.is_open:
+            raise ChannelWrongStateError('Channel is already closed.')
+        self._close()
+
+    def queue_declare(self, queue: str, passive: bool = False, durable: bool = False, exclusive: bool = False,
+                      auto_delete: bool = False, arguments: dict | None = None) -> pika.frame.Method:
+        declared = self._call(self._broker._declare_queue, queue, passive, durable, arguments, self.connection,
+                              exclusive)
+        with self._broker._lock:
+            return pika.frame.Method(self.channel_number, pika.spec.Queue.DeclareOk(
+                declared.name, len(declared.messages), len(declared.consumers)))
+
+    def queue_delete(self, queue: str, if_unused: bool = False, if_empty: bool = False) -> pika.frame.Method:
+        count = self._call(self._broker._delete_queue, queue)
+        return pika.frame.Method(self.channel_number, pika.spec.Queue.DeleteOk(count))
+
+    def queue_purge(self, queue: str) -> pika.frame.Method:
+        queue = self._call(self._broker._declare_queue, queue, True, False, None, self.connection)
+        with self._broker._lock:
+            count = len(queue.messages)
+            queue.messages.clear()
+        return pika.frame.Method(self.channel_number, pika.spec.Queue.PurgeOk(count))
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: str | None = None,
+                   arguments: dict | None = None) -> pika.frame.Method:
+        self._call(self._broker._bind, queue, exchange, routing_key if routing_key is not None else queue)
+        return pika.frame.Method(self.channel_number, pika.spec.Queue.BindOk())
+
+    def queue_unbind(self, queue: str, exchange: str | None = None, routing_key: str | None = None,
+                     arguments: dict | None = None) -> pika.frame.Method:
+        self._call(self._broker._unbind, queue, exchange, routing_key if routing_key is not None else queue)
+        return pika.frame.Method(self.channel_number, pika.spec.Queue.UnbindOk())
+
+    def exchange_declare(self, exchange: str, exchange_type: Any = 'direct', passive: bool = False,
+                         durable: bool = False, auto_delete: bool = False, internal: bool = False,
+                         arguments: dict | None = None) -> pika.frame.Method:
+        self._call(self._broker._declare_exchange, exchange, getattr(exchange_type, 'value', exchange_type), passive)
+        return pika.frame.Method(self.channel_number, pika.spec.Exchange.DeclareOk())
+
+    def basic_qos(self, prefetch_size: int = 0, prefetch_count: int = 0, global_qos: bool = False) -> None:
+        """Sets the prefetch count of consumers started afterwards, like RabbitMQ does without `global_qos`."""
+        self._check_open()
+        self._prefetch_count = prefetch_count
+
+    def confirm_delivery(self, ack_nack_callback: callable = None, callback: callable = None) -> None:
+        """
+        Puts the channel into confirm mode. With `ack_nack_callback` (pika's asynchronous channel API) every publish
+        is confirmed through it the next time the connection processes I/O; without, publishes are confirmed
+        before ``basic_publish`` returns, like on a ``BlockingChannel``.
+        """
+        self._check_open()
+        self._confirm_callback = ack_nack_callback or (lambda frame: None)
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes, properties: BasicProperties = None,
+                      mandatory: bool = False) -> None:
+        self._check_open()
+        if not isinstance(body, bytes):
+            raise TypeError("body must be bytes.")
+        self._call(self._broker._route, exchange, routing_key, properties, body)
+        if self._confirm_callback is not None:
+            frame = pika.frame.Method(self.channel_number, Basic.Ack(delivery_tag=next(self._publish_tags)))
+            self.connection._post(self._confirm_callback, frame)
+
+    def basic_consume(self, queue: str, on_message_callback: callable, auto_ack: bool = False,
+                      exclusive: bool = False, consumer_tag: str | None = None,
+                      arguments: dict | None = None) -> str:
+        self._check_open()
+        consumer_tag = consumer_tag or f'ctag{self.channel_number}.{uuid.uuid4().hex}'
+        with self._broker._lock:
+            declared = self._call(self._broker._declare_queue, queue, True, False, None, self.connection)
+            consumer = _Consumer(consumer_tag, self, declared, on_message_callback, auto_ack, self._prefetch_count)
+            self._consumers[consumer_tag] = consumer
+            declared.consumers.append(consumer)
+            self._broker._dispatch(declared)
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag: str) -> list:
+        """
+        Cancels a consumer. Messages already sent to it but not yet handed to its callback go back to the queue;
+        delivered but unacknowledged ones stay with the channel until they are settled or the channel closes.
+        """
+        with self._broker._lock:
+            consumer = self._consumers.get(consumer_tag)
+            if consumer is not None:
+                self._forget_consumer(consumer)
+                self._broker._dispatch(consumer.queue)  # E.g. to the next single active consumer.
+        return []
+
+    def basic_get(self, queue: str, auto_ack: bool = False) -> tuple:
+        self._check_open()
+        with self._broker._lock:
+            declared = self._call(self._broker._declare_queue, queue, True, False, None, self.connection)
+            if not declared.messages:
+                return None, None, None
+            message = declared.messages.popleft()
+            tag = next(self._delivery_tags)
+            if not auto_ack:
+                self._unacked[tag] = (None, declared, message)
+            method = Basic.GetOk(tag, message.redelivered, message.exchange, message.routing_key,
+                                 len(declared.messages))
+        return method, message.properties, message.body
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False) -> None:
+        self._settle(delivery_tag, multiple, None)
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True) -> None:
+        self._settle(delivery_tag, multiple, requeue)
+
+    def basic_reject(self, delivery_tag: int = 0, requeue: bool = True) -> None:
+        self._settle(delivery_tag, False, requeue)
+
+    def start_consuming(self) -> None:
+        """Processes I/O until every consumer of this channel is cancelled, e.g. by :meth:`stop_consuming`."""
+        while self._consumers and self.is_open and self.connection.is_open:
+            self.connection.process_data_events(time_limit=None)
+
+    def stop_consuming(self, consumer_tag: str | None = None) -> None:
+        """Cancels the given consumer, or all consumers of this channel, so that :meth:`start_consuming` returns."""
+        for tag in [consumer_tag] if consumer_tag else list(self._consumers):
+            self.basic_cancel(tag)
+
+    def _deliver(self, consumer: _Consumer, message: _Message) -> None:
+        """Called by the broker (holding its lock) to send a message to one of this channel's consumers."""
+        tag = next(self._delivery_tags)
+        if not consumer.auto_ack:
+            consumer.unacked += 1
+            self._unacked[tag] = (consumer, consumer.queue, message)
+        method = Basic.Deliver(consumer.tag, tag, message.redelivered, message.exchange, message.routing_key)
+        self.connection._post(self._on_delivery, consumer, method, message)
+
+    def _on_delivery(self, consumer: _Consumer, method: Basic.Deliver, message: _Message) -> None:
+        if not consumer.active or not self.is_open:
+            # Cancelled before the message reached the callback: it goes back to the queue instead of being lost.
+            with self._broker._lock:
+                if not consumer.auto_ack:
+                    if self._unacked.pop(method.delivery_tag, None) is None:
+                        return  # Already requeued when the channel closed.
+                    consumer.unacked -= 1
+                self._broker._requeue(consumer.queue, [message])
+            return
+        consumer.callback(self, method, message.properties, message.body)
+
+    def _settle(self, delivery_tag: int, multiple: bool, requeue: bool | None) -> None:
+        """Acks (`requeue` None) or nacks/rejects the given delivery, or all up to it if `multiple`."""
+        self._check_open()
+        with self._broker._lock:
+            if multiple:
+                tags = [tag for tag in self._unacked if tag <= delivery_tag or delivery_tag == 0]
+            elif delivery_tag in self._unacked:
+                tags = [delivery_tag]
+            else:
+                self._close_by_broker(406, f"PRECONDITION_FAILED - unknown delivery tag {delivery_tag}")
+            requeued: dict[_Queue, list[_Message]] = {}
+            queues = set()
+            for tag in tags:
+                consumer, queue, message = self._unacked.pop(tag)
+                if consumer is not None:
+                    consumer.unacked -= 1
+                queues.add(queue)
+                if requeue:
+                    requeued.setdefault(queue, []).append(message)
+            for queue, messages in requeued.items():
+                self._broker._requeue(queue, messages)
+            for queue in queues:
+                self._broker._dispatch(queue)
+
+    def _forget_consumer(self, consumer: _Consumer) -> None:
+        """Removes a consumer from its queue, e.g. when it is cancelled or its queue is deleted."""
+        consumer.active = False
+        self._consumers.pop(consumer.tag, None)
+        if consumer in consumer.queue.consumers:
+            consumer.queue.consumers.remove(consumer)
+
+    def _close(self) -> None:
+        """Closes the channel and requeues its unacknowledged messages, like RabbitMQ does."""
+        self.is_open = False
+        with self._broker._lock:
+            for consumer in list(self._consumers.values()):
+                self._forget_consumer(consumer)
+            requeued: dict[_Queue, list[_Message]] = {}
+            for consumer, queue, message in self._unacked.values():
+                requeued.setdefault(queue, []).append(message)
+            self._unacked.clear()
+            for queue, messages in requeued.items():
+                self._broker._requeue(queue, messages)
+
+    def _close_by_broker(self, reply_code: int, reply_text: str):
+        self._close()
+        raise ChannelClosedByBroker(reply_code, reply_text)
+
+    def _call(self, operation: callable, *args):
+        """Runs a broker operation; errors the broker answers with close the channel, like on RabbitMQ."""
+        self._check_open()
+        try:
+            return operation(*args)
+        except ChannelClosedByBroker:
+            self._close()
+            raise
+
+    def _check_open(self) -> None:
+        if not self.is_open:
+            raise ChannelWrongStateError('Channel is closed.')
+        self.connection._check_open()
+
+
+def _not_found(text: str) -> ChannelClosedByBroker:
+    return ChannelClosedByBroker(404, f"NOT_FOUND - {text}")
@@ -0,0 +1,592 @@
+import argparse
+import functools
+import itertools
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import threading
+import uuid
+from typing import Any, BinaryIO
+
+import pika
+from pika.exceptions import AMQPConnectionError, ChannelClosedByBroker, ChannelWrongStateError, \
+    ConnectionWrongStateError, StreamLostError
+from pika.spec import Basic, BasicProperties
+
+from services.shared_libs.RabbitMQ.ConnectionManager import ConnectionManager
+from services.shared_libs.RabbitMQ.InMemoryBroker import InMemoryBroker
+from services.shared_libs.RabbitMQ.const import RMQ_IPC_PATH
+from services.shared_libs.RabbitMQ.eventloop import EventLoopConnection
+from services.shared_libs.logging_config import setup_logging
+
+# Every frame is three lengths followed by a JSON header, the AMQP-encoded properties (empty if there are none) and
+# the body. Properties use pika's own wire encoding, so headers of every AMQP type survive the round trip.
+_FRAME = struct.Struct('>III')
+
+# Channel methods a client may call on the server, with the names of their arguments.
+_CHANNEL_METHODS = {
+    'queue_declare': ('queue', 'passive', 'durable', 'exclusive', 'auto_delete', 'arguments'),
+    'queue_delete': ('queue', 'if_unused', 'if_empty'),
+    'queue_purge': ('queue',),
+    'queue_bind': ('queue', 'exchange', 'routing_key', 'arguments'),
+    'queue_unbind': ('queue', 'exchange', 'routing_key', 'arguments'),
+    'exchange_declare': ('exchange', 'exchange_type', 'passive', 'durable', 'auto_delete', 'internal', 'arguments'),
+    'basic_qos': ('prefetch_size', 'prefetch_count', 'global_qos'),
+    'basic_cancel': ('consumer_tag',),
+    'basic_get': ('queue', 'auto_ack'),
+    'basic_ack': ('delivery_tag', 'multiple'),
+    'basic_nack': ('delivery_tag', 'multiple', 'requeue'),
+    'basic_reject': ('delivery_tag', 'requeue'),
+}
+
+_ERRORS = {'ValueError': ValueError, 'TypeError': TypeError}
+
+
+class IpcBroker:
+    """
+    Serves an :class:`InMemoryBroker` to the services of other processes on the same host over a Unix domain socket.
+
+    Co-located services skip AMQP and TCP: every operation is one length-prefixed frame on a local socket, and the
+    broker itself is the in-memory one. Clients select it with ``RMQ_TRANSPORT=ipc`` (see
+    :mod:`~services.shared_libs.RabbitMQ.transports`) and need no code changes. Like the in-memory broker, nothing
+    is persisted, so messages are lost if the broker process stops.
+
+    The socket is only accessible to the user running the broker.
+
+    Example:
+        python -m services.shared_libs.RabbitMQ.IpcBroker --path /tmp/rmq.sock
+        RMQ_TRANSPORT=ipc RMQ_IPC_PATH=/tmp/rmq.sock python -m services.brain.echo.app
+    """
+
+    def __init__(self, path: str = RMQ_IPC_PATH, broker: InMemoryBroker | None = None):
+        """
+        :param path: The path of the Unix domain socket to listen on.
+        :param broker: The broker to serve. None creates a new one.
+        """
+        if not isinstance(path, str) or not path:
+            raise TypeError("path must be a non-empty string.")
+        if broker is not None and not isinstance(broker, InMemoryBroker):
+            raise TypeError("broker must be an InMemoryBroker or None.")
+
+        self.logger = setup_logging(service_name=self.__class__.__name__)
+        self.path = path
+        self.broker = broker if broker is not None else InMemoryBroker()
+        self._server: socket.socket | None = None
+        self._sessions: set[_IpcSession] = set()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Starts listening and accepting clients on a background thread."""
+        if os.path.exists(self.path):
+            if not stat.S_ISSOCK(os.stat(self.path).st_mode):
+                raise ValueError(f"{self.path} exists and is not a socket.")
+            os.unlink(self.path)  # Left behind by a broker that did not shut down cleanly.
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        os.chmod(self.path, 0o600)
+        server.listen()
+        self._server = server
+        threading.Thread(target=self._accept, name='ipc-broker', daemon=True).start()
+        self.logger.info("IPC broker listening on %s", self.path)
+
+    def stop(self) -> None:
+        """Stops accepting clients, disconnects the connected ones and removes the socket."""
+        if self._server is None:
+            return
+        self._server.close()
+        self._server = None
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            session.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.logger.info("IPC broker stopped.")
+
+    def serve_forever(self) -> None:
+        """Starts the broker and blocks until the process is interrupted."""
+        self.start()
+        try:
+            threading.Event().wait()
+        finally:
+            self.stop()
+
+    def connection_manager(self) -> ConnectionManager:
+        """Returns a connection manager for this broker's socket, e.g. for clients in the same process."""
+        return IpcConnectionManager(self.path)
+
+    def _accept(self) -> None:
+        server = self._server
+        while True:
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return  # Stopped.
+            session = _IpcSession(self, client)
+            with self._lock:
+                self._sessions.add(session)
+            session.start()
+
+    def _session_closed(self, session: '_IpcSession') -> None:
+        with self._lock:
+            self._sessions.discard(session)
+
+
+class IpcConnectionManager(ConnectionManager):
+    """Opens connections to an :class:`IpcBroker` instead of a RabbitMQ server."""
+
+    def __init__(self, path: str = RMQ_IPC_PATH):
+        """
+        :param path: The path of the broker's Unix domain socket.
+        """
+        super().__init__(pika.ConnectionParameters(host=path))
+        self.path = path
+
+    def _open(self) -> '_IpcConnection':
+        return _IpcConnection(self.path)
+
+
+def _write_frame(sock: socket.socket, header: dict, properties: BasicProperties | None = None,
+                 body: bytes = b'') -> None:
+    encoded_header = json.dumps(header, separators=(',', ':')).encode()
+    encoded_properties = b''.join(properties.encode()) if properties is not None else b''
+    sock.sendall(b''.join((_FRAME.pack(len(encoded_header), len(encoded_properties), len(body)),
+                           encoded_header, encoded_properties, body)))
+
+
+def _read_frame(reader: BinaryIO) -> tuple[dict, BasicProperties | None, bytes] | None:
+    """Reads one frame, or returns None once the peer closed the socket."""
+    lengths = reader.read(_FRAME.size)
+    if len(lengths) < _FRAME.size:
+        return None
+    header_length, properties_length, body_length = _FRAME.unpack(lengths)
+    header = json.loads(reader.read(header_length))
+    properties = None
+    if properties_length:
+        properties = BasicProperties()
+        properties.decode(reader.read(properties_length))
+    body = reader.read(body_length)
+    if len(body) < body_length:
+        return None
+    return header, properties, body
+
+
+class _IpcSession:
+    """
+    Serves one client. Its requests run on a thread of its own, which owns the client's in-memory connection, so
+    every client behaves like a separate connection to the broker.
+    """
+
+    def __init__(self, server: IpcBroker, sock: socket.socket):
+        self._server = server
+        self._socket = sock
+        self._reader = sock.makefile('rb')
+        self._write_lock = threading.Lock()
+        self._connection = server.broker.connect()
+        self._channels = {}
+        self._connection.add_on_connection_blocked_callback(
+            lambda connection, frame: self._send({'event': 'blocked', 'reason': frame.method.reason}))
+        self._connection.add_on_connection_unblocked_callback(
+            lambda connection, frame: self._send({'event': 'unblocked'}))
+
+    def start(self) -> None:
+        threading.Thread(target=self._serve, name='ipc-session', daemon=True).start()
+        threading.Thread(target=self._read, name='ipc-session-reader', daemon=True).start()
+
+    def close(self) -> None:
+        """Disconnects the client. Its unacknowledged messages are requeued. May be called from any thread."""
+        try:
+            self._connection.add_callback_threadsafe(self._close)
+        except ConnectionWrongStateError:
+            pass  # Already closed.
+
+    def _serve(self) -> None:
+        while self._connection.is_open:
+            self._connection.process_data_events(time_limit=None)
+
+    def _read(self) -> None:
+        try:
+            while (frame := _read_frame(self._reader)) is not None:
+                self._connection.add_callback_threadsafe(functools.partial(self._handle, *frame))
+        except (OSError, ValueError, ConnectionWrongStateError):
+            pass  # The client went away or the session was closed.
+        self.close()
+
+    def _close(self) -> None:
+        if self._connection.is_open:
+            self._connection.close()
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+        self._server._session_closed(self)
+
+    def _send(self, header: dict, properties: BasicProperties | None = None, body: bytes = b'') -> None:
+        try:
+            with self._write_lock:
+                _write_frame(self._socket, header, properties, body)
+        except OSError:
+            self.close()
+
+    def _handle(self, header: dict, properties: BasicProperties | None, body: bytes) -> None:
+        request = header.get('id')
+        try:
+            result, result_properties, result_body = self._execute(header, properties, body)
+        except ChannelClosedByBroker as e:
+            self._channels.pop(header.get('channel'), None)
+            error = {'channel': header.get('channel'), 'code': e.reply_code, 'text': e.reply_text}
+            self._send({'reply': request, 'error': 'channel', **error} if request is not None else
+                       {'event': 'channel_closed', **error})
+            return
+        except Exception as e:
+            if request is not None:
+                self._send({'reply': request, 'error': type(e).__name__, 'text': str(e)})
+            else:
+                self._server.logger.error("IPC request %s failed: %s", header.get('op'), e)
+            return
+        if request is not None:
+            self._send({'reply': request, 'result': result}, result_properties, result_body)
+
+    def _execute(self, header: dict, properties: BasicProperties | None,
+                 body: bytes) -> tuple[Any, BasicProperties | None, bytes]:
+        operation, number, args = header['op'], header.get('channel'), header.get('args', {})
+        if operation == 'channel.open':
+            self._channels[number] = self._connection.channel(number)
+            return None, None, b''
+        channel = self._channels.get(number)
+        if channel is None:
+            raise ChannelClosedByBroker(504, f"CHANNEL_ERROR - channel {number} is not open")
+
+        if operation == 'channel.close':
+            del self._channels[number]
+            if channel.is_open:
+                channel.close()
+        elif operation == 'basic_publish':
+            channel.basic_publish(args['exchange'], args['routing_key'], body, properties)
+        elif operation == 'basic_consume':
+            return channel.basic_consume(args['queue'], functools.partial(self._deliver, number),
+                                         auto_ack=args['auto_ack'], consumer_tag=args['consumer_tag'],
+                                         arguments=args.get('arguments')), None, b''
+        elif operation == 'confirm_delivery':
+            channel.confirm_delivery(ack_nack_callback=functools.partial(self._confirm, number))
+        elif operation == 'queue_declare':
+            method = channel.queue_declare(**args).method
+            return {'queue': method.queue, 'message_count': method.message_count,
+                    'consumer_count': method.consumer_count}, None, b''
+        elif operation in ('queue_delete', 'queue_purge'):
+            return getattr(channel, operation)(**args).method.message_count, None, b''
+        elif operation == 'basic_get':
+            method, message_properties, message_body = channel.basic_get(**args)
+            if method is None:
+                return None, None, b''
+            return {'delivery_tag': method.delivery_tag, 'redelivered': method.redelivered,
+                    'exchange': method.exchange, 'routing_key': method.routing_key,
+                    'message_count': method.message_count}, message_properties, message_body
+        elif operation in _CHANNEL_METHODS:
+            getattr(channel, operation)(**{name: args[name] for name in _CHANNEL_METHODS[operation] if name in args})
+        else:
+            raise ValueError(f"Unknown operation '{operation}'.")
+        return None, None, b''
+
+    def _deliver(self, number: int, channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+        self._send({'event': 'deliver', 'channel': number, 'consumer_tag': method.consumer_tag,
+                    'delivery_tag': method.delivery_tag, 'redelivered': method.redelivered,
+                    'exchange': method.exchange, 'routing_key': method.routing_key}, properties, body)
+
+    def _confirm(self, number: int, frame: pika.frame.Method) -> None:
+        self._send({'event': 'confirm', 'channel': number, 'delivery_tag': frame.method.delivery_tag,
+                    'multiple': frame.method.multiple, 'ack': isinstance(frame.method, Basic.Ack)})
+
+
+class _IpcConnection(EventLoopConnection):
+    """The stand-in for ``pika.BlockingConnection`` that talks to an :class:`IpcBroker`."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError as e:
+            sock.close()
+            raise AMQPConnectionError(f"Cannot connect to the IPC broker at {path}: {e}") from e
+        self._socket = sock
+        self._reader = sock.makefile('rb')
+        self._write_lock = threading.Lock()
+        self._replies: dict[int, tuple[dict, BasicProperties | None, bytes]] = {}
+        self._request_ids = itertools.count(1)
+        self._lost: Exception | None = None
+        self._channels: dict[int, _IpcChannel] = {}
+        self._channel_numbers = itertools.count(1)
+        threading.Thread(target=self._read, name='ipc-reader', daemon=True).start()
+
+    def channel(self, channel_number: int | None = None) -> '_IpcChannel':
+        self._check_open()
+        channel = _IpcChannel(self, channel_number or next(self._channel_numbers))
+        self._channels[channel.channel_number] = channel
+        self._request(channel.channel_number, 'channel.open')
+        return channel
+
+    def close(self, reply_code: int = 200, reply_text: str = 'Normal shutdown') -> None:
+        if not self.is_open:
+            raise ConnectionWrongStateError('Connection is already closed.')
+        self._shut_down()
+        for channel in self._channels.values():
+            channel.is_open = False
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+
+    def _send(self, header: dict, properties: BasicProperties | None = None, body: bytes = b'') -> None:
+        self._check_open()
+        try:
+            with self._write_lock:
+                _write_frame(self._socket, header, properties, body)
+        except OSError as e:
+            self._lose(e)
+            raise StreamLostError(f"Lost the connection to the IPC broker: {e}") from e
+
+    def _request(self, channel: int, operation: str, properties: BasicProperties | None = None, body: bytes = b'',
+                 **args) -> tuple[Any, BasicProperties | None, bytes]:
+        """Sends a request and waits for the broker's reply, like a synchronous AMQP method."""
+        request = next(self._request_ids)
+        self._send({'id': request, 'op': operation, 'channel': channel, 'args': args}, properties, body)
+        with self._condition:
+            while request not in self._replies and self._lost is None and self.is_open:
+                self._condition.wait()
+            reply = self._replies.pop(request, None)
+        if reply is None:
+            self._check_open()
+            raise ConnectionWrongStateError('Connection closed while waiting for the IPC broker.')
+
+        header, reply_properties, reply_body = reply
+        error = header.get('error')
+        if error == 'channel':
+            raise ChannelClosedByBroker(header['code'], header['text'])
+        if error is not None:
+            raise _ERRORS.get(error, RuntimeError)(header['text'])
+        return header['result'], reply_properties, reply_body
+
+    def _read(self) -> None:
+        try:
+            while (frame := _read_frame(self._reader)) is not None:
+                header = frame[0]
+                if 'reply' in header:
+                    with self._condition:
+                        self._replies[header['reply']] = frame
+                        self._condition.notify_all()
+                else:
+                    self._post(self._on_event, *frame)
+        except (OSError, ValueError):
+            pass
+        if self.is_open:
+            self._lose(ConnectionResetError("The IPC broker closed the connection."))
+
+    def _lose(self, error: Exception) -> None:
+        self._lost = error
+        for channel in self._channels.values():
+            channel.is_open = False
+        self._shut_down()
+
+    def _on_event(self, header: dict, properties: BasicProperties | None, body: bytes) -> None:
+        event = header['event']
+        if event == 'blocked':
+            self._notify_blocked(header['reason'])
+        elif event == 'unblocked':
+            self._notify_unblocked()
+        elif (channel := self._channels.get(header['channel'])) is not None:
+            if event == 'deliver':
+                channel._on_deliver(header, properties, body)
+            elif event == 'confirm':
+                channel._on_confirm(header)
+            elif event == 'channel_closed':
+                channel._on_closed_by_broker(header['code'], header['text'])
+
+    def _check_lost(self) -> None:
+        if self._lost is not None:
+            raise StreamLostError(f"Lost the connection to the IPC broker: {self._lost}")
+
+
+class _IpcChannel:
+    """The stand-in for ``pika.adapters.blocking_connection.BlockingChannel`` that talks to an :class:`IpcBroker`."""
+
+    def __init__(self, connection: _IpcConnection, channel_number: int):
+        self.connection = connection
+        self.channel_number = channel_number
+        self.is_open = True
+        self._consumers: dict[str, tuple[callable, bool]] = {}  # consumer tag -> (callback, auto_ack)
+        self._cancelled: dict[str, bool] = {}  # consumer tag -> auto_ack, for deliveries still on their way
+        self._confirm_callback: callable | None = None
+        self._confirming = False
+        self._impl = self  # The producer enables pipelined confirms on the channel implementation.
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    @property
+    def consumer_tags(self) -> list[str]:
+        return list(self._consumers)
+
+    def close(self, reply_code: int = 0, reply_text: str = 'Normal shutdown') -> None:
+        if not self.is_open:
+            raise ChannelWrongStateError('Channel is already closed.')
+        self.is_open = False
+        self._consumers.clear()
+        self.connection._request(self.channel_number, 'channel.close')
+
+    def queue_declare(self, queue: str, passive: bool = False, durable: bool = False, exclusive: bool = False,
+                      auto_delete: bool = False, arguments: dict | None = None) -> pika.frame.Method:
+        result = self._request('queue_declare', queue=queue, passive=passive, durable=durable, exclusive=exclusive,
+                               auto_delete=auto_delete, arguments=arguments)[0]
+        return pika.frame.Method(self.channel_number, pika.spec.Queue.DeclareOk(**result))
+
+    def queue_delete(self, queue: str, if_unused: bool = False, if_empty: bool = False) -> pika.frame.Method:
+        count = self._request('queue_delete', queue=queue, if_unused=if_unused, if_empty=if_empty)[0]
+        return pika.frame.Method(self.channel_number, pika.spec.Queue.DeleteOk(count))
+
+    def queue_purge(self, queue: str) -> pika.frame.Method:
+        count = self._request('queue_purge', queue=queue)[0]
+        return pika.frame.Method(self.channel_number, pika.spec.Queue.PurgeOk(count))
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: str | None = None,
+                   arguments: dict | None = None) -> pika.frame.Method:
+        self._request('queue_bind', queue=queue, exchange=exchange, routing_key=routing_key, arguments=arguments)
+        return pika.frame.Method(self.channel_number, pika.spec.Queue.BindOk())
+
+    def queue_unbind(self, queue: str, exchange: str | None = None, routing_key: str | None = None,
+                     arguments: dict | None = None) -> pika.frame.Method:
+        self._request('queue_unbind', queue=queue, exchange=exchange, routing_key=routing_key, arguments=arguments)
+        return pika.frame.Method(self.channel_number, pika.spec.Queue.UnbindOk())
+
+    def exchange_declare(self, exchange: str, exchange_type: Any = 'direct', passive: bool = False,
+                         durable: bool = False, auto_delete: bool = False, internal: bool = False,
+                         arguments: dict | None = None) -> pika.frame.Method:
+        self._request('exchange_declare', exchange=exchange,
+                      exchange_type=getattr(exchange_type, 'value', exchange_type), passive=passive, durable=durable,
+                      auto_delete=auto_delete, internal=internal, arguments=arguments)
+        return pika.frame.Method(self.channel_number, pika.spec.Exchange.DeclareOk())
+
+    def basic_qos(self, prefetch_size: int = 0, prefetch_count: int = 0, global_qos: bool = False) -> None:
+        self._request('basic_qos', prefetch_size=prefetch_size, prefetch_count=prefetch_count, global_qos=global_qos)
+
+    def confirm_delivery(self, ack_nack_callback: callable = None, callback: callable = None) -> None:
+        """
+        Puts the channel into confirm mode. With `ack_nack_callback` confirms are delivered through it like on
+        pika's asynchronous channel; without, every publish waits for the broker, like on a ``BlockingChannel``.
+        """
+        self._request('confirm_delivery')
+        self._confirm_callback = ack_nack_callback
+        self._confirming = True
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes, properties: BasicProperties = None,
+                      mandatory: bool = False) -> None:
+        self._check_open()
+        if not isinstance(body, bytes):
+            raise TypeError("body must be bytes.")
+        if self._confirming and self._confirm_callback is None:
+            self._request('basic_publish', properties, body, exchange=exchange, routing_key=routing_key)
+        else:
+            # Errors (e.g. an unknown exchange) close the channel asynchronously, like on RabbitMQ.
+            self.connection._send({'op': 'basic_publish', 'channel': self.channel_number,
+                                   'args': {'exchange': exchange, 'routing_key': routing_key}}, properties, body)
+
+    def basic_consume(self, queue: str, on_message_callback: callable, auto_ack: bool = False,
+                      exclusive: bool = False, consumer_tag: str | None = None,
+                      arguments: dict | None = None) -> str:
+        consumer_tag = consumer_tag or f'ctag{self.channel_number}.{uuid.uuid4().hex}'
+        self._request('basic_consume', queue=queue, auto_ack=auto_ack, consumer_tag=consumer_tag,
+                      arguments=arguments)
+        self._consumers[consumer_tag] = (on_message_callback, auto_ack)
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag: str) -> list:
+        consumer = self._consumers.pop(consumer_tag, None)
+        if consumer is not None:
+            self._cancelled[consumer_tag] = consumer[1]
+            self._request('basic_cancel', consumer_tag=consumer_tag)
+        return []
+
+    def basic_get(self, queue: str, auto_ack: bool = False) -> tuple:
+        result, properties, body = self._request('basic_get', queue=queue, auto_ack=auto_ack)
+        if result is None:
+            return None, None, None
+        return Basic.GetOk(**result), properties, body
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False) -> None:
+        self._notify('basic_ack', delivery_tag=delivery_tag, multiple=multiple)
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True) -> None:
+        self._notify('basic_nack', delivery_tag=delivery_tag, multiple=multiple, requeue=requeue)
+
+    def basic_reject(self, delivery_tag: int = 0, requeue: bool = True) -> None:
+        self._notify('basic_reject', delivery_tag=delivery_tag, requeue=requeue)
+
+    def start_consuming(self) -> None:
+        """Processes I/O until every consumer of this channel is cancelled, e.g. by :meth:`stop_consuming`."""
+        while self._consumers and self.is_open and self.connection.is_open:
+            self.connection.process_data_events(time_limit=None)
+
+    def stop_consuming(self, consumer_tag: str | None = None) -> None:
+        for tag in [consumer_tag] if consumer_tag else list(self._consumers):
+            self.basic_cancel(tag)
+
+    def _on_deliver(self, header: dict, properties: BasicProperties | None, body: bytes) -> None:
+        method = Basic.Deliver(header['consumer_tag'], header['delivery_tag'], header['redelivered'],
+                               header['exchange'], header['routing_key'])
+        consumer = self._consumers.get(method.consumer_tag)
+        if consumer is None:
+            if not self._cancelled.get(method.consumer_tag, True) and self.is_open:
+                self.basic_reject(delivery_tag=method.delivery_tag)  # Sent before the cancel arrived; requeue it.
+            return
+        consumer[0](self, method, properties if properties is not None else BasicProperties(), body)
+
+    def _on_confirm(self, header: dict) -> None:
+        if self._confirm_callback is None:
+            return
+        kind = Basic.Ack if header['ack'] else Basic.Nack
+        self._confirm_callback(pika.frame.Method(self.channel_number, kind(delivery_tag=header['delivery_tag'],
+                                                                           multiple=header['multiple'])))
+
+    def _on_closed_by_broker(self, reply_code: int, reply_text: str) -> None:
+        self.is_open = False
+        self._consumers.clear()
+        self.connection._channels.pop(self.channel_number, None)
+
+    def _notify(self, operation: str, **args) -> None:
+        """Sends a method the broker does not answer."""
+        self._check_open()
+        self.connection._send({'op': operation, 'channel': self.channel_number, 'args': args})
+
+    def _request(self, operation: str, properties: BasicProperties | None = None, body: bytes = b'', **args):
+        self._check_open()
+        try:
+            return self.connection._request(self.channel_number, operation, properties, body, **args)
+        except ChannelClosedByBroker:
+            self._on_closed_by_broker(0, '')
+            raise
+
+    def _check_open(self) -> None:
+        self.connection._check_open()
+        if not self.is_open:
+            raise ChannelWrongStateError('Channel is closed.')
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Runs an IPC broker until interrupted."""
+    parser = argparse.ArgumentParser(description="Serve an in-memory message broker over a Unix domain socket.")
+    parser.add_argument('--path', default=RMQ_IPC_PATH, help="The socket path. Defaults to RMQ_IPC_PATH.")
+    args = parser.parse_args(argv)
+    try:
+        IpcBroker(args.path).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
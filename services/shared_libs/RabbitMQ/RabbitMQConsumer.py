@@ -1,55 +1,296 @@
+import functools
+import pickle
+import time
+import uuid
 from abc import ABC, abstractmethod
-from typing import Optional
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Optional
 
 from pika.channel import Channel
-from pika.exceptions import AMQPChannelError, AMQPConnectionError
+from pika.exceptions import AMQPChannelError, AMQPConnectionError, ConnectionClosedByClient
 from pika.spec import Basic, BasicProperties
 
 from services.shared_libs.RabbitMQ.AbstractRabbitMQ import AbstractRabbitMQ
-from services.shared_libs.RabbitMQ.const import RMQ_HOST, RMQ_PORT
+from services.shared_libs.RabbitMQ.const import RMQ_ADAPTIVE_PREFETCH, RMQ_CONSUMER_PRIORITY, RMQ_HOST, RMQ_PORT, \
+    RMQ_PREFETCH_COUNT, RMQ_PREFETCH_SIZE, RMQ_TRACE_FILE, RMQ_MAX_RETRIES, RMQ_RETRY_DELAY_MS, RMQ_SHARDS, \
+    RMQ_DEDUP_PATH, RMQ_DEDUP_SIZE, RMQ_DEDUP_TTL, RMQ_LANE_WEIGHTS
+from services.shared_libs.RabbitMQ import lanes, sharding
+from services.shared_libs.RabbitMQ.dedup import DedupCache
+from services.shared_libs.RabbitMQ.retry import RetryPolicy
+from services.shared_libs.RabbitMQ.serialization import decode_and_call
+from services.shared_libs.RabbitMQ.tracing import TraceRecorder, call_in_trace
+
+
+WORKER_MODES = ('thread', 'process')
 
 
 class RabbitMQConsumer(AbstractRabbitMQ, ABC):
     """
     Abstract base class for RabbitMQ Consumers.
     Subclasses must implement the `_setup` and `callback` methods.
+
+    Message bodies are decompressed by their ``content_encoding`` and decoded by their ``content_type`` (see
+    :mod:`~services.shared_libs.RabbitMQ.serialization`) before they reach the callback; bodies without a content type
+    are passed on as bytes. A body that cannot be decoded is logged and rejected without requeueing.
+
+    By default the callback runs on the connection's thread, one message at a time. With `workers` set, callbacks
+    run concurrently on a thread or process pool instead:
+
+    - The callback receives a stand-in channel. Its ``basic_ack``/``basic_nack``/``basic_reject`` calls are recorded
+      and sent from the connection's thread once the callback returned, in delivery order.
+    - A callback that returns without settling its message is acked; one that raises is handled as described below.
+    - In process mode the callback must be picklable (e.g. a module-level function passed to :meth:`consume`). Its
+      return value is handed to :meth:`_on_worker_result` on the connection's thread, e.g. to publish a reply.
+
+    A callback that raises does not stop consuming. Its message is logged and nacked without requeueing, so a poison
+    message cannot loop forever; a dead-letter exchange of the queue (see
+    :mod:`~services.shared_libs.RabbitMQ.topology`) then receives it. With `max_retries` set, it is retried after an
+    exponentially growing delay instead and moved to the dead-letter queue ``<queue>.dead`` once the retries are
+    exhausted (see :mod:`~services.shared_libs.RabbitMQ.retry`). Messages consumed with `auto_ack` are not retried.
+
+    With `dedup_size` set, the consumer remembers the ``message_id`` of every message its callback processed and acks
+    redeliveries of them without running the callback again (see :mod:`~services.shared_libs.RabbitMQ.dedup`). A
+    message counts as processed unless its callback raised or requeued it.
+
+    QoS defaults come from the ``RMQ_PREFETCH_COUNT``, ``RMQ_PREFETCH_SIZE``, ``RMQ_CONSUMER_PRIORITY`` and
+    ``RMQ_ADAPTIVE_PREFETCH`` environment variables. In adaptive mode the prefetch count follows the measured callback
+    latency: enough messages to keep every worker busy for about `_ADAPTIVE_PREFETCH_BUFFER` seconds, so slow
+    replicas stop hoarding messages that idle replicas could process.
+
+    With `shards` set, the queue is sharded by a key the producers choose (see
+    :mod:`~services.shared_libs.RabbitMQ.sharding`): the replicas of the consumer split the shard queues among
+    themselves and rebalance whenever one of them joins or leaves, so all messages about a key reach the same replica.
+
+    With `lane_weights` set, the queue is split into priority lanes (see :mod:`~services.shared_libs.RabbitMQ.lanes`):
+    the consumer consumes every lane with a share of the prefetch count proportional to the lane's weight, so
+    interactive messages overtake a backlog of bulk ones without starving it.
     """
 
+    _WORKER_DRAIN_TIMEOUT = 30  # Seconds stop_consuming() waits for callbacks still running on workers.
+    _ADAPTIVE_PREFETCH_BUFFER = 1.0  # Seconds of work to keep buffered per worker in adaptive mode.
+    _ADAPTIVE_PREFETCH_MAX = 1000  # Upper bound for the adaptive prefetch count per worker.
+    _ADAPTIVE_PREFETCH_INTERVAL = 5  # Minimum seconds between two prefetch adjustments.
+    _ADAPTIVE_PREFETCH_SMOOTHING = 0.2  # Weight of the latest latency in the moving average.
+    _SHARD_HEARTBEAT_INTERVAL = 2.0  # Seconds between two announcements to the other replicas of a sharded queue.
+    _SHARD_MEMBER_TIMEOUT = 6.0  # Seconds after which a replica that did not announce itself gives up its shards.
+
     def __init__(self,
-                 queue_name: str,
+                 queue_name: str | list[str],
                  host: str = RMQ_HOST,
                  port: int = RMQ_PORT,
                  connection_attempts: int = 5,
-                 retry_delay: float = 5):
+                 retry_delay: float = 5,
+                 workers: int = 0,
+                 worker_mode: str = 'thread',
+                 prefetch_count: int | None = RMQ_PREFETCH_COUNT,
+                 prefetch_size: int = RMQ_PREFETCH_SIZE,
+                 consumer_priority: int | None = RMQ_CONSUMER_PRIORITY,
+                 adaptive_prefetch: bool = RMQ_ADAPTIVE_PREFETCH,
+                 max_retries: int = RMQ_MAX_RETRIES,
+                 retry_delay_ms: int = RMQ_RETRY_DELAY_MS,
+                 shards: int = RMQ_SHARDS,
+                 dedup_size: int = RMQ_DEDUP_SIZE,
+                 dedup_ttl: float = RMQ_DEDUP_TTL,
+                 dedup_path: str | None = RMQ_DEDUP_PATH,
+                 lane_weights: list[int] = RMQ_LANE_WEIGHTS,
+                 **kwargs):
+        """
+        :param queue_name: The name of the queue to consume from, or a list of queues to consume from on one channel.
+                           Deliveries of all queues go to the same callback; ``method.routing_key`` and
+                           ``method.consumer_tag`` tell them apart.
+        :param host: The hostname or IP address of the RabbitMQ server.
+        :param port: The port number on which the RabbitMQ server is listening.
+        :param connection_attempts: The maximum number of attempts to connect to the RabbitMQ server.
+        :param retry_delay: The interval in seconds between each attempt to connect to the RabbitMQ server.
+        :param workers: The number of workers running callbacks concurrently. 0 runs them on the connection's thread.
+        :param worker_mode: 'thread' for I/O-heavy callbacks or 'process' for CPU-heavy ones.
+        :param prefetch_count: The maximum number of unacknowledged messages the broker delivers to this consumer.
+                               0 means unlimited. None keeps the broker's default, or twice the number of
+                               workers if `workers` is set or adaptive prefetch is enabled.
+        :param prefetch_size: The maximum size in bytes of unacknowledged messages. 0 means unlimited; RabbitMQ does
+                              not support any other value.
+        :param consumer_priority: The consumer's priority (``x-priority``). The broker delivers to lower-priority
+                                  consumers only while higher-priority ones are busy. None uses the broker's default.
+        :param adaptive_prefetch: If True, the prefetch count is tuned from the measured callback latency.
+        :param max_retries: How often a message whose callback raised is retried before it is dead-lettered. 0 nacks
+                            it right away.
+        :param retry_delay_ms: The delay before the first retry in milliseconds. It doubles with every retry.
+        :param shards: The number of shards of the queue. 0 consumes the queue itself; otherwise this consumer
+                       consumes the shards ``<queue>.shard.<n>`` it claims. Requires a single queue.
+        :param dedup_size: The number of processed message IDs to remember to skip redeliveries. 0 disables
+                           deduplication.
+        :param dedup_ttl: The seconds a processed message ID is remembered.
+        :param dedup_path: A SQLite database to keep the processed message IDs in across restarts. None keeps them in
+                           memory only.
+        :param lane_weights: The weights of the priority lanes of the queue, lowest priority first. Empty consumes the
+                             queue itself; otherwise this consumer consumes the lanes ``<queue>.lane.<n>``. Requires a
+                             single queue and cannot be combined with `shards` or adaptive prefetch.
+        :param kwargs: Passed on to the next base class, e.g. `connection_manager` or `codecs`, or the producer
+                       settings of a class that also inherits from RabbitMQProducer.
+        """
+        if not isinstance(workers, int) or isinstance(workers, bool):
+            raise TypeError("workers must be a non-negative integer.")
+        elif workers < 0:
+            raise ValueError("workers must be a non-negative integer.")
+
+        if worker_mode not in WORKER_MODES:
+            raise ValueError(f"worker_mode must be one of {WORKER_MODES}.")
+
+        if prefetch_count is not None:
+            if not isinstance(prefetch_count, int) or isinstance(prefetch_count, bool):
+                raise TypeError("prefetch_count must be a non-negative integer or None.")
+            elif prefetch_count < 0:
+                raise ValueError("prefetch_count must be a non-negative integer or None.")
+
+        if not isinstance(prefetch_size, int) or isinstance(prefetch_size, bool):
+            raise TypeError("prefetch_size must be a non-negative integer.")
+        elif prefetch_size < 0:
+            raise ValueError("prefetch_size must be a non-negative integer.")
+
+        if consumer_priority is not None and (not isinstance(consumer_priority, int) or
+                                              isinstance(consumer_priority, bool)):
+            raise TypeError("consumer_priority must be an integer or None.")
+
+        if not isinstance(adaptive_prefetch, bool):
+            raise TypeError("adaptive_prefetch must be a boolean.")
+
+        retry_policy = RetryPolicy(max_retries, retry_delay_ms)
+
+        if not isinstance(shards, int) or isinstance(shards, bool):
+            raise TypeError("shards must be a non-negative integer.")
+        elif shards < 0:
+            raise ValueError("shards must be a non-negative integer.")
 
-        self._queue = queue_name
+        if not isinstance(dedup_size, int) or isinstance(dedup_size, bool):
+            raise TypeError("dedup_size must be a non-negative integer.")
+        elif dedup_size < 0:
+            raise ValueError("dedup_size must be a non-negative integer.")
+
+        if not isinstance(dedup_ttl, int | float) or isinstance(dedup_ttl, bool):
+            raise TypeError("dedup_ttl must be a positive number.")
+        elif dedup_ttl <= 0:
+            raise ValueError("dedup_ttl must be a positive number.")
+
+        if dedup_path is not None and not isinstance(dedup_path, str):
+            raise TypeError("dedup_path must be a string or None.")
+
+        lane_weights = lanes.validate_weights(lane_weights)
+        if lane_weights and shards:
+            raise ValueError("A consumer cannot use both priority lanes and shards.")
+        elif lane_weights and adaptive_prefetch:
+            raise ValueError("The prefetch count of priority lanes is split by weight and cannot be adaptive.")
+
+        self._queues = _queue_names(queue_name)
+        self._queue = self._queues[0]
+        self._shards = shards
+        self._membership: sharding.ShardMembership | None = None
+        self._membership_tag: str | None = None
+        self._shard_timer = None
+        if shards:
+            if len(self._queues) > 1:
+                raise ValueError("A sharded consumer must consume a single queue.")
+            self._membership = sharding.ShardMembership(uuid.uuid4().hex, shards, self._SHARD_MEMBER_TIMEOUT)
+            # Claim every shard until the other replicas are known; the single active consumers keep it on standby.
+            self._queues = sharding.shard_queues(self._queue, shards)
+        self._lane_weights = lane_weights
+        if lane_weights:
+            if len(self._queues) > 1:
+                raise ValueError("A consumer with priority lanes must consume a single queue.")
+            self._queues = lanes.lane_queues(self._queue, len(lane_weights))
         self._consuming = False
-        self._consumer_tag = None
+        self._consumer_tags: list[str] = []
+        self._consume_args: tuple[callable, bool, dict] | None = None  # For consumers started while rebalancing.
+
+        self._workers = workers
+        self._worker_mode = worker_mode
+        if prefetch_count is None and (workers or adaptive_prefetch):
+            prefetch_count = 2 * max(workers, 1)
+        self._prefetch_count = prefetch_count
+        self._prefetch_size = prefetch_size
+        self._consumer_priority = consumer_priority
+        self._adaptive_prefetch = adaptive_prefetch
+        self._latency: float | None = None  # Moving average of the callback duration in seconds.
+        self._prefetch_tuned = 0.0
+        self._pool: Executor | None = None
+        self._work: set[Future] = set()
+        self._in_flight: OrderedDict[int, tuple[str, dict] | None] = OrderedDict()  # delivery tag -> settlement
+        self._retry_policy = retry_policy if max_retries else None
+        self._dedup_size = dedup_size
+        self._dedup_ttl = dedup_ttl
+        self._dedup_path = dedup_path
+        self._dedup: DedupCache | None = None  # Opened by connect().
+        self._processing: set[str] = set()  # IDs of the messages on workers, whose copies count as duplicates.
 
-        super().__init__(host, port, connection_attempts, retry_delay)
+        super().__init__(host, port, connection_attempts, retry_delay, **kwargs)
+        if shards:
+            self._topology = self._topology.merge(sharding.topology(self._queue, shards))
+        if lane_weights:
+            self._topology = self._topology.merge(lanes.topology(self._queue, len(lane_weights)))
+        self._tracer = TraceRecorder(self.__class__.__name__, self._metrics, RMQ_TRACE_FILE) if self._tracing else None
 
     @property
     def queue(self) -> str:
+        """
+        The queue to consume from, or the first of them. For a sharded consumer or one with priority lanes, the queue
+        that is split.
+        """
         return self._queue
 
     @queue.setter
     def queue(self, value: str):
         """
-        Set the queue name.
+        Set the queue name, replacing all queues.
         """
         if not isinstance(value, str):
             raise TypeError("queue_name must be a string.")
         elif not value:
             raise ValueError("queue_name must not be empty.")
-        if value != self._queue and self._consumer_tag and self._consuming:
+        if self._shards:
+            if value == self._queue:
+                return
+            queues = sharding.shard_queues(value, self._shards)
+            self._topology = self._topology.merge(sharding.topology(value, self._shards))
+        elif self._lane_weights:
+            queues = lanes.lane_queues(value, len(self._lane_weights))
+            self._topology = self._topology.merge(lanes.topology(value, len(self._lane_weights)))
+        else:
+            queues = [value]
+        if queues != self._queues and self._consumer_tags and self._consuming:
             self.stop_consuming()
         self._queue = value
-        self.logger.info(f"Queue name set to: {self._queue}")
+        self._queues = queues
+        self.logger.info("Queue name set to: %s", self._queue)
+
+    @property
+    def queues(self) -> list[str]:
+        """
+        All queues to consume from. For a sharded consumer, the shard queues it currently claims; for one with priority
+        lanes, the lanes, lowest priority first.
+        """
+        return list(self._queues)
+
+    def connect(self) -> bool:
+        if self._dedup_size and self._dedup is None:
+            self._dedup = DedupCache(self._dedup_size, self._dedup_ttl, self._dedup_path)
+            if self._dedup:
+                self.logger.info("Loaded %s processed message ID(s) from %s.", len(self._dedup), self._dedup_path)
+        connected = super().connect()
+        if connected and (self._prefetch_count is not None or self._prefetch_size):
+            self._apply_qos()
+        return connected
+
+    def disconnect(self):
+        self._drain_workers()
+        super().disconnect()
+        if self._dedup is not None:
+            self._dedup.close()
+            self._dedup = None
 
     def consume(self, auto_ack: bool = False, callback: Optional[callable] = None,
                 restart_if_running: bool = True) -> None:
         """
-        Starts consuming messages from the specified queue.
+        Starts consuming messages from the specified queues.
 
         :param auto_ack: If True, messages will be automatically acknowledged.
                          If False, the callback method must manually acknowledge.
@@ -58,7 +299,8 @@ class RabbitMQConsumer(AbstractRabbitMQ, ABC):
         :param restart_if_running: If True, the consumer will be restarted if it's already consuming messages.
         :raises RuntimeError: If the RabbitMQConsumer is not connected.
         :raises AMQPChannelError: If a channel-related error occurs during consumption.
-        :raises AMQPConnectionError: If a connection-related error occurs during consumption.
+        :raises AMQPConnectionError: If a connection-related error occurs during consumption. With `auto_reconnect`
+                                     the consumer reconnects and resumes instead.
         """
         if not self._ready():
             msg = "RabbitMQProducer is not connected."
@@ -75,45 +317,473 @@ class RabbitMQConsumer(AbstractRabbitMQ, ABC):
         if (not callable(callback) or not hasattr(callback, '__call__')) and callback is not None:
             raise TypeError("callback must be a callable object or None.")
         callback = callback or self._callback  # Use default callback if not provided
+        if self._metrics is not None:
+            self._bind_metrics()
+        if self._tracer is not None:
+            callback = functools.partial(call_in_trace, callback)  # Publishes from the callback continue the trace.
+        if self._workers:
+            # Decode on the workers, so large bodies do not hold up the connection's thread.
+            callback = self._dispatch_to_workers(functools.partial(decode_and_call, self._codecs, callback), auto_ack)
+        else:
+            callback = self._decoding(callback, auto_ack)
+            if self._dedup is not None:
+                callback = self._deduplicating(callback, auto_ack)
+            callback = self._handling_errors(callback, auto_ack)
+            if self._adaptive_prefetch or self._metrics is not None:
+                callback = self._timed(callback)
+        if self._tracer is not None:
+            callback = self._recording_traces(callback)
 
-        try:
+        consume_options = {}
+        if self._consumer_priority is not None:
+            consume_options['arguments'] = {'x-priority': self._consumer_priority}
+        self._consume_args = (callback, auto_ack, consume_options)
 
-            # Start a new consumer
-            self._consumer_tag = self._channel.basic_consume(
-                queue=self._queue,
-                on_message_callback=callback,
-                auto_ack=auto_ack
-            )
-            self._consuming = True
-            self.logger.info(f"Consuming messages from queue '{self._queue}'")
-            self._channel.start_consuming()
-        except AMQPChannelError as e:
-            self.logger.error(f"AMQP Channel Error during consume: {e}")
-            raise e
-        except AMQPConnectionError as e:
-            self.logger.error(f"AMQP Connection Error during consume: {e}")
-            raise e
-        except Exception as e:
-            self.logger.critical(f"An unexpected error occurred during consume: {e}")
-            raise e
+        while True:
+            try:
+
+                if self._retry_policy is not None:
+                    queues = sharding.shard_queues(self._queue, self._shards) if self._shards else self._queues
+                    self._retry_policy.topology(queues).apply(self._channel)
+                if self._shards:
+                    self._join_shards()
+
+                # Start one consumer per queue, all on this channel
+                if self._lane_weights:
+                    self._consumer_tags = self._consume_lanes()
+                else:
+                    self._consumer_tags = [self._consume_queue(queue) for queue in self._queues]
+                self._consuming = True
+                self.logger.info("Consuming messages from queue(s) '%s'", "', '".join(self._queues))
+                self._channel.start_consuming()
+                return
+            except AMQPChannelError as e:
+                self.logger.error("AMQP Channel Error during consume: %s", e)
+                raise e
+            except AMQPConnectionError as e:
+                self.logger.error("AMQP Connection Error during consume: %s", e)
+                self._consuming = False
+                self._consumer_tags = []
+                self._membership_tag = self._shard_timer = None  # They belonged to the lost connection.
+                if isinstance(e, ConnectionClosedByClient) or not self._should_reconnect():
+                    raise e
+                self.reconnect()  # Re-runs _setup; the loop then registers the consumer on the new channel.
+            except Exception as e:
+                self.logger.critical("An unexpected error occurred during consume: %s", e)
+                raise e
 
     def stop_consuming(self) -> None:
         """
-        Stop consuming messages from the current queue.
-        This will cancel the active consumer if one exists.
+        Stop consuming messages from the current queues.
+        This will cancel the active consumers if there are any.
         """
-        if self._consumer_tag and self._ready():
+        if self._membership_tag and self._ready():
+            self._leave_shards()
+        if self._consumer_tags and self._ready():
             try:
-                un_acknowledged = self._channel.basic_cancel(self._consumer_tag)
-                self.logger.info(f"Stopped consuming messages from queue '{self._queue}'")
+                un_acknowledged = []
+                for consumer_tag in self._consumer_tags:
+                    un_acknowledged += self._channel.basic_cancel(consumer_tag)
+                self.logger.info("Stopped consuming messages from queue(s) '%s'", "', '".join(self._queues))
                 if un_acknowledged:
                     self._handle_unacknowledged_messages(un_acknowledged)
             except Exception as e:
-                self.logger.error(f"Error stopping consumer: {e}")
+                self.logger.error("Error stopping consumer: %s", e)
                 raise e
             finally:
                 self._consuming = False
-                self._consumer_tag = None
+                self._consumer_tags = []
+                self._drain_workers()
+
+    def _consume_queue(self, queue: str) -> str:
+        """Starts consuming `queue` with the callback and options of the running :meth:`consume`."""
+        callback, auto_ack, consume_options = self._consume_args
+        return self._channel.basic_consume(queue=queue, on_message_callback=callback, auto_ack=auto_ack,
+                                           **consume_options)
+
+    def _consume_lanes(self) -> list[str]:
+        """
+        Starts consuming every lane, each with its share of the prefetch count. The broker applies a prefetch count to
+        the consumers started after it was set, so every lane's consumer keeps its own.
+        """
+        counts = lanes.prefetch_counts(self._lane_weights, self._prefetch_count)
+        consumer_tags = []
+        for queue, count in zip(self._queues, counts):
+            self._channel.basic_qos(prefetch_size=self._prefetch_size, prefetch_count=count)
+            consumer_tags.append(self._consume_queue(queue))
+        self.logger.debug("Lane prefetch counts of '%s': %s.", self._queue, counts)
+        return consumer_tags
+
+    def _join_shards(self) -> None:
+        """Starts listening to the other replicas of the sharded queue and announces this one."""
+        membership_queue = self._channel.queue_declare(queue='', exclusive=True, auto_delete=True).method.queue
+        self._channel.queue_bind(queue=membership_queue, exchange=sharding.members_exchange(self._queue))
+        self._membership_tag = self._channel.basic_consume(queue=membership_queue, auto_ack=True,
+                                                           on_message_callback=self._on_shard_announcement)
+        self._on_shard_heartbeat()
+
+    def _leave_shards(self) -> None:
+        """Stops listening to the other replicas and tells them to take over this one's shards right away."""
+        try:
+            if self._shard_timer is not None:
+                self._connection.remove_timeout(self._shard_timer)
+            self._channel.basic_cancel(self._membership_tag)
+            self._announce(sharding.LEAVE)
+        except Exception as e:
+            self.logger.warning("Could not leave the shards of '%s': %s", self._queue, e)
+        finally:
+            self._membership_tag = self._shard_timer = None
+
+    def _announce(self, kind: str) -> None:
+        self._channel.basic_publish(exchange=sharding.members_exchange(self._queue), routing_key='',
+                                    body=self._membership.member.encode(), properties=BasicProperties(
+                                        type=kind, expiration=str(int(self._SHARD_MEMBER_TIMEOUT * 1000))))
+
+    def _on_shard_heartbeat(self) -> None:
+        """Announces this replica, forgets the replicas that went silent and reschedules itself."""
+        self._announce(sharding.HEARTBEAT)
+        expired = self._membership.expire()
+        if expired:
+            self.logger.info("Replica(s) %s of '%s' went silent.", ', '.join(expired), self._queue)
+            self._rebalance_shards()
+        self._shard_timer = self._connection.call_later(self._SHARD_HEARTBEAT_INTERVAL, self._on_shard_heartbeat)
+
+    def _on_shard_announcement(self, ch: Channel, method: Basic.Deliver, properties: BasicProperties,
+                               body: bytes) -> None:
+        member = body.decode()
+        if properties.type == sharding.LEAVE:
+            if self._membership.left(member):
+                self.logger.info("Replica %s of '%s' left.", member, self._queue)
+                self._rebalance_shards()
+        elif self._membership.seen(member):
+            self.logger.info("Replica %s of '%s' joined.", member, self._queue)
+            self._announce(sharding.HEARTBEAT)  # So that the new replica learns about this one without delay.
+            self._rebalance_shards()
+
+    def _rebalance_shards(self) -> None:
+        """Starts consuming the shards newly assigned to this replica and stops consuming the ones it lost."""
+        claimed = sharding.shard_queues(self._queue, self._shards)
+        claimed = [claimed[shard] for shard in self._membership.assignment()]
+        released = [queue for queue in self._queues if queue not in claimed]
+        acquired = [queue for queue in claimed if queue not in self._queues]
+        if not released and not acquired:
+            return
+
+        un_acknowledged = []
+        for queue in released:
+            index = self._queues.index(queue)
+            del self._queues[index]
+            un_acknowledged += self._channel.basic_cancel(self._consumer_tags.pop(index))
+        for queue in acquired:
+            self._queues.append(queue)
+            self._consumer_tags.append(self._consume_queue(queue))
+        if un_acknowledged:
+            self._handle_unacknowledged_messages(un_acknowledged)
+        self.logger.info("Consuming %s of %s shard(s) of '%s' with %s replica(s).", len(self._queues), self._shards,
+                         self._queue, len(self._membership.members))
+
+    def _dispatch_to_workers(self, callback: callable, auto_ack: bool) -> callable:
+        """
+        Wraps `callback` so that each delivery is submitted to the worker pool.
+
+        :raises TypeError: If the callback cannot be sent to a process pool.
+        """
+        if self._worker_mode == 'process':
+            try:
+                pickle.dumps(callback)
+            except Exception as e:
+                raise TypeError(f"callback must be picklable in 'process' worker mode: {e}") from e
+
+        if self._pool is None:
+            executor = ThreadPoolExecutor if self._worker_mode == 'thread' else ProcessPoolExecutor
+            self._pool = executor(max_workers=self._workers)
+            self.logger.debug("Started %s %s worker(s).", self._workers, self._worker_mode)
+
+        def on_message(ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+            if self._metrics is not None:
+                self._count_delivery(method)
+            if self._dedup is not None:
+                if self._skip_duplicate(ch, method, properties, auto_ack):
+                    return
+                if properties.message_id is not None:
+                    self._processing.add(properties.message_id)
+            if not auto_ack:
+                self._in_flight[method.delivery_tag] = None
+            work = self._pool.submit(_run_callback, callback, method, properties, body)
+            self._work.add(work)
+            work.add_done_callback(functools.partial(self._on_work_done, ch, method, properties, body, auto_ack))
+
+        return on_message
+
+    def _on_work_done(self, channel: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes,
+                      auto_ack: bool, work: Future) -> None:
+        """Runs on the worker (or the process pool's management thread) and hands the outcome to the connection."""
+        try:
+            self._connection.add_callback_threadsafe(
+                functools.partial(self._settle, channel, method, properties, body, auto_ack, work))
+        except Exception as e:
+            self._work.discard(work)
+            self.logger.error("Cannot settle delivery %s, the connection is closed: %s", method.delivery_tag, e)
+
+    def _settle(self, channel: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes,
+                auto_ack: bool, work: Future) -> None:
+        """Records the outcome of a worker's callback and sends every settlement that is next in delivery order."""
+        self._work.discard(work)
+        self._processing.discard(properties.message_id)
+        error = None
+        try:
+            settlement, result, duration = work.result()
+            self._record_latency(duration)
+            self._on_worker_result(method, properties, result)
+        except Exception as e:
+            self.logger.error("Error in message callback: %s", e)
+            error = e
+
+        if self._dedup is not None and error is None and not _requeues(settlement):
+            self._remember(properties)
+        if auto_ack:
+            return
+        if channel is not self._channel:
+            # Delivery tags are only valid on their channel; the broker redelivers the message after a reconnect.
+            self.logger.debug("Not settling delivery %s from a previous channel.", method.delivery_tag)
+            return
+        if error is not None:
+            settlement = self._on_callback_error(self._channel, method, properties, body, error)
+        if self._metrics is not None:
+            self._m_settled[(settlement or ('basic_ack',))[0]].inc()
+        self._in_flight[method.delivery_tag] = settlement or ('basic_ack', {})
+
+        acked = None  # Consecutive acks are coalesced into one `multiple` ack.
+        while self._in_flight:
+            tag, settlement = next(iter(self._in_flight.items()))
+            if settlement is None:
+                break  # An earlier delivery is still being processed.
+            del self._in_flight[tag]
+            name, kwargs = settlement
+            if name == 'basic_ack':
+                acked = tag
+                continue
+            if acked is not None:
+                self._channel.basic_ack(delivery_tag=acked, multiple=True)
+                acked = None
+            getattr(self._channel, name)(delivery_tag=tag, **kwargs)
+        if acked is not None:
+            self._channel.basic_ack(delivery_tag=acked, multiple=True)
+
+    def _on_reconnected(self) -> None:
+        self._in_flight.clear()  # Unsettled deliveries of the old channel are redelivered by the broker.
+        super()._on_reconnected()
+
+    def _apply_qos(self) -> None:
+        self._channel.basic_qos(prefetch_size=self._prefetch_size, prefetch_count=self._prefetch_count or 0)
+        self.logger.debug("QoS set to prefetch count %s, prefetch size %s.", self._prefetch_count, self._prefetch_size)
+
+    def _handling_errors(self, callback: callable, auto_ack: bool) -> callable:
+        """Wraps a callback running on the connection's thread so that its errors settle the message."""
+
+        def on_message(ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+            try:
+                callback(ch, method, properties, body)
+            except (AMQPChannelError, AMQPConnectionError):
+                raise  # The broker's failure, not the message's; consume() handles it.
+            except Exception as e:
+                self.logger.error("Error in message callback: %s", e)
+                if not auto_ack:
+                    name, kwargs = self._on_callback_error(ch, method, properties, body, e)
+                    getattr(ch, name)(delivery_tag=method.delivery_tag, **kwargs)
+
+        return on_message
+
+    def _on_callback_error(self, channel: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes,
+                           error: Exception) -> tuple[str, dict]:
+        """
+        Republishes a message whose callback raised to its next retry tier or dead-letter queue, if retries are
+        enabled, and returns how to settle the original delivery.
+
+        :param body: The message body as received, before decoding.
+        :return: The name and keyword arguments of the channel's settlement method.
+        """
+        if self._retry_policy is None:
+            return 'basic_nack', {'requeue': False}
+        queue = self._queue_of(method)
+        target, properties = self._retry_policy.next(queue, properties, error)
+        channel.basic_publish(exchange='', routing_key=target, body=body, properties=properties)
+        if target == self._retry_policy.dead_letter_queue(queue):
+            self.logger.warning("Message %s failed %s retries, moved it to '%s'.", method.delivery_tag,
+                                self._retry_policy.max_retries, target)
+            if self._metrics is not None:
+                self._m_dead_lettered.inc()
+        else:
+            self.logger.info("Retrying message %s through '%s'.", method.delivery_tag, target)
+            if self._metrics is not None:
+                self._m_retried.inc()
+        return 'basic_ack', {}
+
+    def _queue_of(self, method: Basic.Deliver) -> str:
+        """Returns the queue a delivery came from."""
+        if method.consumer_tag in self._consumer_tags:
+            return self._queues[self._consumer_tags.index(method.consumer_tag)]
+        return self._queue
+
+    def _deduplicating(self, callback: callable, auto_ack: bool) -> callable:
+        """
+        Wraps a callback running on the connection's thread to skip messages that were processed before and to
+        remember the ones it processes.
+        """
+
+        def on_message(ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+            if self._skip_duplicate(ch, method, properties, auto_ack):
+                return
+            ch = _SettlementWatchingChannel(ch)
+            callback(ch, method, properties, body)
+            if not ch.requeued:
+                self._remember(properties)
+
+        return on_message
+
+    def _skip_duplicate(self, channel: Channel, method: Basic.Deliver, properties: BasicProperties,
+                        auto_ack: bool) -> bool:
+        """Acks a message that was or is being processed and returns True, or returns False for a new message."""
+        message_id = properties.message_id
+        if message_id is None or (message_id not in self._processing and message_id not in self._dedup):
+            return False
+        self.logger.info("Skipping message %s, it was processed already (delivery %s).", message_id,
+                         method.delivery_tag)
+        if self._metrics is not None:
+            self._m_duplicates.inc()
+        if not auto_ack:
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+        return True
+
+    def _remember(self, properties: BasicProperties) -> None:
+        if properties.message_id is not None:
+            self._dedup.add(properties.message_id)
+
+    def _decoding(self, callback: callable, auto_ack: bool) -> callable:
+        """Wraps a callback running on the connection's thread to decode bodies and reject undecodable ones."""
+
+        def on_message(ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+            try:
+                body = self._codecs.decode(body, properties)
+            except Exception as e:
+                self.logger.error("Cannot decode message %s with content type '%s': %s",
+                                  method.delivery_tag, properties.content_type, e)
+                if not auto_ack:
+                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                return
+            callback(ch, method, properties, body)
+
+        return on_message
+
+    def _timed(self, callback: callable) -> callable:
+        """
+        Wraps a callback running on the connection's thread to measure its latency for adaptive prefetch and metrics.
+        With metrics enabled the callback's acks, nacks and rejects are counted as well.
+        """
+
+        def on_message(ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+            if self._metrics is not None:
+                self._count_delivery(method)
+                ch = _CountingChannel(ch, self._m_settled)
+            started = time.perf_counter()
+            try:
+                callback(ch, method, properties, body)
+            finally:
+                self._record_latency(time.perf_counter() - started)
+
+        return on_message
+
+    def _recording_traces(self, callback: callable) -> callable:
+        """Wraps the delivery callback to record the latency of traced messages as soon as they arrive."""
+
+        def on_message(ch: Channel, method: Basic.Deliver, properties: BasicProperties, body: bytes) -> None:
+            self._tracer.record(properties)
+            callback(ch, method, properties, body)
+
+        return on_message
+
+    def _record_latency(self, duration: float) -> None:
+        """
+        Records a callback's duration in the metrics, feeds it into the moving average and adjusts the prefetch count
+        if it drifted.
+        """
+        if self._metrics is not None:
+            self._m_callback_seconds.observe(duration)
+        if not self._adaptive_prefetch:
+            return
+        alpha = self._ADAPTIVE_PREFETCH_SMOOTHING
+        self._latency = duration if self._latency is None else (1 - alpha) * self._latency + alpha * duration
+
+        now = time.monotonic()
+        if now - self._prefetch_tuned < self._ADAPTIVE_PREFETCH_INTERVAL:
+            return
+        self._prefetch_tuned = now
+
+        per_worker = self._ADAPTIVE_PREFETCH_BUFFER / max(self._latency, 1e-6)
+        target = max(self._workers, 1) * max(1, min(self._ADAPTIVE_PREFETCH_MAX, round(per_worker)))
+        if self._prefetch_count and abs(target - self._prefetch_count) < 0.25 * self._prefetch_count:
+            return  # Avoid a QoS round trip for small changes.
+        self.logger.debug("Adapting prefetch count from %s to %s (average callback latency %.1f ms).",
+                          self._prefetch_count, target, self._latency * 1000)
+        self._prefetch_count = target
+        if self._ready():
+            self._apply_qos()
+
+    def _bind_metrics(self) -> None:
+        """Looks up the consumer's metrics for the queues about to be consumed."""
+        labels = (self.__class__.__name__,
+                  self._queue if self._shards or self._lane_weights else ','.join(self._queues))
+        self._m_consumed = self._metrics.counter('rmq_consumed_total', "Messages delivered to the consumer.",
+                                                 ('client', 'queue')).labels(*labels)
+        self._m_redelivered = self._metrics.counter(
+            'rmq_redelivered_total', "Messages delivered again after an earlier delivery was not acknowledged.",
+            ('client', 'queue')).labels(*labels)
+        self._m_callback_seconds = self._metrics.histogram('rmq_callback_seconds', "Duration of the message callback.",
+                                                           ('client', 'queue')).labels(*labels)
+        settled = self._metrics.counter('rmq_settled_total', "Messages settled by the consumer, by outcome.",
+                                        ('client', 'queue', 'outcome'))
+        self._m_settled = {name: settled.labels(*labels, name[len('basic_'):])
+                           for name in ('basic_ack', 'basic_nack', 'basic_reject')}
+        self._m_retried = self._metrics.counter('rmq_retried_total', "Failed messages sent to a retry queue.",
+                                                ('client', 'queue')).labels(*labels)
+        self._m_dead_lettered = self._metrics.counter(
+            'rmq_dead_lettered_total', "Failed messages moved to the dead-letter queue after their last retry.",
+            ('client', 'queue')).labels(*labels)
+        self._m_duplicates = self._metrics.counter(
+            'rmq_duplicates_total', "Redelivered messages acked without running the callback again.",
+            ('client', 'queue')).labels(*labels)
+
+    def _count_delivery(self, method: Basic.Deliver) -> None:
+        self._m_consumed.inc()
+        if method.redelivered:
+            self._m_redelivered.inc()
+
+    def _drain_workers(self) -> None:
+        """Waits for callbacks still running on workers, sends their settlements and shuts the pool down."""
+        if self._pool is None:
+            return
+        deadline = time.monotonic() + self._WORKER_DRAIN_TIMEOUT
+        while self._work and self._ready() and time.monotonic() < deadline:
+            self._connection.process_data_events(time_limit=0.1)
+        if self._work:
+            self.logger.warning("%s callback(s) still running on workers; their messages will be redelivered.",
+                                len(self._work))
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+        self._work.clear()
+        self._in_flight.clear()
+        self._processing.clear()
+
+    def _on_worker_result(self, method: Basic.Deliver, properties: BasicProperties, result: Any) -> None:
+        """
+        Subclasses may override this method to handle the return value of a callback that ran on a worker.
+        This method is called on the connection's thread, so it may publish.
+
+        :param method: The delivery method frame.
+        :param properties: The message properties.
+        :param result: The value returned by the callback.
+        """
+        pass
 
     def __enter__(self):
         """Context manager entry point."""
@@ -133,17 +803,110 @@ class RabbitMQConsumer(AbstractRabbitMQ, ABC):
         :param ch: The channel object.
         :param method: The delivery method frame.
         :param properties: The message properties.
-        :param body: The message body (bytes).
+        :param body: The message body, decoded according to its ``content_type`` (bytes if it has none).
         """
         pass
 
-    @abstractmethod
     def _handle_unacknowledged_messages(self,
                                         un_acknowledged: list[tuple[Channel, Basic.Deliver, BasicProperties, bytes]]
                                         ) -> None:
         """
-        Subclasses should override this method to handle unacknowledged messages after stopping consumption.
+        Handles the messages that arrived but were not passed to the callback when consuming stopped.
+        By default they are requeued right away, so other consumers need not wait for this channel to close.
+        Subclasses may override this method, e.g. to process them before shutting down.
 
         :param un_acknowledged: A list of unacknowledged messages.
         """
-        pass
+        for channel, method, _, _ in un_acknowledged:
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+        self.logger.info("Requeued %s message(s) that were not processed.", len(un_acknowledged))
+
+
+def _queue_names(queue_name: str | list[str]) -> list[str]:
+    """Validates the `queue_name` argument of a consumer and returns it as a list."""
+    queues = [queue_name] if isinstance(queue_name, str) else queue_name
+    if not isinstance(queues, list | tuple) or not all(isinstance(queue, str) for queue in queues):
+        raise TypeError("queue_name must be a string or a list of strings.")
+    elif not queues or not all(queues):
+        raise ValueError("queue_name must not be empty.")
+    return list(queues)
+
+
+class _DeferredChannel:
+    """
+    Stands in for the channel while a callback runs on a worker.
+    Settlements are only recorded; the consumer sends them from the connection's thread. Picklable for process pools.
+    """
+
+    def __init__(self):
+        self.settlement: tuple[str, dict] | None = None
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False) -> None:
+        self.settlement = ('basic_ack', {})
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True) -> None:
+        self.settlement = ('basic_nack', {'requeue': requeue})
+
+    def basic_reject(self, delivery_tag: int = 0, requeue: bool = True) -> None:
+        self.settlement = ('basic_reject', {'requeue': requeue})
+
+
+class _SettlementWatchingChannel:
+    """Wraps the channel handed to a callback and notes whether the callback nacked or rejected its message."""
+
+    def __init__(self, channel: Channel):
+        self._channel = channel
+        self.requeued = False
+        self.rejected = False  # Nacked or rejected without requeueing.
+
+    def __getattr__(self, name: str):
+        return getattr(self._channel, name)
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True):
+        self._watch(requeue)
+        return self._channel.basic_nack(delivery_tag=delivery_tag, multiple=multiple, requeue=requeue)
+
+    def basic_reject(self, delivery_tag: int = 0, requeue: bool = True):
+        self._watch(requeue)
+        return self._channel.basic_reject(delivery_tag=delivery_tag, requeue=requeue)
+
+    def _watch(self, requeue: bool) -> None:
+        self.requeued = self.requeued or requeue
+        self.rejected = self.rejected or not requeue
+
+
+class _CountingChannel:
+    """Wraps the channel handed to a callback on the connection's thread and counts its settlements."""
+
+    def __init__(self, channel: Channel, settled: dict):
+        self._channel = channel
+        self._settled = settled
+
+    def __getattr__(self, name: str):
+        return getattr(self._channel, name)
+
+    def basic_ack(self, *args, **kwargs):
+        self._settled['basic_ack'].inc()
+        return self._channel.basic_ack(*args, **kwargs)
+
+    def basic_nack(self, *args, **kwargs):
+        self._settled['basic_nack'].inc()
+        return self._channel.basic_nack(*args, **kwargs)
+
+    def basic_reject(self, *args, **kwargs):
+        self._settled['basic_reject'].inc()
+        return self._channel.basic_reject(*args, **kwargs)
+
+
+def _requeues(settlement: tuple[str, dict] | None) -> bool:
+    """Whether a settlement recorded by a worker's callback puts the message back into its queue."""
+    return settlement is not None and settlement[0] != 'basic_ack' and settlement[1].get('requeue', True)
+
+
+def _run_callback(callback: callable, method: Basic.Deliver, properties: BasicProperties,
+                  body: bytes) -> tuple[tuple[str, dict] | None, Any, float]:
+    """Runs `callback` on a worker and returns the settlement it recorded, its return value and its duration."""
+    channel = _DeferredChannel()
+    started = time.perf_counter()
+    result = callback(channel, method, properties, body)
+    return channel.settlement, result, time.perf_counter() - started
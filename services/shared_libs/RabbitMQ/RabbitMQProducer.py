@@ -1,48 +1,479 @@
-from abc import ABC, abstractmethod
+import time
+from abc import ABC
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Iterable
 
 import pika
+from pika.adapters.blocking_connection import BlockingChannel
 from pika.exceptions import AMQPChannelError, AMQPConnectionError
 
 from services.shared_libs.RabbitMQ.AbstractRabbitMQ import AbstractRabbitMQ
+from services.shared_libs.RabbitMQ.ConnectionManager import ConnectionManager
+from services.shared_libs.RabbitMQ import tracing as trace
+from services.shared_libs.RabbitMQ.const import RMQ_COMPRESSION, RMQ_COMPRESSION_THRESHOLD, RMQ_HOST, RMQ_PORT, \
+    RMQ_TRACING, RMQ_TRANSPORT, RMQ_BLOCKED_BUFFER_SIZE, RMQ_OVERFLOW_POLICY, RMQ_SPILL_DIR, RMQ_SPILL_MAX_BYTES, \
+    RMQ_SPOOL_DIR, RMQ_SPOOL_SYNC, RMQ_TOPOLOGY, RMQ_MESSAGE_IDS
+from services.shared_libs.RabbitMQ.publishing import BLOCK, DROP_OLDEST, BlockedBuffer, ConfirmTracker, \
+    build_properties, with_message_id, with_priority
+from services.shared_libs.RabbitMQ.serialization import JSON, CodecRegistry
+from services.shared_libs.RabbitMQ.spool import Spool
+from services.shared_libs.RabbitMQ.streaming import Stream
+from services.shared_libs.RabbitMQ.topology import Topology
+from services.shared_libs.RabbitMQ.transports import Transport
+from services.shared_libs.metrics import MetricsRegistry
 
 
 class RabbitMQProducer(AbstractRabbitMQ, ABC):
     """
     Abstract base class for RabbitMQ Producers.
-    Subclasses must implement the `setup` and `_on_connection_blocked` methods.
+    Subclasses must implement the `_setup` method.
+
+    While the broker blocks the connection (``connection.blocked``, e.g. on a memory or disk alarm), published
+    messages are held in a bounded buffer and published in order once it is unblocked.
     """
 
+    _DISCONNECT_CONFIRM_TIMEOUT = 5  # Seconds disconnect() waits for the confirms of a final flush.
+    _SPOOL_REPLAY_BATCH = 100  # Spooled messages replayed (and, with publisher confirms, confirmed) at a time.
+    _SPOOL_CONFIRM_TIMEOUT = 30  # Seconds a replayed batch may wait for its confirms before it is replayed again.
+    _SPOOL_RETRY_DELAY = 5  # Seconds before a replay that was not confirmed is retried.
+
+    def __init__(self,
+                 host: str = RMQ_HOST,
+                 port: int = RMQ_PORT,
+                 connection_attempts: int = 5,
+                 retry_delay: float = 5,
+                 publisher_confirms: bool = False,
+                 confirm_window: int = 128,
+                 batch_size: int | None = None,
+                 batch_timeout_ms: float | None = None,
+                 connection_manager: ConnectionManager | None = None,
+                 auto_reconnect: bool = False,
+                 reconnect_buffer_size: int = 1000,
+                 codecs: CodecRegistry | None = None,
+                 content_type: str = JSON,
+                 compression: str | None = RMQ_COMPRESSION,
+                 compression_threshold: int = RMQ_COMPRESSION_THRESHOLD,
+                 metrics: MetricsRegistry | None = None,
+                 tracing: bool = RMQ_TRACING,
+                 transport: str | Transport = RMQ_TRANSPORT,
+                 blocked_buffer_size: int = RMQ_BLOCKED_BUFFER_SIZE,
+                 overflow_policy: str = RMQ_OVERFLOW_POLICY,
+                 spill_dir: str | None = RMQ_SPILL_DIR,
+                 spill_max_bytes: int = RMQ_SPILL_MAX_BYTES,
+                 spool_dir: str | None = RMQ_SPOOL_DIR,
+                 spool_sync: bool = RMQ_SPOOL_SYNC,
+                 topology: Topology | str | None = RMQ_TOPOLOGY,
+                 message_ids: bool = RMQ_MESSAGE_IDS):
+        """
+        :param host: The hostname or IP address of the RabbitMQ server.
+        :param port: The port number on which the RabbitMQ server is listening.
+        :param connection_attempts: The maximum number of attempts to connect to the RabbitMQ server.
+        :param retry_delay: The interval in seconds between each attempt to connect to the RabbitMQ server.
+        :param publisher_confirms: If True, the channel is put into confirm mode and every publish returns a
+                                   :class:`~concurrent.futures.Future` that resolves to True (ack) or False (nack).
+                                   Futures are resolved by the producer's own calls (publish, flush,
+                                   wait_for_confirms) or a zero-delay timer on the connection's thread, never
+                                   from inside pika's I/O loop.
+        :param confirm_window: The maximum number of unconfirmed messages in flight. Once reached, publishing blocks
+                               until the broker confirms older messages.
+        :param batch_size: If set, :meth:`publish` buffers messages and flushes them as one batch once this many are
+                           buffered. None publishes every message immediately.
+        :param batch_timeout_ms: The maximum time in milliseconds a buffered message waits before the batch is
+                                 flushed. Only used if `batch_size` is set.
+        :param connection_manager: Shares its connection with other clients in this process. None opens a private
+                                   connection.
+        :param auto_reconnect: If True, :meth:`publish` keeps accepting messages while the connection is down. They
+                               are buffered, a reconnect is attempted whenever the backoff allows, and the buffer is
+                               published in order once reconnected.
+        :param reconnect_buffer_size: The maximum number of messages buffered while disconnected. Once full,
+                                      :meth:`publish` raises instead of buffering.
+        :param codecs: The codecs used to encode published messages. None uses the built-in codecs.
+        :param content_type: The content type of published objects that are neither bytes nor strings (see
+                             :meth:`publish`).
+        :param compression: The content encoding (e.g. 'deflate', 'gzip' or, if installed, 'lz4') to compress bodies
+                            with. Consumers decompress them transparently. None publishes bodies uncompressed.
+        :param compression_threshold: The minimum size in bytes of an encoded body to be compressed. Smaller bodies
+                                      are not worth the CPU time.
+        :param metrics: The registry to record metrics in. None uses the process-wide registry if metrics are enabled.
+        :param tracing: If True, every message is stamped with trace headers (see
+                        :mod:`~services.shared_libs.RabbitMQ.tracing`).
+        :param transport: The transport, or its name, to publish over if no `connection_manager` is given (see
+                          :mod:`~services.shared_libs.RabbitMQ.transports`).
+        :param blocked_buffer_size: The maximum number of messages kept in memory while the broker blocks the
+                                    connection (e.g. on a memory alarm). They are published once it is unblocked.
+        :param overflow_policy: What :meth:`publish` does once that buffer is full: 'block' processes I/O until the
+                                connection is unblocked, 'drop-oldest' discards the oldest buffered message (failing
+                                its future) and 'raise' raises a RuntimeError.
+        :param spill_dir: A directory to spill messages to once the memory buffer is full, before the overflow policy
+                          applies. None keeps the buffer in memory only.
+        :param spill_max_bytes: The maximum size of the messages spilled to disk.
+        :param spool_dir: A directory for a durable spool (see :mod:`~services.shared_libs.RabbitMQ.spool`). Messages
+                          that cannot be published because the broker is unreachable are written to it instead of
+                          being lost, and replayed in order once a connection is (re-)established. Messages spooled
+                          by an earlier process are replayed on :meth:`connect`. None disables the spool.
+        :param spool_sync: If True, every spooled message is fsynced.
+        :param topology: The topology to declare on every (re)connect, whose publish routes also apply to
+                         :meth:`publish` (see :mod:`~services.shared_libs.RabbitMQ.topology`).
+        :param message_ids: If True, every message without a ``message_id`` gets a unique one, which stays the same
+                            when the message is buffered, spooled or resent, so that consumers can skip redeliveries
+                            (see :mod:`~services.shared_libs.RabbitMQ.dedup`).
+        """
+        if not isinstance(publisher_confirms, bool):
+            raise TypeError("publisher_confirms must be a boolean.")
+
+        if not isinstance(message_ids, bool):
+            raise TypeError("message_ids must be a boolean.")
+
+        if not isinstance(confirm_window, int) or isinstance(confirm_window, bool):
+            raise TypeError("confirm_window must be a positive integer.")
+        elif confirm_window <= 0:
+            raise ValueError("confirm_window must be a positive integer.")
+
+        if batch_size is not None:
+            if not isinstance(batch_size, int) or isinstance(batch_size, bool):
+                raise TypeError("batch_size must be a positive integer or None.")
+            elif batch_size <= 0:
+                raise ValueError("batch_size must be a positive integer or None.")
+
+        if batch_timeout_ms is not None:
+            if not isinstance(batch_timeout_ms, float | int) or isinstance(batch_timeout_ms, bool):
+                raise TypeError("batch_timeout_ms must be a positive float or None.")
+            elif batch_timeout_ms <= 0:
+                raise ValueError("batch_timeout_ms must be a positive float or None.")
+
+        if not isinstance(reconnect_buffer_size, int) or isinstance(reconnect_buffer_size, bool):
+            raise TypeError("reconnect_buffer_size must be a positive integer.")
+        elif reconnect_buffer_size <= 0:
+            raise ValueError("reconnect_buffer_size must be a positive integer.")
+
+        if compression is not None and not isinstance(compression, str):
+            raise TypeError("compression must be a string or None.")
+
+        if not isinstance(compression_threshold, int) or isinstance(compression_threshold, bool):
+            raise TypeError("compression_threshold must be a non-negative integer.")
+        elif compression_threshold < 0:
+            raise ValueError("compression_threshold must be a non-negative integer.")
+
+        self._publisher_confirms = publisher_confirms
+        self._message_ids = message_ids
+        self._confirm_window = confirm_window
+        self._confirms = ConfirmTracker()
+        self._confirm_frames: deque[pika.spec.Basic.Ack | pika.spec.Basic.Nack] = deque()
+        self._confirm_timer = None
+
+        self._batch_size = batch_size
+        self._batch_timeout = batch_timeout_ms / 1000 if batch_timeout_ms is not None else None
+        self._batch: deque[tuple] = deque()  # (exchange, routing_key, body, durable, properties, future)
+        self._batch_started: float | None = None
+        self._batch_timer = None
+
+        self._publish_channel: BlockingChannel | None = None
+
+        self._blocked = False  # Whether the broker blocks the connection.
+        self._blocked_buffer = BlockedBuffer(blocked_buffer_size, overflow_policy, spill_dir, spill_max_bytes)
+
+        if spool_dir is not None and not isinstance(spool_dir, str):
+            raise TypeError("spool_dir must be a string or None.")
+        if not isinstance(spool_sync, bool):
+            raise TypeError("spool_sync must be a boolean.")
+        self._spool_dir = spool_dir
+        self._spool_sync = spool_sync
+        self._spool: Spool | None = None  # Opened by connect(), even if the broker is unreachable.
+        self._spool_futures: dict[int, Future] = {}  # sequence number -> future of a spooled message
+        self._replaying = False
+
+        self._reconnect_buffer_size = reconnect_buffer_size
+        self._outbox: deque[tuple] = deque()  # Messages published while disconnected, same layout as `_batch`.
+        self._content_type = content_type
+        self._compression = compression
+        self._compression_threshold = compression_threshold
+
+        super().__init__(host, port, connection_attempts, retry_delay, connection_manager, auto_reconnect, codecs,
+                         metrics, tracing, transport, topology)
+        self._codecs.get(content_type)  # Fail early on a content type or compression nobody can decode.
+        if compression is not None:
+            self._codecs.get_compressor(compression)
+
     def connect(self):
+        self._blocked = False
+        if self._spool_dir is not None and self._spool is None:
+            self._spool = Spool(self._spool_dir, sync=self._spool_sync)
+            if self._spool:
+                self.logger.info("Found %s spooled message(s) to replay.", len(self._spool))
         connected = super().connect()
         if connected:
+            self._publish_channel = self._open_publish_channel()
             self._connection.add_on_connection_blocked_callback(self._on_connection_blocked)
             self._connection.add_on_connection_unblocked_callback(self._on_connection_unblocked)
+            if self._publisher_confirms:
+                self._enable_publisher_confirms()
+            if self._spool is not None:
+                self._replay_spool()
 
         return connected
 
-    @abstractmethod
-    def _on_connection_blocked(self, blocked: pika.spec.Connection.Blocked):
-        pass
+    def disconnect(self):
+        if self._blocked_buffer and not self._blocked and self._publish_ready():
+            try:
+                self._drain_blocked_buffer()
+            except Exception as e:
+                self.logger.error("Failed to publish %s message(s) buffered while blocked on disconnect: %s",
+                                  len(self._blocked_buffer), e)
+        if self._batch and not self._blocked and self._publish_ready():
+            try:
+                # Bounded, since disconnect() also runs from __del__ and must not hang on a blocked connection.
+                self.flush(timeout=self._DISCONNECT_CONFIRM_TIMEOUT)
+            except Exception as e:
+                self.logger.error("Failed to flush %s buffered message(s) on disconnect: %s", len(self._batch), e)
+        if self._spool is not None:
+            self._spool_pending()  # Keep what could not be published for the next connection.
+        self._drop_blocked_buffer(AMQPConnectionError("Connection closed while the broker blocked it."))
+        self._drop_batch(AMQPConnectionError("Connection closed before the buffered message was published."))
+        self._drop_outbox(AMQPConnectionError("Connection closed before the buffered message was published."))
+        super().disconnect()
+        self._fail_pending_confirms(AMQPConnectionError("Connection closed before the broker confirmed the message."))
+        if self._spool is not None:
+            self._close_spool()
+
+    @property
+    def unconfirmed(self) -> int:
+        """The number of published messages the broker has not confirmed yet."""
+        self._resolve_confirms()
+        return len(self._confirms)
+
+    @property
+    def blocked(self) -> bool:
+        """Whether the broker currently blocks the connection; publishes are buffered meanwhile."""
+        return self._blocked
 
-    @abstractmethod
-    def _on_connection_unblocked(self, unblocked: pika.spec.Connection.Unblocked):
-        pass
+    def _on_connection_blocked(self, connection: pika.BlockingConnection, frame: pika.frame.Method):
+        """
+        Called when the broker blocks publishing on the connection, with the ``Connection.Blocked`` frame.
+        Subclasses that override this must call the base implementation.
+        """
+        self._blocked = True
+        self.logger.warning("Connection blocked by the broker: %s. Buffering published messages.",
+                            frame.method.reason)
+
+    def _on_connection_unblocked(self, connection: pika.BlockingConnection, frame: pika.frame.Method):
+        """
+        Called when the broker unblocks the connection. Publishes the messages buffered in the meantime.
+        Subclasses that override this must call the base implementation.
+        """
+        self._blocked = False
+        self.logger.info("Connection unblocked, publishing %s buffered message(s).", len(self._blocked_buffer))
+        try:
+            self._drain_blocked_buffer()
+        except Exception as e:
+            self.logger.error("Failed to publish the messages buffered while blocked, keeping %s: %s",
+                              len(self._blocked_buffer), e)
+            return
+        if self._spool is not None:
+            self._replay_spool()
 
-    def publish(self, message: bytes, routing_key: str, exchange: str = '', durable: bool = True,
-                properties: pika.BasicProperties = None) -> None:
+    def publish(self, message: Any, routing_key: str, exchange: str = '', durable: bool = True,
+                properties: pika.BasicProperties = None, priority: int | None = None) -> Future | None:
         """
         Publishes a message to the specified exchange and routing key.
+        If batching is enabled, the message is buffered and sent with the next :meth:`flush`.
+
+        Bytes are sent unchanged. Other messages are encoded with the codec of ``properties.content_type`` or, if it is
+        not set, as ``text/plain`` (strings) or with the producer's `content_type` (JSON by default). With
+        `compression` enabled, bodies of at least `compression_threshold` bytes are then compressed. Messages to the
+        default exchange follow the publish routes of the producer's topology.
 
         :param message: The message to publish.
         :param routing_key: The routing key used to route the message to the correct queue.
         :param exchange: The exchange to publish the message to. If left blank, the message will be published to the default exchange.
         :param durable: If True, the message will be persisted to disk. If False, the message will not be persisted.
         :param properties: The message properties.
+        :param priority: The priority of the message (0-255), see :mod:`~services.shared_libs.RabbitMQ.lanes`. None
+                         keeps the priority of `properties`.
+        :return: A Future resolving to True (ack) or False (nack) if publisher confirms are enabled, None otherwise.
+        :raises ValueError: If no codec is registered for the message's content type.
+        """
+        properties = with_priority(properties, priority)
+        if not isinstance(message, bytes):
+            message, properties = self._codecs.encode(message, properties, self._content_type)
+        if self._compression is not None and len(message) >= self._compression_threshold:
+            message, properties = self._codecs.compress(message, properties, self._compression)
+        if self._tracing:
+            # Before a hand-over to the connection's thread: the trace being handled is only known on this one.
+            properties = trace.inject(properties, self.__class__.__name__)
+        if self._message_ids:
+            properties = with_message_id(properties)
+
+        if not self._in_connection_thread():
+            return self._publish_threadsafe(message, routing_key, exchange, durable, properties)
+
+        exchange, routing_key = self._topology.route(exchange, routing_key)
+        if self._spool is not None and (self._spool or not self._publish_ready()):
+            return self._publish_to_spool(exchange, routing_key, message, durable, properties)
+
+        if self._should_reconnect() and (self._outbox or not self._publish_ready()):
+            return self._publish_while_disconnected(message, routing_key, exchange, durable, properties)
+
+        if self._blocked or self._blocked_buffer:
+            self._ensure_ready()
+            future = Future() if self._publisher_confirms else None
+            self._publish_while_blocked(exchange, routing_key, message, build_properties(durable, properties), future)
+            return future
+
+        if self._batch_size is None:
+            try:
+                return self._basic_publish(exchange, routing_key, message, durable, properties)
+            except AMQPConnectionError:
+                if self._spool is not None:
+                    return self._publish_to_spool(exchange, routing_key, message, durable, properties)
+                if not self._should_reconnect():
+                    raise
+                return self._publish_while_disconnected(message, routing_key, exchange, durable, properties)
+
+        self._ensure_ready()
+        future = Future() if self._publisher_confirms else None
+        self._batch.append((exchange, routing_key, message, durable, properties, future))
+        if len(self._batch) == 1:
+            self._start_batch_timer()
+
+        if len(self._batch) >= self._batch_size or self._batch_expired():
+            self.flush()
+        return future
+
+    def publish_many(self, messages: Iterable[Any], routing_key: str, exchange: str = '', durable: bool = True,
+                     properties: pika.BasicProperties = None, priority: int | None = None) -> list[Future] | None:
+        """
+        Publishes several messages to the same exchange and routing key as one batch.
+        The connection is checked once, all messages share one properties object and, if publisher confirms are
+        enabled, the broker's confirms are awaited once for the whole batch.
+        Messages are encoded like in :meth:`publish`; all messages of a batch share one content type. With
+        `compression` enabled, either all messages are compressed or none, depending on the largest one.
+
+        :param messages: The messages to publish.
+        :param routing_key: The routing key used to route the messages to the correct queue.
+        :param exchange: The exchange to publish the messages to. If left blank, the messages will be published to the default exchange.
+        :param durable: If True, the messages will be persisted to disk. If False, the messages will not be persisted.
+        :param properties: The message properties, shared by all messages.
+        :param priority: The priority of the messages (0-255). None keeps the priority of `properties`.
+        :return: One resolved Future per message if publisher confirms are enabled, None otherwise.
+        """
+        properties = with_priority(properties, priority)
+        if self._spool is not None and (self._spool or not self._publish_ready()):
+            futures = [self.publish(message, routing_key, exchange, durable, properties) for message in messages]
+            return futures if self._publisher_confirms else None
+
+        exchange, routing_key = self._topology.route(exchange, routing_key)
+        self._ensure_ready()
+        if self._batch:
+            self.flush()  # Keep messages buffered by publish() ahead of this batch.
+        if self._tracing:
+            properties = trace.inject(properties, self.__class__.__name__)  # One trace for the whole batch.
+        properties = build_properties(durable, properties)
+        bodies = [self._codecs.encode(message, properties, self._content_type)[0] for message in messages]
+        if self._compression is not None and bodies and max(map(len, bodies)) >= self._compression_threshold \
+                and properties.content_encoding is None:
+            compressor = self._codecs.get_compressor(self._compression)
+            bodies = [compressor.compress(body) for body in bodies]
+            properties.content_encoding = self._compression
+
+        if self._blocked or self._blocked_buffer:
+            futures = [Future() if self._publisher_confirms else None for _ in bodies]
+            for body, future in zip(bodies, futures):
+                self._publish_while_blocked(exchange, routing_key, body,
+                                            with_message_id(properties) if self._message_ids else properties, future)
+            return futures if self._publisher_confirms else None
+
+        if self._message_ids:  # One ID per message; the rest of the properties stay shared.
+            futures = [self._send(exchange, routing_key, body, with_message_id(properties)) for body in bodies]
+        else:
+            futures = [self._send(exchange, routing_key, body, properties) for body in bodies]
+        self.logger.info("Published batch of %s message(s) to exchange: %s, routing key: %s",
+                         len(futures), exchange, routing_key)
+
+        if not self._publisher_confirms:
+            return None
+        self.wait_for_confirms()
+        return futures
+
+    def stream(self, routing_key: str, exchange: str = '', durable: bool = True,
+               properties: pika.BasicProperties = None, stream_id: str | None = None,
+               priority: int | None = None) -> Stream:
+        """
+        Opens a stream to publish a reply in ordered chunks, so that its consumer can start on the first chunk early
+        (see :mod:`~services.shared_libs.RabbitMQ.streaming`). Chunks are published like with :meth:`publish`; with
+        `batch_size` set they wait for their batch like other messages.
+
+        :param routing_key: The routing key of every chunk.
+        :param exchange: The exchange of every chunk.
+        :param durable: If True, the chunks will be persisted to disk.
+        :param properties: The properties of every chunk, to which the stream headers are added.
+        :param stream_id: The ID of the stream. None generates a unique one.
+        :param priority: The priority of every chunk (0-255). None keeps the priority of `properties`.
+        :return: The stream; end it with :meth:`Stream.end` or use it as a context manager.
+        """
+        return Stream(self, routing_key, exchange, durable, with_priority(properties, priority), stream_id)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Publishes all messages buffered by :meth:`publish` in batching mode.
+        Messages without explicit properties share one properties object per durability setting, and publisher
+        confirms (if enabled) are awaited once for the whole batch.
+        If publishing fails, the remaining messages stay buffered and the batch timer is re-armed.
+
+        :param timeout: The maximum number of seconds to wait for publisher confirms. None waits indefinitely.
+        :return: True if all messages were confirmed in time (always True without publisher confirms).
+        """
+        self._cancel_batch_timer()
+        if not self._batch:
+            return True
+
+        if self._blocked or self._blocked_buffer:
+            self._ensure_ready()
+            while self._batch:  # Hand the batch over to the blocked buffer, which keeps the order.
+                exchange, routing_key, body, durable, properties, future = self._batch.popleft()
+                self._publish_while_blocked(exchange, routing_key, body, build_properties(durable, properties),
+                                            future)
+            if self._blocked_buffer:
+                return not self._publisher_confirms  # Nothing can be confirmed before the connection is unblocked.
+            return self.wait_for_confirms(timeout) if self._publisher_confirms else True
+
+        shared_properties = {}
+        count = 0
+        try:
+            self._ensure_ready()
+            while self._batch:
+                exchange, routing_key, body, durable, properties, future = self._batch[0]
+                if properties is None:
+                    if durable not in shared_properties:
+                        shared_properties[durable] = build_properties(durable)
+                    properties = shared_properties[durable]
+                else:
+                    properties = build_properties(durable, properties)
+
+                self._send(exchange, routing_key, body, properties, future)
+                self._batch.popleft()  # Only drop the message once it was handed to the channel.
+                count += 1
+        except Exception:
+            if self._batch:
+                self._start_batch_timer()  # Keep the latency bound for the messages left behind.
+            raise
+
+        self.logger.debug("Flushed batch of %s message(s).", count)
+        if self._publisher_confirms:
+            return self.wait_for_confirms(timeout)
+        return True
+
+    def wait_for_confirms(self, timeout: float | None = None) -> bool:
+        """
+        Blocks until the broker has confirmed every message published so far.
+
+        :param timeout: The maximum number of seconds to wait. None waits indefinitely.
+        :return: True if all messages were confirmed (acked or nacked) in time, False otherwise.
         """
-        self._basic_publish(exchange, routing_key, message, durable, properties)
+        return self._wait_for_confirms(0, timeout)
 
     def _basic_publish(self, exchange: str, routing_key: str, body: bytes, durable: bool = True,
-                       properties: pika.BasicProperties = None) -> None:
+                       properties: pika.BasicProperties = None) -> Future | None:
         """
         Publishes a message to the specified exchange and routing key.
 
@@ -50,33 +481,464 @@ class RabbitMQProducer(AbstractRabbitMQ, ABC):
         :param routing_key: The routing key used to route the message to the correct queue.
         :param body: The message to publish.
         :param durable: If True, the message will be persisted to disk. If False, the message will not be persisted.
+        :return: A Future resolving to True (ack) or False (nack) if publisher confirms are enabled, None otherwise.
+        """
+        self._ensure_ready()
+        future = self._send(exchange, routing_key, body, build_properties(durable, properties))
+        self.logger.debug("Published message to exchange: %s, routing key: %s", exchange, routing_key)
+
+        if self._publisher_confirms:
+            # Pick up any confirms that already arrived without blocking.
+            self._connection.process_data_events(time_limit=0)
+            self._resolve_confirms()
+        return future
+
+    def _publish_threadsafe(self, message: bytes, routing_key: str, exchange: str = '', durable: bool = True,
+                            properties: pika.BasicProperties = None) -> Future | None:
+        """
+        Hands a publish from another thread (e.g. a consumer's worker) over to the thread that owns the connection.
+        The message is published the next time that thread processes I/O; errors are logged and, if publisher
+        confirms are enabled, set on the returned Future.
+
+        :return: A Future resolving to True (ack) or False (nack) if publisher confirms are enabled, None otherwise.
+        """
+        self._ensure_ready()
+        future = Future() if self._publisher_confirms else None
+
+        def publish():
+            try:
+                confirmed = self.publish(message, routing_key, exchange, durable, properties)
+            except Exception as e:
+                self.logger.error("Failed to publish message handed over from another thread: %s", e)
+                if future is not None:
+                    future.set_exception(e)
+                return
+            if future is not None:
+                confirmed.add_done_callback(lambda done: _copy_outcome(done, future))
+
+        self._connection.add_callback_threadsafe(publish)
+        return future
+
+    def _publish_while_disconnected(self, message: bytes, routing_key: str, exchange: str, durable: bool,
+                                    properties: pika.BasicProperties) -> Future | None:
+        """
+        Buffers a message while the connection is down and reconnects if the backoff allows it.
+
+        :return: A Future resolving once the message is confirmed after reconnecting if publisher confirms are
+                 enabled, None otherwise.
+        :raises RuntimeError: If the reconnect buffer is full.
+        """
+        if len(self._outbox) >= self._reconnect_buffer_size:
+            msg = f"RabbitMQProducer is not connected and its reconnect buffer is full ({len(self._outbox)} messages)."
+            self.logger.error(msg)
+            raise RuntimeError(msg)
+
+        future = Future() if self._publisher_confirms else None
+        self._outbox.append((exchange, routing_key, message, durable, properties, future))
+        if self._reconnect_due() and not self._publish_ready():
+            self._reconnect_once()  # Publishes the buffer through _on_reconnected() on success.
+        elif self._publish_ready():
+            self._publish_outbox()
+        return future
+
+    def _publish_while_blocked(self, exchange: str, routing_key: str, body: bytes, properties: pika.BasicProperties,
+                               future: Future | None) -> None:
+        """
+        Buffers a message while the broker blocks the connection, applying the overflow policy if the buffer is full,
+        and publishes the buffer if the connection is unblocked by then.
+
+        :raises RuntimeError: If the buffer is full and the overflow policy is 'raise'.
+        """
+        while not self._blocked_buffer.put(exchange, routing_key, body, properties, future):
+            if not self._blocked:
+                self._drain_blocked_buffer()
+            elif self._blocked_buffer.policy == DROP_OLDEST:
+                dropped = self._blocked_buffer.pop()
+                self.logger.warning("Blocked buffer full, dropping the oldest of %s message(s).",
+                                    len(self._blocked_buffer) + 1)
+                if dropped[-1] is not None and not dropped[-1].done():
+                    dropped[-1].set_exception(RuntimeError("Dropped from the full blocked buffer."))
+                if self._metrics is not None:
+                    self._m_dropped.inc()
+            elif self._blocked_buffer.policy == BLOCK:
+                # The unblocked callback runs while processing I/O and drains the buffer.
+                self._connection.process_data_events(time_limit=1)
+            else:
+                msg = f"The broker blocks the connection and the buffer is full ({len(self._blocked_buffer)} messages)."
+                self.logger.error(msg)
+                raise RuntimeError(msg)
+        if self._metrics is not None:
+            self._m_buffered.inc()
+        if not self._blocked:
+            self._drain_blocked_buffer()
+
+    def _drain_blocked_buffer(self) -> None:
+        """Publishes the messages buffered while blocked, in order, until the buffer is empty or blocked again."""
+        count = 0
+        while self._blocked_buffer and not self._blocked:
+            entry = self._blocked_buffer.pop()
+            try:
+                self._send(*entry)
+            except Exception:
+                self._blocked_buffer.restore(entry)
+                raise
+            count += 1
+        if count:
+            self.logger.debug("Published %s message(s) buffered while blocked.", count)
+
+    def _publish_to_spool(self, exchange: str, routing_key: str, body: bytes, durable: bool,
+                          properties: pika.BasicProperties) -> Future | None:
+        """
+        Writes a message the broker cannot take right now to the spool, behind the ones already spooled, and
+        replays the spool if the connection is back (reconnecting if the backoff allows it).
+
+        :return: A Future resolving once the replayed message is confirmed if publisher confirms are enabled, None
+                 otherwise.
+        """
+        self._spool_pending()  # Messages held in memory are older; keep them in front.
+        sequence = self._spool.append(exchange, routing_key, body, build_properties(durable, properties))
+        future = None
+        if self._publisher_confirms:
+            future = self._spool_futures[sequence] = Future()
+        if self._metrics is not None:
+            self._m_spooled.inc()
+        self.logger.debug("Spooled message to exchange: %s, routing key: %s", exchange, routing_key)
+        self._replay_spool()
+        return future
+
+    def _spool_pending(self) -> None:
+        """Moves the messages held in memory (reconnect, blocked and batch buffers) to the spool, oldest first."""
+        pending = [(exchange, routing_key, body, build_properties(durable, properties), future)
+                   for exchange, routing_key, body, durable, properties, future in self._outbox]
+        while (entry := self._blocked_buffer.pop()) is not None:
+            pending.append(entry)
+        pending += [(exchange, routing_key, body, build_properties(durable, properties), future)
+                    for exchange, routing_key, body, durable, properties, future in self._batch]
+        self._outbox.clear()
+        self._batch.clear()
+        self._cancel_batch_timer()
+        for exchange, routing_key, body, properties, future in pending:
+            sequence = self._spool.append(exchange, routing_key, body, properties)
+            if future is not None:
+                self._spool_futures[sequence] = future
+
+    def _replay_spool(self) -> None:
+        """
+        Publishes the spooled messages in order, in batches that are removed from the spool once handed to the channel
+        or, with publisher confirms, once the broker confirmed all of them.
+        """
+        if self._replaying or not self._spool:
+            return
+        if not self._publish_ready():
+            if not self._disconnect_requested and self._reconnect_due():
+                self._reconnect_once()  # connect() replays the spool on success.
+            return
+
+        self._replaying = True
+        try:
+            while self._spool and self._publish_ready() and not self._blocked:
+                batch = self._spool.read(self._SPOOL_REPLAY_BATCH)
+                futures = [self._send(exchange, routing_key, body, properties)
+                           for _, (exchange, routing_key, body, properties) in batch]
+                if self._publisher_confirms and not (self.wait_for_confirms(self._SPOOL_CONFIRM_TIMEOUT) and
+                                                     all(future.result() for future in futures)):
+                    self.logger.warning("The broker did not confirm %s replayed message(s); retrying in %ss.",
+                                        len(batch), self._SPOOL_RETRY_DELAY)
+                    self._connection.call_later(self._SPOOL_RETRY_DELAY, self._replay_spool)
+                    return
+                last = batch[-1][0]
+                self._spool.ack(last)
+                for sequence in [sequence for sequence in self._spool_futures if sequence <= last]:
+                    self._spool_futures.pop(sequence).set_result(True)
+                self.logger.info("Replayed %s spooled message(s), %s left.", len(batch), len(self._spool))
+        except (AMQPConnectionError, AMQPChannelError) as e:
+            self.logger.error("Replaying the spool failed, %s message(s) stay spooled: %s", len(self._spool), e)
+        finally:
+            self._replaying = False
+
+    def _close_spool(self) -> None:
+        if self._spool:
+            self.logger.info("%s message(s) stay spooled in %s.", len(self._spool), self._spool_dir)
+        error = AMQPConnectionError("Disconnected before the spooled message was replayed; it stays spooled.")
+        for future in self._spool_futures.values():
+            if not future.done():
+                future.set_exception(error)
+        self._spool_futures.clear()
+        self._spool.close()
+        self._spool = None
+
+    def _drop_blocked_buffer(self, error: Exception) -> None:
+        """Discards all messages buffered while blocked and fails their futures."""
+        if not self._blocked_buffer:
+            return
+        self.logger.warning("Dropping %s message(s) buffered while the connection was blocked.",
+                            len(self._blocked_buffer))
+        for future in self._blocked_buffer.clear():
+            if not future.done():
+                future.set_exception(error)
+
+    def _on_reconnected(self) -> None:
+        super()._on_reconnected()
+        self._blocked = False  # A new connection starts unblocked; the broker re-sends Blocked if the alarm persists.
+        try:
+            self._drain_blocked_buffer()
+        except AMQPConnectionError as e:
+            self.logger.error("Connection lost again, keeping %s blocked message(s): %s", len(self._blocked_buffer), e)
+            return
+        self._publish_outbox()
+
+    def _publish_outbox(self) -> None:
+        """Publishes the messages buffered while disconnected, in order, keeping them if the connection fails again."""
+        if not self._outbox:
+            return
+        self.logger.info("Publishing %s message(s) buffered while disconnected.", len(self._outbox))
+        while self._outbox:
+            exchange, routing_key, body, durable, properties, future = self._outbox[0]
+            try:
+                if self._batch_size is None:
+                    confirmed = self._basic_publish(exchange, routing_key, body, durable, properties)
+                else:
+                    self._ensure_ready()
+                    self._batch.append((exchange, routing_key, body, durable, properties, future))
+                    confirmed = None
+            except (AMQPConnectionError, RuntimeError) as e:
+                self.logger.error("Connection lost again, keeping %s buffered message(s): %s", len(self._outbox), e)
+                return
+            self._outbox.popleft()
+            if future is not None and confirmed is not None:
+                confirmed.add_done_callback(lambda done, target=future: _copy_outcome(done, target))
+        if self._batch:
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error("Flushing the replayed messages failed, keeping %s buffered: %s", len(self._batch), e)
+
+    def _drop_outbox(self, error: Exception) -> None:
+        """
+        Discards all messages buffered while disconnected and fails their futures.
+
+        :param error: The exception to set on each buffered message's future.
+        """
+        if not self._outbox:
+            return
+        self.logger.warning("Dropping %s message(s) buffered while disconnected.", len(self._outbox))
+        while self._outbox:
+            future = self._outbox.popleft()[-1]
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    def _open_publish_channel(self) -> BlockingChannel:
+        """
+        Returns the channel to publish on. Producers publish on their only channel; clients that also consume (e.g.
+        AbstractBrain) override this to publish on a channel of their own, so publishing never competes with the
+        consumer's flow control.
+        """
+        return self._channel
+
+    def _publish_ready(self) -> bool:
+        if self._publish_channel is self._channel:
+            return self._ready()
+        return self._ready() and self._publish_channel is not None and self._publish_channel.is_open
+
+    def _close_channels(self) -> None:
+        if self._publish_channel is not None and self._publish_channel is not self._channel and \
+                self._publish_channel.is_open:
+            self._publish_channel.close()
+        super()._close_channels()
+
+    def _ensure_ready(self) -> None:
+        """
+        :raises RuntimeError: If the RabbitMQProducer is not connected.
         """
-        if not self._ready():
+        if not self._publish_ready():
             msg = "RabbitMQProducer is not connected."
             self.logger.error(msg)
             raise RuntimeError(msg + " Call connect() first.")
 
-        if properties is None:
-            properties = pika.BasicProperties(
-                delivery_mode=pika.DeliveryMode.Persistent if durable else pika.DeliveryMode.Transient
-            )
-        else:
-            properties.delivery_mode = 2 if durable else 1
+    def _send(self, exchange: str, routing_key: str, body: bytes, properties: pika.BasicProperties,
+              future: Future | None = None) -> Future | None:
+        """
+        Hands a single message to the channel, honoring the publisher confirm window.
+        Callers are responsible for checking the connection and building the properties.
 
+        :param future: The Future to resolve once the broker confirms the message. Created if None.
+        :return: The confirm Future if publisher confirms are enabled, None otherwise.
+        """
+        tag = None
+        started = time.perf_counter() if self._metrics is not None else 0.0
         try:
-            self._channel.basic_publish(
+            if self._publisher_confirms:
+                # Keep at most `confirm_window` messages in flight; block only once the window is full.
+                self._wait_for_confirms(self._confirm_window - 1)
+                # Register before publishing: basic_publish runs I/O, so the confirm may arrive before it returns.
+                future = future or Future()
+                tag = self._confirms.register(future)
+
+            self._publish_channel.basic_publish(
                 exchange=exchange,
                 routing_key=routing_key,
                 body=body,
                 properties=properties
             )
-            self.logger.info(f"Published message to exchange: {exchange}, routing key: {routing_key}")
         except AMQPChannelError as e:
-            self.logger.error(f"AMQP Channel Error during publish: {e}")
+            self.logger.error("AMQP Channel Error during publish: %s", e)
+            self._fail_pending_confirms(e)
             raise e
         except AMQPConnectionError as e:
-            self.logger.error(f"AMQP Connection Error during publish: {e}")
+            self.logger.error("AMQP Connection Error during publish: %s", e)
+            self._fail_pending_confirms(e)
             raise e
         except Exception as e:
-            self.logger.critical(f"An unexpected error occurred during publish: {e}")
+            self.logger.critical("An unexpected error occurred during publish: %s", e)
+            if tag is not None:
+                self._confirms.discard(tag)
             raise e
+
+        if self._metrics is not None:
+            self._m_published.inc()
+            self._m_publish_seconds.observe(time.perf_counter() - started)
+        return future if self._publisher_confirms else None
+
+    def _init_metrics(self) -> None:
+        super()._init_metrics()
+        client = self.__class__.__name__
+        self._m_published = self._metrics.counter('rmq_published_total', "Messages handed to the channel.",
+                                                  ('client',)).labels(client)
+        self._m_publish_seconds = self._metrics.histogram(
+            'rmq_publish_seconds', "Time to hand a message to the channel, including waits for the confirm window.",
+            ('client',)).labels(client)
+        self._m_nacked = self._metrics.counter('rmq_publish_nacked_total', "Messages nacked by the broker.",
+                                               ('client',)).labels(client)
+        self._m_buffered = self._metrics.counter('rmq_publish_blocked_buffered_total',
+                                                 "Messages buffered while the broker blocked the connection.",
+                                                 ('client',)).labels(client)
+        self._m_dropped = self._metrics.counter('rmq_publish_blocked_dropped_total',
+                                                "Buffered messages dropped by the 'drop-oldest' overflow policy.",
+                                                ('client',)).labels(client)
+        self._m_spooled = self._metrics.counter('rmq_publish_spooled_total',
+                                                "Messages written to the spool because the broker was unreachable.",
+                                                ('client',)).labels(client)
+
+    def _start_batch_timer(self) -> None:
+        """Schedules a flush of the current batch once `batch_timeout_ms` has passed."""
+        self._batch_started = time.monotonic()
+        if self._batch_timeout is not None and self._connection is not None and self._connection.is_open:
+            # Fires whenever the connection processes I/O (e.g. during `connection.sleep` or `process_data_events`).
+            self._batch_timer = self._connection.call_later(self._batch_timeout, self._on_batch_timeout)
+
+    def _cancel_batch_timer(self) -> None:
+        if self._batch_timer is not None and self._connection is not None and self._connection.is_open:
+            self._connection.remove_timeout(self._batch_timer)
+        self._batch_timer = None
+        self._batch_started = None
+
+    def _batch_expired(self) -> bool:
+        return (self._batch_timeout is not None and self._batch_started is not None and
+                time.monotonic() - self._batch_started >= self._batch_timeout)
+
+    def _on_batch_timeout(self) -> None:
+        self._batch_timer = None
+        if self._batch:
+            self.logger.debug("Batch timeout reached with %s buffered message(s).", len(self._batch))
+            try:
+                self.flush()
+            except Exception as e:
+                # Raising here would surface in an unrelated connection.sleep()/process_data_events() call.
+                self.logger.error("Timed flush failed, keeping %s buffered message(s): %s", len(self._batch), e)
+
+    def _drop_batch(self, error: Exception) -> None:
+        """
+        Discards all buffered messages and fails their futures.
+
+        :param error: The exception to set on each buffered message's future.
+        """
+        self._cancel_batch_timer()
+        if not self._batch:
+            return
+        self.logger.warning("Dropping %s buffered message(s) that were never published.", len(self._batch))
+        while self._batch:
+            future = self._batch.popleft()[-1]
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    def _enable_publisher_confirms(self) -> None:
+        """
+        Puts the channel into confirm mode.
+
+        ``BlockingChannel.confirm_delivery`` waits for a confirm after every single publish. To pipeline publishes,
+        confirm mode is enabled on the underlying channel implementation (``BlockingChannel._impl``, see the pika pin
+        in requirements.txt) instead, so ``basic_publish`` returns immediately and acks/nacks are queued by
+        :meth:`_on_delivery_confirmation` whenever the connection processes I/O.
+        """
+        self._confirms.reset()
+        self._confirm_frames.clear()
+        self._confirm_timer = None
+        self._publish_channel._impl.confirm_delivery(ack_nack_callback=self._on_delivery_confirmation)
+        self.logger.debug("Publisher confirms enabled (window: %s).", self._confirm_window)
+
+    def _on_delivery_confirmation(self, method_frame: pika.frame.Method) -> None:
+        """
+        Queues a Basic.Ack or Basic.Nack sent by the broker.
+
+        This runs inside pika's I/O loop, so the futures are only resolved later by :meth:`_resolve_confirms`; a
+        future's done-callback may then safely publish again. A zero-delay timer makes sure that happens even if the
+        producer itself is idle, e.g. while the connection's thread is consuming.
+
+        :param method_frame: The Basic.Ack or Basic.Nack method frame sent by the broker.
+        """
+        self._confirm_frames.append(method_frame.method)
+        if self._confirm_timer is None:
+            self._confirm_timer = self._connection.call_later(0, self._on_confirm_timer)
+
+    def _on_confirm_timer(self) -> None:
+        self._confirm_timer = None
+        self._resolve_confirms()
+
+    def _resolve_confirms(self) -> None:
+        """Resolves the futures of all messages covered by the queued acks/nacks."""
+        while self._confirm_frames:
+            method = self._confirm_frames.popleft()
+            count = self._confirms.confirm(method)
+            if isinstance(method, pika.spec.Basic.Nack):
+                if self._metrics is not None:
+                    self._m_nacked.inc(count)
+                self.logger.warning("Broker nacked %s message(s) up to delivery tag %s.", count, method.delivery_tag)
+
+    def _wait_for_confirms(self, max_pending: int, timeout: float | None = None) -> bool:
+        """
+        Processes I/O until at most `max_pending` messages are unconfirmed.
+
+        :param max_pending: The number of unconfirmed messages that may remain in flight.
+        :param timeout: The maximum number of seconds to wait. None waits indefinitely.
+        :return: True if the target was reached in time, False otherwise.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._resolve_confirms()
+        while len(self._confirms) > max_pending:
+            if not self._publish_ready():
+                raise AMQPConnectionError("Connection lost while waiting for publisher confirms.")
+            if deadline is None:
+                self._connection.process_data_events(time_limit=1)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._connection.process_data_events(time_limit=remaining)
+            self._resolve_confirms()
+        return True
+
+    def _fail_pending_confirms(self, error: Exception) -> None:
+        """
+        Fails the futures of all unconfirmed messages, e.g. after the channel or connection was lost.
+
+        :param error: The exception to set on each pending future.
+        """
+        self._resolve_confirms()  # Confirms that already arrived still count.
+        self._confirms.fail_all(error)
+
+
+def _copy_outcome(source: Future, target: Future) -> None:
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -1,5 +1,13 @@
+from .AsyncRabbitMQConsumer import AsyncRabbitMQConsumer
+from .AsyncRabbitMQProducer import AsyncRabbitMQProducer
+from .ConnectionManager import ConnectionManager
+from .InMemoryBroker import InMemoryBroker
+from .IpcBroker import IpcBroker
 from .RabbitMQConsumer import RabbitMQConsumer
 from .RabbitMQProducer import RabbitMQProducer
 from .const import RMQ_HOST, RMQ_PORT
+from .serialization import Codec, CodecRegistry
+from .topology import Topology
 
-__all__ = ['RabbitMQConsumer', 'RabbitMQProducer', 'RMQ_HOST', 'RMQ_PORT']
+__all__ = ['AsyncRabbitMQConsumer', 'AsyncRabbitMQProducer', 'Codec', 'CodecRegistry', 'ConnectionManager',
+           'InMemoryBroker', 'IpcBroker', 'RabbitMQConsumer', 'RabbitMQProducer', 'RMQ_HOST', 'RMQ_PORT', 'Topology']
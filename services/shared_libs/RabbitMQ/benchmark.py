@@ -0,0 +1,317 @@
+"""
+Throughput and latency benchmarks for the messaging layer.
+
+Every scenario publishes `messages` messages of `message_size` bytes with a :class:`RabbitMQProducer` and consumes
+them with a :class:`RabbitMQConsumer` on its own connection and thread, like an Ear feeding a Brain. The first eight
+bytes of every body hold the time it was published, so the consumer measures the end-to-end latency of each message.
+The scenarios are the cross product of the given message sizes, prefetch counts, durability, confirm modes and batch
+sizes:
+
+    python -m services.shared_libs.RabbitMQ.benchmark --sizes 64 65536 --confirms off on --output results.jsonl
+
+Scenarios run against a RabbitMQ broker or, with ``--in-memory``, against an :class:`InMemoryBroker`, which shows the
+framework's own overhead apart from the broker's. ``--ipc`` serves the in-memory broker over a Unix domain socket
+(see :class:`~services.shared_libs.RabbitMQ.IpcBroker.IpcBroker`), which adds the cost of the IPC transport.
+
+Every result is written as one JSON line. Comparing a run against an earlier one fails (exit code 1) if any scenario
+lost more throughput than the tolerance allows, so regressions in the hot path are caught before a release:
+
+    python -m services.shared_libs.RabbitMQ.benchmark --compare baseline.jsonl --tolerance 0.1
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import struct
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Iterable
+
+import pika
+
+from services.shared_libs.RabbitMQ.AbstractRabbitMQ import RabbitMQConnectionError
+from services.shared_libs.RabbitMQ.InMemoryBroker import InMemoryBroker
+from services.shared_libs.RabbitMQ.IpcBroker import IpcBroker
+from services.shared_libs.RabbitMQ.RabbitMQConsumer import RabbitMQConsumer
+from services.shared_libs.RabbitMQ.RabbitMQProducer import RabbitMQProducer
+from services.shared_libs.RabbitMQ.const import RMQ_HOST, RMQ_PORT
+from services.shared_libs.RabbitMQ.tracing import percentile
+
+_STAMP = struct.Struct('>Q')  # Publish time in nanoseconds of time.perf_counter_ns(), at the start of every body.
+
+
+class Scenario:
+    """One point of the benchmark matrix."""
+
+    __slots__ = ('message_size', 'prefetch', 'durable', 'confirms', 'batch_size', 'messages')
+
+    def __init__(self, message_size: int, prefetch: int, durable: bool, confirms: bool, batch_size: int,
+                 messages: int):
+        """
+        :param message_size: The size of every message body in bytes, at least 8 for the timestamp.
+        :param prefetch: The consumer's prefetch count. 0 means unlimited.
+        :param durable: If True, the queue is durable and messages are persisted.
+        :param confirms: If True, the producer waits for publisher confirms.
+        :param batch_size: The number of messages the producer buffers before publishing them. 1 publishes every
+                           message immediately.
+        :param messages: The number of messages to send.
+        """
+        if message_size < _STAMP.size:
+            raise ValueError(f"message_size must be at least {_STAMP.size} bytes.")
+        if prefetch < 0:
+            raise ValueError("prefetch must be a non-negative integer.")
+        if batch_size <= 0:
+            raise ValueError("batch_size must be a positive integer.")
+        if messages <= 0:
+            raise ValueError("messages must be a positive integer.")
+
+        self.message_size = message_size
+        self.prefetch = prefetch
+        self.durable = durable
+        self.confirms = confirms
+        self.batch_size = batch_size
+        self.messages = messages
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def key(self) -> tuple:
+        """Identifies the scenario across runs, regardless of the number of messages sent."""
+        return self.message_size, self.prefetch, self.durable, self.confirms, self.batch_size
+
+    def __eq__(self, other):
+        return isinstance(other, Scenario) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return 'Scenario(' + ', '.join(f'{name}={value!r}' for name, value in self.as_dict().items()) + ')'
+
+
+def matrix(message_sizes: Iterable[int] = (64, 4096, 65536), prefetches: Iterable[int] = (0, 100),
+           durabilities: Iterable[bool] = (False, True), confirm_modes: Iterable[bool] = (False, True),
+           batch_sizes: Iterable[int] = (1, 100), messages: int = 10000) -> list[Scenario]:
+    """Returns every combination of the given settings as a scenario."""
+    return [Scenario(size, prefetch, durable, confirms, batch_size, messages)
+            for size, prefetch, durable, confirms, batch_size
+            in itertools.product(message_sizes, prefetches, durabilities, confirm_modes, batch_sizes)]
+
+
+class _BenchmarkProducer(RabbitMQProducer):
+    def _setup(self) -> None:
+        pass  # The consumer declares the queue before anything is published.
+
+    def _on_connection_blocked(self, connection: pika.BlockingConnection, frame: pika.frame.Method):
+        super()._on_connection_blocked(connection, frame)
+        self.logger.warning("Throughput results will be skewed by the blocked connection.")
+
+
+class _BenchmarkConsumer(RabbitMQConsumer):
+    def __init__(self, queue_name: str, expected: int, durable: bool, **kwargs):
+        self.latencies: list[int] = []  # Nanoseconds from publish to delivery, in delivery order.
+        self.finished: int | None = None  # time.perf_counter_ns() of the last delivery.
+        self._expected = expected
+        self._durable = durable
+        super().__init__(queue_name, **kwargs)
+
+    def _setup(self) -> None:
+        self._channel.queue_declare(queue=self._queue, durable=self._durable)
+
+    def _callback(self, ch, method, properties, body) -> None:
+        received = time.perf_counter_ns()
+        self.latencies.append(received - _STAMP.unpack_from(body)[0])
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        if len(self.latencies) >= self._expected:
+            self.finished = received
+            ch.stop_consuming()
+
+
+def run(scenario: Scenario, host: str = RMQ_HOST, port: int = RMQ_PORT, timeout: float = 60,
+        broker: InMemoryBroker | IpcBroker | None = None) -> dict:
+    """
+    Runs one scenario against the broker at `host`:`port` on a fresh queue, which is deleted afterwards.
+
+    :param scenario: The scenario to run.
+    :param timeout: The maximum number of seconds to wait for the consumer after everything was published.
+    :param broker: An in-memory or started IPC broker to run against instead of the one at `host`:`port`.
+    :return: The result, see :func:`summarise`.
+    :raises RabbitMQConnectionError: If the producer or consumer cannot connect.
+    """
+    queue = f'benchmark.{uuid.uuid4().hex[:12]}'
+    consumer = _BenchmarkConsumer(queue, scenario.messages, scenario.durable, host=host, port=port,
+                                  prefetch_count=scenario.prefetch,
+                                  connection_manager=broker.connection_manager() if broker else None)
+    producer = _BenchmarkProducer(host=host, port=port, publisher_confirms=scenario.confirms,
+                                  batch_size=scenario.batch_size if scenario.batch_size > 1 else None,
+                                  connection_manager=broker.connection_manager() if broker else None)
+
+    ready = threading.Event()
+    errors: list[Exception] = []
+
+    def consume():
+        try:
+            if not consumer.connect():
+                raise RabbitMQConnectionError(f"Cannot connect the consumer to {host}:{port}.")
+            ready.set()
+            consumer.consume()
+            consumer._channel.queue_delete(queue=queue)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            ready.set()
+            consumer.disconnect()
+
+    thread = threading.Thread(target=consume, name='benchmark-consumer', daemon=True)
+    thread.start()
+    ready.wait()
+    if errors:
+        raise errors[0]
+
+    try:
+        if not producer.connect():
+            raise RabbitMQConnectionError(f"Cannot connect the producer to {host}:{port}.")
+        padding = bytes(scenario.message_size - _STAMP.size)
+        started = time.perf_counter_ns()
+        for _ in range(scenario.messages):
+            producer.publish(_STAMP.pack(time.perf_counter_ns()) + padding, queue, durable=scenario.durable)
+        producer.flush()
+        if scenario.confirms:
+            producer.wait_for_confirms()
+        published = time.perf_counter_ns()
+    finally:
+        producer.disconnect()
+
+    thread.join(timeout)
+    if thread.is_alive():  # Messages were lost or the consumer is too slow; report what arrived.
+        consumer._connection.add_callback_threadsafe(consumer._channel.stop_consuming)
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    result = summarise(scenario, started, published, consumer.finished, consumer.latencies)
+    if broker is None:
+        result['broker'] = f'{host}:{port}'
+    else:
+        result['broker'] = f'ipc:{broker.path}' if isinstance(broker, IpcBroker) else 'in-memory'
+    return result
+
+
+def summarise(scenario: Scenario, started: int, published: int, finished: int | None,
+              latencies: list[int]) -> dict:
+    """
+    Builds the result of a run from its raw timings in nanoseconds.
+
+    Rates are in messages per second: ``publish_rate`` counts until the last message was handed to the broker (and
+    confirmed, with confirms), ``throughput`` until the last one was consumed. Latencies are in milliseconds.
+    """
+    received = len(latencies)
+    publish_seconds = (published - started) / 1e9
+    seconds = (finished - started) / 1e9 if finished is not None else None
+    milliseconds = [latency / 1e6 for latency in latencies]
+    return {
+        'scenario': scenario.as_dict(),
+        'received': received,
+        'publish_seconds': publish_seconds,
+        'seconds': seconds,
+        'publish_rate': scenario.messages / publish_seconds if publish_seconds > 0 else None,
+        'throughput': received / seconds if seconds else None,
+        'megabytes_per_second': received * scenario.message_size / seconds / 1e6 if seconds else None,
+        'latency_ms': {
+            name: percentile(milliseconds, fraction) if milliseconds else None
+            for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0))
+        },
+        'python': platform.python_version(),
+        'pika': pika.__version__,
+    }
+
+
+def compare(baseline: list[dict], results: list[dict], tolerance: float = 0.1) -> list[str]:
+    """
+    Compares the throughput of every scenario that both runs contain.
+
+    :param baseline: The results of an earlier run.
+    :param results: The results of this run.
+    :param tolerance: The fraction of throughput a scenario may lose before it counts as a regression.
+    :return: One description per regression; empty if there is none.
+    """
+    def key(result):
+        return Scenario(**result['scenario']).key()
+
+    before = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = before.get(key(result))
+        if previous is None or not previous['throughput']:
+            continue
+        if result['received'] < result['scenario']['messages']:
+            regressions.append(f"{result['scenario']}: lost {result['scenario']['messages'] - result['received']} "
+                               f"message(s)")
+        elif (result['throughput'] or 0) < previous['throughput'] * (1 - tolerance):
+            regressions.append(f"{result['scenario']}: {result['throughput']:.0f} msg/s, baseline "
+                               f"{previous['throughput']:.0f} msg/s")
+    return regressions
+
+
+def _switch(value: str) -> bool:
+    if value not in ('on', 'off'):
+        raise argparse.ArgumentTypeError("expected 'on' or 'off'.")
+    return value == 'on'
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Runs the benchmark matrix and writes one JSON line per scenario. Returns 1 on regressions."""
+    parser = argparse.ArgumentParser(description="Benchmark RabbitMQ producer to consumer pipelines.")
+    parser.add_argument('--host', default=RMQ_HOST, help="The broker's host. Defaults to RMQ_HOST.")
+    parser.add_argument('--port', type=int, default=RMQ_PORT, help="The broker's port. Defaults to RMQ_PORT.")
+    transport = parser.add_mutually_exclusive_group()
+    transport.add_argument('--in-memory', action='store_true', help="Run against an in-process stand-in broker.")
+    transport.add_argument('--ipc', action='store_true', help="Run against the stand-in broker over a Unix socket.")
+    parser.add_argument('--messages', type=int, default=10000, help="Messages per scenario.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 4096, 65536], help="Message sizes in bytes.")
+    parser.add_argument('--prefetch', type=int, nargs='+', default=[0, 100], help="Prefetch counts (0: unlimited).")
+    parser.add_argument('--durable', type=_switch, nargs='+', default=[False, True], help="on and/or off.")
+    parser.add_argument('--confirms', type=_switch, nargs='+', default=[False, True], help="on and/or off.")
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[1, 100], help="Producer batch sizes.")
+    parser.add_argument('--timeout', type=float, default=60, help="Seconds to wait for the consumer per scenario.")
+    parser.add_argument('--output', help="The JSON lines file to write the results to. Defaults to stdout.")
+    parser.add_argument('--compare', metavar='BASELINE', help="A results file of an earlier run to compare with.")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Throughput a scenario may lose, e.g. 0.1.")
+    args = parser.parse_args(argv)
+
+    scenarios = matrix(args.sizes, args.prefetch, args.durable, args.confirms, args.batch_size, args.messages)
+    results = []
+    ipc = None
+    if args.ipc:
+        ipc = IpcBroker(os.path.join(tempfile.mkdtemp(prefix='benchmark-'), 'rmq.sock'))
+        ipc.start()
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for index, scenario in enumerate(scenarios, 1):
+            broker = InMemoryBroker() if args.in_memory else ipc
+            result = run(scenario, args.host, args.port, args.timeout, broker)
+            results.append(result)
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            print(f"[{index}/{len(scenarios)}] {scenario}: {result['throughput'] or 0:.0f} msg/s, "
+                  f"p99 {result['latency_ms']['p99'] or 0:.2f} ms", file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if ipc is not None:
+            ipc.stop()
+            os.rmdir(os.path.dirname(ipc.path))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = [json.loads(line) for line in file if line.strip()]
+        regressions = compare(baseline, results, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -2,3 +2,56 @@ import os
 
 RMQ_HOST = os.getenv('RMQ_HOST', 'localhost')
 RMQ_PORT = int(os.getenv('RMQ_PORT', 5672))
+
+# Consumer QoS, see RabbitMQConsumer. Unset prefetch count keeps the broker's default (unlimited).
+RMQ_PREFETCH_COUNT = int(os.getenv('RMQ_PREFETCH_COUNT')) if os.getenv('RMQ_PREFETCH_COUNT') else None
+RMQ_PREFETCH_SIZE = int(os.getenv('RMQ_PREFETCH_SIZE', 0))
+RMQ_CONSUMER_PRIORITY = int(os.getenv('RMQ_CONSUMER_PRIORITY')) if os.getenv('RMQ_CONSUMER_PRIORITY') else None
+RMQ_ADAPTIVE_PREFETCH = os.getenv('RMQ_ADAPTIVE_PREFETCH', 'false').lower() in ('1', 'true', 'yes')
+
+# Consumer retries of failed callbacks, see retry.py. 0 retries nacks failed messages without requeueing them.
+RMQ_MAX_RETRIES = int(os.getenv('RMQ_MAX_RETRIES', 0))
+RMQ_RETRY_DELAY_MS = int(os.getenv('RMQ_RETRY_DELAY_MS', 1000))
+
+# Consistent-hash sharding of ear_to_brain, see sharding.py. Use the same number of shards for the Ear and every Brain;
+# 0 disables sharding.
+RMQ_SHARDS = int(os.getenv('RMQ_SHARDS', 0))
+
+# Deduplication of redeliveries by message ID, see dedup.py. Producers stamp every message with an ID if
+# RMQ_MESSAGE_IDS is set; consumers remember the IDs of up to RMQ_DEDUP_SIZE processed messages (0 disables it) for
+# RMQ_DEDUP_TTL seconds, persisted in the SQLite database RMQ_DEDUP_PATH if set.
+RMQ_MESSAGE_IDS = os.getenv('RMQ_MESSAGE_IDS', 'false').lower() in ('1', 'true', 'yes')
+RMQ_DEDUP_SIZE = int(os.getenv('RMQ_DEDUP_SIZE', 0))
+RMQ_DEDUP_TTL = float(os.getenv('RMQ_DEDUP_TTL', 3600))
+RMQ_DEDUP_PATH = os.getenv('RMQ_DEDUP_PATH') or None
+
+# Producer compression, see RabbitMQProducer. Unset compression publishes bodies uncompressed.
+RMQ_COMPRESSION = os.getenv('RMQ_COMPRESSION') or None
+RMQ_COMPRESSION_THRESHOLD = int(os.getenv('RMQ_COMPRESSION_THRESHOLD', 1024))
+
+# Latency tracing through message headers, see tracing.py. Enable it for every service of a pipeline.
+RMQ_TRACING = os.getenv('RMQ_TRACING', 'false').lower() in ('1', 'true', 'yes')
+RMQ_TRACE_FILE = os.getenv('RMQ_TRACE_FILE') or None
+
+# Transport of the blocking clients, see transports.py: 'amqp' (RabbitMQ), 'memory' (in-process) or 'ipc' (a local
+# IpcBroker listening on RMQ_IPC_PATH).
+RMQ_TRANSPORT = os.getenv('RMQ_TRANSPORT', 'amqp')
+RMQ_IPC_PATH = os.getenv('RMQ_IPC_PATH', '/tmp/rmq-ipc.sock')
+
+# Declarative topology, see topology.py: a YAML or JSON file, or inline JSON. Unset declares nothing beyond `_setup`.
+RMQ_TOPOLOGY = os.getenv('RMQ_TOPOLOGY') or None
+
+# Producer flow control while the broker blocks the connection, see publishing.BlockedBuffer. Unset spill directory
+# keeps the buffer in memory only.
+RMQ_BLOCKED_BUFFER_SIZE = int(os.getenv('RMQ_BLOCKED_BUFFER_SIZE', 10000))
+RMQ_OVERFLOW_POLICY = os.getenv('RMQ_OVERFLOW_POLICY', 'block')
+RMQ_SPILL_DIR = os.getenv('RMQ_SPILL_DIR') or None
+RMQ_SPILL_MAX_BYTES = int(os.getenv('RMQ_SPILL_MAX_BYTES', 256 * 1024 * 1024))
+
+# Durable spool for messages published while the broker is unreachable, see spool.py. Unset directory disables it.
+RMQ_SPOOL_DIR = os.getenv('RMQ_SPOOL_DIR') or None
+RMQ_SPOOL_SYNC = os.getenv('RMQ_SPOOL_SYNC', 'false').lower() in ('1', 'true', 'yes')
+
+# Priority lanes of ear_to_brain, see lanes.py: the comma-separated weights of the lanes, lowest priority first (e.g.
+# "1,4"). Use the same weights for the Ear and every Brain; unset consumes the queue itself.
+RMQ_LANE_WEIGHTS = [int(weight) for weight in os.getenv('RMQ_LANE_WEIGHTS', '').split(',') if weight.strip()]
@@ -0,0 +1,105 @@
+"""
+Deduplication of redelivered messages by their ``message_id``, see :class:`DedupCache`.
+
+RabbitMQ delivers at least once: a message whose ack was lost with the connection, or that a consumer handed back
+when it stopped, is delivered again. A consumer with deduplication remembers the IDs of the messages its callback
+processed and acks repeats without running the callback again. Messages need an ID for that; producers give every
+message one with `message_ids` enabled. Messages without an ID are always processed.
+"""
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+class DedupCache:
+    """
+    The IDs of recently processed messages, bounded in number (the least recently seen are forgotten first) and in
+    age. With a `path` they are also kept in a SQLite database, so that a restarted consumer still knows them.
+
+    Not thread-safe; consumers use it from their connection's thread only.
+    """
+
+    def __init__(self, max_size: int = 100_000, ttl: float = 3600, path: str | None = None):
+        """
+        :param max_size: The maximum number of IDs to remember.
+        :param ttl: The seconds after which an ID is forgotten.
+        :param path: The SQLite database to persist the IDs in. Created if missing. None keeps them in memory only.
+        """
+        if not isinstance(max_size, int) or isinstance(max_size, bool):
+            raise TypeError("dedup_size must be a positive integer.")
+        elif max_size <= 0:
+            raise ValueError("dedup_size must be a positive integer.")
+
+        if not isinstance(ttl, int | float) or isinstance(ttl, bool):
+            raise TypeError("dedup_ttl must be a positive number.")
+        elif ttl <= 0:
+            raise ValueError("dedup_ttl must be a positive number.")
+
+        if path is not None and (not isinstance(path, str) or not path):
+            raise TypeError("dedup_path must be a non-empty string or None.")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self._seen: OrderedDict[str, float] = OrderedDict()  # message ID -> wall-clock time it was processed
+        self._db: sqlite3.Connection | None = None
+        if path is not None:
+            self._open()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def __contains__(self, message_id: str) -> bool:
+        seen = self._seen.get(message_id)
+        if seen is None:
+            return False
+        if seen < time.time() - self.ttl:
+            self._forget([message_id])
+            return False
+        self._seen.move_to_end(message_id)
+        return True
+
+    def add(self, message_id: str) -> None:
+        """Remembers a processed message and forgets the least recently seen ones beyond the bounds."""
+        now = time.time()
+        self._seen[message_id] = now
+        self._seen.move_to_end(message_id)
+
+        forgotten = []
+        while len(self._seen) > self.max_size or next(iter(self._seen.values())) < now - self.ttl:
+            forgotten.append(self._seen.popitem(last=False)[0])
+        if self._db is not None:
+            self._db.execute('INSERT OR REPLACE INTO seen (message_id, seen) VALUES (?, ?)', (message_id, now))
+            self._forget(forgotten)
+            self._db.commit()
+
+    def discard(self, message_id: str | None) -> None:
+        """Forgets a message that was remembered too early, e.g. because it failed after all."""
+        if message_id is not None and message_id in self._seen:
+            self._forget([message_id])
+            if self._db is not None:
+                self._db.commit()
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _open(self) -> None:
+        """Opens the database and loads the IDs that are still recent enough, oldest first."""
+        # The consumer may be created on another thread than the one it consumes on.
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')  # Appends instead of rewriting pages; a crash loses no commits.
+        self._db.execute('CREATE TABLE IF NOT EXISTS seen (message_id TEXT PRIMARY KEY, seen REAL NOT NULL)')
+        self._db.execute('DELETE FROM seen WHERE seen < ?', (time.time() - self.ttl,))
+        rows = self._db.execute('SELECT message_id, seen FROM seen ORDER BY seen DESC LIMIT ?', (self.max_size,))
+        for message_id, seen in reversed(rows.fetchall()):
+            self._seen[message_id] = seen
+        self._db.execute('DELETE FROM seen WHERE seen < ?', (next(iter(self._seen.values()), 0),))
+        self._db.commit()
+
+    def _forget(self, message_ids: list[str]) -> None:
+        for message_id in message_ids:
+            self._seen.pop(message_id, None)
+        if self._db is not None and message_ids:
+            self._db.executemany('DELETE FROM seen WHERE message_id = ?', [(message_id,) for message_id in message_ids])
@@ -0,0 +1,144 @@
+"""
+The I/O loop shared by the connections of the in-process transports (see :mod:`~services.shared_libs.RabbitMQ.transports`).
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+import pika
+from pika.exceptions import ConnectionWrongStateError
+
+
+class EventLoopConnection:
+    """
+    The parts of ``pika.BlockingConnection`` that do not depend on the wire: a queue of events (deliveries, confirms,
+    thread-safe callbacks), timers and ``connection.blocked`` notifications. Events run on the thread that owns the
+    connection whenever it processes I/O, like with pika. Subclasses add channels and post events with :meth:`_post`.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._events: deque[tuple[callable, tuple]] = deque()  # Run on the connection's thread.
+        self._timers: list[tuple[float, int, callable]] = []  # Heap of (due, timer id, callback).
+        self._cancelled_timers: set[int] = set()
+        self._timer_ids = itertools.count(1)
+        self._blocked_callbacks: list[callable] = []
+        self._unblocked_callbacks: list[callable] = []
+        self.is_open = True
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    def process_data_events(self, time_limit: float | None = 0) -> None:
+        """
+        Runs pending deliveries, confirms, thread-safe callbacks and due timers. Like pika, it returns once it ran
+        something or `time_limit` seconds passed; None waits until there is something to run.
+        """
+        self._check_open()
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        while True:
+            if self._run_pending():
+                return
+            self._check_lost()
+            if not self.is_open:
+                return
+            with self._condition:
+                if self._events:
+                    continue
+                timeout = self._next_timer_delay()
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                self._condition.wait(timeout)
+
+    def sleep(self, duration: float) -> None:
+        """Processes I/O for `duration` seconds."""
+        deadline = time.monotonic() + duration
+        while self.is_open and (remaining := deadline - time.monotonic()) > 0:
+            self.process_data_events(time_limit=remaining)
+
+    def add_callback_threadsafe(self, callback: callable) -> None:
+        """Runs `callback` on the connection's thread; the only method that may be called from other threads."""
+        if not self.is_open:
+            raise ConnectionWrongStateError('Connection is closed.')
+        self._post(callback)
+
+    def call_later(self, delay: float, callback: callable) -> int:
+        self._check_open()
+        timer = next(self._timer_ids)
+        with self._condition:
+            heapq.heappush(self._timers, (time.monotonic() + delay, timer, callback))
+            self._condition.notify_all()
+        return timer
+
+    def remove_timeout(self, timeout_id: int) -> None:
+        with self._condition:
+            self._cancelled_timers.add(timeout_id)
+
+    def add_on_connection_blocked_callback(self, callback: callable) -> None:
+        """`callback` is called with the connection and the ``Connection.Blocked`` frame, like with pika."""
+        self._blocked_callbacks.append(callback)
+
+    def add_on_connection_unblocked_callback(self, callback: callable) -> None:
+        """`callback` is called with the connection and the ``Connection.Unblocked`` frame, like with pika."""
+        self._unblocked_callbacks.append(callback)
+
+    def _post(self, callback: callable, *args) -> None:
+        """Queues `callback` to run on the connection's thread. May be called from any thread."""
+        with self._condition:
+            self._events.append((callback, args))
+            self._condition.notify_all()
+
+    def _shut_down(self) -> None:
+        """Marks the connection closed, drops its pending events and wakes a thread waiting for I/O."""
+        self.is_open = False
+        with self._condition:
+            self._events.clear()
+            self._condition.notify_all()
+
+    def _run_pending(self) -> bool:
+        """Runs the events and due timers queued so far; later ones wait for the next call, like pika's I/O loop."""
+        with self._condition:
+            events = list(self._events)
+            self._events.clear()
+            now = time.monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                _, timer, callback = heapq.heappop(self._timers)
+                if timer in self._cancelled_timers:
+                    self._cancelled_timers.discard(timer)
+                else:
+                    events.append((callback, ()))
+        for callback, args in events:
+            if not self.is_open:
+                break
+            callback(*args)
+        return bool(events)
+
+    def _next_timer_delay(self) -> float | None:
+        while self._timers and self._timers[0][1] in self._cancelled_timers:
+            self._cancelled_timers.discard(heapq.heappop(self._timers)[1])
+        return max(0.0, self._timers[0][0] - time.monotonic()) if self._timers else None
+
+    def _notify_blocked(self, reason: str) -> None:
+        frame = pika.frame.Method(0, pika.spec.Connection.Blocked(reason))
+        for callback in self._blocked_callbacks:
+            callback(self, frame)
+
+    def _notify_unblocked(self) -> None:
+        frame = pika.frame.Method(0, pika.spec.Connection.Unblocked())
+        for callback in self._unblocked_callbacks:
+            callback(self, frame)
+
+    def _check_lost(self) -> None:
+        """Subclasses raise an AMQPConnectionError here if the connection was lost rather than closed."""
+        pass
+
+    def _check_open(self) -> None:
+        self._check_lost()
+        if not self.is_open:
+            raise ConnectionWrongStateError('Connection is closed.')
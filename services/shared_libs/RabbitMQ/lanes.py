@@ -0,0 +1,64 @@
+"""
+Priority lanes, so that interactive messages overtake bulk traffic (e.g. heartbeats) sharing a queue with them.
+
+A queue ``<queue>`` with lanes is split into one lane queue ``<queue>.lane.<n>`` per priority level, lane 0 being the
+lowest. Producers pick the lane of a message from its priority with :func:`routing_key`. Consumers consume all lanes
+of the queue with a weighted fair share: each lane's consumer gets a prefetch count proportional to the lane's weight
+(see :func:`prefetch_counts`), so the broker keeps that many of its messages in flight at once. Under load every lane
+progresses at a rate proportional to its weight, and a message of a heavy lane waits behind at most the few messages
+the light lanes have in flight, however long their queues are. No lane starves, unlike with strict priorities.
+
+For strict priorities within one queue, declare it with ``max_priority`` in the topology (see
+:mod:`~services.shared_libs.RabbitMQ.topology`) and publish with a `priority`; the broker then delivers higher
+priorities first. That only reorders the messages still in the queue, so keep the consumers' prefetch count small.
+
+Use the same lane weights for the producers and the consumers of a queue.
+"""
+from services.shared_libs.RabbitMQ.topology import Topology
+
+BACKGROUND = 0  # The priority of bulk and background traffic, e.g. heartbeats.
+INTERACTIVE = 9  # The priority of messages a user waits for, e.g. chat messages.
+
+
+def lane_queue(queue: str, lane: int) -> str:
+    return f'{queue}.lane.{lane}'
+
+
+def lane_queues(queue: str, lanes: int) -> list[str]:
+    return [lane_queue(queue, lane) for lane in range(lanes)]
+
+
+def lane_of(priority: int | None, lanes: int) -> int:
+    """Returns the lane of a message with `priority`: the lane of the same number, or the highest lane above it."""
+    return min(max(priority or 0, 0), lanes - 1)
+
+
+def routing_key(queue: str, priority: int | None, lanes: int) -> str:
+    """Returns the queue a message with `priority` goes to: its lane of `queue`, or `queue` itself if `lanes` is 0."""
+    return lane_queue(queue, lane_of(priority, lanes)) if lanes else queue
+
+
+def topology(queue: str, lanes: int) -> Topology:
+    """Returns the lane queues of `queue`."""
+    return Topology(queues=[{'name': name} for name in lane_queues(queue, lanes)])
+
+
+def prefetch_counts(weights: list[int], prefetch_count: int | None) -> list[int]:
+    """
+    Splits a consumer's prefetch count among its lanes in proportion to their weights, leaving every lane at least
+    one message. Without a prefetch count (None or 0, i.e. unlimited), every lane's prefetch count is its weight.
+    """
+    if not prefetch_count:
+        return list(weights)
+    total = sum(weights)
+    return [max(1, round(prefetch_count * weight / total)) for weight in weights]
+
+
+def validate_weights(weights: list[int]) -> list[int]:
+    """Validates the `lane_weights` argument of a consumer and returns it as a list."""
+    if not isinstance(weights, list | tuple) or not all(isinstance(weight, int) and not isinstance(weight, bool)
+                                                        for weight in weights):
+        raise TypeError("lane_weights must be a list of positive integers.")
+    elif not all(weight > 0 for weight in weights):
+        raise ValueError("lane_weights must be a list of positive integers.")
+    return list(weights)
@@ -0,0 +1,274 @@
+"""
+Helpers shared by the blocking and asyncio producers.
+"""
+import copy
+import json
+import os
+import struct
+import tempfile
+import uuid
+from collections import OrderedDict, deque
+from typing import Any
+
+import pika
+
+
+def build_properties(durable: bool, properties: pika.BasicProperties = None) -> pika.BasicProperties:
+    """
+    Returns the message properties with the delivery mode set according to `durable`.
+
+    :param durable: If True, the message will be persisted to disk. If False, the message will not be persisted.
+    :param properties: The message properties to update. If None, new properties are created.
+    """
+    if properties is None:
+        return pika.BasicProperties(
+            delivery_mode=pika.DeliveryMode.Persistent if durable else pika.DeliveryMode.Transient
+        )
+    properties.delivery_mode = 2 if durable else 1
+    return properties
+
+
+def with_message_id(properties: pika.BasicProperties | None) -> pika.BasicProperties:
+    """
+    Returns `properties` if they have a ``message_id``, or else a copy of them with a new unique one, so that
+    consumers can recognize redeliveries (see :mod:`~services.shared_libs.RabbitMQ.dedup`).
+    """
+    if properties is not None and properties.message_id is not None:
+        return properties
+    properties = copy.copy(properties) if properties is not None else pika.BasicProperties()
+    properties.message_id = uuid.uuid4().hex
+    return properties
+
+
+def with_priority(properties: pika.BasicProperties | None, priority: int | None) -> pika.BasicProperties | None:
+    """
+    Returns a copy of `properties` with the message priority set to `priority`, or `properties` unchanged if `priority`
+    is None. Queues declared with ``x-max-priority`` deliver messages of higher priority first.
+    """
+    if priority is None:
+        return properties
+    if not isinstance(priority, int) or isinstance(priority, bool):
+        raise TypeError("priority must be an integer between 0 and 255 or None.")
+    elif not 0 <= priority <= 255:
+        raise ValueError("priority must be an integer between 0 and 255 or None.")
+    properties = copy.copy(properties) if properties is not None else pika.BasicProperties()
+    properties.priority = priority
+    return properties
+
+
+class ConfirmTracker:
+    """
+    Bookkeeping for publisher confirms.
+
+    Maps the delivery tag of every unconfirmed message to a future. Works with both
+    :class:`concurrent.futures.Future` and :class:`asyncio.Future`.
+    """
+
+    def __init__(self):
+        self.pending: OrderedDict[int, Any] = OrderedDict()  # delivery tag -> future
+        self.next_delivery_tag = 1
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def reset(self) -> None:
+        """Forgets all pending messages. Delivery tags restart at 1 on every new channel in confirm mode."""
+        self.pending.clear()
+        self.next_delivery_tag = 1
+
+    def register(self, future) -> int:
+        """
+        Registers the future of the next message to be published.
+
+        :return: The delivery tag the broker will use to confirm the message.
+        """
+        tag = self.next_delivery_tag
+        self.pending[tag] = future
+        self.next_delivery_tag += 1
+        return tag
+
+    def discard(self, tag: int) -> None:
+        """Removes a registered message that never reached the channel."""
+        if self.pending.pop(tag, None) is not None and tag == self.next_delivery_tag - 1:
+            self.next_delivery_tag -= 1
+
+    def confirm(self, method: pika.spec.Basic.Ack | pika.spec.Basic.Nack) -> int:
+        """
+        Resolves the futures of all messages covered by a Basic.Ack (True) or Basic.Nack (False).
+
+        :return: The number of resolved messages.
+        """
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            tags = [tag for tag in self.pending if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag] if method.delivery_tag in self.pending else []
+
+        for tag in tags:
+            future = self.pending.pop(tag)
+            if not future.done():
+                future.set_result(acked)
+        return len(tags)
+
+    def fail_all(self, error: Exception) -> None:
+        """Fails the futures of all unconfirmed messages, e.g. after the channel or connection was lost."""
+        while self.pending:
+            _, future = self.pending.popitem(last=False)
+            if not future.done():
+                future.set_exception(error)
+
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop-oldest'
+RAISE = 'raise'
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, RAISE)
+
+# Spilled records: the lengths of the routing header (JSON), the AMQP-encoded properties and the body.
+_SPILL_RECORD = struct.Struct('>III')
+
+
+class BlockedBuffer:
+    """
+    Holds the messages published while the broker blocks the connection (``connection.blocked``, e.g. on a memory or
+    disk alarm), in publish order, until the producer drains it on ``connection.unblocked``.
+
+    Up to `capacity` messages are kept in memory. With a `spill_dir`, further messages are written to a temporary file
+    there while they take up less than `spill_max_bytes`; only their futures stay in memory. Once both are full, :meth:`put`
+    refuses messages and the producer applies its overflow policy (one of :data:`OVERFLOW_POLICIES`).
+
+    Entries are ``(exchange, routing_key, body, properties, future)`` tuples.
+    """
+
+    def __init__(self, capacity: int, policy: str = BLOCK, spill_dir: str | None = None,
+                 spill_max_bytes: int = 256 * 1024 * 1024):
+        """
+        :param capacity: The maximum number of messages kept in memory.
+        :param policy: What the producer does once the buffer is full: 'block' until the connection is unblocked,
+                       'drop-oldest' buffered message or 'raise'.
+        :param spill_dir: The directory to spill messages beyond `capacity` to. None keeps the buffer in memory only.
+        :param spill_max_bytes: The maximum size of the spill file.
+        """
+        if not isinstance(capacity, int) or isinstance(capacity, bool):
+            raise TypeError("blocked_buffer_size must be a positive integer.")
+        elif capacity <= 0:
+            raise ValueError("blocked_buffer_size must be a positive integer.")
+
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of {', '.join(OVERFLOW_POLICIES)}.")
+
+        if spill_dir is not None and not isinstance(spill_dir, str):
+            raise TypeError("spill_dir must be a string or None.")
+
+        if not isinstance(spill_max_bytes, int) or isinstance(spill_max_bytes, bool):
+            raise TypeError("spill_max_bytes must be a positive integer.")
+        elif spill_max_bytes <= 0:
+            raise ValueError("spill_max_bytes must be a positive integer.")
+
+        self.capacity = capacity
+        self.policy = policy
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self._memory: deque[tuple] = deque()
+        self._spill_file = None
+        self._spilled_futures: deque[Any] = deque()  # One per spilled message, in file order.
+        self._spill_read = 0  # Offset of the oldest spilled message not read back yet.
+        self._spill_size = 0
+
+    def __len__(self) -> int:
+        return len(self._memory) + len(self._spilled_futures)
+
+    @property
+    def spilled(self) -> int:
+        """The number of messages currently held on disk."""
+        return len(self._spilled_futures)
+
+    def put(self, exchange: str, routing_key: str, body: bytes, properties: pika.BasicProperties,
+            future: Any = None) -> bool:
+        """
+        Appends a message.
+
+        :return: False if neither memory nor the spill file has room for it.
+        """
+        while self._spilled_futures and len(self._memory) < self.capacity:
+            self._memory.append(self._unspill())  # Spilled messages are older; they go first.
+        if not self._spilled_futures and len(self._memory) < self.capacity:
+            self._memory.append((exchange, routing_key, body, properties, future))
+            return True
+        return self.spill_dir is not None and self._spill(exchange, routing_key, body, properties, future)
+
+    def pop(self) -> tuple | None:
+        """Removes and returns the oldest message, or None if the buffer is empty."""
+        if not self._memory and self._spilled_futures:
+            self._memory.append(self._unspill())
+        return self._memory.popleft() if self._memory else None
+
+    def restore(self, entry: tuple) -> None:
+        """Puts a popped message back in front, e.g. because publishing it failed."""
+        self._memory.appendleft(entry)
+
+    def clear(self) -> list[Any]:
+        """Discards every message and the spill file, and returns the futures of the discarded messages."""
+        futures = [entry[-1] for entry in self._memory] + list(self._spilled_futures)
+        self._memory.clear()
+        self._spilled_futures.clear()
+        self._close_spill_file()
+        return [future for future in futures if future is not None]
+
+    def _spill(self, exchange: str, routing_key: str, body: bytes, properties: pika.BasicProperties,
+               future: Any) -> bool:
+        header = json.dumps([exchange, routing_key]).encode()
+        encoded_properties = b''.join(properties.encode()) if properties is not None else b''
+        size = _SPILL_RECORD.size + len(header) + len(encoded_properties) + len(body)
+        if self._spill_size + size > self.spill_max_bytes:
+            return False
+
+        if self._spill_file is None:
+            self._spill_file = self._open_spill_file()
+        elif self._spill_read >= self.spill_max_bytes:
+            self._compact_spill_file()  # Keeps the file below twice the limit.
+        self._spill_file.seek(0, os.SEEK_END)
+        self._spill_file.write(_SPILL_RECORD.pack(len(header), len(encoded_properties), len(body)))
+        self._spill_file.write(header + encoded_properties + body)
+        self._spill_size += size
+        self._spilled_futures.append(future)
+        return True
+
+    def _unspill(self) -> tuple:
+        self._spill_file.flush()
+        self._spill_file.seek(self._spill_read)
+        header_length, properties_length, body_length = _SPILL_RECORD.unpack(self._spill_file.read(_SPILL_RECORD.size))
+        exchange, routing_key = json.loads(self._spill_file.read(header_length))
+        properties = None
+        if properties_length:
+            properties = pika.BasicProperties()
+            properties.decode(self._spill_file.read(properties_length))
+        body = self._spill_file.read(body_length)
+        self._spill_size -= self._spill_file.tell() - self._spill_read
+        self._spill_read = self._spill_file.tell()
+        future = self._spilled_futures.popleft()
+        if not self._spilled_futures:
+            self._close_spill_file()  # Start over with an empty file rather than growing it forever.
+        return exchange, routing_key, body, properties, future
+
+    def _open_spill_file(self):
+        descriptor, path = tempfile.mkstemp(prefix='rmq-spill-', dir=self.spill_dir)
+        os.unlink(path)  # Removed by the OS once closed, even if the process dies.
+        return os.fdopen(descriptor, 'w+b')
+
+    def _compact_spill_file(self) -> None:
+        """Moves the messages not read back yet to a new file, dropping the space of those that were."""
+        compacted = self._open_spill_file()
+        self._spill_file.flush()
+        self._spill_file.seek(self._spill_read)
+        while chunk := self._spill_file.read(1024 * 1024):
+            compacted.write(chunk)
+        self._spill_file.close()
+        self._spill_file = compacted
+        self._spill_read = 0
+
+    def _close_spill_file(self) -> None:
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        self._spill_read = 0
+        self._spill_size = 0
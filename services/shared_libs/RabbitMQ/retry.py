@@ -0,0 +1,92 @@
+"""
+Delayed retries and dead-lettering for messages whose callback failed, see :class:`RetryPolicy`.
+
+A failed message is republished to a retry queue without consumers whose ``x-message-ttl`` is the retry delay and
+whose dead-letter target is the original queue, so the broker hands it back once the delay expired. Delays grow
+exponentially from tier to tier, one retry queue per tier. The number of retries so far travels in the
+``x-retry-count`` header; once it reaches the limit the message goes to the queue's dead-letter queue instead,
+together with the last error in ``x-last-error``.
+"""
+import copy
+
+from pika.spec import BasicProperties
+
+from services.shared_libs.RabbitMQ.topology import Topology
+
+RETRY_COUNT_HEADER = 'x-retry-count'
+ERROR_HEADER = 'x-last-error'
+
+
+class RetryPolicy:
+    """Names the retry and dead-letter queues of a queue and decides where a failed message goes next."""
+
+    _MAX_DELAY_MS = 3_600_000  # Upper bound for a tier's delay.
+    _MAX_ERROR_LENGTH = 1000  # Characters of the error kept in the ERROR_HEADER.
+
+    def __init__(self, max_retries: int, delay_ms: int = 1000, multiplier: int = 2):
+        """
+        :param max_retries: How often a message is retried before it is dead-lettered.
+        :param delay_ms: The delay before the first retry in milliseconds.
+        :param multiplier: The factor by which the delay grows with every retry.
+        """
+        if not isinstance(max_retries, int) or isinstance(max_retries, bool):
+            raise TypeError("max_retries must be a non-negative integer.")
+        elif max_retries < 0:
+            raise ValueError("max_retries must be a non-negative integer.")
+
+        if not isinstance(delay_ms, int) or isinstance(delay_ms, bool):
+            raise TypeError("retry_delay_ms must be a positive integer.")
+        elif delay_ms <= 0:
+            raise ValueError("retry_delay_ms must be a positive integer.")
+
+        if not isinstance(multiplier, int) or isinstance(multiplier, bool):
+            raise TypeError("multiplier must be a positive integer.")
+        elif multiplier <= 0:
+            raise ValueError("multiplier must be a positive integer.")
+
+        self.max_retries = max_retries
+        self.delay_ms = delay_ms
+        self.multiplier = multiplier
+
+    def delay(self, retry: int) -> int:
+        """Returns the delay in milliseconds before the `retry`-th retry (counting from 1)."""
+        return min(self.delay_ms * self.multiplier ** (retry - 1), self._MAX_DELAY_MS)
+
+    def retry_queue(self, queue: str, retry: int) -> str:
+        return f'{queue}.retry.{self.delay(retry)}ms'
+
+    @staticmethod
+    def dead_letter_queue(queue: str) -> str:
+        return f'{queue}.dead'
+
+    def topology(self, queues: list[str]) -> Topology:
+        """Returns the retry tiers and dead-letter queues of `queues`. Tiers with the same delay are shared."""
+        declared = []
+        for queue in queues:
+            tiers = {self.retry_queue(queue, retry): self.delay(retry) for retry in range(1, self.max_retries + 1)}
+            declared += [{'name': name, 'message_ttl': delay, 'dead_letter_exchange': '',
+                          'dead_letter_routing_key': queue} for name, delay in tiers.items()]
+            declared.append({'name': self.dead_letter_queue(queue)})
+        return Topology(queues=declared)
+
+    @staticmethod
+    def retries(properties: BasicProperties) -> int:
+        """Returns how often the message was retried so far."""
+        return int((properties.headers or {}).get(RETRY_COUNT_HEADER, 0))
+
+    def next(self, queue: str, properties: BasicProperties, error: Exception) -> tuple[str, BasicProperties]:
+        """
+        Decides where a message from `queue` whose callback raised `error` goes next.
+
+        :return: The queue to republish the message to (via the default exchange) and its new properties.
+        """
+        retries = self.retries(properties)
+        properties = copy.copy(properties)
+        headers = dict(properties.headers or {})
+        headers[ERROR_HEADER] = f'{type(error).__name__}: {error}'[:self._MAX_ERROR_LENGTH]
+        if retries >= self.max_retries:
+            properties.headers = headers
+            return self.dead_letter_queue(queue), properties
+        headers[RETRY_COUNT_HEADER] = retries + 1
+        properties.headers = headers
+        return self.retry_queue(queue, retries + 1), properties
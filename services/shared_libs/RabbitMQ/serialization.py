@@ -0,0 +1,305 @@
+"""
+Message codecs shared by the producers and consumers.
+
+A codec turns Python objects into message bodies and back. Producers pick the codec from the ``content_type``
+property (or the type of the message), consumers decode every delivery whose ``content_type`` has a registered codec
+before handing it to `_callback`. Bodies without a ``content_type`` are passed on unchanged, so existing services that
+publish and consume raw bytes keep working.
+
+Encoded bodies may additionally be compressed. The compression is named in the ``content_encoding`` property and
+undone before the body is decoded.
+"""
+import gzip
+import json
+import zlib
+from typing import Any
+
+import pika
+
+try:
+    import msgpack
+except ImportError:  # Optional, see requirements.txt.
+    msgpack = None
+
+try:
+    import lz4.frame
+except ImportError:  # Optional, see requirements.txt.
+    lz4 = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+TEXT = 'text/plain'
+BINARY = 'application/octet-stream'
+
+DEFLATE = 'deflate'
+GZIP = 'gzip'
+LZ4 = 'lz4'
+
+BytesLike = bytes | bytearray | memoryview
+
+
+class Codec:
+    """Encodes objects of one content type to bytes and decodes them again."""
+
+    content_type: str = None
+
+    def encode(self, obj: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, body: bytes) -> Any:
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    """UTF-8 encoded JSON."""
+
+    content_type = JSON
+
+    def encode(self, obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+    def decode(self, body: bytes) -> Any:
+        return json.loads(body)
+
+
+class MsgpackCodec(Codec):
+    """MessagePack, a compact binary format. Binary fields decode to bytes without base64 round trips."""
+
+    content_type = MSGPACK
+
+    def encode(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, body: bytes) -> Any:
+        return msgpack.unpackb(body, raw=False)
+
+
+class TextCodec(Codec):
+    """UTF-8 encoded text."""
+
+    content_type = TEXT
+
+    def encode(self, obj: str) -> bytes:
+        return obj.encode()
+
+    def decode(self, body: bytes) -> str:
+        return body.decode()
+
+
+class BinaryCodec(Codec):
+    """
+    Passes binary payloads through. Bodies are decoded to a :class:`memoryview`, so large payloads can be sliced and
+    handed on without copying them.
+    """
+
+    content_type = BINARY
+
+    def encode(self, obj: BytesLike) -> bytes:
+        # pika only sends bytes; bytes objects are passed through without a copy.
+        return obj if isinstance(obj, bytes) else bytes(obj)
+
+    def decode(self, body: bytes) -> memoryview:
+        return memoryview(body)
+
+
+class Compressor:
+    """Compresses bodies for one content encoding and decompresses them again."""
+
+    encoding: str = None
+
+    def compress(self, body: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decompress(self, body: bytes) -> bytes:
+        raise NotImplementedError
+
+
+class DeflateCompressor(Compressor):
+    """zlib's deflate format, as in HTTP's ``deflate`` content encoding."""
+
+    encoding = DEFLATE
+
+    def __init__(self, level: int = 6):
+        """
+        :param level: The compression level from 1 (fastest) to 9 (smallest).
+        """
+        self.level = level
+
+    def compress(self, body: bytes) -> bytes:
+        return zlib.compress(body, self.level)
+
+    def decompress(self, body: bytes) -> bytes:
+        return zlib.decompress(body)
+
+
+class GzipCompressor(Compressor):
+    """gzip, for consumers outside this project that only understand ``gzip``."""
+
+    encoding = GZIP
+
+    def __init__(self, level: int = 6):
+        """
+        :param level: The compression level from 1 (fastest) to 9 (smallest).
+        """
+        self.level = level
+
+    def compress(self, body: bytes) -> bytes:
+        return gzip.compress(body, self.level, mtime=0)
+
+    def decompress(self, body: bytes) -> bytes:
+        return gzip.decompress(body)
+
+
+class Lz4Compressor(Compressor):
+    """LZ4 frames, much faster than deflate at a somewhat lower ratio."""
+
+    encoding = LZ4
+
+    def compress(self, body: bytes) -> bytes:
+        return lz4.frame.compress(body)
+
+    def decompress(self, body: bytes) -> bytes:
+        return lz4.frame.decompress(body)
+
+
+class CodecRegistry:
+    """
+    Maps content types to codecs and content encodings to compressors.
+
+    Example:
+        registry = CodecRegistry()
+        registry.register(MyProtobufCodec())
+        producer = MyEar(codecs=registry)
+    """
+
+    def __init__(self, codecs: list[Codec] | None = None, compressors: list[Compressor] | None = None):
+        """
+        :param codecs: The codecs to register. None registers the built-in codecs (msgpack only if it is installed).
+        :param compressors: The compressors to register. None registers deflate, gzip and (if installed) lz4.
+        """
+        self._codecs: dict[str, Codec] = {}
+        self._compressors: dict[str, Compressor] = {}
+        if codecs is None:
+            codecs = [JsonCodec(), TextCodec(), BinaryCodec()] + ([MsgpackCodec()] if msgpack is not None else [])
+        if compressors is None:
+            compressors = [DeflateCompressor(), GzipCompressor()] + ([Lz4Compressor()] if lz4 is not None else [])
+        for codec in codecs:
+            self.register(codec)
+        for compressor in compressors:
+            self.register_compressor(compressor)
+
+    def __contains__(self, content_type: str) -> bool:
+        return content_type in self._codecs
+
+    def register(self, codec: Codec) -> None:
+        """
+        Registers `codec` for its content type, replacing any codec registered for it before.
+
+        :raises TypeError: If `codec` is not a Codec.
+        :raises ValueError: If the codec does not declare a content type.
+        """
+        if not isinstance(codec, Codec):
+            raise TypeError("codec must be a Codec instance.")
+        if not codec.content_type:
+            raise ValueError("codec must declare a content_type.")
+        self._codecs[codec.content_type] = codec
+
+    def register_compressor(self, compressor: Compressor) -> None:
+        """
+        Registers `compressor` for its content encoding, replacing any compressor registered for it before.
+
+        :raises TypeError: If `compressor` is not a Compressor.
+        :raises ValueError: If the compressor does not declare an encoding.
+        """
+        if not isinstance(compressor, Compressor):
+            raise TypeError("compressor must be a Compressor instance.")
+        if not compressor.encoding:
+            raise ValueError("compressor must declare an encoding.")
+        self._compressors[compressor.encoding] = compressor
+
+    def get_compressor(self, encoding: str) -> Compressor:
+        """
+        :raises ValueError: If no compressor is registered for `encoding`.
+        """
+        try:
+            return self._compressors[encoding]
+        except KeyError:
+            raise ValueError(f"No compressor registered for content encoding '{encoding}'.") from None
+
+    def get(self, content_type: str) -> Codec:
+        """
+        :raises ValueError: If no codec is registered for `content_type`.
+        """
+        try:
+            return self._codecs[content_type]
+        except KeyError:
+            raise ValueError(f"No codec registered for content type '{content_type}'.") from None
+
+    def encode(self, message: Any, properties: pika.BasicProperties = None,
+               default_content_type: str = JSON) -> tuple[bytes, pika.BasicProperties | None]:
+        """
+        Encodes a message for publishing.
+
+        Bytes-like messages are taken as already encoded and sent as they are, so raw payloads and forwarded bodies
+        are never copied into another format. Other messages are encoded with the codec of ``properties.content_type``
+        or, if that is not set, as text (strings) or with `default_content_type`. The chosen content type is stored in
+        the returned properties.
+
+        :param message: The object to publish.
+        :param properties: The message properties. Updated in place if given.
+        :param default_content_type: The content type of messages that are neither bytes-like nor strings.
+        :return: The message body and the properties to publish it with (None if none were given and the message is bytes-like).
+        :raises ValueError: If no codec is registered for the content type.
+        """
+        if isinstance(message, BytesLike):
+            return (message if isinstance(message, bytes) else bytes(message)), properties
+
+        if properties is None:
+            properties = pika.BasicProperties()
+        if properties.content_type is None:
+            properties.content_type = TEXT if isinstance(message, str) else default_content_type
+        return self.get(properties.content_type).encode(message), properties
+
+    def compress(self, body: bytes, properties: pika.BasicProperties | None,
+                 encoding: str) -> tuple[bytes, pika.BasicProperties | None]:
+        """
+        Compresses an encoded body and names the compression in ``properties.content_encoding``.
+        Bodies that already have a content encoding, and bodies that would not get smaller, are returned unchanged.
+
+        :param body: The encoded message body.
+        :param properties: The message properties. Updated in place if given.
+        :param encoding: The content encoding to compress with.
+        :return: The body and the properties to publish it with.
+        :raises ValueError: If no compressor is registered for `encoding`.
+        """
+        compressor = self.get_compressor(encoding)
+        if properties is not None and properties.content_encoding is not None:
+            return body, properties
+        compressed = compressor.compress(body)
+        if len(compressed) >= len(body):
+            return body, properties
+        if properties is None:
+            properties = pika.BasicProperties()
+        properties.content_encoding = encoding
+        return compressed, properties
+
+    def decode(self, body: bytes, properties: pika.BasicProperties = None) -> Any:
+        """
+        Decompresses a delivered body according to its ``content_encoding`` and decodes it according to its
+        ``content_type``. Bodies without a content type or with one that has no registered codec are returned as bytes.
+
+        :raises ValueError: If no compressor is registered for the body's content encoding.
+        """
+        if properties is not None and properties.content_encoding is not None:
+            body = self.get_compressor(properties.content_encoding).decompress(body)
+        content_type = properties.content_type if properties is not None else None
+        codec = self._codecs.get(content_type) if content_type is not None else None
+        return body if codec is None else codec.decode(body)
+
+
+codecs = CodecRegistry()  # Used by every client that is not given a registry of its own.
+
+
+def decode_and_call(registry: CodecRegistry, callback: callable, ch, method, properties, body) -> Any:
+    """Decodes `body` and calls `callback` with the result. Module-level, so it can be sent to a process pool."""
+    return callback(ch, method, properties, registry.decode(body, properties))
@@ -0,0 +1,121 @@
+"""
+Consistent-hash sharding of a queue, so that every message about the same key (e.g. a conversation) reaches the same
+consumer and its per-key state stays in one process.
+
+A sharded queue ``<queue>`` is split into a fixed number of shard queues ``<queue>.shard.<n>``. Producers pick the
+shard of a message from its key with :func:`routing_key`. Consumers of the queue claim the shards among themselves:
+every consumer announces itself on the fanout exchange ``<queue>.members`` and tracks the others in a
+:class:`ShardMembership`, which assigns each shard to one member by rendezvous hashing. When a consumer joins or
+leaves (or stops announcing itself), only the shards it gains or loses move. The shard queues have a single active
+consumer, so a shard is never processed by two consumers at once while they rebalance, and a consumer that does not
+know its peers yet merely stands by on the shards they own.
+
+Use the same number of shards for the producers and the consumers of a queue; changing it moves about all keys.
+"""
+import hashlib
+import time
+
+from services.shared_libs.RabbitMQ.topology import Topology
+
+HEARTBEAT = 'heartbeat'
+LEAVE = 'leave'
+
+
+def _hash(value: str) -> int:
+    """A 64-bit hash that, unlike ``hash()``, is the same in every process."""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+def shard_of(key: str | int, shards: int) -> int:
+    """
+    Returns the shard of `key`, using jump consistent hashing (Lamping and Veach), so that growing the number of
+    shards from n to n + 1 moves only 1/(n + 1) of the keys.
+
+    :raises ValueError: If `shards` is not positive.
+    """
+    if shards <= 0:
+        raise ValueError("shards must be a positive integer.")
+    key = _hash(str(key))
+    shard, candidate = -1, 0
+    while candidate < shards:
+        shard = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((shard + 1) * (1 << 31) / ((key >> 33) + 1))
+    return shard
+
+
+def shard_queue(queue: str, shard: int) -> str:
+    return f'{queue}.shard.{shard}'
+
+
+def shard_queues(queue: str, shards: int) -> list[str]:
+    return [shard_queue(queue, shard) for shard in range(shards)]
+
+
+def members_exchange(queue: str) -> str:
+    """The fanout exchange the consumers of a sharded queue announce themselves on."""
+    return f'{queue}.members'
+
+
+def routing_key(queue: str, key: str | int, shards: int) -> str:
+    """Returns the queue a message about `key` goes to: its shard of `queue`, or `queue` itself if `shards` is 0."""
+    return shard_queue(queue, shard_of(key, shards)) if shards else queue
+
+
+def topology(queue: str, shards: int) -> Topology:
+    """Returns the shard queues of `queue`, each with a single active consumer, and its membership exchange."""
+    return Topology(exchanges=[{'name': members_exchange(queue), 'type': 'fanout', 'durable': False}],
+                    queues=[{'name': name, 'arguments': {'x-single-active-consumer': True}}
+                            for name in shard_queues(queue, shards)])
+
+
+class ShardMembership:
+    """The consumers of a sharded queue as seen by one of them, `member`, and the shards each of them owns."""
+
+    def __init__(self, member: str, shards: int, timeout: float):
+        """
+        :param member: The ID of the consumer keeping this view.
+        :param shards: The number of shards.
+        :param timeout: The seconds after which a member that did not announce itself is considered gone.
+        """
+        if not isinstance(shards, int) or isinstance(shards, bool):
+            raise TypeError("shards must be a positive integer.")
+        elif shards <= 0:
+            raise ValueError("shards must be a positive integer.")
+
+        self.member = member
+        self.shards = shards
+        self.timeout = timeout
+        self._last_seen: dict[str, float] = {}  # The other members by the time they last announced themselves.
+
+    @property
+    def members(self) -> list[str]:
+        return sorted([self.member, *self._last_seen])
+
+    def seen(self, member: str) -> bool:
+        """Records that `member` announced itself and returns whether it is new."""
+        if member == self.member:
+            return False
+        new = member not in self._last_seen
+        self._last_seen[member] = time.monotonic()
+        return new
+
+    def left(self, member: str) -> bool:
+        """Forgets `member` and returns whether it was known."""
+        return self._last_seen.pop(member, None) is not None
+
+    def expire(self) -> list[str]:
+        """Forgets and returns the members that did not announce themselves within the timeout."""
+        deadline = time.monotonic() - self.timeout
+        expired = [member for member, seen in self._last_seen.items() if seen < deadline]
+        for member in expired:
+            del self._last_seen[member]
+        return expired
+
+    def owner(self, shard: int) -> str:
+        """Returns the member the shard is assigned to, the one with the highest rendezvous hash for it."""
+        return max(self.members, key=lambda member: _hash(f'{member}/{shard}'))
+
+    def assignment(self) -> list[int]:
+        """Returns the shards assigned to this view's own member."""
+        return [shard for shard in range(self.shards) if self.owner(shard) == self.member]
@@ -0,0 +1,255 @@
+"""
+A durable, append-only spool for messages a producer could not deliver, e.g. during a broker outage.
+
+Messages are appended to segment files in a directory of their own. Every message has a sequence number; the producer
+replays them in order once the broker is reachable again and acknowledges them with :meth:`Spool.ack`, which moves the
+checkpoint forward and deletes segments whose messages were all acknowledged. Messages that were spooled but not
+acknowledged when the process stopped are replayed by the next producer that opens the spool, so an outage costs
+latency rather than data. Replays are at-least-once: a message may be published again if the process stops between
+publishing and acknowledging it.
+"""
+import json
+import os
+import struct
+import threading
+import zlib
+
+import pika
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; the spool is then not protected against concurrent use.
+    fcntl = None
+
+# Every record: a CRC-32 of the rest of the record, then the lengths of the routing header (JSON), the AMQP-encoded
+# properties and the body, followed by the three of them. A record with a wrong checksum is a torn write.
+_RECORD = struct.Struct('>IIII')
+_SEGMENT_SUFFIX = '.seg'
+_CHECKPOINT = 'checkpoint'
+_LOCK = 'lock'
+
+
+class Spool:
+    """
+    A write-ahead spool in `directory`. Only one spool may use a directory at a time.
+
+    Not tied to a connection's thread; all methods are thread-safe.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024, sync: bool = False):
+        """
+        :param directory: The directory to keep the segments in. Created if missing.
+        :param segment_bytes: The size after which a new segment is started. Acknowledged segments are deleted.
+        :param sync: If True, every append is fsynced, which survives power loss rather than only process crashes.
+        :raises RuntimeError: If another spool uses the directory.
+        """
+        if not isinstance(directory, str) or not directory:
+            raise TypeError("spool_dir must be a non-empty string.")
+
+        if not isinstance(segment_bytes, int) or isinstance(segment_bytes, bool):
+            raise TypeError("segment_bytes must be a positive integer.")
+        elif segment_bytes <= 0:
+            raise ValueError("segment_bytes must be a positive integer.")
+
+        if not isinstance(sync, bool):
+            raise TypeError("sync must be a boolean.")
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.sync = sync
+        self._lock = threading.RLock()
+        self._lock_file = open(os.path.join(directory, _LOCK), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise RuntimeError(f"The spool in {directory} is used by another producer.")
+
+        self._acked = self._read_checkpoint()  # Sequence number of the last acknowledged message.
+        self._segments: list[list[int]] = []  # [first sequence number, message count] per segment, oldest first.
+        self._writer = None
+        self._writer_size = 0
+        self._read_position: tuple[int, int] | None = None  # (segment index, offset) of the message after `_acked`.
+        self._recover()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._next_sequence() - self._acked - 1
+
+    def append(self, exchange: str, routing_key: str, body: bytes, properties: pika.BasicProperties | None) -> int:
+        """
+        Appends a message and flushes it to the operating system (and the disk, with `sync`).
+
+        :return: The message's sequence number.
+        """
+        header = json.dumps([exchange, routing_key]).encode()
+        encoded_properties = b''.join(properties.encode()) if properties is not None else b''
+        payload = header + encoded_properties + body
+        record = _RECORD.pack(zlib.crc32(payload), len(header), len(encoded_properties), len(body)) + payload
+
+        with self._lock:
+            if self._writer is None or self._writer_size >= self.segment_bytes:
+                self._start_segment()
+            self._writer.write(record)
+            self._writer.flush()
+            if self.sync:
+                os.fsync(self._writer.fileno())
+            self._writer_size += len(record)
+            self._segments[-1][1] += 1
+            return self._next_sequence() - 1
+
+    def read(self, limit: int) -> list[tuple[int, tuple]]:
+        """
+        Returns up to `limit` of the oldest unacknowledged messages without removing them.
+
+        :return: ``(sequence, (exchange, routing_key, body, properties))`` pairs in order.
+        """
+        with self._lock:
+            messages = self._scan(self._read_position, limit)
+            return [(self._acked + 1 + index, message) for index, (_, message) in enumerate(messages)]
+
+    def ack(self, sequence: int) -> None:
+        """Acknowledges every message up to and including `sequence` and deletes the segments no longer needed."""
+        with self._lock:
+            sequence = min(sequence, self._next_sequence() - 1)
+            if sequence <= self._acked:
+                return
+            position = self._read_position
+            for position, _ in self._scan(self._read_position, sequence - self._acked):
+                pass
+            self._acked = sequence
+            self._read_position = position
+            self._write_checkpoint()
+            self._compact()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            if not self._lock_file.closed:
+                self._lock_file.close()  # Releases the lock.
+
+    def _path(self, first_sequence: int) -> str:
+        return os.path.join(self.directory, f'{first_sequence:020d}{_SEGMENT_SUFFIX}')
+
+    def _next_sequence(self) -> int:
+        if not self._segments:
+            return self._acked + 1
+        first, count = self._segments[-1]
+        return first + count
+
+    def _start_segment(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        first = self._next_sequence()
+        self._writer = open(self._path(first), 'ab')
+        self._writer_size = 0
+        self._segments.append([first, 0])
+        if self._read_position is None:
+            self._read_position = (len(self._segments) - 1, 0)
+
+    def _recover(self) -> None:
+        """Indexes the segments left by an earlier process and cuts off a record torn by a crash."""
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(_SEGMENT_SUFFIX))
+        for name in names:
+            first = int(name[:-len(_SEGMENT_SUFFIX)])
+            path = os.path.join(self.directory, name)
+            count, valid_size = 0, 0
+            with open(path, 'rb') as segment:
+                while _read_record(segment) is not None:
+                    count += 1
+                    valid_size = segment.tell()
+            if valid_size < os.path.getsize(path):
+                with open(path, 'r+b') as segment:
+                    segment.truncate(valid_size)
+            if count == 0 or first + count - 1 <= self._acked:
+                os.remove(path)  # Empty, or acknowledged before the last process could delete it.
+                continue
+            self._segments.append([first, count])
+
+        if self._segments:
+            first = self._segments[0][0]
+            self._read_position = (0, 0)
+            if first <= self._acked:  # Skip the acknowledged head of the oldest segment.
+                for position, _ in self._scan((0, 0), self._acked - first + 1):
+                    self._read_position = position
+            self._acked = max(self._acked, first - 1)
+
+    def _scan(self, start: tuple[int, int] | None, limit: int | None = None):
+        """
+        Yields ``(position after the message, message)`` for up to `limit` messages from `start` on.
+        Messages are decoded lazily, so skipping over them is cheap.
+        """
+        if start is None:
+            return
+        index, offset = start
+        yielded = 0
+        while index < len(self._segments) and (limit is None or yielded < limit):
+            if self._writer is not None and index == len(self._segments) - 1:
+                self._writer.flush()
+            with open(self._path(self._segments[index][0]), 'rb') as segment:
+                segment.seek(offset)
+                while limit is None or yielded < limit:
+                    message = _read_record(segment)
+                    if message is None:
+                        break
+                    offset = segment.tell()
+                    yielded += 1
+                    yield (index, offset), message
+            if limit is not None and yielded >= limit:
+                return
+            index, offset = index + 1, 0
+
+    def _compact(self) -> None:
+        """Deletes the segments all of whose messages were acknowledged."""
+        removed = 0
+        for first, count in self._segments:
+            if first + count - 1 > self._acked:
+                break
+            if self._writer is not None and first == self._segments[-1][0]:
+                self._writer.close()  # Everything was acknowledged; the next append starts a new segment.
+                self._writer = None
+            os.remove(self._path(first))
+            removed += 1
+        if removed:
+            del self._segments[:removed]
+            index, offset = self._read_position
+            self._read_position = (index - removed, offset) if self._segments else None
+            if self._read_position is not None and self._read_position[0] < 0:
+                self._read_position = (0, 0)
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(os.path.join(self.directory, _CHECKPOINT), encoding='utf-8') as file:
+                return int(file.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self) -> None:
+        path = os.path.join(self.directory, _CHECKPOINT)
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            file.write(str(self._acked))
+            file.flush()
+            if self.sync:
+                os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)  # Atomic, so a crash leaves either the old or the new checkpoint.
+
+
+def _read_record(segment) -> tuple | None:
+    """Reads the next record, or returns None at the end of the segment or at a torn record."""
+    prefix = segment.read(_RECORD.size)
+    if len(prefix) < _RECORD.size:
+        return None
+    checksum, header_length, properties_length, body_length = _RECORD.unpack(prefix)
+    payload = segment.read(header_length + properties_length + body_length)
+    if len(payload) < header_length + properties_length + body_length or zlib.crc32(payload) != checksum:
+        return None
+    exchange, routing_key = json.loads(payload[:header_length])
+    properties = None
+    if properties_length:
+        properties = pika.BasicProperties()
+        properties.decode(payload[header_length:header_length + properties_length])
+    return exchange, routing_key, payload[header_length + properties_length:], properties
@@ -0,0 +1,254 @@
+"""
+Streamed responses: a reply published as ordered chunks, so that its consumer can start on the first chunk while the
+rest is still being produced (e.g. a Mouth speaking a reply the Brain is still generating).
+
+A producer opens a :class:`Stream` with :meth:`RabbitMQProducer.stream` and publishes chunks to it. Every chunk
+carries the stream's ID in the ``x-stream-id`` header and its position in ``x-stream-seq``; the last one carries
+``x-stream-end``. Consumers tell chunks apart from other messages with :func:`chunk_of` and put them back into order
+with a :class:`Reassembler`, see :class:`~services.mouth.abstract_mouth.AbstractMouth`.
+
+RabbitMQ keeps the order of the messages of one channel in one queue, but redeliveries and requeues can overtake
+them; the reassembler holds chunks back until their predecessors arrived. All chunks of a stream must reach the same
+consumer, so a queue carrying streams needs a single consumer or sharding by stream ID (see
+:mod:`~services.shared_libs.RabbitMQ.sharding`).
+"""
+import copy
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+import pika
+
+STREAM_ID_HEADER = 'x-stream-id'
+STREAM_SEQ_HEADER = 'x-stream-seq'
+STREAM_END_HEADER = 'x-stream-end'
+
+
+class Chunk(NamedTuple):
+    """The position of a message in its stream."""
+    stream_id: str
+    seq: int  # 0 for the first chunk
+    end: bool  # Whether it is the last chunk of the stream
+
+
+def chunk_of(properties: pika.BasicProperties | None) -> Chunk | None:
+    """Returns the position of a message in its stream, or None if it is not a chunk of a stream."""
+    headers = properties.headers if properties is not None else None
+    if not headers or STREAM_ID_HEADER not in headers:
+        return None
+    stream_id = headers[STREAM_ID_HEADER]
+    if isinstance(stream_id, bytes):
+        stream_id = stream_id.decode()
+    return Chunk(stream_id, int(headers.get(STREAM_SEQ_HEADER, 0)), bool(headers.get(STREAM_END_HEADER, False)))
+
+
+def chunk_properties(chunk: Chunk, properties: pika.BasicProperties | None = None) -> pika.BasicProperties:
+    """Returns a copy of `properties` with the stream headers of `chunk`."""
+    properties = copy.copy(properties) if properties is not None else pika.BasicProperties()
+    headers = dict(properties.headers or {})
+    headers[STREAM_ID_HEADER] = chunk.stream_id
+    headers[STREAM_SEQ_HEADER] = chunk.seq
+    if chunk.end:
+        headers[STREAM_END_HEADER] = True
+    else:
+        headers.pop(STREAM_END_HEADER, None)
+    properties.headers = headers
+    return properties
+
+
+def renewed(properties: pika.BasicProperties | None, stream_ids: dict[str, str]) -> pika.BasicProperties | None:
+    """
+    Returns `properties` with a new stream ID if they belong to a chunk, e.g. to publish a recorded stream again.
+    Chunks of the same original stream get the same new ID from `stream_ids`, which maps original to new IDs.
+    """
+    chunk = chunk_of(properties)
+    if chunk is None:
+        return properties
+    stream_id = stream_ids.setdefault(chunk.stream_id, uuid.uuid4().hex)
+    return chunk_properties(chunk._replace(stream_id=stream_id), properties)
+
+
+class Stream:
+    """
+    Publishes the chunks of one streamed reply. Use it as a context manager, so that the stream is ended even if
+    producing the reply fails::
+
+        with brain.stream('brain_to_mouth') as stream:
+            for token in model.generate(prompt):
+                stream.send(token)
+
+    Not thread-safe; publish the chunks of a stream from one thread.
+    """
+
+    def __init__(self, producer, routing_key: str, exchange: str = '', durable: bool = True,
+                 properties: pika.BasicProperties | None = None, stream_id: str | None = None):
+        """
+        :param producer: The producer to publish with, e.g. a :class:`RabbitMQProducer`.
+        :param routing_key: The routing key of every chunk.
+        :param exchange: The exchange of every chunk.
+        :param durable: If True, the chunks will be persisted to disk.
+        :param properties: The properties of every chunk, to which the stream headers are added.
+        :param stream_id: The ID of the stream. None generates a unique one.
+        """
+        if stream_id is not None and (not isinstance(stream_id, str) or not stream_id):
+            raise TypeError("stream_id must be a non-empty string or None.")
+
+        self.stream_id = stream_id or uuid.uuid4().hex
+        self._producer = producer
+        self._routing_key = routing_key
+        self._exchange = exchange
+        self._durable = durable
+        self._properties = properties
+        self._seq = 0
+        self.ended = False
+
+    def __enter__(self) -> 'Stream':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self.ended:
+            self.end()
+
+    def send(self, chunk: Any) -> Any:
+        """
+        Publishes the next chunk.
+
+        :return: What the producer's ``publish`` returned, e.g. a Future with publisher confirms.
+        :raises RuntimeError: If the stream has ended.
+        """
+        return self._publish(chunk, end=False)
+
+    def end(self, chunk: Any = b'') -> Any:
+        """
+        Publishes the last chunk, by default an empty one that only marks the end.
+
+        :return: What the producer's ``publish`` returned, e.g. a Future with publisher confirms.
+        :raises RuntimeError: If the stream has ended.
+        """
+        return self._publish(chunk, end=True)
+
+    def _publish(self, chunk: Any, end: bool) -> Any:
+        if self.ended:
+            raise RuntimeError(f"Stream {self.stream_id} has ended.")
+        properties = chunk_properties(Chunk(self.stream_id, self._seq, end), self._properties)
+        self._seq += 1
+        self.ended = end
+        return self._producer.publish(chunk, self._routing_key, self._exchange, self._durable, properties)
+
+
+class Reassembler:
+    """
+    Puts the chunks of streams back into order.
+
+    :meth:`add` takes chunks as they arrive and returns the ones that are next in their stream, holding back chunks
+    whose predecessors are missing. Chunks that arrive again after they were handed over, and chunks of streams that
+    ended, are dropped. If a stream makes no progress for `timeout` seconds, :meth:`expire` hands over the chunks it
+    held back anyway, skipping the missing ones.
+
+    Not thread-safe; consumers use it from their connection's thread only.
+    """
+
+    _ENDED_STREAMS = 10_000  # IDs of ended streams remembered to drop their late duplicates.
+
+    def __init__(self, timeout: float = 30):
+        """
+        :param timeout: The seconds a stream may wait for a missing chunk, and the seconds of silence after which an
+                        unended stream is forgotten.
+        """
+        if not isinstance(timeout, int | float) or isinstance(timeout, bool):
+            raise TypeError("stream_timeout must be a positive number.")
+        elif timeout <= 0:
+            raise ValueError("stream_timeout must be a positive number.")
+
+        self.timeout = timeout
+        self._next: dict[str, int] = {}  # stream ID -> sequence number expected next
+        self._held: dict[str, dict[int, tuple[Chunk, Any]]] = {}  # stream ID -> seq -> (chunk, item)
+        self._active: dict[str, float] = {}  # stream ID -> monotonic time of its last progress
+        self._ended: OrderedDict[str, None] = OrderedDict()
+
+    def __len__(self) -> int:
+        """The number of streams that did not end yet."""
+        return len(self._next)
+
+    @property
+    def held(self) -> int:
+        """The number of chunks held back."""
+        return sum(len(held) for held in self._held.values())
+
+    def add(self, chunk: Chunk, item: Any) -> tuple[list[tuple[Chunk, Any]], list[tuple[Chunk, Any]]]:
+        """
+        Adds an arrived chunk.
+
+        :param chunk: The position of the chunk.
+        :param item: What to hand over for the chunk, e.g. the delivery.
+        :return: The chunks (with their items) that are next in the stream, in order, and the chunks that are dropped:
+                 duplicates and chunks past the end of their stream.
+        """
+        if chunk.stream_id in self._ended or chunk.seq < self._next.get(chunk.stream_id, 0) or \
+                chunk.seq in self._held.get(chunk.stream_id, {}):
+            return [], [(chunk, item)]
+        if chunk.stream_id not in self._next:
+            self._next[chunk.stream_id] = 0
+            self._active[chunk.stream_id] = time.monotonic()
+        self._held.setdefault(chunk.stream_id, {})[chunk.seq] = (chunk, item)
+        return self._release(chunk.stream_id)
+
+    def expire(self) -> tuple[list[tuple[Chunk, Any]], list[tuple[Chunk, Any]]]:
+        """
+        Gives up waiting for the missing chunks of streams that made no progress within the timeout, and forgets
+        streams that fell silent without ending, e.g. because their producer died.
+
+        :return: The chunks (with their items) held back by those streams, in order, and the chunks that are dropped.
+        """
+        released, dropped = [], []
+        deadline = time.monotonic() - self.timeout
+        for stream_id, active in list(self._active.items()):
+            if active > deadline:
+                continue
+            if not self._held.get(stream_id):
+                self._forget(stream_id)
+                continue
+            while self._held.get(stream_id):
+                self._next[stream_id] = min(self._held[stream_id])  # Skip the missing chunks.
+                next_released, next_dropped = self._release(stream_id)
+                released += next_released
+                dropped += next_dropped
+        return released, dropped
+
+    def drop_held(self) -> list[tuple[Chunk, Any]]:
+        """
+        Forgets the chunks held back, e.g. because their channel closed and they will be delivered again. The
+        progress of the streams is kept, so chunks handed over already are still dropped when they arrive again.
+
+        :return: The chunks (with their items) that were held back.
+        """
+        held = [item for stream in self._held.values() for _, item in sorted(stream.items())]
+        self._held.clear()
+        return held
+
+    def waiting(self) -> bool:
+        """Whether chunks are held back, i.e. :meth:`expire` may have to be called."""
+        return any(self._held.values())
+
+    def _release(self, stream_id: str) -> tuple[list[tuple[Chunk, Any]], list[tuple[Chunk, Any]]]:
+        """Takes the chunks that are next in a stream from the held-back ones."""
+        released = []
+        held = self._held[stream_id]
+        while self._next[stream_id] in held:
+            chunk, item = held.pop(self._next[stream_id])
+            released.append((chunk, item))
+            self._next[stream_id] += 1
+            self._active[stream_id] = time.monotonic()
+            if chunk.end:
+                self._forget(stream_id)
+                self._ended[stream_id] = None
+                if len(self._ended) > self._ENDED_STREAMS:
+                    self._ended.popitem(last=False)
+                return released, [held[seq] for seq in sorted(held)]
+        return released, []
+
+    def _forget(self, stream_id: str) -> None:
+        self._next.pop(stream_id, None)
+        self._active.pop(stream_id, None)
+        self._held.pop(stream_id, None)
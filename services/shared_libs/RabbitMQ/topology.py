@@ -0,0 +1,242 @@
+"""
+Declarative broker topology: exchanges, queues, bindings and publish routes, loaded from YAML or JSON.
+
+Clients apply their topology on every (re)connect, before `_setup` runs. Declarations are idempotent, so every
+service of a pipeline can apply the same file. Routes let producers keep publishing to a logical name on the default
+exchange while the topology decides where the messages go, e.g. to fan them out to several Brains or to shard them
+over several queues, without code changes.
+
+Example:
+    exchanges:
+      - name: ear
+        type: fanout
+    queues:
+      - name: ear_to_brain
+        message_ttl: 60000
+        dead_letter_exchange: dead_letters
+    bindings:
+      - queue: ear_to_brain
+        exchange: ear
+    routes:
+      ear_to_brain: {exchange: ear, routing_key: ''}
+"""
+import json
+import os
+from typing import Any
+
+try:
+    import yaml
+except ImportError:  # Optional, see requirements.txt. JSON topologies work without it.
+    yaml = None
+
+EXCHANGE_TYPES = ('direct', 'fanout', 'topic', 'headers')
+
+# Queue options that map to RabbitMQ's optional queue arguments.
+_QUEUE_ARGUMENTS = {
+    'message_ttl': 'x-message-ttl',
+    'expires': 'x-expires',
+    'max_length': 'x-max-length',
+    'max_length_bytes': 'x-max-length-bytes',
+    'overflow': 'x-overflow',
+    'dead_letter_exchange': 'x-dead-letter-exchange',
+    'dead_letter_routing_key': 'x-dead-letter-routing-key',
+    'max_priority': 'x-max-priority',
+    'queue_type': 'x-queue-type',
+}
+_EXCHANGE_OPTIONS = {'name', 'type', 'durable', 'auto_delete', 'internal', 'arguments'}
+_QUEUE_OPTIONS = {'name', 'durable', 'exclusive', 'auto_delete', 'arguments'} | set(_QUEUE_ARGUMENTS)
+_BINDING_OPTIONS = {'queue', 'exchange', 'routing_key', 'arguments'}
+_ROUTE_OPTIONS = {'exchange', 'routing_key'}
+
+
+class Topology:
+    """
+    A validated topology. An empty topology declares nothing and routes every message as published.
+
+    Queues are durable unless stated otherwise, since a queue that vanishes with the broker loses the persistent
+    messages published to it.
+    """
+
+    def __init__(self, exchanges: list[dict] | None = None, queues: list[dict] | None = None,
+                 bindings: list[dict] | None = None, routes: dict[str, dict] | None = None):
+        """
+        :param exchanges: Exchanges as mappings with a `name` and optionally `type` (direct, fanout, topic or headers),
+                          `durable`, `auto_delete`, `internal` and `arguments`.
+        :param queues: Queues as mappings with a `name` and optionally `durable`, `exclusive`, `auto_delete`,
+                       `arguments` and the shorthands `message_ttl`, `expires`, `max_length`, `max_length_bytes`,
+                       `overflow`, `dead_letter_exchange`, `dead_letter_routing_key`, `max_priority` and
+                       `queue_type` for the corresponding ``x-`` arguments.
+        :param bindings: Bindings as mappings with a `queue`, an `exchange` and optionally `routing_key` (defaults to
+                         the queue name) and `arguments`.
+        :param routes: Publish routes by routing key: messages published to the default exchange with that routing
+                       key go to the route's `exchange` with its `routing_key` (defaults to the original one).
+        :raises TypeError: If an entry is not a mapping or has a value of the wrong type.
+        :raises ValueError: If an entry lacks its name or has unknown options.
+        """
+        self.exchanges = [_exchange(entry) for entry in _entries(exchanges, 'exchanges')]
+        self.queues = [_queue(entry) for entry in _entries(queues, 'queues')]
+        self.bindings = [_binding(entry) for entry in _entries(bindings, 'bindings')]
+
+        if routes is None:
+            routes = {}
+        if not isinstance(routes, dict):
+            raise TypeError("routes must be a mapping of routing keys to routes.")
+        self.routes: dict[str, tuple[str, str]] = {}
+        for routing_key, route in routes.items():
+            _check_options(route, _ROUTE_OPTIONS, f"route '{routing_key}'", required=None)
+            if 'exchange' not in route:
+                raise ValueError(f"route '{routing_key}' must have an exchange.")
+            self.routes[routing_key] = (_string(route.get('exchange', ''), 'exchange'),
+                                        _string(route.get('routing_key', routing_key), 'routing_key'))
+
+        self._queue_names = {queue['queue'] for queue in self.queues}
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> 'Topology':
+        """
+        :param spec: A mapping with the optional keys `exchanges`, `queues`, `bindings` and `routes`.
+        :raises ValueError: If `spec` has other keys.
+        """
+        _check_options(spec, {'exchanges', 'queues', 'bindings', 'routes'}, "topology", required=None)
+        return cls(spec.get('exchanges'), spec.get('queues'), spec.get('bindings'), spec.get('routes'))
+
+    @classmethod
+    def load(cls, source: str) -> 'Topology':
+        """
+        Loads a topology from a YAML or JSON file, or from inline JSON (a `source` starting with ``{``), e.g. the
+        value of the ``RMQ_TOPOLOGY`` environment variable.
+
+        :raises ImportError: If the topology is YAML and PyYAML is not installed.
+        """
+        if not isinstance(source, str) or not source.strip():
+            raise TypeError("topology must be a Topology, a file name, inline JSON or None.")
+        if source.lstrip().startswith('{'):
+            return cls.from_dict(json.loads(source))
+
+        with open(source, encoding='utf-8') as file:
+            text = file.read()
+        if os.path.splitext(source)[1].lower() == '.json':
+            return cls.from_dict(json.loads(text))
+        if yaml is None:
+            raise ImportError(f"PyYAML is required to load the YAML topology {source}.")
+        return cls.from_dict(yaml.safe_load(text) or {})
+
+    def __bool__(self) -> bool:
+        return bool(self.exchanges or self.queues or self.bindings or self.routes)
+
+    def __contains__(self, queue: str) -> bool:
+        """Whether the topology declares `queue`, so that `_setup` need not (and must not) redeclare it."""
+        return queue in self._queue_names
+
+    def merge(self, other: 'Topology') -> 'Topology':
+        """Returns a topology that declares this one's entities, then `other`'s. `other`'s routes take precedence."""
+        merged = Topology()
+        merged.exchanges = self.exchanges + other.exchanges
+        merged.queues = self.queues + other.queues
+        merged.bindings = self.bindings + other.bindings
+        merged.routes = {**self.routes, **other.routes}
+        merged._queue_names = self._queue_names | other._queue_names
+        return merged
+
+    def declarations(self) -> list[tuple[str, dict[str, Any]]]:
+        """
+        Returns the channel calls that declare the topology: exchanges first, then queues, then bindings.
+
+        :return: ``(channel method name, keyword arguments)`` pairs.
+        """
+        return ([('exchange_declare', exchange) for exchange in self.exchanges] +
+                [('queue_declare', queue) for queue in self.queues] +
+                [('queue_bind', binding) for binding in self.bindings])
+
+    def apply(self, channel) -> None:
+        """Declares the topology on a blocking channel. Asynchronous clients await the :meth:`declarations`."""
+        for method, kwargs in self.declarations():
+            getattr(channel, method)(**kwargs)
+
+    def route(self, exchange: str, routing_key: str) -> tuple[str, str]:
+        """Returns where a message published to `exchange` with `routing_key` goes."""
+        if exchange == '' and routing_key in self.routes:
+            return self.routes[routing_key]
+        return exchange, routing_key
+
+
+def get_topology(topology: 'Topology | str | None') -> Topology:
+    """
+    Returns `topology` itself, the topology loaded from it (see :meth:`Topology.load`) or, for None, an empty one.
+
+    :raises TypeError: If `topology` is neither.
+    """
+    if topology is None:
+        return Topology()
+    if isinstance(topology, Topology):
+        return topology
+    return Topology.load(topology)
+
+
+def _entries(entries: list[dict] | None, name: str) -> list[dict]:
+    if entries is None:
+        return []
+    if not isinstance(entries, list):
+        raise TypeError(f"{name} must be a list.")
+    return entries
+
+
+def _check_options(entry: dict, options: set[str], what: str, required: str | None = 'name') -> None:
+    if not isinstance(entry, dict):
+        raise TypeError(f"{what} must be a mapping.")
+    unknown = set(entry) - options
+    if unknown:
+        raise ValueError(f"Unknown options for {what}: {', '.join(sorted(unknown))}.")
+    if required is not None and not entry.get(required):
+        raise ValueError(f"{what} must have a {required}.")
+
+
+def _string(value: Any, name: str) -> str:
+    if not isinstance(value, str):
+        raise TypeError(f"{name} must be a string.")
+    return value
+
+
+def _boolean(entry: dict, name: str, default: bool) -> bool:
+    value = entry.get(name, default)
+    if not isinstance(value, bool):
+        raise TypeError(f"{name} must be a boolean.")
+    return value
+
+
+def _arguments(entry: dict) -> dict:
+    arguments = entry.get('arguments') or {}
+    if not isinstance(arguments, dict):
+        raise TypeError("arguments must be a mapping.")
+    return dict(arguments)
+
+
+def _exchange(entry: dict) -> dict:
+    _check_options(entry, _EXCHANGE_OPTIONS, "exchange")
+    exchange_type = entry.get('type', 'direct')
+    if exchange_type not in EXCHANGE_TYPES:
+        raise ValueError(f"Exchange type must be one of {EXCHANGE_TYPES}.")
+    return {'exchange': _string(entry['name'], 'name'), 'exchange_type': exchange_type,
+            'durable': _boolean(entry, 'durable', True), 'auto_delete': _boolean(entry, 'auto_delete', False),
+            'internal': _boolean(entry, 'internal', False), 'arguments': _arguments(entry) or None}
+
+
+def _queue(entry: dict) -> dict:
+    _check_options(entry, _QUEUE_OPTIONS, "queue")
+    arguments = _arguments(entry)
+    for option, argument in _QUEUE_ARGUMENTS.items():
+        if entry.get(option) is not None:
+            arguments[argument] = entry[option]
+    return {'queue': _string(entry['name'], 'name'), 'durable': _boolean(entry, 'durable', True),
+            'exclusive': _boolean(entry, 'exclusive', False), 'auto_delete': _boolean(entry, 'auto_delete', False),
+            'arguments': arguments or None}
+
+
+def _binding(entry: dict) -> dict:
+    _check_options(entry, _BINDING_OPTIONS, "binding", required='queue')
+    if 'exchange' not in entry:
+        raise ValueError("binding must have an exchange.")
+    routing_key = entry.get('routing_key')
+    return {'queue': _string(entry['queue'], 'queue'), 'exchange': _string(entry['exchange'], 'exchange'),
+            'routing_key': _string(routing_key, 'routing_key') if routing_key is not None else None,
+            'arguments': _arguments(entry) or None}
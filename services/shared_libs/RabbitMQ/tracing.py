@@ -0,0 +1,223 @@
+"""
+End-to-end latency tracing through AMQP headers.
+
+Producers with tracing enabled stamp every message with a trace id, the time the trace started and one entry per
+service it passed (``[service, received, published]`` in microseconds since the epoch). A message published while a
+traced delivery is being handled continues that delivery's trace, so a chat message keeps its trace id from the Ear
+through the Brain to the Mouth.
+
+Consumers with tracing enabled record, for every traced delivery, the time since the previous service published it
+(``Ear → Brain``), the time that service spent between receiving and publishing (``Brain``) and the total time since
+the trace started. Records go to the ``rmq_trace_*`` metrics (if enabled) and, with ``RMQ_TRACE_FILE`` set, to a JSON
+lines file that this module summarises:
+
+    python -m services.shared_libs.RabbitMQ.tracing trace.jsonl
+
+Timestamps come from each host's wall clock, so latencies between hosts are only as accurate as their clock sync.
+"""
+import argparse
+import contextvars
+import copy
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any
+
+import pika
+
+from services.shared_libs.metrics import MetricsRegistry
+
+TRACE_ID = 'x-trace-id'
+TRACE_ORIGIN = 'x-trace-origin'
+TRACE_HOPS = 'x-trace-hops'
+
+_current: contextvars.ContextVar['TraceContext | None'] = contextvars.ContextVar('trace_context', default=None)
+
+_file_lock = threading.Lock()
+_file = None
+
+
+class TraceContext:
+    """The trace of the delivery being handled, continued by every message published while handling it."""
+
+    __slots__ = ('trace_id', 'origin', 'hops', 'received')
+
+    def __init__(self, trace_id: str, origin: int, hops: list, received: int):
+        self.trace_id = trace_id
+        self.origin = origin
+        self.hops = hops
+        self.received = received
+
+    @classmethod
+    def from_properties(cls, properties: pika.BasicProperties, received: int | None = None) -> 'TraceContext | None':
+        """Returns the trace of a delivery, or None if it carries no trace headers."""
+        headers = properties.headers if properties is not None else None
+        if not headers or TRACE_ID not in headers:
+            return None
+        return cls(headers[TRACE_ID], headers.get(TRACE_ORIGIN), list(headers.get(TRACE_HOPS) or []),
+                   received if received is not None else now())
+
+
+def now() -> int:
+    """The current wall-clock time in microseconds; AMQP headers cannot carry floats."""
+    return time.time_ns() // 1000
+
+
+def current() -> TraceContext | None:
+    """The trace of the delivery being handled on this thread or task, if any."""
+    return _current.get()
+
+
+def inject(properties: pika.BasicProperties | None, service: str) -> pika.BasicProperties:
+    """
+    Stamps `properties` with the current trace (or a new one) and a hop for `service`.
+
+    :param properties: The message properties. Copied, so properties reused for several messages are not stamped.
+    :param service: The name of the publishing service.
+    :return: The properties to publish with.
+    """
+    properties = copy.copy(properties) if properties is not None else pika.BasicProperties()
+    headers = dict(properties.headers or {})
+    published = now()
+    context = _current.get()
+    if context is not None:
+        headers[TRACE_ID] = context.trace_id
+        headers[TRACE_ORIGIN] = context.origin
+        headers[TRACE_HOPS] = context.hops + [[service, context.received, published]]
+    elif TRACE_ID not in headers:
+        headers[TRACE_ID] = properties.message_id or uuid.uuid4().hex
+        headers[TRACE_ORIGIN] = published
+        headers[TRACE_HOPS] = [[service, None, published]]
+    properties.headers = headers
+    return properties
+
+
+def activate(properties: pika.BasicProperties) -> contextvars.Token:
+    """Makes the trace of a delivery the current one until :func:`deactivate` is called with the returned token."""
+    return _current.set(TraceContext.from_properties(properties))
+
+
+def deactivate(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def call_in_trace(callback: callable, ch, method, properties, body) -> Any:
+    """
+    Calls `callback` with the delivery's trace as the current one, so that its publishes continue the trace.
+    Module-level, so it can be sent to a process pool.
+    """
+    token = activate(properties)
+    try:
+        return callback(ch, method, properties, body)
+    finally:
+        deactivate(token)
+
+
+class TraceRecorder:
+    """Records the latencies of traced deliveries for one consumer."""
+
+    def __init__(self, service: str, metrics: MetricsRegistry | None = None, path: str | None = None):
+        """
+        :param service: The name of the consuming service.
+        :param metrics: The registry to record the latencies in. None records no metrics.
+        :param path: The JSON lines file to append every record to. None writes no file.
+        """
+        self.service = service
+        self._path = path
+        if metrics is not None:
+            self._hop_seconds = metrics.histogram('rmq_trace_hop_seconds', "Time from one service publishing a "
+                                                  "message to the next service receiving it.", ('hop',))
+            self._service_seconds = metrics.histogram('rmq_trace_service_seconds', "Time a service spent between "
+                                                      "receiving a message and publishing its result.", ('service',))
+            self._total_seconds = metrics.histogram('rmq_trace_total_seconds', "Time since the trace started.",
+                                                    ('service',)).labels(service)
+        self._metrics = metrics
+
+    def record(self, properties: pika.BasicProperties, received: int | None = None) -> dict | None:
+        """
+        Records the latencies of a delivery.
+
+        :return: The record, or None if the delivery is not traced.
+        """
+        context = TraceContext.from_properties(properties, received)
+        if context is None or not context.hops:
+            return None
+        publisher, publisher_received, published = context.hops[-1]
+        hop = f'{publisher} → {self.service}'
+        stages = {hop: (context.received - published) / 1e6}
+        if publisher_received is not None:
+            stages[publisher] = (published - publisher_received) / 1e6
+        total = (context.received - context.origin) / 1e6 if context.origin is not None else None
+
+        if self._metrics is not None:
+            self._hop_seconds.labels(hop).observe(stages[hop])
+            if publisher_received is not None:
+                self._service_seconds.labels(publisher).observe(stages[publisher])
+            if total is not None:
+                self._total_seconds.observe(total)
+
+        record = {'trace_id': context.trace_id, 'service': self.service, 'stages': stages, 'total': total}
+        if self._path is not None:
+            _write(self._path, record)
+        return record
+
+
+def _write(path: str, record: dict) -> None:
+    """Appends a record as one line; short appends from several processes to the same file do not interleave."""
+    global _file
+    line = json.dumps(record, ensure_ascii=False) + '\n'
+    with _file_lock:
+        if _file is None or _file.name != path:
+            _file = open(path, 'a', encoding='utf-8', buffering=1)
+        _file.write(line)
+
+
+def summarise(records: list[dict]) -> dict[str, list[float]]:
+    """
+    Groups the latencies of trace records by stage. The end-to-end latency of a trace is the largest total any
+    service recorded for it, under the stage ``total``.
+    """
+    stages = defaultdict(list)
+    totals = {}
+    for record in records:
+        for stage, seconds in record['stages'].items():
+            stages[stage].append(seconds)
+        if record.get('total') is not None:
+            totals[record['trace_id']] = max(totals.get(record['trace_id'], 0.0), record['total'])
+    if totals:
+        stages['total'] = list(totals.values())
+    return stages
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """The nearest-rank percentile of `values`, e.g. fraction 0.99 for p99."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Prints latency percentiles per stage of the pipeline from a trace file."""
+    parser = argparse.ArgumentParser(description="Summarise RabbitMQ trace records (RMQ_TRACE_FILE).")
+    parser.add_argument('file', nargs='?', default=os.getenv('RMQ_TRACE_FILE'),
+                        help="The JSON lines trace file. Defaults to RMQ_TRACE_FILE.")
+    args = parser.parse_args(argv)
+    if not args.file:
+        parser.error("no trace file given and RMQ_TRACE_FILE is not set.")
+
+    with open(args.file, encoding='utf-8') as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    stages = summarise(records)
+
+    print(f"{'stage':<40} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage, values in sorted(stages.items(), key=lambda item: item[0] == 'total'):
+        p50, p90, p99 = (percentile(values, fraction) * 1000 for fraction in (0.5, 0.9, 0.99))
+        print(f"{stage:<40} {len(values):>7} {p50:>9.1f} {p90:>9.1f} {p99:>9.1f} {max(values) * 1000:>9.1f}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,110 @@
+"""
+The transports the blocking clients can exchange messages over. Every transport hands out
+:class:`~services.shared_libs.RabbitMQ.ConnectionManager.ConnectionManager`\\ s, so producers and consumers work the
+same on all of them:
+
+- ``amqp``: a RabbitMQ server over TCP (the default).
+- ``memory``: an :class:`~services.shared_libs.RabbitMQ.InMemoryBroker.InMemoryBroker` shared by every client of
+  the process, for services running in one process and for tests.
+- ``ipc``: an :class:`~services.shared_libs.RabbitMQ.IpcBroker.IpcBroker` on a Unix domain socket, for co-located
+  services in separate processes.
+
+The clients pick the transport from ``RMQ_TRANSPORT`` unless one is passed explicitly.
+"""
+import threading
+
+import pika
+
+from services.shared_libs.RabbitMQ.ConnectionManager import ConnectionManager
+from services.shared_libs.RabbitMQ.InMemoryBroker import InMemoryBroker
+from services.shared_libs.RabbitMQ.IpcBroker import IpcConnectionManager
+from services.shared_libs.RabbitMQ.const import RMQ_IPC_PATH
+
+
+class Transport:
+    """Creates the connection managers of the clients using this transport."""
+
+    name: str = ''
+
+    def connection_manager(self, parameters: pika.ConnectionParameters) -> ConnectionManager:
+        """
+        :param parameters: The connection parameters of the client. Transports other than AMQP ignore them.
+        :return: A connection manager for a client that does not share its connection.
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}()"
+
+
+class AmqpTransport(Transport):
+    name = 'amqp'
+
+    def connection_manager(self, parameters: pika.ConnectionParameters) -> ConnectionManager:
+        return ConnectionManager(parameters)
+
+
+class InMemoryTransport(Transport):
+    name = 'memory'
+
+    def __init__(self, broker: InMemoryBroker | None = None):
+        """
+        :param broker: The broker to connect to. None uses the broker shared by the whole process.
+        """
+        if broker is not None and not isinstance(broker, InMemoryBroker):
+            raise TypeError("broker must be an InMemoryBroker or None.")
+        self._broker = broker
+
+    @property
+    def broker(self) -> InMemoryBroker:
+        return self._broker if self._broker is not None else shared_broker()
+
+    def connection_manager(self, parameters: pika.ConnectionParameters) -> ConnectionManager:
+        return self.broker.connection_manager()
+
+
+class IpcTransport(Transport):
+    name = 'ipc'
+
+    def __init__(self, path: str = RMQ_IPC_PATH):
+        """
+        :param path: The path of the broker's Unix domain socket.
+        """
+        if not isinstance(path, str) or not path:
+            raise TypeError("path must be a non-empty string.")
+        self.path = path
+
+    def connection_manager(self, parameters: pika.ConnectionParameters) -> ConnectionManager:
+        return IpcConnectionManager(self.path)
+
+    def __repr__(self):
+        return f"IpcTransport(path={self.path!r})"
+
+
+_TRANSPORTS = {transport.name: transport for transport in (AmqpTransport, InMemoryTransport, IpcTransport)}
+
+_shared_broker: InMemoryBroker | None = None
+_shared_broker_lock = threading.Lock()
+
+
+def shared_broker() -> InMemoryBroker:
+    """Returns the in-memory broker of the ``memory`` transport, creating it on first use."""
+    global _shared_broker
+    with _shared_broker_lock:
+        if _shared_broker is None:
+            _shared_broker = InMemoryBroker()
+        return _shared_broker
+
+
+def get_transport(transport: str | Transport) -> Transport:
+    """
+    :param transport: A transport or the name of one, see the module documentation.
+    :return: The transport. Transports given by name use their default settings.
+    """
+    if isinstance(transport, Transport):
+        return transport
+    if not isinstance(transport, str):
+        raise TypeError("transport must be a string or a Transport.")
+    if transport.lower() not in _TRANSPORTS:
+        raise ValueError(f"transport must be one of {', '.join(sorted(_TRANSPORTS))}.")
+    return _TRANSPORTS[transport.lower()]()
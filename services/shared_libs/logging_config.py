@@ -1,11 +1,30 @@
-import logging.config
+import atexit
+import json
+import logging
 import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+_lock = threading.Lock()
+_configured = False
+_listener: QueueListener | None = None
 
 
 def setup_logging(service_name, log_level=None):
     """
     Sets up consistent logging for a given service or component.
 
+    The handlers are installed only once per process; later calls just return the logger and refresh the level.
+    By default records are handed to a background thread through a queue, so formatting and writing to stdout do
+    not slow down the caller.
+
+    Environment variables:
+        LOG_LEVEL: The default log level (DEBUG, INFO, WARNING, ERROR, CRITICAL). Defaults to INFO.
+        LOG_FORMAT: 'standard' (default) or 'json' for one JSON object per line, e.g. for ELK/Grafana Loki.
+        LOG_ASYNC: 'false' to write records on the calling thread instead of the background thread.
+
     :param service_name: The name of the service/component (e.g., 'ear-mic', 'brain-llm').
                          Used in log messages to identify the source.
     :param log_level: The desired log level (DEBUG, INFO, WARNING, ERROR, CRITICAL).
@@ -17,57 +36,93 @@ def setup_logging(service_name, log_level=None):
     else:
         level = getattr(logging, default_log_level, logging.INFO)
 
-    # Basic configuration dictionary (can be expanded significantly)
-    # Using dictionary config is generally recommended over basicConfig
-    LOGGING_CONFIG = {
-        'version': 1,
-        'disable_existing_loggers': False,  # Don't disable existing loggers (e.g., from imported libraries)
-
-        'formatters': {
-            'standard': {
-                # Add service_name to the format
-                'format': f'[%(asctime)s] [{service_name}] (%(name)s) [%(levelname)s]: %(message)s'
-            },
-            'json': {
-                # For structured logging, useful if you ever move to ELK/Grafana Loki stack
-                'format': '{"time": "%(asctime)s", "level": "%(levelname)s", "service": "' + service_name + '", "logger": "%(name)s", "message": "%(message)s"}'
-            }
-        },
-        'handlers': {
-            'console': {
-                'level': level,
-                'formatter': 'standard',
-                'class': 'logging.StreamHandler',
-                'stream': 'ext://sys.stdout',  # Send logs to stdout
-            },
-            # You could add a file handler here for local file logging if desired:
-            # 'file_handler': {
-            #     'level': level,
-            #     'formatter': 'standard',
-            #     'class': 'logging.handlers.RotatingFileHandler',
-            #     'filename': f'/var/log/{service_name}.log', # Path inside container
-            #     'maxBytes': 10485760, # 10MB
-            #     'backupCount': 5,
-            # }
-        },
-        'loggers': {
-            # Root logger configuration
-            '': {
-                'handlers': ['console'],  # Add 'file_handler' if you use it
-                'level': level,
-                'propagate': False  # Prevent logs from being sent to root handler twice
-            },
-            # Specific logger for pika (RabbitMQ client) to control its verbosity
-            'pika': {
-                'handlers': ['console'],
-                'level': 'WARNING',  # Keep pika logs less verbose by default
-                'propagate': False
-            },
-            # You can add more specific loggers here for different modules if needed
-        }
-    }
-
-    logging.config.dictConfig(LOGGING_CONFIG)
+    root = logging.getLogger()
+    with _lock:
+        if not _configured:
+            _configure(service_name)
+        if root.level != level:
+            root.setLevel(level)
 
     # Return the logger for the specific service, so modules can get it
     return logging.getLogger(service_name)
+
+
+def _configure(service_name: str) -> None:
+    """Installs the handlers. The first service to set up logging names the process in every record."""
+    global _configured, _listener
+
+    console = _StdoutHandler()
+    if os.getenv('LOG_FORMAT', 'standard').lower() == 'json':
+        console.setFormatter(JsonFormatter(service_name))
+    else:
+        # Add service_name to the format
+        console.setFormatter(
+            logging.Formatter(f'[%(asctime)s] [{service_name}] (%(name)s) [%(levelname)s]: %(message)s'))
+
+    if os.getenv('LOG_ASYNC', 'true').lower() in ('0', 'false', 'no'):
+        handler = console
+    else:
+        records = queue.SimpleQueue()
+        handler = _DeferredQueueHandler(records)
+        _listener = QueueListener(records, console)
+        _listener.start()
+        atexit.register(_stop_listener)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+
+    # Keep pika (RabbitMQ client) logs less verbose by default
+    logging.getLogger('pika').setLevel(logging.WARNING)
+    _configured = True
+
+
+def _stop_listener() -> None:
+    """Writes out the records still queued on exit."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line, with the message and traceback properly escaped."""
+
+    def __init__(self, service_name: str):
+        super().__init__()
+        self._service_name = service_name
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'service': self._service_name,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to whatever `sys.stdout` is at the time of the write, so redirections made later are honoured."""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Queues records unformatted; the listener thread formats them. Records never leave the process."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
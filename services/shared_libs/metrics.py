@@ -0,0 +1,229 @@
+import bisect
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable
+
+_lock = threading.Lock()
+_server: ThreadingHTTPServer | None = None
+
+DEFAULT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)  # Seconds
+
+
+def setup_metrics():
+    """
+    Returns the process-wide metrics registry, or None if metrics are disabled.
+
+    The exporter is started only once per process, on the first call with ``METRICS_PORT`` set. Clients keep the
+    returned value and skip all instrumentation if it is None, so disabled metrics cost one ``is None`` check.
+
+    Environment variables:
+        METRICS_ENABLED: 'true' to collect metrics. Defaults to false, unless METRICS_PORT is set.
+        METRICS_PORT: The port to serve the metrics on in Prometheus' text format (``GET /metrics``).
+        METRICS_HOST: The address to serve the metrics on. Defaults to all interfaces.
+    """
+    global _server
+
+    port = os.getenv('METRICS_PORT')
+    if not port and os.getenv('METRICS_ENABLED', 'false').lower() not in ('1', 'true', 'yes'):
+        return None
+
+    with _lock:
+        if port and _server is None:
+            _server = registry.serve(int(port), os.getenv('METRICS_HOST', ''))
+    return registry
+
+
+class Counter:
+    """
+    A monotonically increasing count, e.g. of published messages, with one child per label combination.
+    By Prometheus convention the name ends in ``_total``.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, _CounterChild] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> '_CounterChild':
+        """
+        Returns the child for the given label values, in the order of `labelnames`. Look children up once and keep
+        them, e.g. in ``__init__``; incrementing a child is cheaper than looking it up.
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}.")
+        values = tuple(str(value) for value in values)
+        with self._lock:
+            if values not in self._children:
+                self._children[values] = _CounterChild()
+            return self._children[values]
+
+    def inc(self, amount: float = 1) -> None:
+        """Increments the counter of a metric without labels."""
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterable[tuple[str, tuple, float]]:
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            yield self.name, values, child.value
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Counts observations (e.g. latencies in seconds) in cumulative buckets, with one child per label combination."""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._children: dict[tuple, _HistogramChild] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> '_HistogramChild':
+        """Returns the child for the given label values, in the order of `labelnames`."""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}.")
+        values = tuple(str(value) for value in values)
+        with self._lock:
+            if values not in self._children:
+                self._children[values] = _HistogramChild(self.buckets)
+            return self._children[values]
+
+    def observe(self, value: float) -> None:
+        """Records an observation of a metric without labels."""
+        self.labels().observe(value)
+
+    def samples(self) -> Iterable[tuple[str, tuple, float]]:
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            with child.lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket', values + (('le', _format_value(bound)),), cumulative
+            yield self.name + '_sum', values, total
+            yield self.name + '_count', values, count
+
+
+class _HistogramChild:
+    def __init__(self, buckets: tuple[float, ...]):
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket is +Inf.
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class MetricsRegistry:
+    """Holds the metrics of a process and renders them in Prometheus' text exposition format."""
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        """Returns the counter called `name`, creating it on first use."""
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Returns the histogram called `name`, creating it on first use."""
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def _get_or_create(self, kind, name, documentation, labelnames, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = kind(name, documentation, labelnames, *args)
+            elif not isinstance(metric, kind) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels.")
+            return metric
+
+    def render(self) -> str:
+        """Returns all metrics in Prometheus' text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, values, value in metric.samples():
+                labels = _format_labels(metric.labelnames, values)
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int, host: str = '') -> ThreadingHTTPServer:
+        """
+        Serves the metrics on ``http://host:port/metrics`` from a daemon thread.
+
+        :return: The server; call its ``shutdown()`` to stop serving.
+        """
+        render = self.render
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would drown the service's own logs.
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-exporter', daemon=True).start()
+        return server
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple) -> str:
+    pairs = list(zip(labelnames, values)) + list(values[len(labelnames):])  # Extra pairs, e.g. a bucket's `le`.
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+registry = MetricsRegistry()  # Process-wide registry returned by setup_metrics().
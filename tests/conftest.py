@@ -0,0 +1,4 @@
+import os
+
+# Write log records on the calling thread, so capsys sees them as soon as the code under test returns.
+os.environ.setdefault("LOG_ASYNC", "false")
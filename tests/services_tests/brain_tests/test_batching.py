@@ -0,0 +1,127 @@
+import threading
+
+import pytest
+
+from services.brain.abstract_brain import AbstractBrain
+from services.shared_libs.RabbitMQ import InMemoryBroker
+from services.shared_libs.metrics import MetricsRegistry
+from services_tests.brain_tests.test_response_cache import Producer, wait_for
+
+
+class BatchingBrain(AbstractBrain):
+    """Upper-cases every message of a batch; fails the ones saying 'bad' and the whole batch on 'crash'."""
+
+    def __init__(self, broker, **kwargs):
+        self.batches = []
+        kwargs.setdefault('input_batch_timeout_ms', 5000)
+        super().__init__('ear_to_brain', connection_manager=broker.connection_manager(), **kwargs)
+
+    def _setup(self):
+        self._channel.queue_declare(queue='ear_to_brain')
+        self._channel.queue_declare(queue='brain_to_mouth')
+
+    def _callback(self, ch, method, properties, body):
+        raise AssertionError("Batches do not reach _callback.")
+
+    def _batch_callback(self, messages):
+        self.batches.append([message.body for message in messages])
+        if any(message.body == 'crash' for message in messages):
+            raise RuntimeError("model crashed")
+        return [ValueError("bad input") if message.body == 'bad' else
+                None if message.body == 'skip' else message.body.upper() for message in messages]
+
+    def _handle_unacknowledged_messages(self, un_acknowledged):
+        pass
+
+
+def consume_until(brain, broker, condition, *messages):
+    """Publishes the messages to the brain, consumes until `condition` holds and returns what reached the Mouth."""
+    producer = Producer(connection_manager=broker.connection_manager())
+    producer.connect()
+    for message in messages:
+        producer.publish(message, 'ear_to_brain')
+    producer.disconnect()
+
+    def consume():  # Connects on the consuming thread, which publishes the results.
+        brain.connect()
+        brain.consume()
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    try:
+        wait_for(condition)
+    finally:
+        brain._connection.add_callback_threadsafe(brain.stop_consuming)
+        thread.join(5)
+        brain.disconnect()
+    return [body for _, body in broker.queue('brain_to_mouth')]
+
+
+class TestInputBatches:
+    def test_full_batches_are_published_and_acked_together(self):
+        broker = InMemoryBroker()
+        registry = MetricsRegistry()
+        brain = BatchingBrain(broker, input_batch_size=3, metrics=registry)
+
+        results = consume_until(brain, broker, lambda: len(brain.batches) == 2, 'a', 'b', 'c', 'd', 'e', 'f')
+
+        assert brain.batches == [['a', 'b', 'c'], ['d', 'e', 'f']]
+        assert results == [b'A', b'B', b'C', b'D', b'E', b'F']
+        assert broker.queue('ear_to_brain') == []  # Acked, not requeued when the brain disconnected.
+        rendered = registry.render()
+        assert 'brain_input_batch_size_count{client="BatchingBrain"} 2' in rendered
+        assert 'rmq_settled_total{client="BatchingBrain",queue="ear_to_brain",outcome="ack"} 6' in rendered
+        assert 'rmq_callback_seconds_count{client="BatchingBrain",queue="ear_to_brain"} 6' in rendered
+
+    def test_a_partial_batch_is_flushed_after_the_timeout(self):
+        broker = InMemoryBroker()
+        brain = BatchingBrain(broker, input_batch_size=10, input_batch_timeout_ms=20)
+
+        results = consume_until(brain, broker, lambda: brain.batches, 'a', 'b')
+
+        assert brain.batches == [['a', 'b']]
+        assert results == [b'A', b'B']
+
+    def test_a_failed_result_only_fails_its_message(self):
+        broker = InMemoryBroker()
+        brain = BatchingBrain(broker, input_batch_size=3, max_retries=1, retry_delay_ms=60_000)
+
+        results = consume_until(brain, broker, lambda: brain.batches, 'a', 'bad', 'skip')
+
+        assert results == [b'A']
+        assert broker.queue('ear_to_brain') == []
+        assert [body for _, body in broker.queue('ear_to_brain.retry.60000ms')] == [b'bad']
+
+    def test_a_failed_batch_fails_every_message(self):
+        broker = InMemoryBroker()
+        brain = BatchingBrain(broker, input_batch_size=2)
+
+        results = consume_until(brain, broker, lambda: brain.batches, 'a', 'crash')
+
+        assert results == []
+        assert broker.queue('ear_to_brain') == []  # Nacked without requeueing.
+
+    def test_stopping_flushes_the_pending_batch(self):
+        broker = InMemoryBroker()
+        brain = BatchingBrain(broker, input_batch_size=10)
+
+        results = consume_until(brain, broker, lambda: brain._input_batch, 'a')
+
+        assert brain.batches == [['a']]
+        assert results == [b'A']
+
+    def test_prefetch_count_fits_the_batch_size(self):
+        broker = InMemoryBroker()
+
+        assert BatchingBrain(broker, input_batch_size=8, prefetch_count=None)._prefetch_count == 16
+        assert BatchingBrain(broker, input_batch_size=8, prefetch_count=50)._prefetch_count == 50
+
+    @pytest.mark.parametrize("params, error", [
+        ({'input_batch_size': -1}, ValueError), ({'input_batch_size': '8'}, TypeError),
+        ({'input_batch_size': 8, 'input_batch_timeout_ms': 0}, ValueError),
+        ({'input_batch_size': 8, 'results_routing_key': None}, TypeError),
+        ({'input_batch_size': 8, 'workers': 2}, ValueError), ({'input_batch_size': 8, 'cache_size': 10}, ValueError),
+    ])
+    def test_validation(self, params, error):
+        with pytest.raises(error):
+            BatchingBrain(InMemoryBroker(), **params)
@@ -0,0 +1,176 @@
+import threading
+import time
+
+import pika
+import pytest
+
+from services.brain.abstract_brain import AbstractBrain
+from services.brain.response_cache import ResponseCache, cache_key
+from services.shared_libs.RabbitMQ import InMemoryBroker, RabbitMQProducer
+from services.shared_libs.RabbitMQ.streaming import chunk_of
+from services.shared_libs.metrics import MetricsRegistry
+
+
+class TestResponseCache:
+    def test_evicts_the_least_recently_used_beyond_its_size(self):
+        cache = ResponseCache(max_size=2, ttl=60)
+        cache.put('a', [('publish', ('A',))])
+        cache.put('b', [('publish', ('B',))])
+        assert cache.get('a') == [('publish', ('A',))]  # Used again, so 'b' is now the least recently used.
+
+        cache.put('c', [])
+
+        assert cache.get('b') is None and cache.get('a') is not None and cache.get('c') == []
+        assert len(cache) == 2
+
+    def test_responses_expire_after_the_ttl(self):
+        cache = ResponseCache(max_size=2, ttl=0.01)
+        cache.put('a', [])
+        time.sleep(0.02)
+
+        assert cache.get('a') is None and len(cache) == 0
+
+    @pytest.mark.parametrize("params, error", [
+        ({'max_size': 0, 'ttl': 1}, ValueError), ({'max_size': '1', 'ttl': 1}, TypeError),
+        ({'max_size': 1, 'ttl': 0}, ValueError), ({'max_size': 1, 'ttl': True}, TypeError),
+    ])
+    def test_validation(self, params, error):
+        with pytest.raises(error):
+            ResponseCache(**params)
+
+
+class TestCacheKey:
+    def test_whitespace_and_key_order_are_ignored(self):
+        properties = pika.BasicProperties()
+
+        assert cache_key({'author': 'a', 'content': ' hello   world\n'}, properties) == \
+               cache_key({'content': 'hello world', 'author': 'a'}, properties)
+        assert cache_key('hello world', properties) != cache_key('hello, world', properties)
+        assert cache_key(b'hello', properties) != cache_key('hello', properties)
+
+    def test_context_headers_are_part_of_the_key(self):
+        first = pika.BasicProperties(headers={'conversation': 1, 'other': 'x'})
+        second = pika.BasicProperties(headers={'conversation': 2, 'other': 'x'})
+
+        assert cache_key('hi', first) == cache_key('hi', second)
+        assert cache_key('hi', first, ['conversation']) != cache_key('hi', second, ['conversation'])
+        assert cache_key('hi', first, ['other']) == cache_key('hi', second, ['other'])
+
+
+class Producer(RabbitMQProducer):
+    def _setup(self):
+        self._channel.queue_declare(queue='ear_to_brain')
+        self._channel.queue_declare(queue='brain_to_mouth')
+
+
+class CountingBrain(AbstractBrain):
+    """Answers every message with its upper-cased text and counts how often its logic ran."""
+
+    def __init__(self, broker, **kwargs):
+        self.calls = 0
+        super().__init__('ear_to_brain', connection_manager=broker.connection_manager(), **kwargs)
+
+    def _setup(self):
+        self._channel.queue_declare(queue='ear_to_brain')
+        self._channel.queue_declare(queue='brain_to_mouth')
+
+    def _callback(self, ch, method, properties, body):
+        self.calls += 1
+        self.publish(str(body).upper(), 'brain_to_mouth')
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    def _handle_unacknowledged_messages(self, un_acknowledged):
+        pass
+
+
+class StreamingBrain(CountingBrain):
+    """Streams every message back word by word."""
+
+    def _callback(self, ch, method, properties, body):
+        self.calls += 1
+        with self.stream('brain_to_mouth') as stream:
+            for word in str(body).split():
+                stream.send(word)
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+
+class Requeueing(CountingBrain):
+    """Answers, but requeues every message the first time it sees it."""
+
+    def _callback(self, ch, method, properties, body):
+        self.calls += 1
+        self.publish(str(body).upper(), 'brain_to_mouth')
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=not method.redelivered)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out."
+        time.sleep(0.01)
+
+
+def run(brain, broker, *messages, expected):
+    """Publishes the messages to the brain and consumes until `expected` answers reached brain_to_mouth."""
+    producer = Producer(connection_manager=broker.connection_manager())
+    producer.connect()
+    for message in messages:
+        producer.publish(message, 'ear_to_brain')
+    producer.disconnect()
+
+    def consume():  # Connects on the consuming thread, which publishes the answers.
+        brain.connect()
+        brain.consume()
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    try:
+        wait_for(lambda: len(broker.queue('brain_to_mouth')) >= expected)
+    finally:
+        brain._connection.add_callback_threadsafe(brain._channel.stop_consuming)
+        thread.join(5)
+        brain.disconnect()
+    return [body for _, body in broker.queue('brain_to_mouth')]
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+class TestCachingBrain:
+    def test_repeated_inputs_are_answered_from_the_cache(self, workers):
+        broker = InMemoryBroker()
+        registry = MetricsRegistry()
+        brain = CountingBrain(broker, cache_size=10, workers=workers, metrics=registry)
+
+        answers = run(brain, broker, {'text': 'hi'}, {'text': ' hi '}, {'text': 'bye'}, expected=3)
+
+        assert brain.calls == 2
+        assert len(answers) == 3 and answers[0] == answers[1] != answers[2]
+        assert broker.queue('ear_to_brain') == []
+        rendered = registry.render()
+        assert 'brain_response_cache_lookups_total{client="CountingBrain",outcome="hit"} 1' in rendered
+        assert 'brain_response_cache_lookups_total{client="CountingBrain",outcome="miss"} 2' in rendered
+
+    def test_replayed_streams_get_a_new_stream_id(self, workers):
+        broker = InMemoryBroker()
+        brain = StreamingBrain(broker, cache_size=10, workers=workers)
+
+        run(brain, broker, 'hello world', 'hello world', expected=6)
+
+        chunks = [chunk_of(properties) for properties, _ in broker.queue('brain_to_mouth')]
+        assert brain.calls == 1
+        assert [chunk.seq for chunk in chunks] == [0, 1, 2, 0, 1, 2]
+        assert chunks[0].stream_id == chunks[2].stream_id != chunks[3].stream_id == chunks[5].stream_id
+
+    def test_requeued_messages_are_not_cached(self, workers):
+        broker = InMemoryBroker()
+        brain = Requeueing(broker, cache_size=10, workers=workers)
+
+        run(brain, broker, 'hi', expected=2)
+
+        assert brain.calls == 2
+
+    def test_without_a_cache_every_message_runs_the_logic(self, workers):
+        broker = InMemoryBroker()
+        brain = CountingBrain(broker, workers=workers)
+
+        assert run(brain, broker, 'hi', 'hi', expected=2) == [b'HI', b'HI']
+        assert brain.calls == 2
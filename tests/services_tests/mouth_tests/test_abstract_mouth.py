@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+from services.mouth.abstract_mouth import AbstractMouth
+from services.shared_libs.RabbitMQ import InMemoryBroker
+from services.shared_libs.RabbitMQ.streaming import Chunk, chunk_of, chunk_properties
+from services_tests.brain_tests.test_response_cache import wait_for
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_InMemoryBroker import Producer
+
+
+class RecordingMouth(AbstractMouth):
+    """Records what it receives, with the stream position of chunks; fails on 'bad'."""
+
+    def __init__(self, broker, **kwargs):
+        self.received = []
+        super().__init__('jobs', connection_manager=broker.connection_manager(), **kwargs)
+
+    def _setup(self):
+        self._channel.queue_declare(queue='jobs')
+
+    def _callback(self, ch, method, properties, body):
+        if body == 'bad':
+            raise ValueError("cannot say that")
+        chunk = chunk_of(properties)
+        self.received.append((body, chunk.seq if chunk else None))
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    def _handle_unacknowledged_messages(self, un_acknowledged):
+        pass
+
+
+def publish(broker, *messages):
+    """Publishes (body, chunk) pairs; a chunk of None publishes a plain message."""
+    producer = Producer(connection_manager=broker.connection_manager())
+    producer.connect()
+    for body, chunk in messages:
+        producer.publish(body, 'jobs', properties=chunk_properties(chunk) if chunk else None)
+    producer.disconnect()
+
+
+def consume_until(mouth, condition):
+    mouth.connect()
+    thread = threading.Thread(target=mouth.consume)
+    thread.start()
+    try:
+        wait_for(condition)
+    finally:
+        mouth._connection.add_callback_threadsafe(mouth.stop_consuming)
+        thread.join(5)
+        mouth.disconnect()
+
+
+class TestStreamReassembly:
+    def test_chunks_reach_the_callback_in_order(self):
+        broker = InMemoryBroker()
+        publish(broker, ('lo', Chunk('s', 1, False)), ('plain', None), ('Hel', Chunk('s', 0, False)),
+                ('Hel', Chunk('s', 0, False)), ('!', Chunk('s', 2, True)))
+        mouth = RecordingMouth(broker)
+
+        consume_until(mouth, lambda: len(mouth.received) == 4)
+
+        assert mouth.received == [('plain', None), ('Hel', 0), ('lo', 1), ('!', 2)]
+        assert broker.queue('jobs') == []  # The repeated chunk was acked as well.
+
+    def test_a_missing_chunk_is_skipped_after_the_timeout(self):
+        broker = InMemoryBroker()
+        publish(broker, ('a', Chunk('s', 0, False)), ('c', Chunk('s', 2, True)))
+        mouth = RecordingMouth(broker, stream_timeout=0.05)
+
+        consume_until(mouth, lambda: len(mouth.received) == 2)
+
+        assert mouth.received == [('a', 0), ('c', 2)]
+
+    def test_a_failing_chunk_settles_its_own_delivery(self):
+        broker = InMemoryBroker()
+        publish(broker, ('b', Chunk('s', 1, True)), ('bad', Chunk('s', 0, False)))
+        mouth = RecordingMouth(broker)
+
+        consume_until(mouth, lambda: mouth.received)
+
+        assert mouth.received == [('b', 1)]
+        assert broker.queue('jobs') == []  # The failed chunk was nacked without requeueing, the other acked.
+
+    def test_held_chunks_are_requeued_when_consuming_stops(self):
+        broker = InMemoryBroker()
+        publish(broker, ('b', Chunk('s', 1, True)))
+        mouth = RecordingMouth(broker)
+
+        consume_until(mouth, lambda: mouth._reassembler.waiting())
+
+        assert mouth.received == []
+        assert [body for _, body in broker.queue('jobs')] == [b'b']
+
+    def test_workers_are_rejected(self):
+        with pytest.raises(ValueError):
+            RecordingMouth(InMemoryBroker(), workers=2)
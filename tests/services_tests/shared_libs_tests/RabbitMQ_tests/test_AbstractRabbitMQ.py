@@ -8,13 +8,14 @@ This test suite verifies the functionality of the AbstractRabbitMQ class, includ
   both through explicit disconnect methods and the class destructor.
 """
 import os
+import random
 from unittest.mock import patch
 
 import pytest
 from pika.exceptions import AMQPConnectionError
 
 from services.shared_libs.RabbitMQ.AbstractRabbitMQ import AbstractRabbitMQ
-from tests.services_tests.shared_libs_tests.RabbitMQ_tests.test_utils import mock_pika
+from tests.services_tests.shared_libs_tests.RabbitMQ_tests.test_utils import mock_pika, reopening_pika
 
 
 # Define a concrete implementation of the abstract class for testing purposes.
@@ -157,6 +158,74 @@ class TestConnectionHandling:
         assert instance.setup_called
 
 
+class TestReconnect:
+    """Tests focused on reconnecting after the connection was lost."""
+
+    @pytest.fixture(autouse=True)
+    def setup_env(self):
+        os.environ["LOG_LEVEL"] = "DEBUG"
+
+    def test_invalid_auto_reconnect(self):
+        with pytest.raises(TypeError, match="auto_reconnect must be a boolean."):
+            ConcreteRabbitMQ(auto_reconnect="yes")
+
+    def test_backoff_doubles_up_to_maximum(self, monkeypatch):
+        ceilings = []
+        monkeypatch.setattr(random, "uniform", lambda low, high: ceilings.append(high) or high)
+        instance = ConcreteRabbitMQ()
+        instance._RECONNECT_MAX_DELAY = 4
+
+        for _ in range(5):
+            instance._schedule_reconnect()
+
+        assert ceilings == [0.5, 1, 2, 4, 4]
+        assert not instance._reconnect_due()
+
+    def test_backoff_is_jittered(self, monkeypatch):
+        bounds = []
+        monkeypatch.setattr(random, "uniform", lambda low, high: bounds.append((low, high)) or low)
+        instance = ConcreteRabbitMQ()
+
+        instance._schedule_reconnect()
+        instance._schedule_reconnect()
+
+        assert bounds == [(0, 0.5), (0, 1.0)]
+        assert instance._reconnect_due()  # Jitter drew zero delay.
+
+    def test_reconnect_reruns_setup(self, reopening_pika, mock_sleep):
+        _, lose_connection, _ = reopening_pika
+        instance = rabbitmq_instance()
+        instance.connect()
+        instance.setup_called = False
+        lose_connection()
+
+        assert instance.reconnect()
+        assert instance.setup_called
+        assert instance._ready()
+
+    def test_reconnect_retries_until_connected(self, reopening_pika, mock_sleep):
+        state, lose_connection, _ = reopening_pika
+        instance = rabbitmq_instance()
+        instance.connect()
+        lose_connection()
+        state['failures'] = 2
+
+        assert instance.reconnect()
+        assert instance._reconnect_failures == 0
+        assert mock_sleep.call_count == 3
+
+    def test_reconnect_gives_up_after_max_attempts(self, reopening_pika, mock_sleep, capsys):
+        state, lose_connection, _ = reopening_pika
+        instance = rabbitmq_instance()
+        instance.connect()
+        lose_connection()
+        state['failures'] = 5
+
+        assert not instance.reconnect(max_attempts=3)
+        assert not instance._ready()
+        assert "Could not reconnect to RabbitMQ, next attempt in" in capsys.readouterr().out
+
+
 class TestReadyState:
     """Tests focused on the is_ready() method."""
 
@@ -0,0 +1,184 @@
+import asyncio
+
+import pytest
+from pika.exceptions import ChannelClosedByBroker, StreamLostError
+from pika.spec import Basic, BasicProperties
+
+from services.shared_libs.RabbitMQ import AsyncRabbitMQConsumer
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_utils import mock_async_pika
+
+
+class ConcreteAsyncConsumer(AsyncRabbitMQConsumer):
+    def __init__(self, *args, **kwargs):
+        self.received = []
+        super().__init__(*args, **kwargs)
+
+    def _setup(self):
+        """Concrete implementation for testing."""
+        self._channel.queue_declare(queue=self._queue)
+
+    async def _callback(self, ch, method, properties, body):
+        """Concrete implementation for testing."""
+        await asyncio.sleep(0)
+        if body == b"poison":
+            raise ValueError("cannot handle message")
+        self.received.append(body)
+
+
+def run(coroutine, timeout=5):
+    """Runs a test coroutine, failing instead of hanging if it does not finish in time."""
+    return asyncio.run(asyncio.wait_for(coroutine, timeout=timeout))
+
+
+def deliver(mock_channel, body, properties=None):
+    on_message_callback = mock_channel.basic_consume.call_args.kwargs['on_message_callback']
+    on_message_callback(mock_channel, Basic.Deliver(delivery_tag=1), properties, body)
+
+
+async def start_consuming(instance, **kwargs):
+    await instance.connect()
+    consuming = asyncio.ensure_future(instance.consume(**kwargs))
+    while not instance._consuming:
+        await asyncio.sleep(0)
+    return consuming
+
+
+class TestConsume:
+    def test_consume_raises_runtime_error_if_not_connected(self, mock_async_pika):
+        async def scenario():
+            await ConcreteAsyncConsumer("test_queue").consume()
+
+        with pytest.raises(RuntimeError, match="not connected"):
+            run(scenario())
+
+    def test_consume_dispatches_coroutine_callbacks(self, mock_async_pika):
+        _, _, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncConsumer("test_queue")
+            consuming = await start_consuming(instance)
+
+            deliver(mock_channel, b"first")
+            deliver(mock_channel, b"second")
+            await instance.stop_consuming()
+            await consuming
+            await instance.disconnect()
+            return instance
+
+        instance = run(scenario())
+        assert instance.received == [b"first", b"second"]
+        assert not instance._consuming
+        mock_channel.basic_cancel.assert_called_once()
+
+    def test_consume_decodes_bodies(self, mock_async_pika):
+        _, _, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncConsumer("test_queue")
+            consuming = await start_consuming(instance)
+
+            deliver(mock_channel, b'{"content":"hi"}', BasicProperties(content_type="application/json"))
+            deliver(mock_channel, b"{broken", BasicProperties(content_type="application/json"))
+            await instance.stop_consuming()
+            await consuming
+            await instance.disconnect()
+            return instance
+
+        instance = run(scenario())
+        assert instance.received == [{"content": "hi"}]
+        mock_channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=False)
+
+    def test_consume_logs_failing_coroutine_callback(self, mock_async_pika, capsys):
+        _, _, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncConsumer("test_queue")
+            consuming = await start_consuming(instance)
+
+            deliver(mock_channel, b"poison")
+            deliver(mock_channel, b"next")
+            await instance.stop_consuming()
+            await consuming
+            await instance.disconnect()
+            return instance
+
+        instance = run(scenario())
+        assert instance.received == [b"next"]
+        assert "Error in message callback: cannot handle message" in capsys.readouterr().out
+
+    def test_consume_returns_when_disconnected(self, mock_async_pika):
+        async def scenario():
+            instance = ConcreteAsyncConsumer("test_queue")
+            consuming = await start_consuming(instance)
+            await instance.disconnect()
+            await consuming
+            return instance
+
+        assert not run(scenario())._consuming
+
+    def test_consume_raises_when_broker_closes_channel(self, mock_async_pika):
+        _, _, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncConsumer("test_queue")
+            consuming = await start_consuming(instance)
+            on_close = mock_channel.add_on_close_callback.call_args.args[0]
+            on_close(mock_channel, ChannelClosedByBroker(404, "NOT_FOUND - no queue 'test_queue'"))
+            try:
+                await consuming
+            finally:
+                await instance.disconnect()
+
+        with pytest.raises(ChannelClosedByBroker):
+            run(scenario())
+
+    def test_consume_raises_when_connection_drops(self, mock_async_pika):
+        mock_asyncio_connection, mock_connection, _ = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncConsumer("test_queue")
+            consuming = await start_consuming(instance)
+            on_close = mock_asyncio_connection.call_args.kwargs['on_close_callback']
+            mock_connection.is_open = False
+            on_close(mock_connection, StreamLostError("Transport indicated EOF"))
+            await consuming
+
+        with pytest.raises(StreamLostError):
+            run(scenario())
+
+    def test_consume_uses_custom_sync_callback(self, mock_async_pika):
+        _, _, mock_channel = mock_async_pika
+        received = []
+
+        async def scenario():
+            instance = ConcreteAsyncConsumer("test_queue")
+            consuming = await start_consuming(instance, callback=lambda ch, m, p, body: received.append(body))
+            deliver(mock_channel, b"message")
+            await instance.stop_consuming()
+            await consuming
+            await instance.disconnect()
+
+        run(scenario())
+        assert received == [b"message"]
+
+
+class TestQueueProperty:
+    @pytest.mark.parametrize("queue_name", [None, 0, list()])
+    def test_queue_setter_invalid_type(self, mock_async_pika, queue_name):
+        with pytest.raises(TypeError):
+            ConcreteAsyncConsumer("test_queue").queue = queue_name
+
+    def test_queue_setter_stops_active_consumer(self, mock_async_pika):
+        _, _, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncConsumer("test_queue")
+            consuming = await start_consuming(instance)
+            instance.queue = "new_queue"
+            await consuming
+            await instance.disconnect()
+            return instance
+
+        instance = run(scenario())
+        assert instance.queue == "new_queue"
+        mock_channel.basic_cancel.assert_called_once()
@@ -0,0 +1,321 @@
+import asyncio
+import os
+
+import pika
+import pytest
+from pika.exceptions import AMQPConnectionError
+
+from services.shared_libs.RabbitMQ import AsyncRabbitMQProducer, Topology
+from services.shared_libs.RabbitMQ.spool import Spool
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_utils import mock_async_pika
+
+
+class ConcreteAsyncProducer(AsyncRabbitMQProducer):
+    def __init__(self, *args, **kwargs):
+        self.setup_called = False
+        super().__init__(*args, **kwargs)
+
+    async def _setup(self):
+        """Concrete implementation for testing."""
+        await self._call(self._channel.queue_declare, queue='test_queue')
+        self.setup_called = True
+
+
+def ack_frame(delivery_tag, multiple=False):
+    return pika.frame.Method(1, pika.spec.Basic.Ack(delivery_tag=delivery_tag, multiple=multiple))
+
+
+def run(coroutine, timeout=5):
+    """Runs a test coroutine, failing instead of hanging if it does not finish in time."""
+    return asyncio.run(asyncio.wait_for(coroutine, timeout=timeout))
+
+
+async def wait_until(condition):
+    while not condition():
+        await asyncio.sleep(0)
+
+
+class TestConnect:
+    def test_connect_opens_channel_and_awaits_setup(self, mock_async_pika):
+        _, _, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncProducer()
+            assert await instance.connect()
+            await instance.disconnect()
+            return instance
+
+        instance = run(scenario())
+        assert instance.setup_called
+        assert instance._channel is mock_channel
+        mock_channel.queue_declare.assert_called_once()
+
+    def test_connect_declares_the_topology_before_setup(self, mock_async_pika):
+        _, _, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncProducer(topology=Topology(queues=[{'name': 'jobs', 'message_ttl': 1000}]))
+            await instance.connect()
+            await instance.disconnect()
+
+        run(scenario())
+        declared = [call.kwargs for call in mock_channel.queue_declare.call_args_list]
+        assert declared[0]['queue'] == 'jobs' and declared[0]['arguments'] == {'x-message-ttl': 1000}
+        assert declared[1]['queue'] == 'test_queue'
+
+    def test_connect_returns_false_on_connection_error(self, mock_async_pika):
+        mock_asyncio_connection, _, _ = mock_async_pika
+
+        def fail(parameters, on_open_callback, on_open_error_callback, on_close_callback, custom_ioloop):
+            custom_ioloop.call_soon(on_open_error_callback, None, AMQPConnectionError("unreachable"))
+
+        mock_asyncio_connection.side_effect = fail
+
+        async def scenario():
+            return await ConcreteAsyncProducer().connect()
+
+        assert not run(scenario())
+
+    def test_disconnect_waits_for_close(self, mock_async_pika):
+        _, mock_connection, _ = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncProducer()
+            await instance.connect()
+            await instance.disconnect()
+
+        run(scenario())
+        mock_connection.close.assert_called_once()
+        assert not mock_connection.is_open
+
+    def test_destructor_tolerates_closed_event_loop(self, mock_async_pika):
+        _, mock_connection, _ = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncProducer()
+            await instance.connect()
+            return instance
+
+        instance = run(scenario())
+        mock_connection.close.side_effect = RuntimeError("Event loop is closed")
+        instance.__del__()  # Must not raise.
+
+
+class TestPublish:
+    def test_publish_without_confirms(self, mock_async_pika):
+        _, _, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncProducer()
+            await instance.connect()
+            result = await instance.publish(b"test_message", "test_routing_key")
+            await instance.disconnect()
+            return result
+
+        assert run(scenario()) is None
+        mock_channel.basic_publish.assert_called_once_with(
+            exchange="",
+            routing_key="test_routing_key",
+            body=b"test_message",
+            properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent)
+        )
+
+    def test_publish_encodes_objects(self, mock_async_pika):
+        _, _, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncProducer()
+            await instance.connect()
+            await instance.publish({"author": "joe", "content": "hi"}, "test_routing_key")
+            await instance.disconnect()
+
+        run(scenario())
+        published = mock_channel.basic_publish.call_args.kwargs
+        assert published["body"] == b'{"author":"joe","content":"hi"}'
+        assert published["properties"].content_type == "application/json"
+
+    def test_publish_when_not_connected(self, mock_async_pika):
+        async def scenario():
+            await ConcreteAsyncProducer().publish(b"test_message", "test_routing_key")
+
+        with pytest.raises(RuntimeError, match="AsyncRabbitMQProducer is not connected."):
+            run(scenario())
+
+    def test_publish_awaits_confirm(self, mock_async_pika):
+        _, _, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncProducer(publisher_confirms=True)
+            await instance.connect()
+            mock_channel.basic_publish.side_effect = lambda **kwargs: asyncio.get_running_loop().call_soon(
+                instance._on_delivery_confirmation, ack_frame(instance._confirms.next_delivery_tag - 1))
+            result = await instance.publish(b"test_message", "test_routing_key")
+            await instance.disconnect()
+            return result
+
+        assert run(scenario()) is True
+        mock_channel.confirm_delivery.assert_called_once()
+
+    def test_confirm_window_limits_in_flight_messages(self, mock_async_pika):
+        async def scenario():
+            instance = ConcreteAsyncProducer(publisher_confirms=True, confirm_window=2)
+            await instance.connect()
+            tasks = [asyncio.ensure_future(instance.publish(b"m", "test_routing_key")) for _ in range(4)]
+            await wait_until(lambda: len(instance._confirms) == 2)
+            in_flight = list(instance._confirms.pending)
+
+            instance._on_delivery_confirmation(ack_frame(2, multiple=True))
+            await wait_until(lambda: len(instance._confirms) == 2)  # Tasks 3 and 4 acquired the window.
+            in_flight_after_ack = list(instance._confirms.pending)
+
+            instance._on_delivery_confirmation(ack_frame(4, multiple=True))
+            results = await asyncio.gather(*tasks)
+            await instance.disconnect()
+            return in_flight, in_flight_after_ack, results
+
+        in_flight, in_flight_after_ack, results = run(scenario())
+        assert in_flight == [1, 2]
+        assert in_flight_after_ack == [3, 4]
+        assert results == [True, True, True, True]
+
+    def test_channel_close_fails_pending_confirms(self, mock_async_pika):
+        _, _, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncProducer(publisher_confirms=True)
+            await instance.connect()
+            publishing = asyncio.ensure_future(instance.publish(b"m", "test_routing_key"))
+            await wait_until(lambda: len(instance._confirms) == 1)
+            on_close = mock_channel.add_on_close_callback.call_args.args[0]
+            on_close(mock_channel, pika.exceptions.ChannelClosedByBroker(406, "PRECONDITION_FAILED"))
+            try:
+                await publishing
+            finally:
+                await instance.disconnect()
+
+        with pytest.raises(pika.exceptions.AMQPChannelError):
+            run(scenario())
+
+
+def blocked_frame():
+    return pika.frame.Method(0, pika.spec.Connection.Blocked("low on memory"))
+
+
+def unblocked_frame():
+    return pika.frame.Method(0, pika.spec.Connection.Unblocked())
+
+
+class TestFlowControl:
+    def test_publishes_wait_for_unblock_and_keep_their_order(self, mock_async_pika):
+        _, mock_connection, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncProducer()
+            await instance.connect()
+            instance._on_connection_blocked(mock_connection, blocked_frame())
+            await instance.publish(b"1", "test_routing_key")
+            await instance.publish(b"2", "test_routing_key")
+            published_while_blocked = mock_channel.basic_publish.call_count
+
+            instance._on_connection_unblocked(mock_connection, unblocked_frame())
+            await instance.publish(b"3", "test_routing_key")
+            await instance.disconnect()
+            return published_while_blocked
+
+        assert run(scenario()) == 0
+        assert [call.kwargs["body"] for call in mock_channel.basic_publish.call_args_list] == [b"1", b"2", b"3"]
+
+    def test_block_policy_awaits_room(self, mock_async_pika):
+        _, mock_connection, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncProducer(blocked_buffer_size=1, overflow_policy="block")
+            await instance.connect()
+            instance._on_connection_blocked(mock_connection, blocked_frame())
+            await instance.publish(b"1", "test_routing_key")
+            waiting = asyncio.ensure_future(instance.publish(b"2", "test_routing_key"))
+            await asyncio.sleep(0.01)
+            assert not waiting.done()
+
+            instance._on_connection_unblocked(mock_connection, unblocked_frame())
+            await waiting
+            await instance.disconnect()
+
+        run(scenario())
+        assert [call.kwargs["body"] for call in mock_channel.basic_publish.call_args_list] == [b"1", b"2"]
+
+    def test_confirmed_publish_resolves_after_drain(self, mock_async_pika):
+        _, mock_connection, mock_channel = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncProducer(publisher_confirms=True)
+            await instance.connect()
+            instance._on_connection_blocked(mock_connection, blocked_frame())
+            publishing = asyncio.ensure_future(instance.publish(b"1", "test_routing_key"))
+            await asyncio.sleep(0)
+
+            instance._on_connection_unblocked(mock_connection, unblocked_frame())
+            instance._on_delivery_confirmation(ack_frame(1))
+            result = await publishing
+            await instance.disconnect()
+            return result
+
+        assert run(scenario()) is True
+
+    def test_raise_policy(self, mock_async_pika):
+        _, mock_connection, _ = mock_async_pika
+
+        async def scenario():
+            instance = ConcreteAsyncProducer(blocked_buffer_size=1, overflow_policy="raise")
+            await instance.connect()
+            instance._on_connection_blocked(mock_connection, blocked_frame())
+            await instance.publish(b"1", "test_routing_key")
+            try:
+                await instance.publish(b"2", "test_routing_key")
+            finally:
+                await instance.disconnect()
+
+        with pytest.raises(RuntimeError):
+            run(scenario())
+
+
+class TestSpool:
+    def test_messages_published_while_unreachable_are_replayed(self, mock_async_pika, tmp_path):
+        mock_asyncio_connection, _, mock_channel = mock_async_pika
+        create_connection = mock_asyncio_connection.side_effect
+
+        def fail(parameters, on_open_callback, on_open_error_callback, on_close_callback, custom_ioloop):
+            mock_asyncio_connection.side_effect = create_connection  # The broker is back for the next attempt.
+            custom_ioloop.call_soon(on_open_error_callback, None, AMQPConnectionError("unreachable"))
+
+        async def scenario():
+            instance = ConcreteAsyncProducer(spool_dir=str(tmp_path))
+            mock_asyncio_connection.side_effect = fail
+            assert not await instance.connect()
+            assert await instance.publish(b"1", "test_routing_key") is None
+            assert await instance.publish(b"2", "test_routing_key") is None
+            await wait_until(lambda: not instance._spool)
+            await instance.publish(b"3", "test_routing_key")
+            await instance.disconnect()
+
+        run(scenario())
+        assert [call.kwargs["body"] for call in mock_channel.basic_publish.call_args_list] == [b"1", b"2", b"3"]
+        assert sorted(os.listdir(tmp_path)) == ["checkpoint", "lock"]  # The replayed segment is deleted.
+
+    def test_replay_waits_for_confirms(self, mock_async_pika, tmp_path):
+        _, _, mock_channel = mock_async_pika
+
+        left_over = Spool(str(tmp_path))  # Spooled by an earlier process.
+        left_over.append("", "test_routing_key", b"1", None)
+        left_over.close()
+
+        async def scenario():
+            instance = ConcreteAsyncProducer(spool_dir=str(tmp_path), publisher_confirms=True)
+            mock_channel.basic_publish.side_effect = lambda **kwargs: asyncio.get_running_loop().call_soon(
+                instance._on_delivery_confirmation, ack_frame(instance._confirms.next_delivery_tag - 1))
+            await instance.connect()
+            await wait_until(lambda: not instance._spool)
+            await instance.disconnect()
+
+        run(scenario())
+        assert [call.kwargs["body"] for call in mock_channel.basic_publish.call_args_list] == [b"1"]
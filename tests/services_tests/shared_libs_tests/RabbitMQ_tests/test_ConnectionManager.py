@@ -0,0 +1,124 @@
+import os
+from unittest.mock import MagicMock
+
+import pika
+import pytest
+
+from services.shared_libs.RabbitMQ import ConnectionManager, RabbitMQConsumer, RabbitMQProducer
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_utils import mock_pika
+
+
+class ConcreteConsumer(RabbitMQConsumer):
+    def _setup(self):
+        pass
+
+    def _callback(self, ch, method, properties, body):
+        pass
+
+    def _handle_unacknowledged_messages(self, un_acknowledged):
+        pass
+
+
+class ConcreteProducer(RabbitMQProducer):
+    def _setup(self):
+        pass
+
+
+@pytest.fixture
+def manager():
+    return ConnectionManager(pika.ConnectionParameters(host="rabbitmq", port=5673))
+
+
+@pytest.fixture
+def separate_channels(mock_pika):
+    """Makes every connection.channel() call return a new channel."""
+    _, mock_connection, _ = mock_pika
+
+    def open_channel():
+        channel = MagicMock()
+        channel.is_open = True
+        channel.close.side_effect = lambda: setattr(channel, 'is_open', False)
+        return channel
+
+    mock_connection.channel.side_effect = open_channel
+    return mock_connection
+
+
+class TestInitialization:
+    def test_invalid_parameters(self):
+        with pytest.raises(TypeError, match="parameters must be a pika.ConnectionParameters instance."):
+            ConnectionManager("localhost")
+
+    def test_client_rejects_invalid_manager(self, mock_pika):
+        with pytest.raises(TypeError, match="connection_manager must be a ConnectionManager or None."):
+            ConcreteProducer(connection_manager="localhost")
+
+    def test_client_takes_parameters_from_manager(self, mock_pika, manager):
+        instance = ConcreteProducer(connection_manager=manager)
+
+        assert instance._connection_parameters is manager.parameters
+        assert instance._message_broker_host == "rabbitmq"
+        assert instance._message_broker_port == 5673
+
+
+class TestSharing:
+    @pytest.fixture(autouse=True)
+    def setup_env(self):
+        os.environ["LOG_LEVEL"] = "DEBUG"
+
+    def test_clients_share_one_connection(self, mock_pika, separate_channels, manager):
+        mock_blocking_connection, _, _ = mock_pika
+        producer = ConcreteProducer(connection_manager=manager)
+        consumer = ConcreteConsumer("test_queue", connection_manager=manager)
+
+        producer.connect()
+        consumer.connect()
+
+        mock_blocking_connection.assert_called_once_with(manager.parameters)
+        assert producer._connection is consumer._connection
+        assert producer._channel is not consumer._channel
+        assert manager.users == 2
+
+    def test_connection_closes_with_last_client(self, mock_pika, separate_channels, manager, capsys):
+        producer = ConcreteProducer(connection_manager=manager)
+        consumer = ConcreteConsumer("test_queue", connection_manager=manager)
+        producer.connect()
+        consumer.connect()
+
+        producer.disconnect()
+        separate_channels.close.assert_not_called()
+        assert not producer._channel.is_open
+        assert consumer._channel.is_open
+        assert "connection still used by 1 other client(s)" in capsys.readouterr().out
+
+        consumer.disconnect()
+        separate_channels.close.assert_called_once()
+        assert manager.users == 0
+
+    def test_disconnect_twice_releases_once(self, mock_pika, separate_channels, manager):
+        producer = ConcreteProducer(connection_manager=manager)
+        consumer = ConcreteConsumer("test_queue", connection_manager=manager)
+        producer.connect()
+        consumer.connect()
+
+        producer.disconnect()
+        producer.disconnect()
+
+        separate_channels.close.assert_not_called()
+        assert manager.users == 1
+
+    def test_acquire_reopens_closed_connection(self, mock_pika, manager):
+        mock_blocking_connection, mock_connection, _ = mock_pika
+        manager.acquire()
+        mock_connection.close()
+
+        manager.acquire()
+
+        assert mock_blocking_connection.call_count == 2
+        assert manager.users == 1
+
+    def test_release_of_stale_connection_is_ignored(self, mock_pika, manager):
+        manager.acquire()
+
+        assert manager.release(MagicMock())
+        assert manager.users == 1
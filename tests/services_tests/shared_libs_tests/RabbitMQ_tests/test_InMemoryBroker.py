@@ -0,0 +1,309 @@
+import threading
+from unittest.mock import MagicMock
+
+import pika
+import pytest
+from pika.exceptions import ChannelClosedByBroker, ChannelWrongStateError, ConnectionWrongStateError
+
+from services.shared_libs.RabbitMQ import InMemoryBroker, RabbitMQConsumer, RabbitMQProducer
+from services.shared_libs.RabbitMQ.InMemoryBroker import _topic_matches
+
+
+class Producer(RabbitMQProducer):
+    def _setup(self):
+        self._channel.queue_declare(queue="jobs")
+
+
+class Collector(RabbitMQConsumer):
+    """Acks every message and sets `done` once it received `expected` of them."""
+
+    def __init__(self, queue_name, expected=1, **kwargs):
+        self.received = []
+        self.expected = expected
+        self.done = threading.Event()
+        super().__init__(queue_name, **kwargs)
+
+    def _setup(self):
+        self._channel.queue_declare(queue=self._queue)
+
+    def _callback(self, ch, method, properties, body):
+        self.received.append(body)
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        if len(self.received) >= self.expected:
+            self.done.set()
+
+    def _handle_unacknowledged_messages(self, un_acknowledged):
+        pass
+
+
+def consume_in_thread(collector):
+    """Starts consuming on a thread of its own and returns a function that waits for `done` and stops it."""
+    thread = threading.Thread(target=collector.consume)
+    thread.start()
+
+    def stop():
+        collector.done.wait(5)
+        collector._connection.add_callback_threadsafe(collector._channel.stop_consuming)
+        thread.join(5)
+        assert not thread.is_alive()
+
+    return stop
+
+
+@pytest.fixture
+def broker():
+    return InMemoryBroker()
+
+
+@pytest.fixture
+def channel(broker):
+    connection = broker.connect()
+    yield connection.channel()
+    if connection.is_open:
+        connection.close()
+
+
+def deliveries(channel, queue, auto_ack=False, **kwargs):
+    """Consumes from `queue` and returns the list the deliveries are collected in."""
+    received = []
+    channel.basic_consume(queue, lambda ch, method, properties, body: received.append((method, body)),
+                          auto_ack=auto_ack, **kwargs)
+    return received
+
+
+class TestRouting:
+    def test_default_exchange_routes_by_queue_name(self, broker, channel):
+        channel.queue_declare(queue="a")
+        channel.basic_publish(exchange="", routing_key="a", body=b"1")
+        channel.basic_publish(exchange="", routing_key="missing", body=b"2")
+
+        assert [body for _, body in broker.queue("a")] == [b"1"]
+
+    @pytest.mark.parametrize("kind, bindings, routing_key, expected", [
+        ("direct", {"a": "red", "b": "blue"}, "red", ["a"]),
+        ("fanout", {"a": "red", "b": "blue"}, "green", ["a", "b"]),
+        ("topic", {"a": "chat.*", "b": "chat.#", "c": "log.#"}, "chat.discord.dm", ["b"]),
+    ])
+    def test_exchanges(self, broker, channel, kind, bindings, routing_key, expected):
+        channel.exchange_declare(exchange="x", exchange_type=kind)
+        for queue, key in bindings.items():
+            channel.queue_declare(queue=queue)
+            channel.queue_bind(queue=queue, exchange="x", routing_key=key)
+
+        channel.basic_publish(exchange="x", routing_key=routing_key, body=b"m")
+
+        assert [queue for queue in bindings if broker.queue(queue)] == expected
+
+    @pytest.mark.parametrize("pattern, routing_key, matches", [
+        ("a.*", "a.b", True), ("a.*", "a.b.c", False), ("a.#", "a", True), ("#", "a.b", True),
+        ("*.b.#", "a.b.c.d", True), ("a.#.d", "a.b.c.d", True), ("a.#.d", "a.b.c", False),
+    ])
+    def test_topic_patterns(self, pattern, routing_key, matches):
+        assert _topic_matches(pattern, routing_key) is matches
+
+    def test_unknown_exchange_closes_the_channel(self, channel):
+        with pytest.raises(ChannelClosedByBroker):
+            channel.basic_publish(exchange="missing", routing_key="a", body=b"1")
+        with pytest.raises(ChannelWrongStateError):
+            channel.queue_declare(queue="a")
+
+    def test_passive_declare_of_a_missing_queue_fails(self, channel):
+        with pytest.raises(ChannelClosedByBroker) as error:
+            channel.queue_declare(queue="missing", passive=True)
+        assert error.value.reply_code == 404
+
+    def test_redeclaring_with_other_settings_fails(self, channel):
+        channel.queue_declare(queue="a", durable=True)
+        with pytest.raises(ChannelClosedByBroker) as error:
+            channel.queue_declare(queue="a")
+        assert error.value.reply_code == 406
+
+
+class TestDelivery:
+    def test_deliveries_run_when_the_connection_processes_io(self, channel):
+        channel.queue_declare(queue="a")
+        received = deliveries(channel, "a")
+        channel.basic_publish(exchange="", routing_key="a", body=b"1")
+        assert received == []
+
+        channel.connection.process_data_events()
+
+        assert [body for _, body in received] == [b"1"]
+
+    def test_prefetch_limits_unacked_deliveries(self, broker, channel):
+        channel.queue_declare(queue="a")
+        channel.basic_qos(prefetch_count=2)
+        received = deliveries(channel, "a")
+        for body in (b"1", b"2", b"3"):
+            channel.basic_publish(exchange="", routing_key="a", body=body)
+        channel.connection.process_data_events()
+        assert len(received) == 2 and len(broker.queue("a")) == 1
+
+        channel.basic_ack(delivery_tag=received[1][0].delivery_tag, multiple=True)
+        channel.connection.process_data_events()
+
+        assert [body for _, body in received] == [b"1", b"2", b"3"]
+
+    def test_nack_with_requeue_redelivers(self, channel):
+        channel.queue_declare(queue="a")
+        received = deliveries(channel, "a")
+        channel.basic_publish(exchange="", routing_key="a", body=b"1")
+        channel.connection.process_data_events()
+
+        channel.basic_nack(delivery_tag=received[0][0].delivery_tag)
+        channel.connection.process_data_events()
+
+        assert [method.redelivered for method, _ in received] == [False, True]
+
+    def test_reject_without_requeue_drops(self, broker, channel):
+        channel.queue_declare(queue="a")
+        received = deliveries(channel, "a")
+        channel.basic_publish(exchange="", routing_key="a", body=b"1")
+        channel.connection.process_data_events()
+
+        channel.basic_reject(delivery_tag=received[0][0].delivery_tag, requeue=False)
+
+        assert len(received) == 1 and broker.queue("a") == []
+
+    def test_closing_the_channel_requeues_unacked_messages(self, broker, channel):
+        channel.queue_declare(queue="a")
+        deliveries(channel, "a")
+        channel.basic_publish(exchange="", routing_key="a", body=b"1")
+        channel.connection.process_data_events()
+
+        channel.close()
+
+        assert [body for _, body in broker.queue("a")] == [b"1"]
+
+    def test_consumers_share_a_queue_round_robin(self, broker):
+        first, second = broker.connect().channel(), broker.connect().channel()
+        first.queue_declare(queue="a")
+        received = deliveries(first, "a", auto_ack=True), deliveries(second, "a", auto_ack=True)
+        for body in (b"1", b"2", b"3", b"4"):
+            first.basic_publish(exchange="", routing_key="a", body=body)
+        first.connection.process_data_events()
+        second.connection.process_data_events()
+
+        assert [[body for _, body in bodies] for bodies in received] == [[b"1", b"3"], [b"2", b"4"]]
+
+    def test_single_active_consumer_takes_over_when_the_active_one_is_cancelled(self, broker):
+        first, second = broker.connect().channel(), broker.connect().channel()
+        first.queue_declare(queue="a", arguments={"x-single-active-consumer": True})
+        received = deliveries(first, "a", auto_ack=True, consumer_tag="ctag"), deliveries(second, "a", auto_ack=True)
+        first.basic_publish(exchange="", routing_key="a", body=b"1")
+        first.basic_publish(exchange="", routing_key="a", body=b"2")
+        first.connection.process_data_events()
+
+        first.basic_cancel("ctag")
+        first.basic_publish(exchange="", routing_key="a", body=b"3")
+        second.connection.process_data_events()
+
+        assert [[body for _, body in bodies] for bodies in received] == [[b"1", b"2"], [b"3"]]
+
+    def test_priority_queue_delivers_higher_priorities_first(self, broker, channel):
+        channel.queue_declare(queue="a", arguments={"x-max-priority": 5})
+        for body, priority in ((b"low", None), (b"high", 9), (b"mid", 3), (b"high 2", 5)):
+            channel.basic_publish(exchange="", routing_key="a", body=body,
+                                  properties=pika.BasicProperties(priority=priority))
+        assert [body for _, body in broker.queue("a")] == [b"high", b"high 2", b"mid", b"low"]
+
+        channel.basic_qos(prefetch_count=3)
+        received = deliveries(channel, "a")
+        channel.connection.process_data_events()
+        channel.basic_cancel(received[0][0].consumer_tag)
+        channel.basic_nack(delivery_tag=received[2][0].delivery_tag, multiple=True)  # Requeue high, high 2 and mid.
+
+        assert [body for _, body in broker.queue("a")] == [b"high", b"high 2", b"mid", b"low"]
+
+    def test_exclusive_queues_belong_to_their_connection(self, broker, channel):
+        name = channel.queue_declare(queue="", exclusive=True).method.queue
+
+        with pytest.raises(ChannelClosedByBroker, match="RESOURCE_LOCKED"):
+            broker.connect().channel().queue_declare(queue=name, exclusive=True)
+        channel.connection.close()
+        assert name not in broker._queues
+
+    def test_cancelled_consumer_returns_undelivered_messages(self, broker, channel):
+        channel.queue_declare(queue="a")
+        received = deliveries(channel, "a", consumer_tag="ctag")
+        channel.basic_publish(exchange="", routing_key="a", body=b"1")
+
+        channel.basic_cancel("ctag")
+        channel.connection.process_data_events()
+
+        assert received == [] and [body for _, body in broker.queue("a")] == [b"1"]
+
+    def test_closed_connection_rejects_calls(self, broker):
+        connection = broker.connect()
+        connection.close()
+        with pytest.raises(ConnectionWrongStateError):
+            connection.channel()
+        with pytest.raises(ConnectionWrongStateError):
+            connection.add_callback_threadsafe(lambda: None)
+
+
+class TestConnection:
+    def test_timers_and_threadsafe_callbacks(self, broker):
+        connection = broker.connect()
+        calls = []
+        connection.call_later(0, lambda: calls.append("timer"))
+        cancelled = connection.call_later(0, lambda: calls.append("cancelled"))
+        connection.remove_timeout(cancelled)
+        threading.Thread(target=connection.add_callback_threadsafe, args=(lambda: calls.append("thread"),)).start()
+
+        connection.sleep(0.05)
+
+        assert sorted(calls) == ["thread", "timer"]
+
+    def test_blocked_callbacks_get_the_connection_and_frame(self, broker):
+        connection = broker.connect()
+        blocked, unblocked = MagicMock(), MagicMock()
+        connection.add_on_connection_blocked_callback(blocked)
+        connection.add_on_connection_unblocked_callback(unblocked)
+
+        broker.block("low on disk")
+        broker.unblock()
+        connection.process_data_events()
+
+        assert blocked.call_args.args[0] is connection
+        assert blocked.call_args.args[1].method.reason == "low on disk"
+        assert isinstance(unblocked.call_args.args[1].method, pika.spec.Connection.Unblocked)
+
+
+class TestClients:
+    def test_producer_confirms_resolve(self, broker):
+        producer = Producer(publisher_confirms=True, connection_manager=broker.connection_manager())
+        producer.connect()
+
+        futures = [producer.publish(b"job", "jobs") for _ in range(3)]
+        producer.wait_for_confirms(timeout=1)
+
+        assert [future.result() for future in futures] == [True, True, True]
+        assert len(broker.queue("jobs")) == 3
+
+    def test_consumer_decodes_and_acks(self, broker):
+        producer = Producer(connection_manager=broker.connection_manager())
+        producer.connect()
+        producer.publish({"text": "hi"}, "jobs")
+        consumer = Collector("jobs", connection_manager=broker.connection_manager())
+        consumer.connect()
+
+        consume_in_thread(consumer)()
+
+        assert consumer.received == [{"text": "hi"}]
+        assert broker.queue("jobs") == []
+
+    @pytest.mark.parametrize("workers", [0, 2])
+    def test_pipeline_across_threads(self, broker, workers):
+        collector = Collector("jobs", expected=50, workers=workers, connection_manager=broker.connection_manager())
+        collector.connect()
+        stop = consume_in_thread(collector)
+
+        producer = Producer(connection_manager=broker.connection_manager())
+        producer.connect()
+        for index in range(50):
+            producer.publish(index, "jobs")
+        stop()
+
+        assert sorted(collector.received) == list(range(50))
+        collector.disconnect()
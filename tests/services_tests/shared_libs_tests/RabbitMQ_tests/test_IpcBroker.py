@@ -0,0 +1,124 @@
+import threading
+
+import pika
+import pytest
+from pika.exceptions import AMQPConnectionError, ChannelClosedByBroker, ChannelWrongStateError, StreamLostError
+
+from services.shared_libs.RabbitMQ import InMemoryBroker
+from services.shared_libs.RabbitMQ.IpcBroker import IpcBroker, IpcConnectionManager
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_InMemoryBroker import Collector, Producer, consume_in_thread
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = IpcBroker(str(tmp_path / "rmq.sock"), InMemoryBroker())
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def channel(server):
+    connection = IpcConnectionManager(server.path).acquire()
+    yield connection.channel()
+    if connection.is_open:
+        connection.close()
+
+
+class TestChannel:
+    def test_publish_and_get(self, server, channel):
+        channel.queue_declare(queue="a")
+        channel.basic_publish(exchange="", routing_key="a", body=b"1")
+
+        method, properties, body = channel.basic_get("a", auto_ack=True)
+
+        assert body == b"1" and method.routing_key == "a"
+        assert channel.basic_get("a") == (None, None, None)
+
+    def test_consume_and_ack(self, server, channel):
+        channel.queue_declare(queue="a")
+        received = []
+        channel.basic_consume("a", lambda ch, method, properties, body: (
+            received.append((properties.headers, body)), ch.basic_ack(delivery_tag=method.delivery_tag)))
+        channel.basic_publish(exchange="", routing_key="a", body=b"1",
+                              properties=pika.BasicProperties(headers={"n": 1}))
+
+        while not received:
+            channel.connection.process_data_events(time_limit=1)
+        channel.queue_declare(queue="b")  # A round trip after the ack.
+
+        assert received == [({"n": 1}, b"1")]
+        assert server.broker.queue("a") == []
+
+    def test_broker_errors_close_the_channel(self, channel):
+        with pytest.raises(ChannelClosedByBroker) as error:
+            channel.queue_declare(queue="missing", passive=True)
+        assert error.value.reply_code == 404
+        with pytest.raises(ChannelWrongStateError):
+            channel.queue_declare(queue="a")
+
+    def test_disconnect_requeues_unacked_messages(self, server):
+        connection = IpcConnectionManager(server.path).acquire()
+        channel = connection.channel()
+        channel.queue_declare(queue="a")
+        channel.basic_publish(exchange="", routing_key="a", body=b"1")
+        assert channel.basic_get("a")[2] == b"1"
+
+        connection.close()
+
+        for _ in range(100):
+            if server.broker.queue("a"):
+                break
+            threading.Event().wait(0.01)
+        assert [body for _, body in server.broker.queue("a")] == [b"1"]
+
+
+class TestConnection:
+    def test_missing_socket_fails_to_connect(self, tmp_path):
+        with pytest.raises(AMQPConnectionError):
+            IpcConnectionManager(str(tmp_path / "missing.sock")).acquire()
+
+    def test_stopped_broker_loses_the_connection(self, server, channel):
+        server.stop()
+
+        with pytest.raises(StreamLostError):
+            for _ in range(100):
+                channel.connection.process_data_events(time_limit=0.01)
+
+    def test_blocked_notifications(self, server, channel):
+        reasons = []
+        channel.connection.add_on_connection_blocked_callback(
+            lambda connection, frame: reasons.append(frame.method.reason))
+
+        server.broker.block("low on disk")
+        channel.connection.process_data_events(time_limit=1)
+
+        assert reasons == ["low on disk"]
+
+
+class TestClients:
+    def test_producer_confirms_resolve(self, server):
+        producer = Producer(publisher_confirms=True, connection_manager=server.connection_manager())
+        producer.connect()
+
+        futures = [producer.publish(b"job", "jobs") for _ in range(3)]
+        producer.wait_for_confirms(timeout=2)
+
+        assert [future.result() for future in futures] == [True, True, True]
+        producer.disconnect()
+
+    @pytest.mark.parametrize("workers", [0, 2])
+    def test_pipeline_between_connections(self, server, workers):
+        collector = Collector("jobs", expected=50, workers=workers, connection_manager=server.connection_manager())
+        collector.connect()
+        stop = consume_in_thread(collector)
+
+        producer = Producer(transport="ipc", connection_manager=server.connection_manager())
+        producer.connect()
+        for index in range(50):
+            producer.publish({"index": index}, "jobs")
+        stop()
+
+        assert sorted(message["index"] for message in collector.received) == list(range(50))
+        producer.disconnect()
+        collector.disconnect()
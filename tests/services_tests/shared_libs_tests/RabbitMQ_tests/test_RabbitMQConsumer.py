@@ -1,10 +1,18 @@
 import os
-from unittest.mock import patch
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from unittest.mock import ANY, MagicMock, call, patch
 
 import pytest
+from pika.exceptions import ConnectionClosedByClient, StreamLostError
+from pika.spec import Basic, BasicProperties
 
-from services.shared_libs.RabbitMQ import RabbitMQConsumer
-from services_tests.shared_libs_tests.RabbitMQ_tests.test_utils import mock_pika
+from services.shared_libs.RabbitMQ import RabbitMQConsumer, tracing
+from services.shared_libs.metrics import MetricsRegistry
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_utils import mock_pika, reopening_pika
 
 
 class ConcreteConsumer(RabbitMQConsumer):
@@ -63,6 +71,49 @@ def rabbitmq_instance_consuming(queue_name, mock_blocking_connection):
     return instance
 
 
+@pytest.fixture
+def connection_thread(mock_pika):
+    """Queues add_callback_threadsafe() callbacks and runs them from process_data_events(), like pika does."""
+    _, mock_connection, _ = mock_pika
+    callbacks = queue.Queue()
+
+    def process_data_events(time_limit=0):
+        try:
+            callbacks.get(timeout=time_limit)()
+            while True:
+                callbacks.get_nowait()()
+        except queue.Empty:
+            pass
+
+    mock_connection.add_callback_threadsafe.side_effect = callbacks.put
+    mock_connection.process_data_events.side_effect = process_data_events
+    return mock_connection
+
+
+def deliver(instance, delivery_tag, body=b"body", properties=None, redelivered=False):
+    """Hands a message to the consumer's on_message_callback as pika would."""
+    on_message = instance._channel.basic_consume.call_args.kwargs["on_message_callback"]
+    on_message(instance._channel, Basic.Deliver(delivery_tag=delivery_tag, redelivered=redelivered),
+               properties or BasicProperties(), body)
+
+
+def settle_all(instance, timeout=5):
+    deadline = time.monotonic() + timeout
+    while instance._work and time.monotonic() < deadline:
+        instance._connection.process_data_events(time_limit=0.05)
+    assert not instance._work
+
+
+def upper(ch, method, properties, body):
+    """Module-level so it can be sent to a process pool."""
+    return body.upper()
+
+
+def keys(ch, method, properties, body):
+    """Module-level so it can be sent to a process pool."""
+    return sorted(body)
+
+
 class TestInitialization:
     @pytest.mark.parametrize("params",
                              [{"queue_name": "test_queue", "host": "localhost", "port": 5672, "connection_attempts": 5,
@@ -100,7 +151,7 @@ class TestConsume:
         instance.consume()
 
         assert instance._consuming
-        assert instance._consumer_tag is not None
+        assert instance._consumer_tags
         instance._channel.basic_consume.assert_called_once()
         instance._channel.start_consuming.assert_called_once()
 
@@ -136,14 +187,16 @@ class TestConsume:
     def test_consume_uses_custom_callback(self, mock_pika):
         """Verify that a custom callback can be passed to consume()."""
         instance = rabbitmq_instance_ready("test_queue")
-        custom_callback = lambda a, b, c, d: None
+        custom_callback = MagicMock()
         instance.consume(callback=custom_callback)
 
         instance._channel.basic_consume.assert_called_with(
             queue='test_queue',
-            on_message_callback=custom_callback,
+            on_message_callback=ANY,
             auto_ack=False
         )
+        deliver(instance, 1)
+        custom_callback.assert_called_once_with(instance._channel, ANY, ANY, b"body")
 
 
 class TestStopConsuming:
@@ -159,7 +212,7 @@ class TestStopConsuming:
         if consuming:
             instance.consume()
         else:
-            assert instance._consumer_tag is None
+            assert instance._consumer_tags == []
 
         instance.stop_consuming()
         assert instance.stop_consuming_called
@@ -189,6 +242,26 @@ class TestStopConsuming:
 
         assert not instance.handle_unacknowledged_messages_called
 
+    def test_unacknowledged_messages_are_requeued_by_default(self, mock_pika):
+        class DefaultConsumer(RabbitMQConsumer):
+            def _setup(self):
+                pass
+
+            def _callback(self, ch, method, properties, body):
+                pass
+
+        instance = DefaultConsumer("test_queue")
+        instance.connect()
+        instance.consume()
+        channel = MagicMock()
+        instance._channel.basic_cancel.return_value = [(channel, Basic.Deliver(delivery_tag=tag), BasicProperties(),
+                                                        b"body") for tag in (4, 5)]
+
+        instance.stop_consuming()
+
+        assert channel.basic_nack.call_args_list == [call(delivery_tag=4, requeue=True),
+                                                     call(delivery_tag=5, requeue=True)]
+
 
 class TestQueueProperty:
     @pytest.fixture(autouse=True)
@@ -202,10 +275,10 @@ class TestQueueProperty:
         if consuming:
             instance.consume()
             assert instance._consuming
-            assert instance._consumer_tag
+            assert instance._consumer_tags
         else:
             assert not instance._consuming
-            assert not instance._consumer_tag
+            assert not instance._consumer_tags
 
         assert instance._queue == "test_queue"
         assert instance.queue == "test_queue"
@@ -271,3 +344,434 @@ class TestContextManager:
 
         assert instance.stop_consuming_called
         assert instance.disconnect_called
+
+
+class TestWorkerPool:
+    @pytest.fixture(autouse=True)
+    def setup_env(self):
+        os.environ["LOG_LEVEL"] = "DEBUG"
+
+    @pytest.mark.parametrize("params, error", [({"workers": -1}, ValueError), ({"workers": 1.5}, TypeError),
+                                               ({"worker_mode": "fiber"}, ValueError),
+                                               ({"prefetch_count": -1}, ValueError),
+                                               ({"prefetch_count": "10"}, TypeError)])
+    def test_invalid_params(self, mock_pika, params, error):
+        with pytest.raises(error):
+            ConcreteConsumer("test_queue", **params)
+
+    def test_acks_are_sent_in_delivery_order(self, mock_pika, connection_thread):
+        release_first = threading.Event()
+
+        def callback(ch, method, properties, body):
+            if method.delivery_tag == 1:
+                release_first.wait(5)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+
+        instance = ConcreteConsumer("test_queue", workers=2)
+        instance.connect()
+        instance.consume(callback=callback)
+        deliver(instance, 1)
+        deliver(instance, 2)
+
+        while len(instance._work) > 1:
+            connection_thread.process_data_events(time_limit=0.05)
+        instance._channel.basic_ack.assert_not_called()  # The second message must wait for the first.
+
+        release_first.set()
+        settle_all(instance)
+        instance._channel.basic_ack.assert_called_once_with(delivery_tag=2, multiple=True)
+        instance.stop_consuming()
+
+    def test_callback_runs_on_worker_thread(self, mock_pika, connection_thread):
+        threads = []
+        instance = ConcreteConsumer("test_queue", workers=1)
+        instance.connect()
+        instance.consume(callback=lambda ch, method, properties, body: threads.append(threading.get_ident()))
+        deliver(instance, 1)
+        settle_all(instance)
+
+        assert threads and threads[0] != threading.get_ident()
+        instance._channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)  # Acked implicitly.
+        instance.stop_consuming()
+
+    def test_raising_callback_is_logged_and_nacked(self, mock_pika, connection_thread, capsys):
+        def callback(ch, method, properties, body):
+            raise ValueError("boom")
+
+        instance = ConcreteConsumer("test_queue", workers=1)
+        instance.connect()
+        instance.consume(callback=callback)
+        deliver(instance, 1)
+        settle_all(instance)
+
+        instance._channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=False)
+        assert "Error in message callback: boom" in capsys.readouterr().out
+        instance.stop_consuming()
+
+    def test_nack_between_acks_keeps_order(self, mock_pika, connection_thread):
+        def callback(ch, method, properties, body):
+            if body == b"bad":
+                ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+            else:
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+
+        instance = ConcreteConsumer("test_queue", workers=1)
+        instance.connect()
+        instance.consume(callback=callback)
+        for tag, body in [(1, b"ok"), (2, b"bad"), (3, b"ok")]:
+            deliver(instance, tag, body)
+        settle_all(instance)
+
+        assert instance._channel.method_calls[-3:] == [call.basic_ack(delivery_tag=1, multiple=True),
+                                                       call.basic_reject(delivery_tag=2, requeue=False),
+                                                       call.basic_ack(delivery_tag=3, multiple=True)]
+        instance.stop_consuming()
+
+    def test_auto_ack_sends_no_acks(self, mock_pika, connection_thread):
+        instance = ConcreteConsumer("test_queue", workers=1)
+        instance.connect()
+        instance.consume(auto_ack=True, callback=lambda ch, method, properties, body: None)
+        deliver(instance, 1)
+        settle_all(instance)
+
+        instance._channel.basic_ack.assert_not_called()
+        instance.stop_consuming()
+
+    def test_stop_consuming_waits_for_running_callbacks(self, mock_pika, connection_thread):
+        def callback(ch, method, properties, body):
+            time.sleep(0.1)
+
+        instance = ConcreteConsumer("test_queue", workers=1)
+        instance.connect()
+        instance.consume(callback=callback)
+        deliver(instance, 1)
+        instance.stop_consuming()
+
+        instance._channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+        assert instance._pool is None
+
+    def test_process_mode_rejects_unpicklable_callback(self, mock_pika):
+        instance = ConcreteConsumer("test_queue", workers=1, worker_mode="process")
+        instance.connect()
+
+        with pytest.raises(TypeError, match="picklable"):
+            instance.consume(callback=lambda ch, method, properties, body: None)
+
+    def test_process_mode_hands_result_to_connection_thread(self, mock_pika, connection_thread):
+        results = []
+        instance = ConcreteConsumer("test_queue", workers=1, worker_mode="process")
+        instance._on_worker_result = lambda method, properties, result: results.append(result)
+        instance.connect()
+        instance.consume(callback=upper)
+        deliver(instance, 1, b"hello")
+        settle_all(instance, timeout=30)
+
+        assert results == [b"HELLO"]
+        instance._channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+        instance.stop_consuming()
+
+
+class TestQos:
+    @pytest.fixture(autouse=True)
+    def setup_env(self):
+        os.environ["LOG_LEVEL"] = "DEBUG"
+
+    @pytest.mark.parametrize("params, error", [({"prefetch_size": -1}, ValueError), ({"prefetch_size": None}, TypeError),
+                                               ({"consumer_priority": "high"}, TypeError),
+                                               ({"adaptive_prefetch": "yes"}, TypeError)])
+    def test_invalid_params(self, mock_pika, params, error):
+        with pytest.raises(error):
+            ConcreteConsumer("test_queue", **params)
+
+    @pytest.mark.parametrize("params, prefetch", [({}, None), ({"workers": 2}, 4),
+                                                  ({"workers": 2, "prefetch_count": 10}, 10),
+                                                  ({"prefetch_count": 1}, 1), ({"adaptive_prefetch": True}, 2)])
+    def test_connect_applies_prefetch_count(self, mock_pika, params, prefetch):
+        instance = ConcreteConsumer("test_queue", **params)
+        instance.connect()
+
+        if prefetch is None:
+            instance._channel.basic_qos.assert_not_called()
+        else:
+            instance._channel.basic_qos.assert_called_once_with(prefetch_size=0, prefetch_count=prefetch)
+
+    def test_connect_applies_prefetch_size(self, mock_pika):
+        instance = ConcreteConsumer("test_queue", prefetch_size=65536)
+        instance.connect()
+
+        instance._channel.basic_qos.assert_called_once_with(prefetch_size=65536, prefetch_count=0)
+
+    def test_consumer_priority_is_passed_to_basic_consume(self, mock_pika):
+        instance = ConcreteConsumer("test_queue", consumer_priority=5)
+        instance.connect()
+        instance.consume()
+
+        assert instance._channel.basic_consume.call_args.kwargs["arguments"] == {"x-priority": 5}
+
+    def test_consume_without_priority_sends_no_arguments(self, mock_pika):
+        instance = ConcreteConsumer("test_queue")
+        instance.connect()
+        instance.consume()
+
+        assert "arguments" not in instance._channel.basic_consume.call_args.kwargs
+
+    @pytest.mark.parametrize("workers, latency, prefetch", [(0, 0.25, 4), (0, 0.001, 1000), (0, 10, 1), (4, 0.1, 40)])
+    def test_adaptive_prefetch_follows_latency(self, mock_pika, workers, latency, prefetch):
+        instance = ConcreteConsumer("test_queue", workers=workers, adaptive_prefetch=True)
+        instance._ADAPTIVE_PREFETCH_INTERVAL = 0
+        instance.connect()
+        instance._channel.basic_qos.reset_mock()
+
+        instance._record_latency(latency)
+
+        assert instance._prefetch_count == prefetch
+        instance._channel.basic_qos.assert_called_once_with(prefetch_size=0, prefetch_count=prefetch)
+
+    def test_adaptive_prefetch_ignores_small_changes(self, mock_pika):
+        instance = ConcreteConsumer("test_queue", prefetch_count=10, adaptive_prefetch=True)
+        instance._ADAPTIVE_PREFETCH_INTERVAL = 0
+        instance.connect()
+        instance._channel.basic_qos.reset_mock()
+
+        instance._record_latency(0.11)  # ~9 messages per second of buffer
+
+        assert instance._prefetch_count == 10
+        instance._channel.basic_qos.assert_not_called()
+
+    def test_adaptive_prefetch_measures_inline_callbacks(self, mock_pika):
+        instance = ConcreteConsumer("test_queue", adaptive_prefetch=True)
+        instance.connect()
+        instance.consume(callback=lambda ch, method, properties, body: time.sleep(0.01))
+
+        deliver(instance, 1)
+
+        assert instance._latency >= 0.01
+
+
+class TestAutoReconnect:
+    @pytest.fixture(autouse=True)
+    def setup_env(self):
+        os.environ["LOG_LEVEL"] = "DEBUG"
+
+    @pytest.fixture
+    def instance(self, reopening_pika):
+        _, lose_connection, (_, _, mock_channel) = reopening_pika
+
+        def start_consuming():
+            if mock_channel.start_consuming.call_count == 1:
+                lose_connection()
+                raise StreamLostError("Transport indicated EOF")
+
+        mock_channel.start_consuming.side_effect = start_consuming
+        with patch('time.sleep'):
+            instance = ConcreteConsumer("test_queue", auto_reconnect=True)
+            instance.connect()
+            yield instance
+
+    def test_consume_resumes_after_connection_loss(self, instance):
+        instance.setup_called = False
+
+        instance.consume()
+
+        assert instance.setup_called  # Topology redeclared on the new connection.
+        assert instance._channel.basic_consume.call_count == 2
+        assert instance._channel.start_consuming.call_count == 2
+
+    def test_consume_raises_without_auto_reconnect(self, instance):
+        instance._auto_reconnect = False
+
+        with pytest.raises(StreamLostError):
+            instance.consume()
+        assert not instance._consuming
+
+    def test_consume_does_not_reconnect_after_client_close(self, instance):
+        instance._channel.start_consuming.side_effect = ConnectionClosedByClient(200, "Normal shutdown")
+
+        with pytest.raises(ConnectionClosedByClient):
+            instance.consume()
+        instance._channel.basic_consume.assert_called_once()
+
+    def test_settlements_of_previous_channel_are_dropped(self, instance):
+        old_channel = object()
+        work = Future()
+        work.set_result((("basic_ack", {}), None, 0.0))
+
+        instance._settle(old_channel, Basic.Deliver(delivery_tag=1), BasicProperties(), b'', False, work)
+
+        instance._channel.basic_ack.assert_not_called()
+        assert not instance._in_flight
+
+
+
+class TestDecoding:
+    @pytest.fixture(autouse=True)
+    def setup_env(self):
+        os.environ["LOG_LEVEL"] = "DEBUG"
+
+    @pytest.mark.parametrize("content_type, body, expected", [
+        (None, b"raw", b"raw"),
+        ("application/json", b'{"author":"joe","content":"hi"}', {"author": "joe", "content": "hi"}),
+        ("text/plain", "h\u00e9".encode(), "h\u00e9"),
+        ("application/x-unknown", b"raw", b"raw"),
+    ])
+    def test_callback_receives_decoded_body(self, mock_pika, content_type, body, expected):
+        instance = rabbitmq_instance_ready("test_queue")
+        callback = MagicMock()
+        instance.consume(callback=callback)
+
+        deliver(instance, 1, body, BasicProperties(content_type=content_type))
+
+        assert callback.call_args.args[3] == expected
+
+    def test_compressed_body_is_decompressed(self, mock_pika):
+        instance = rabbitmq_instance_ready("test_queue")
+        callback = MagicMock()
+        instance.consume(callback=callback)
+
+        deliver(instance, 1, zlib.compress(b'{"text":"hi"}'),
+                BasicProperties(content_type="application/json", content_encoding="deflate"))
+
+        assert callback.call_args.args[3] == {"text": "hi"}
+
+    def test_binary_body_is_not_copied(self, mock_pika):
+        instance = rabbitmq_instance_ready("test_queue")
+        callback = MagicMock()
+        instance.consume(callback=callback)
+        body = b"x" * 1024
+
+        deliver(instance, 1, body, BasicProperties(content_type="application/octet-stream"))
+
+        received = callback.call_args.args[3]
+        assert isinstance(received, memoryview)
+        assert received.obj is body
+
+    def test_undecodable_body_is_rejected(self, mock_pika, capsys):
+        instance = rabbitmq_instance_ready("test_queue")
+        callback = MagicMock()
+        instance.consume(callback=callback)
+
+        deliver(instance, 1, b"{not json", BasicProperties(content_type="application/json"))
+
+        callback.assert_not_called()
+        instance._channel.basic_nack.assert_called_once_with(delivery_tag=1, requeue=False)
+        assert "Cannot decode message 1" in capsys.readouterr().out
+
+    def test_workers_decode_before_calling_back(self, mock_pika, connection_thread):
+        instance = ConcreteConsumer("test_queue", workers=2, worker_mode='process')
+        instance.connect()
+        results = []
+        instance._on_worker_result = lambda method, properties, result: results.append(result)
+        instance.consume(callback=keys)
+
+        deliver(instance, 1, b'{"b":1,"a":2}', BasicProperties(content_type="application/json"))
+        settle_all(instance)
+
+        assert results == [["a", "b"]]
+        instance._channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+        instance.stop_consuming()
+
+
+def ack_or_nack(ch, method, properties, body):
+    """Module-level so it can be sent to a process pool."""
+    if body == b"bad":
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+    else:
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+
+class TestMetrics:
+    @pytest.fixture(autouse=True)
+    def setup_env(self):
+        os.environ["LOG_LEVEL"] = "DEBUG"
+
+    def test_metrics_are_disabled_by_default(self, mock_pika):
+        instance = rabbitmq_instance_ready("test_queue")
+        callback = MagicMock()
+        instance.consume(callback=callback)
+
+        deliver(instance, 1)
+
+        assert instance._metrics is None
+        assert callback.call_args.args[0] is instance._channel  # No counting wrapper around the channel.
+
+    @pytest.mark.parametrize("workers", [0, 2])
+    def test_deliveries_and_settlements_are_counted(self, mock_pika, connection_thread, workers):
+        registry = MetricsRegistry()
+        instance = ConcreteConsumer("test_queue", workers=workers, metrics=registry)
+        instance.connect()
+        instance.consume(callback=ack_or_nack)
+
+        deliver(instance, 1)
+        deliver(instance, 2, b"bad", redelivered=True)
+        deliver(instance, 3)
+        if workers:
+            settle_all(instance)
+
+        rendered = registry.render()
+        labels = 'client="ConcreteConsumer",queue="test_queue"'
+        assert f"rmq_consumed_total{{{labels}}} 3" in rendered
+        assert f"rmq_redelivered_total{{{labels}}} 1" in rendered
+        assert f"rmq_callback_seconds_count{{{labels}}} 3" in rendered
+        assert f'rmq_settled_total{{{labels},outcome="ack"}} 2' in rendered
+        assert f'rmq_settled_total{{{labels},outcome="nack"}} 1' in rendered
+        instance.stop_consuming()
+
+    def test_reconnects_are_counted(self, reopening_pika):
+        state, _, _ = reopening_pika
+        registry = MetricsRegistry()
+        with patch('time.sleep'):
+            instance = ConcreteConsumer("test_queue", metrics=registry)
+            state["failures"] = 1
+            assert instance.reconnect(max_attempts=2)
+
+        rendered = registry.render()
+        assert 'rmq_reconnects_total{client="ConcreteConsumer",outcome="failure"} 1' in rendered
+        assert 'rmq_reconnects_total{client="ConcreteConsumer",outcome="success"} 1' in rendered
+
+
+def current_trace_id(ch, method, properties, body):
+    """Module-level so it can be sent to a process pool."""
+    return tracing.current().trace_id
+
+
+class TestTracing:
+    @pytest.fixture(autouse=True)
+    def setup_env(self):
+        os.environ["LOG_LEVEL"] = "DEBUG"
+
+    def traced(self):
+        return tracing.inject(BasicProperties(content_type="text/plain"), "Ear")
+
+    def test_tracing_is_disabled_by_default(self, mock_pika):
+        instance = rabbitmq_instance_ready("test_queue")
+        assert instance._tracer is None
+
+    @pytest.mark.parametrize("workers", [0, 2])
+    def test_callback_runs_in_the_delivery_trace(self, mock_pika, connection_thread, workers):
+        instance = ConcreteConsumer("test_queue", workers=workers, tracing=True)
+        instance.connect()
+        results = []
+        instance._on_worker_result = lambda method, properties, result: results.append(result)
+        callback = current_trace_id
+        if not workers:
+            callback = MagicMock(side_effect=lambda *args: results.append(current_trace_id(*args)))
+        instance.consume(callback=callback)
+        properties = self.traced()
+
+        deliver(instance, 1, b"hi", properties)
+        if workers:
+            settle_all(instance)
+            instance.stop_consuming()
+
+        assert results == [properties.headers[tracing.TRACE_ID]]
+
+    def test_latency_is_recorded_on_arrival(self, mock_pika):
+        registry = MetricsRegistry()
+        instance = ConcreteConsumer("test_queue", tracing=True, metrics=registry)
+        instance.connect()
+        instance.consume(callback=MagicMock())
+
+        deliver(instance, 1, b"hi", self.traced())
+        deliver(instance, 2, b"untraced")
+
+        assert 'rmq_trace_hop_seconds_count{hop="Ear → ConcreteConsumer"} 1' in registry.render()
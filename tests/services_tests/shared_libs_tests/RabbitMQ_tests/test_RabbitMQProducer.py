@@ -1,12 +1,18 @@
+import inspect
 import os
-from unittest.mock import patch
+import threading
+import zlib
+from unittest.mock import MagicMock, patch
 
 import pika
 import pytest
+from pika.adapters.blocking_connection import BlockingChannel
 from pika.exceptions import AMQPConnectionError, AMQPChannelError
 
-from services.shared_libs.RabbitMQ import RabbitMQProducer
-from services_tests.shared_libs_tests.RabbitMQ_tests.test_utils import mock_pika
+from services.shared_libs.RabbitMQ import InMemoryBroker, RabbitMQProducer, tracing
+from services.shared_libs.RabbitMQ.serialization import Codec, CodecRegistry
+from services.shared_libs.metrics import MetricsRegistry
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_utils import mock_pika, reopening_pika
 
 
 # Define a concrete implementation for testing the abstract class
@@ -19,12 +25,14 @@ class ConcreteProducer(RabbitMQProducer):
         """Concrete implementation for testing."""
         self.setup_called = True
 
-    def _on_connection_blocked(self, blocked):
+    def _on_connection_blocked(self, connection, frame):
         """Concrete implementation for testing."""
+        super()._on_connection_blocked(connection, frame)
         self.connection_blocked_called = True
 
-    def _on_connection_unblocked(self, unblocked):
+    def _on_connection_unblocked(self, connection, frame):
         """Concrete implementation for testing."""
+        super()._on_connection_unblocked(connection, frame)
         self.connection_unblocked_called = True
 
 
@@ -302,3 +310,861 @@ class TestPublish:
 
         captured = capsys.readouterr()
         assert "Error during publish" in captured.out
+
+
+def ack_frame(delivery_tag, multiple=False):
+    return pika.frame.Method(1, pika.spec.Basic.Ack(delivery_tag=delivery_tag, multiple=multiple))
+
+
+def nack_frame(delivery_tag, multiple=False):
+    return pika.frame.Method(1, pika.spec.Basic.Nack(delivery_tag=delivery_tag, multiple=multiple))
+
+
+@patch('pika.BlockingConnection')
+def rabbitmq_instance_confirming(mock_blocking_connection, **params):
+    """Provides a connected ConcreteProducer with publisher confirms enabled."""
+    instance = ConcreteProducer(publisher_confirms=True, **params)
+    instance.connect()
+    assert instance._ready()
+    return instance
+
+
+class TestPublisherConfirms:
+    @pytest.mark.parametrize("confirm_window", [0, -1])
+    def test_init_raises_value_error_for_invalid_window(self, mock_pika, confirm_window):
+        with pytest.raises(ValueError, match="confirm_window must be a positive integer."):
+            ConcreteProducer(publisher_confirms=True, confirm_window=confirm_window)
+
+    @pytest.mark.parametrize("confirm_window", [None, 1.5, "10", True])
+    def test_init_raises_type_error_for_invalid_window(self, mock_pika, confirm_window):
+        with pytest.raises(TypeError, match="confirm_window must be a positive integer."):
+            ConcreteProducer(publisher_confirms=True, confirm_window=confirm_window)
+
+    def test_connect_enables_confirm_mode(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+        instance._channel._impl.confirm_delivery.assert_called_once_with(
+            ack_nack_callback=instance._on_delivery_confirmation)
+
+    def test_confirm_mode_disabled_by_default(self, mock_pika):
+        instance = rabbitmq_instance_ready()
+        instance._channel._impl.confirm_delivery.assert_not_called()
+        assert instance.publish(b"test_message", "test_routing_key") is None
+
+    def test_publish_returns_pending_future(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+        future = instance.publish(b"test_message", "test_routing_key")
+
+        assert not future.done()
+        assert instance.unconfirmed == 1
+
+    def test_ack_resolves_future(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+        future = instance.publish(b"test_message", "test_routing_key")
+
+        instance._on_delivery_confirmation(ack_frame(1))
+        instance._resolve_confirms()
+
+        assert future.result() is True
+        assert instance.unconfirmed == 0
+
+    def test_nack_resolves_future(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+        future = instance.publish(b"test_message", "test_routing_key")
+
+        instance._on_delivery_confirmation(nack_frame(1))
+        instance._resolve_confirms()
+
+        assert future.result() is False
+        assert instance.unconfirmed == 0
+
+    def test_multiple_ack_resolves_all_older_futures(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+        futures = [instance.publish(b"test_message", "test_routing_key") for _ in range(3)]
+
+        instance._on_delivery_confirmation(ack_frame(2, multiple=True))
+        instance._resolve_confirms()
+
+        assert futures[0].result() and futures[1].result()
+        assert not futures[2].done()
+        assert instance.unconfirmed == 1
+
+    def test_publish_blocks_when_window_is_full(self, mock_pika):
+        instance = rabbitmq_instance_confirming(confirm_window=2)
+
+        def ack_oldest(time_limit=None):
+            if time_limit and instance._confirms.pending:
+                instance._on_delivery_confirmation(ack_frame(next(iter(instance._confirms.pending))))
+
+        instance._connection.process_data_events.side_effect = ack_oldest
+
+        futures = [instance.publish(b"test_message", "test_routing_key") for _ in range(5)]
+
+        assert instance.unconfirmed <= 2
+        assert all(future.result() for future in futures[:3])
+
+    def test_confirm_is_not_resolved_inside_io_callback(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+        future = instance.publish(b"test_message", "test_routing_key")
+
+        instance._on_delivery_confirmation(ack_frame(1))  # Runs inside pika's I/O loop.
+
+        assert not future.done()
+        assert instance.wait_for_confirms(timeout=0)
+        assert future.result() is True
+
+    def test_confirm_arriving_during_basic_publish(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+        # BlockingChannel.basic_publish processes I/O while flushing, so the ack may arrive before it returns.
+        instance._channel.basic_publish.side_effect = lambda **kwargs: instance._on_delivery_confirmation(
+            ack_frame(instance._confirms.next_delivery_tag - 1))
+
+        future = instance.publish(b"test_message", "test_routing_key")
+
+        assert future.result(timeout=0) is True
+        assert instance.unconfirmed == 0
+
+    def test_unexpected_publish_error_releases_window_slot(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+        instance._channel.basic_publish.side_effect = ValueError("unexpected")
+
+        with pytest.raises(ValueError):
+            instance.publish(b"test_message", "test_routing_key")
+
+        assert instance.unconfirmed == 0
+        assert instance._confirms.next_delivery_tag == 1
+
+    def test_blocking_channel_exposes_channel_impl(self):
+        # _enable_publisher_confirms relies on this pika internal; fail loudly if a pika upgrade changes it.
+        channel_impl = MagicMock(spec=pika.channel.Channel, channel_number=1)
+        channel = BlockingChannel(channel_impl, MagicMock())
+
+        assert channel._impl is channel_impl
+        assert list(inspect.signature(pika.channel.Channel.confirm_delivery).parameters) == [
+            "self", "ack_nack_callback", "callback"]
+
+    def test_wait_for_confirms_times_out(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+        instance.publish(b"test_message", "test_routing_key")
+
+        assert not instance.wait_for_confirms(timeout=0.01)
+
+    def test_confirm_schedules_resolution_on_connection_thread(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+        future = instance.publish(b"test_message", "test_routing_key")
+
+        instance._on_delivery_confirmation(ack_frame(1))
+        instance._on_delivery_confirmation(ack_frame(1))
+        delay, callback = instance._connection.call_later.call_args.args
+        assert delay == 0
+        instance._connection.call_later.assert_called_once()  # One timer per burst of confirms.
+
+        callback()
+        assert future.result(timeout=0) is True
+
+    def test_disconnect_fails_pending_futures(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+        future = instance.publish(b"test_message", "test_routing_key")
+
+        instance.disconnect()
+
+        with pytest.raises(AMQPConnectionError):
+            future.result()
+
+
+class TestPublishMany:
+    def test_publish_many_publishes_all_messages(self, mock_pika):
+        instance = rabbitmq_instance_ready()
+
+        instance.publish_many([b"a", b"b", b"c"], "test_routing_key")
+
+        assert instance._channel.basic_publish.call_count == 3
+        bodies = [call.kwargs["body"] for call in instance._channel.basic_publish.call_args_list]
+        assert bodies == [b"a", b"b", b"c"]
+
+    def test_publish_many_shares_properties(self, mock_pika):
+        instance = rabbitmq_instance_ready()
+
+        instance.publish_many([b"a", b"b"], "test_routing_key", durable=False)
+
+        first, second = [call.kwargs["properties"] for call in instance._channel.basic_publish.call_args_list]
+        assert first is second
+        assert first.delivery_mode == pika.DeliveryMode.Transient.value
+
+    def test_publish_many_when_not_connected(self, mock_pika):
+        instance = rabbitmq_instance_not_ready()
+
+        with pytest.raises(RuntimeError, match="RabbitMQProducer is not connected."):
+            instance.publish_many([b"a"], "test_routing_key")
+
+    def test_publish_many_waits_once_for_confirms(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+
+        def ack_all(time_limit=None):
+            if instance._confirms.pending:
+                instance._on_delivery_confirmation(ack_frame(next(reversed(instance._confirms.pending)), True))
+
+        instance._connection.process_data_events.side_effect = ack_all
+
+        futures = instance.publish_many([b"a", b"b", b"c"], "test_routing_key")
+
+        assert [future.result() for future in futures] == [True, True, True]
+        assert instance._connection.process_data_events.call_count == 1
+
+
+class TestAutoBatching:
+    @pytest.mark.parametrize("params", [{"batch_size": 0}, {"batch_size": 1, "batch_timeout_ms": -5}])
+    def test_init_raises_value_error_for_invalid_batching(self, mock_pika, params):
+        with pytest.raises(ValueError):
+            ConcreteProducer(**params)
+
+    def test_publish_buffers_until_batch_size(self, mock_pika):
+        instance = ConcreteProducer(batch_size=3)
+        instance.connect()
+
+        instance.publish(b"a", "test_routing_key")
+        instance.publish(b"b", "test_routing_key")
+        instance._channel.basic_publish.assert_not_called()
+
+        instance.publish(b"c", "test_routing_key")
+        assert instance._channel.basic_publish.call_count == 3
+        assert not instance._batch
+
+    def test_flush_publishes_buffered_messages_in_order(self, mock_pika):
+        instance = ConcreteProducer(batch_size=10)
+        instance.connect()
+
+        instance.publish(b"a", "first")
+        instance.publish(b"b", "second", durable=False)
+        instance.flush()
+
+        calls = instance._channel.basic_publish.call_args_list
+        assert [(call.kwargs["routing_key"], call.kwargs["body"]) for call in calls] == [("first", b"a"),
+                                                                                       ("second", b"b")]
+        assert calls[1].kwargs["properties"].delivery_mode == pika.DeliveryMode.Transient.value
+
+    def test_batch_timeout_schedules_flush(self, mock_pika):
+        instance = ConcreteProducer(batch_size=10, batch_timeout_ms=50)
+        instance.connect()
+
+        instance.publish(b"a", "test_routing_key")
+        delay, callback = instance._connection.call_later.call_args.args
+        assert delay == 0.05
+
+        callback()
+        instance._channel.basic_publish.assert_called_once()
+
+    def test_disconnect_flushes_buffered_messages(self, mock_pika):
+        instance = ConcreteProducer(batch_size=10)
+        instance.connect()
+
+        instance.publish(b"a", "test_routing_key")
+        instance.disconnect()
+
+        instance._channel.basic_publish.assert_called_once()
+
+    def test_publish_in_batch_mode_when_not_connected(self, mock_pika):
+        instance = ConcreteProducer(batch_size=10)
+
+        with pytest.raises(RuntimeError, match="RabbitMQProducer is not connected."):
+            instance.publish(b"a", "test_routing_key")
+        assert not instance._batch
+
+    def test_publish_many_flushes_buffered_messages_first(self, mock_pika):
+        instance = ConcreteProducer(batch_size=10)
+        instance.connect()
+
+        instance.publish(b"buffered", "test_routing_key")
+        instance.publish_many([b"a", b"b"], "test_routing_key")
+
+        bodies = [call.kwargs["body"] for call in instance._channel.basic_publish.call_args_list]
+        assert bodies == [b"buffered", b"a", b"b"]
+
+    def test_failed_timed_flush_is_logged_and_keeps_messages(self, mock_pika, capsys):
+        os.environ["LOG_LEVEL"] = "DEBUG"
+        instance = ConcreteProducer(batch_size=10, batch_timeout_ms=50)
+        instance.connect()
+        instance.publish(b"a", "test_routing_key")
+        _, callback = instance._connection.call_later.call_args.args
+        instance._connection.call_later.reset_mock()
+        instance._channel.basic_publish.side_effect = AMQPChannelError("channel closed")
+
+        callback()  # Must not raise out of the connection's I/O loop.
+
+        assert len(instance._batch) == 1
+        instance._connection.call_later.assert_called_once()  # Latency bound re-armed for the leftovers.
+        assert "Timed flush failed, keeping 1 buffered message(s)" in capsys.readouterr().out
+
+    def test_disconnect_fails_buffered_futures_when_not_ready(self, mock_pika, capsys):
+        os.environ["LOG_LEVEL"] = "DEBUG"
+        instance = ConcreteProducer(batch_size=10, publisher_confirms=True)
+        instance.connect()
+        future = instance.publish(b"a", "test_routing_key")
+        instance._channel.close()
+
+        instance.disconnect()
+
+        assert not instance._batch
+        with pytest.raises(AMQPConnectionError):
+            future.result(timeout=0)
+        assert "Dropping 1 buffered message(s)" in capsys.readouterr().out
+
+    def test_disconnect_waits_for_confirms_with_timeout(self, mock_pika):
+        instance = ConcreteProducer(batch_size=10, publisher_confirms=True)
+        instance._DISCONNECT_CONFIRM_TIMEOUT = 0.01
+        instance.connect()
+        future = instance.publish(b"a", "test_routing_key")
+
+        instance.disconnect()  # The broker never confirms; must not hang.
+
+        instance._channel.basic_publish.assert_called_once()
+        with pytest.raises(AMQPConnectionError):
+            future.result(timeout=0)
+
+
+class TestPublishFromOtherThreads:
+    def run_in_thread(self, function):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(function()))
+        thread.start()
+        thread.join(5)
+        return results[0]
+
+    def test_publish_is_handed_to_connection_thread(self, mock_pika):
+        instance = rabbitmq_instance_ready()
+
+        result = self.run_in_thread(lambda: instance.publish(b"test_message", "test_routing_key"))
+
+        assert result is None
+        instance._channel.basic_publish.assert_not_called()
+        (callback,) = instance._connection.add_callback_threadsafe.call_args.args
+        callback()
+        instance._channel.basic_publish.assert_called_once()
+
+    def test_handed_over_publish_resolves_future(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+
+        future = self.run_in_thread(lambda: instance.publish(b"test_message", "test_routing_key"))
+        (callback,) = instance._connection.add_callback_threadsafe.call_args.args
+        callback()
+        instance._on_delivery_confirmation(ack_frame(1))
+        instance.wait_for_confirms()
+
+        assert future.result(timeout=0) is True
+
+    def test_handed_over_publish_error_is_set_on_future(self, mock_pika):
+        instance = rabbitmq_instance_confirming()
+        instance._channel.basic_publish.side_effect = AMQPChannelError("channel closed")
+
+        future = self.run_in_thread(lambda: instance.publish(b"test_message", "test_routing_key"))
+        (callback,) = instance._connection.add_callback_threadsafe.call_args.args
+        callback()
+
+        with pytest.raises(AMQPChannelError):
+            future.result(timeout=0)
+
+
+class ConcreteSeparateChannelProducer(ConcreteProducer):
+    """Publishes on a channel of its own, like AbstractBrain."""
+
+    def _open_publish_channel(self):
+        return self._connection.channel()
+
+
+class TestSeparatePublishChannel:
+    @pytest.fixture
+    def instance(self, mock_pika):
+        _, mock_connection, mock_channel = mock_pika
+        publish_channel = MagicMock()
+        publish_channel.is_open = True
+        mock_connection.channel.side_effect = [mock_channel, publish_channel]
+        instance = ConcreteSeparateChannelProducer(publisher_confirms=True)
+        instance.connect()
+        return instance
+
+    def test_publishes_on_own_channel(self, instance):
+        instance.publish(b"test_message", "test_routing_key")
+
+        instance._publish_channel.basic_publish.assert_called_once()
+        instance._channel.basic_publish.assert_not_called()
+        instance._publish_channel._impl.confirm_delivery.assert_called_once()
+
+    def test_closed_publish_channel_is_not_ready(self, instance):
+        instance._publish_channel.is_open = False
+
+        with pytest.raises(RuntimeError, match="RabbitMQProducer is not connected."):
+            instance.publish(b"test_message", "test_routing_key")
+
+
+class TestAutoReconnect:
+    @pytest.fixture
+    def disconnected(self, reopening_pika):
+        """A producer whose connection was lost and whose next reconnect attempt fails."""
+        state, lose_connection, _ = reopening_pika
+        with patch('time.sleep'):
+            instance = ConcreteProducer(auto_reconnect=True, reconnect_buffer_size=2)
+            instance.connect()
+            lose_connection()
+            state['failures'] = 1
+            yield instance
+
+    @pytest.mark.parametrize("size, error", [(0, ValueError), (1.5, TypeError)])
+    def test_invalid_buffer_size(self, mock_pika, size, error):
+        with pytest.raises(error, match="reconnect_buffer_size must be a positive integer."):
+            ConcreteProducer(reconnect_buffer_size=size)
+
+    def test_publish_buffers_while_disconnected(self, disconnected):
+        assert disconnected.publish(b"a", "test_routing_key") is None
+
+        assert len(disconnected._outbox) == 1
+        disconnected._channel.basic_publish.assert_not_called()
+        assert not disconnected._reconnect_due()  # The failed attempt scheduled the next one.
+
+    def test_buffer_is_published_in_order_after_reconnect(self, disconnected):
+        disconnected.publish(b"a", "test_routing_key")
+        disconnected.publish(b"b", "test_routing_key")
+
+        assert disconnected.reconnect()
+
+        bodies = [call.kwargs["body"] for call in disconnected._channel.basic_publish.call_args_list]
+        assert bodies == [b"a", b"b"]
+        assert not disconnected._outbox
+
+    def test_full_buffer_raises(self, disconnected):
+        disconnected.publish(b"a", "test_routing_key")
+        disconnected.publish(b"b", "test_routing_key")
+
+        with pytest.raises(RuntimeError, match="reconnect buffer is full"):
+            disconnected.publish(b"c", "test_routing_key")
+
+    def test_publish_reconnects_once_backoff_elapsed(self, disconnected):
+        disconnected.publish(b"a", "test_routing_key")
+        disconnected._next_reconnect = 0.0
+
+        disconnected.publish(b"b", "test_routing_key")
+
+        assert disconnected._publish_ready()
+        assert disconnected._channel.basic_publish.call_count == 2
+
+    def test_buffered_future_resolves_after_reconnect(self, disconnected):
+        disconnected._publisher_confirms = True
+        future = disconnected.publish(b"a", "test_routing_key")
+
+        disconnected.reconnect()
+        disconnected._on_delivery_confirmation(ack_frame(1))
+        disconnected.wait_for_confirms()
+
+        assert future.result(timeout=0) is True
+
+    def test_disconnect_fails_buffered_futures(self, disconnected):
+        disconnected._publisher_confirms = True
+        future = disconnected.publish(b"a", "test_routing_key")
+
+        disconnected.disconnect()
+
+        with pytest.raises(AMQPConnectionError):
+            future.result(timeout=0)
+
+    def test_publish_after_disconnect_is_not_buffered(self, disconnected):
+        disconnected.disconnect()
+
+        with pytest.raises(RuntimeError, match="RabbitMQProducer is not connected."):
+            disconnected.publish(b"a", "test_routing_key")
+
+
+
+class TestEncoding:
+    @pytest.mark.parametrize("message, body, content_type", [
+        (b"raw", b"raw", None),
+        (bytearray(b"raw"), b"raw", None),
+        ("hé", "hé".encode(), "text/plain"),
+        ({"author": "joe", "content": "hi"}, b'{"author":"joe","content":"hi"}', "application/json"),
+    ])
+    def test_publish_encodes_by_message_type(self, mock_pika, message, body, content_type):
+        instance = rabbitmq_instance_ready()
+
+        instance.publish(message, "test_routing_key")
+
+        published = instance._channel.basic_publish.call_args.kwargs
+        assert published["body"] == body
+        assert published["properties"].content_type == content_type
+
+    def test_publish_uses_content_type_of_properties(self, mock_pika):
+        instance = rabbitmq_instance_ready()
+
+        instance.publish("hi", "test_routing_key", properties=pika.BasicProperties(content_type="application/json"))
+
+        assert instance._channel.basic_publish.call_args.kwargs["body"] == b'"hi"'
+
+    def test_publish_uses_default_content_type(self, mock_pika):
+        registry = CodecRegistry([ReprCodec()])
+        instance = ConcreteProducer(codecs=registry, content_type=ReprCodec.content_type)
+        instance.connect()
+
+        instance.publish([1, 2], "test_routing_key")
+
+        published = instance._channel.basic_publish.call_args.kwargs
+        assert published["body"] == b"[1, 2]"
+        assert published["properties"].content_type == ReprCodec.content_type
+
+    def test_unknown_content_type(self, mock_pika):
+        with pytest.raises(ValueError, match="No codec registered for content type 'application/x-unknown'"):
+            ConcreteProducer(content_type="application/x-unknown")
+
+        instance = rabbitmq_instance_ready()
+        with pytest.raises(ValueError, match="No codec registered"):
+            instance.publish({}, "test_routing_key",
+                             properties=pika.BasicProperties(content_type="application/x-unknown"))
+        instance._channel.basic_publish.assert_not_called()
+
+    def test_publish_many_encodes_every_message(self, mock_pika):
+        instance = rabbitmq_instance_ready()
+
+        instance.publish_many([{"n": 1}, {"n": 2}], "test_routing_key")
+
+        bodies = [c.kwargs["body"] for c in instance._channel.basic_publish.call_args_list]
+        assert bodies == [b'{"n":1}', b'{"n":2}']
+        assert instance._channel.basic_publish.call_args.kwargs["properties"].content_type == "application/json"
+
+
+class ReprCodec(Codec):
+    content_type = "text/x-python-repr"
+
+    def encode(self, obj):
+        return repr(obj).encode()
+
+    def decode(self, body):
+        return body.decode()
+
+
+class TestCompression:
+    def test_invalid_params(self, mock_pika):
+        with pytest.raises(TypeError, match="compression must be a string or None."):
+            ConcreteProducer(compression=1)
+        with pytest.raises(ValueError, match="compression_threshold must be a non-negative integer."):
+            ConcreteProducer(compression="deflate", compression_threshold=-1)
+        with pytest.raises(ValueError, match="No compressor registered for content encoding 'br'."):
+            ConcreteProducer(compression="br")
+
+    def test_large_bodies_are_compressed(self, mock_pika):
+        instance = ConcreteProducer(compression="deflate", compression_threshold=100)
+        instance.connect()
+
+        instance.publish({"text": "word " * 100}, "test_routing_key")
+
+        published = instance._channel.basic_publish.call_args.kwargs
+        assert published["properties"].content_encoding == "deflate"
+        assert zlib.decompress(published["body"]) == b'{"text":"' + b"word " * 100 + b'"}'
+
+    def test_small_bodies_are_not_compressed(self, mock_pika):
+        instance = ConcreteProducer(compression="deflate", compression_threshold=100)
+        instance.connect()
+
+        instance.publish(b"small", "test_routing_key")
+
+        published = instance._channel.basic_publish.call_args.kwargs
+        assert published["body"] == b"small"
+        assert published["properties"].content_encoding is None
+
+    def test_compression_is_off_by_default(self, mock_pika):
+        instance = rabbitmq_instance_ready()
+
+        instance.publish(b"a" * 100_000, "test_routing_key")
+
+        assert instance._channel.basic_publish.call_args.kwargs["body"] == b"a" * 100_000
+
+    def test_publish_many_compresses_whole_batch(self, mock_pika):
+        instance = ConcreteProducer(compression="deflate", compression_threshold=100)
+        instance.connect()
+
+        instance.publish_many([b"a" * 1000, b"small"], "test_routing_key")
+
+        bodies = [zlib.decompress(c.kwargs["body"]) for c in instance._channel.basic_publish.call_args_list]
+        assert bodies == [b"a" * 1000, b"small"]
+        assert instance._channel.basic_publish.call_args.kwargs["properties"].content_encoding == "deflate"
+
+
+class TestMetrics:
+    def test_metrics_are_disabled_by_default(self, mock_pika):
+        instance = rabbitmq_instance_ready()
+        assert instance._metrics is None
+        assert not hasattr(instance, "_m_published")
+
+    def test_publish_is_counted_and_timed(self, mock_pika):
+        registry = MetricsRegistry()
+        instance = ConcreteProducer(metrics=registry)
+        instance.connect()
+
+        instance.publish(b"test_message", "test_routing_key")
+        instance.publish_many([b"a", b"b"], "test_routing_key")
+
+        rendered = registry.render()
+        assert 'rmq_published_total{client="ConcreteProducer"} 3' in rendered
+        assert 'rmq_publish_seconds_count{client="ConcreteProducer"} 3' in rendered
+
+    def test_failed_publish_is_not_counted(self, mock_pika):
+        registry = MetricsRegistry()
+        instance = ConcreteProducer(metrics=registry)
+        instance.connect()
+        instance._connection.close()
+
+        with pytest.raises(RuntimeError):
+            instance.publish(b"test_message", "test_routing_key")
+        assert 'rmq_published_total{client="ConcreteProducer"} 0' in registry.render()
+
+    def test_nacks_are_counted(self, mock_pika):
+        registry = MetricsRegistry()
+        instance = ConcreteProducer(publisher_confirms=True, metrics=registry)
+        instance.connect()
+        instance.publish(b"a", "test_routing_key")
+        instance.publish(b"b", "test_routing_key")
+
+        instance._on_delivery_confirmation(nack_frame(2, multiple=True))
+        instance._resolve_confirms()
+
+        assert 'rmq_publish_nacked_total{client="ConcreteProducer"} 2' in registry.render()
+
+
+class TestTracing:
+    def sent_headers(self, instance, call=-1):
+        properties = instance._channel.basic_publish.call_args_list[call].kwargs["properties"]
+        return properties.headers if properties is not None else None
+
+    def test_tracing_is_disabled_by_default(self, mock_pika):
+        instance = rabbitmq_instance_ready()
+        instance.publish(b"test_message", "test_routing_key")
+        assert self.sent_headers(instance) is None
+
+    def test_publish_starts_a_trace(self, mock_pika):
+        instance = ConcreteProducer(tracing=True)
+        instance.connect()
+        properties = pika.BasicProperties(headers={"x-custom": "kept"})
+
+        instance.publish(b"test_message", "test_routing_key", properties=properties)
+
+        headers = self.sent_headers(instance)
+        assert headers["x-custom"] == "kept"
+        assert headers[tracing.TRACE_HOPS] == [["ConcreteProducer", None, headers[tracing.TRACE_ORIGIN]]]
+        assert properties.headers == {"x-custom": "kept"}
+
+    def test_publish_while_handling_a_delivery_continues_its_trace(self, mock_pika):
+        instance = ConcreteProducer(tracing=True)
+        instance.connect()
+        delivered = tracing.inject(None, "Ear")
+
+        tracing.call_in_trace(lambda *args: instance.publish(b"reply", "test_routing_key"),
+                              None, None, delivered, b"body")
+
+        headers = self.sent_headers(instance)
+        assert headers[tracing.TRACE_ID] == delivered.headers[tracing.TRACE_ID]
+        assert [hop[0] for hop in headers[tracing.TRACE_HOPS]] == ["Ear", "ConcreteProducer"]
+
+    def test_publish_many_shares_one_trace(self, mock_pika):
+        instance = ConcreteProducer(tracing=True)
+        instance.connect()
+
+        instance.publish_many([b"a", b"b"], "test_routing_key")
+
+        assert self.sent_headers(instance, 0) == self.sent_headers(instance, 1)
+
+
+class QueueProducer(RabbitMQProducer):
+    def _setup(self):
+        self._channel.queue_declare(queue='jobs')
+
+
+def blocked_producer(broker, **params):
+    """Returns a producer connected to `broker` that has processed the broker's connection.blocked."""
+    producer = QueueProducer(connection_manager=broker.connection_manager(), **params)
+    producer.connect()
+    broker.block()
+    producer._connection.process_data_events()
+    return producer
+
+
+def bodies(broker):
+    return [body for _, body in broker.queue('jobs')]
+
+
+class TestFlowControl:
+    def test_publishes_are_buffered_while_blocked(self):
+        broker = InMemoryBroker()
+        producer = blocked_producer(broker)
+
+        producer.publish(b'1', 'jobs')
+        producer.publish_many([b'2', b'3'], 'jobs')
+
+        assert producer.blocked
+        assert bodies(broker) == []
+
+    def test_buffer_drains_in_order_on_unblock(self):
+        broker = InMemoryBroker()
+        producer = blocked_producer(broker, publisher_confirms=True)
+        futures = [producer.publish(str(index).encode(), 'jobs') for index in range(3)]
+
+        broker.unblock()
+        producer._connection.process_data_events()
+        producer.publish(b'3', 'jobs')
+        producer.wait_for_confirms(timeout=1)
+
+        assert not producer.blocked
+        assert bodies(broker) == [b'0', b'1', b'2', b'3']
+        assert [future.result() for future in futures] == [True, True, True]
+
+    def test_batches_flushed_while_blocked_keep_their_order(self):
+        broker = InMemoryBroker()
+        producer = QueueProducer(connection_manager=broker.connection_manager(), batch_size=10)
+        producer.connect()
+        producer.publish(b'0', 'jobs')
+        broker.block()
+        producer._connection.process_data_events()
+
+        producer.flush()
+        producer.publish(b'1', 'jobs')
+        broker.unblock()
+        producer._connection.process_data_events()
+        producer.flush()
+
+        assert bodies(broker) == [b'0', b'1']
+
+    def test_raise_policy(self):
+        broker = InMemoryBroker()
+        producer = blocked_producer(broker, blocked_buffer_size=2, overflow_policy='raise')
+        producer.publish(b'1', 'jobs')
+        producer.publish(b'2', 'jobs')
+
+        with pytest.raises(RuntimeError):
+            producer.publish(b'3', 'jobs')
+
+    def test_drop_oldest_policy(self):
+        broker = InMemoryBroker()
+        producer = blocked_producer(broker, blocked_buffer_size=2, overflow_policy='drop-oldest',
+                                    publisher_confirms=True)
+        dropped = producer.publish(b'1', 'jobs')
+        producer.publish(b'2', 'jobs')
+        producer.publish(b'3', 'jobs')
+
+        broker.unblock()
+        producer._connection.process_data_events()
+
+        assert isinstance(dropped.exception(), RuntimeError)
+        assert bodies(broker) == [b'2', b'3']
+
+    def test_block_policy_waits_for_unblock(self):
+        broker = InMemoryBroker()
+        producer = blocked_producer(broker, blocked_buffer_size=1, overflow_policy='block')
+        producer.publish(b'1', 'jobs')
+        threading.Timer(0.05, broker.unblock).start()
+
+        producer.publish(b'2', 'jobs')
+
+        assert not producer.blocked
+        assert bodies(broker) == [b'1', b'2']
+
+    def test_spills_to_disk_beyond_the_memory_buffer(self, tmp_path):
+        broker = InMemoryBroker()
+        producer = blocked_producer(broker, blocked_buffer_size=2, overflow_policy='raise', spill_dir=str(tmp_path))
+        for index in range(5):
+            producer.publish({'index': index}, 'jobs', properties=pika.BasicProperties(headers={'n': index}))
+        assert producer._blocked_buffer.spilled == 3
+
+        broker.unblock()
+        producer._connection.process_data_events()
+
+        assert [properties.headers['n'] for properties, _ in broker.queue('jobs')] == [0, 1, 2, 3, 4]
+        assert producer._blocked_buffer.spilled == 0
+
+    def test_disconnect_fails_messages_still_blocked(self):
+        broker = InMemoryBroker()
+        producer = blocked_producer(broker, publisher_confirms=True)
+        future = producer.publish(b'1', 'jobs')
+
+        producer.disconnect()
+
+        assert isinstance(future.exception(), AMQPConnectionError)
+
+    def test_invalid_policy(self):
+        with pytest.raises(ValueError):
+            QueueProducer(overflow_policy='wait')
+
+
+def unreachable(manager):
+    """Makes `manager` fail to connect, like a broker that is down."""
+    return patch.object(manager, '_open', side_effect=AMQPConnectionError("unreachable"))
+
+
+class TestSpool:
+    def test_messages_published_while_unreachable_are_replayed_on_connect(self, tmp_path):
+        broker = InMemoryBroker()
+        manager = broker.connection_manager()
+        producer = QueueProducer(connection_manager=manager, spool_dir=str(tmp_path))
+        with unreachable(manager):
+            assert not producer.connect()
+            for index in range(3):
+                assert producer.publish(str(index).encode(), 'jobs') is None
+        assert len(producer._spool) == 3
+
+        assert producer.connect()
+
+        assert bodies(broker) == [b'0', b'1', b'2']
+        assert len(producer._spool) == 0
+        producer.disconnect()
+
+    def test_new_messages_queue_behind_spooled_ones(self, tmp_path):
+        broker = InMemoryBroker()
+        manager = broker.connection_manager()
+        producer = QueueProducer(connection_manager=manager, spool_dir=str(tmp_path), publisher_confirms=True)
+        with unreachable(manager):
+            producer.connect()
+            futures = [producer.publish(b'0', 'jobs')]
+        producer._next_reconnect = 0  # Skip the backoff.
+
+        futures.append(producer.publish(b'1', 'jobs'))
+
+        assert bodies(broker) == [b'0', b'1']
+        assert [future.result(timeout=1) for future in futures] == [True, True]
+        producer.disconnect()
+
+    def test_spool_outlives_the_producer(self, tmp_path):
+        broker = InMemoryBroker()
+        manager = broker.connection_manager()
+        producer = QueueProducer(connection_manager=manager, spool_dir=str(tmp_path), publisher_confirms=True)
+        with unreachable(manager):
+            producer.connect()
+            future = producer.publish(b'0', 'jobs')
+            producer.disconnect()
+        assert isinstance(future.exception(), AMQPConnectionError)
+
+        successor = QueueProducer(connection_manager=manager, spool_dir=str(tmp_path))
+        successor.connect()
+
+        assert bodies(broker) == [b'0']
+        successor.disconnect()
+
+    def test_messages_blocked_at_disconnect_are_spooled(self, tmp_path):
+        broker = InMemoryBroker()
+        producer = blocked_producer(broker, spool_dir=str(tmp_path))
+        producer.publish(b'0', 'jobs')
+
+        producer.disconnect()
+        broker.unblock()
+        successor = QueueProducer(connection_manager=broker.connection_manager(), spool_dir=str(tmp_path))
+        successor.connect()
+
+        assert bodies(broker) == [b'0']
+        successor.disconnect()
+
+    def test_spooled_messages_are_counted(self, tmp_path):
+        broker = InMemoryBroker()
+        manager = broker.connection_manager()
+        metrics = MetricsRegistry()
+        producer = QueueProducer(connection_manager=manager, spool_dir=str(tmp_path), metrics=metrics)
+        with unreachable(manager):
+            producer.connect()
+            producer.publish(b'0', 'jobs')
+
+        assert 'rmq_publish_spooled_total{client="QueueProducer"} 1' in metrics.render()
+        producer.disconnect()
+
+    def test_invalid_spool_dir(self):
+        with pytest.raises(TypeError):
+            QueueProducer(spool_dir=1)
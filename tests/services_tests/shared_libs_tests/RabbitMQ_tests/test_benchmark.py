@@ -0,0 +1,113 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from services.shared_libs.RabbitMQ import InMemoryBroker, benchmark
+from services.shared_libs.RabbitMQ.IpcBroker import IpcBroker
+from services.shared_libs.RabbitMQ.benchmark import Scenario, compare, matrix, summarise
+
+
+def result(throughput, received=100, **scenario):
+    settings = dict(message_size=64, prefetch=0, durable=False, confirms=False, batch_size=1, messages=100)
+    settings.update(scenario)
+    return {'scenario': settings, 'received': received, 'throughput': throughput, 'latency_ms': {'p99': 1.0}}
+
+
+class TestScenario:
+    def test_matrix_is_the_cross_product(self):
+        scenarios = matrix([64, 1024], [0, 10], [False], [False, True], [1], messages=5)
+
+        assert len(scenarios) == 8
+        assert Scenario(1024, 10, False, True, 1, 5) in scenarios
+
+    @pytest.mark.parametrize("settings", [
+        dict(message_size=4), dict(prefetch=-1), dict(batch_size=0), dict(messages=0),
+    ])
+    def test_invalid_settings_raise(self, settings):
+        defaults = dict(message_size=64, prefetch=0, durable=False, confirms=False, batch_size=1, messages=10)
+        with pytest.raises(ValueError):
+            Scenario(**{**defaults, **settings})
+
+    def test_key_ignores_the_number_of_messages(self):
+        assert Scenario(64, 0, True, True, 1, 10).key() == Scenario(64, 0, True, True, 1, 1000).key()
+
+
+class TestSummarise:
+    def test_rates_and_latencies(self):
+        scenario = Scenario(1000, 0, False, False, 1, 4)
+
+        summary = summarise(scenario, 0, 1_000_000_000, 2_000_000_000, [1_000_000, 2_000_000, 3_000_000, 4_000_000])
+
+        assert summary['publish_rate'] == 4
+        assert summary['throughput'] == 2
+        assert summary['megabytes_per_second'] == 0.002
+        assert summary['latency_ms'] == {'p50': 2, 'p90': 4, 'p99': 4, 'max': 4}
+        json.dumps(summary)
+
+    def test_nothing_received(self):
+        summary = summarise(Scenario(64, 0, False, False, 1, 4), 0, 1_000_000, None, [])
+
+        assert summary['received'] == 0
+        assert summary['throughput'] is None
+        assert summary['latency_ms']['p99'] is None
+
+
+class TestCompare:
+    def test_slower_scenario_is_a_regression(self):
+        regressions = compare([result(1000)], [result(850)], tolerance=0.1)
+        assert len(regressions) == 1
+        assert "850 msg/s" in regressions[0]
+
+    def test_within_tolerance(self):
+        assert compare([result(1000)], [result(950)], tolerance=0.1) == []
+
+    def test_lost_messages_are_a_regression(self):
+        assert compare([result(1000)], [result(2000, received=99)])
+
+    def test_new_scenarios_are_ignored(self):
+        assert compare([result(1000)], [result(1, message_size=128)]) == []
+
+
+class TestMain:
+    def test_writes_one_line_per_scenario(self, tmp_path):
+        output = tmp_path / "results.jsonl"
+        with patch.object(benchmark, 'run', side_effect=lambda scenario, *args: result(100, **scenario.as_dict())):
+            code = benchmark.main(["--sizes", "64", "128", "--prefetch", "0", "--durable", "off", "--confirms",
+                                   "off", "--batch-size", "1", "--messages", "100", "--output", str(output)])
+
+        lines = [json.loads(line) for line in output.read_text().splitlines()]
+        assert code == 0
+        assert [line['scenario']['message_size'] for line in lines] == [64, 128]
+
+    def test_regression_fails(self, tmp_path):
+        baseline = tmp_path / "baseline.jsonl"
+        baseline.write_text(json.dumps(result(1000)) + "\n")
+        with patch.object(benchmark, 'run', side_effect=lambda scenario, *args: result(10, **scenario.as_dict())):
+            code = benchmark.main(["--sizes", "64", "--prefetch", "0", "--durable", "off", "--confirms", "off",
+                                   "--batch-size", "1", "--messages", "100", "--output", str(tmp_path / "out.jsonl"),
+                                   "--compare", str(baseline)])
+        assert code == 1
+
+
+class TestRun:
+    @pytest.mark.parametrize("confirms, batch_size", [(False, 1), (True, 10)])
+    def test_in_memory_run(self, confirms, batch_size):
+        scenario = Scenario(64, 10, False, confirms, batch_size, 200)
+
+        summary = benchmark.run(scenario, timeout=5, broker=InMemoryBroker())
+
+        assert summary['received'] == 200
+        assert summary['broker'] == 'in-memory'
+        assert summary['throughput'] > 0
+
+    def test_ipc_run(self, tmp_path):
+        broker = IpcBroker(str(tmp_path / "rmq.sock"))
+        broker.start()
+        try:
+            summary = benchmark.run(Scenario(64, 10, False, True, 10, 200), timeout=5, broker=broker)
+        finally:
+            broker.stop()
+
+        assert summary['received'] == 200
+        assert summary['broker'] == f'ipc:{broker.path}'
@@ -0,0 +1,144 @@
+import time
+
+import pika
+import pytest
+
+from services.shared_libs.RabbitMQ import InMemoryBroker
+from services.shared_libs.RabbitMQ.dedup import DedupCache
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_InMemoryBroker import Collector, Producer, consume_in_thread
+
+
+class TestDedupCache:
+    def test_forgets_the_least_recently_seen_beyond_its_size(self):
+        cache = DedupCache(max_size=2)
+        cache.add('a')
+        cache.add('b')
+        assert 'a' in cache  # Seen again, so 'b' is now the least recently seen.
+
+        cache.add('c')
+
+        assert 'a' in cache and 'c' in cache and 'b' not in cache
+        assert len(cache) == 2
+
+    def test_forgets_ids_after_the_ttl(self):
+        cache = DedupCache(ttl=0.01)
+        cache.add('a')
+        time.sleep(0.02)
+
+        assert 'a' not in cache and len(cache) == 0
+
+    def test_persisted_ids_survive_a_restart(self, tmp_path):
+        path = str(tmp_path / 'dedup.db')
+        cache = DedupCache(max_size=2, path=path)
+        for message_id in ('a', 'b', 'c'):
+            cache.add(message_id)
+        cache.close()
+
+        restarted = DedupCache(max_size=2, path=path)
+
+        assert 'a' not in restarted and 'b' in restarted and 'c' in restarted
+        restarted.close()
+
+    def test_discarded_ids_are_forgotten_on_disk_too(self, tmp_path):
+        path = str(tmp_path / 'dedup.db')
+        cache = DedupCache(path=path)
+        cache.add('a')
+        cache.discard('a')
+        cache.discard(None)
+        cache.close()
+
+        assert 'a' not in cache and 'a' not in DedupCache(path=path)
+
+    def test_expired_ids_are_not_loaded(self, tmp_path):
+        path = str(tmp_path / 'dedup.db')
+        cache = DedupCache(path=path)
+        cache.add('a')
+        cache.close()
+        time.sleep(0.02)
+
+        assert 'a' not in DedupCache(ttl=0.01, path=path)
+
+    @pytest.mark.parametrize("params, error", [
+        ({'max_size': 0}, ValueError), ({'max_size': '1'}, TypeError), ({'ttl': 0}, ValueError),
+        ({'ttl': True}, TypeError), ({'path': ''}, TypeError),
+    ])
+    def test_validation(self, params, error):
+        with pytest.raises(error):
+            DedupCache(**params)
+
+
+class Requeueing(Collector):
+    """Requeues every message the first time it sees it."""
+
+    def _callback(self, ch, method, properties, body):
+        if not method.redelivered:
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+        super()._callback(ch, method, properties, body)
+
+
+def publish(broker, *message_ids):
+    producer = Producer(connection_manager=broker.connection_manager())
+    producer.connect()
+    for message_id in message_ids:
+        producer.publish(message_id.encode(), 'jobs', properties=pika.BasicProperties(message_id=message_id))
+    producer.disconnect()
+
+
+def consume(consumer, expected):
+    consumer.expected = expected
+    consumer.connect()
+    consume_in_thread(consumer)()
+    consumer.disconnect()
+    return consumer.received
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+class TestConsumerDeduplication:
+    def test_redeliveries_are_acked_without_running_the_callback(self, workers):
+        broker = InMemoryBroker()
+        publish(broker, 'a', 'b', 'a', 'b', 'c')
+
+        consumer = Collector('jobs', connection_manager=broker.connection_manager(), dedup_size=10, workers=workers)
+        received = consume(consumer, expected=3)
+
+        assert sorted(received) == [b'a', b'b', b'c']
+        assert broker.queue('jobs') == []
+
+    def test_requeued_messages_are_processed_again(self, workers):
+        broker = InMemoryBroker()
+        publish(broker, 'a')
+
+        consumer = Requeueing('jobs', connection_manager=broker.connection_manager(), dedup_size=10,
+                              workers=workers)
+
+        assert consume(consumer, expected=1) == [b'a']
+
+    def test_processed_ids_survive_a_restart(self, workers, tmp_path):
+        broker = InMemoryBroker()
+        path = str(tmp_path / 'dedup.db')
+        publish(broker, 'a')
+        consume(Collector('jobs', connection_manager=broker.connection_manager(), dedup_size=10, dedup_path=path,
+                          workers=workers), expected=1)
+
+        publish(broker, 'a', 'b')
+        restarted = Collector('jobs', connection_manager=broker.connection_manager(), dedup_size=10,
+                              dedup_path=path, workers=workers)
+
+        assert consume(restarted, expected=1) == [b'b']
+
+
+class TestMessageIds:
+    def test_producer_gives_every_message_its_own_id(self):
+        broker = InMemoryBroker()
+        producer = Producer(connection_manager=broker.connection_manager(), message_ids=True)
+        producer.connect()
+        producer.publish(b'1', 'jobs')
+        producer.publish(b'2', 'jobs', properties=pika.BasicProperties(message_id='given'))
+        producer.publish_many([b'3', b'4'], 'jobs')
+        producer.disconnect()
+
+        message_ids = [properties.message_id for properties, _ in broker.queue('jobs')]
+
+        assert message_ids[1] == 'given'
+        assert all(message_ids) and len(set(message_ids)) == 4
@@ -0,0 +1,92 @@
+import pika
+import pytest
+
+from services.shared_libs.RabbitMQ import InMemoryBroker
+from services.shared_libs.RabbitMQ.lanes import BACKGROUND, INTERACTIVE, lane_of, lane_queues, prefetch_counts, \
+    routing_key, topology
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_InMemoryBroker import Collector, Producer, \
+    consume_in_thread
+
+
+class TestLanes:
+    @pytest.mark.parametrize("priority, lane", [(None, 0), (0, 0), (1, 1), (INTERACTIVE, 2), (-1, 0)])
+    def test_priorities_above_the_highest_lane_go_to_it(self, priority, lane):
+        assert lane_of(priority, 3) == lane
+
+    def test_routing_key(self):
+        assert routing_key('ear_to_brain', INTERACTIVE, 2) == 'ear_to_brain.lane.1'
+        assert routing_key('ear_to_brain', BACKGROUND, 2) == 'ear_to_brain.lane.0'
+        assert routing_key('ear_to_brain', INTERACTIVE, 0) == 'ear_to_brain'
+
+    def test_topology_declares_the_lanes(self):
+        assert [queue['queue'] for queue in topology('jobs', 2).queues] == lane_queues('jobs', 2) == ['jobs.lane.0',
+                                                                                                   'jobs.lane.1']
+
+    @pytest.mark.parametrize("weights, prefetch_count, expected", [
+        ([1, 4], 10, [2, 8]), ([1, 9], 5, [1, 4]), ([1, 4], None, [1, 4]), ([1, 4], 0, [1, 4]),
+    ])
+    def test_prefetch_counts_follow_the_weights(self, weights, prefetch_count, expected):
+        assert prefetch_counts(weights, prefetch_count) == expected
+
+
+class TestLanedConsumer:
+    def test_interactive_messages_overtake_a_bulk_backlog(self):
+        broker = InMemoryBroker()
+        collector = Collector('jobs', expected=24, lane_weights=[1, 4], prefetch_count=5,
+                              connection_manager=broker.connection_manager())
+        collector.connect()  # Declares the lanes.
+        producer = Producer(connection_manager=broker.connection_manager())
+        producer.connect()
+        for index in range(20):
+            producer.publish(f'bulk {index}', routing_key('jobs', BACKGROUND, 2), priority=BACKGROUND)
+        for index in range(4):
+            producer.publish(f'chat {index}', routing_key('jobs', INTERACTIVE, 2), priority=INTERACTIVE)
+        producer.disconnect()
+
+        consume_in_thread(collector)()
+        collector.disconnect()
+
+        assert len(collector.received) == 24
+        assert max(collector.received.index(f'chat {index}') for index in range(4)) < 6
+        assert [body for body in collector.received if body.startswith('bulk')] == [f'bulk {index}'
+                                                                                    for index in range(20)]
+
+    def test_the_queue_setter_moves_to_the_lanes_of_the_new_queue(self):
+        collector = Collector('jobs', lane_weights=[1, 2], connection_manager=InMemoryBroker().connection_manager())
+
+        collector.queue = 'other'
+
+        assert collector.queues == ['other.lane.0', 'other.lane.1']
+
+    @pytest.mark.parametrize("params, error", [
+        ({'queue_name': 'jobs', 'lane_weights': [1, 0]}, ValueError),
+        ({'queue_name': 'jobs', 'lane_weights': '1,4'}, TypeError),
+        ({'queue_name': ['a', 'b'], 'lane_weights': [1, 4]}, ValueError),
+        ({'queue_name': 'jobs', 'lane_weights': [1, 4], 'shards': 2}, ValueError),
+        ({'queue_name': 'jobs', 'lane_weights': [1, 4], 'adaptive_prefetch': True}, ValueError),
+    ])
+    def test_validation(self, params, error):
+        with pytest.raises(error):
+            Collector(connection_manager=InMemoryBroker().connection_manager(), **params)
+
+
+class TestPriority:
+    def test_publish_sets_the_priority_without_changing_the_given_properties(self):
+        broker = InMemoryBroker()
+        given = pika.BasicProperties(headers={'conversation': 7})
+        producer = Producer(connection_manager=broker.connection_manager())
+        producer.connect()
+        producer.publish('hi', 'jobs', properties=given, priority=INTERACTIVE)
+        producer.publish_many(['a', 'b'], 'jobs', priority=BACKGROUND)
+        producer.disconnect()
+
+        assert [properties.priority for properties, _ in broker.queue('jobs')] == [INTERACTIVE, BACKGROUND, BACKGROUND]
+        assert given.priority is None
+
+    @pytest.mark.parametrize("priority, error", [(256, ValueError), (-1, ValueError), ('9', TypeError)])
+    def test_validation(self, priority, error):
+        producer = Producer(connection_manager=InMemoryBroker().connection_manager())
+        producer.connect()
+        with pytest.raises(error):
+            producer.publish('hi', 'jobs', priority=priority)
+        producer.disconnect()
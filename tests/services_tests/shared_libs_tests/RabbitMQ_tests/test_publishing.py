@@ -0,0 +1,80 @@
+import pika
+import pytest
+
+from services.shared_libs.RabbitMQ.publishing import BlockedBuffer
+
+
+def message(index, size=16):
+    return '', 'jobs', bytes([index]) * size, pika.BasicProperties(headers={'n': index}), f'future-{index}'
+
+
+def drain(buffer):
+    entries = []
+    while (entry := buffer.pop()) is not None:
+        entries.append(entry)
+    return entries
+
+
+class TestBlockedBuffer:
+    def test_memory_only_refuses_beyond_capacity(self):
+        buffer = BlockedBuffer(2)
+
+        assert [buffer.put(*message(index)) for index in range(3)] == [True, True, False]
+        assert [entry[-1] for entry in drain(buffer)] == ['future-0', 'future-1']
+
+    def test_spilled_messages_round_trip_in_order(self, tmp_path):
+        buffer = BlockedBuffer(2, spill_dir=str(tmp_path))
+        for index in range(6):
+            assert buffer.put(*message(index))
+        assert len(buffer) == 6 and buffer.spilled == 4
+
+        entries = drain(buffer)
+
+        assert [entry[2] for entry in entries] == [message(index)[2] for index in range(6)]
+        assert [entry[3].headers['n'] for entry in entries] == list(range(6))
+        assert [entry[-1] for entry in entries] == [f'future-{index}' for index in range(6)]
+        assert list(tmp_path.iterdir()) == []  # The spill file is unlinked right after it is created.
+
+    def test_new_messages_queue_behind_spilled_ones(self, tmp_path):
+        buffer = BlockedBuffer(2, spill_dir=str(tmp_path))
+        for index in range(4):
+            buffer.put(*message(index))
+        buffer.pop()
+
+        buffer.put(*message(4))
+
+        assert [entry[3].headers['n'] for entry in drain(buffer)] == [1, 2, 3, 4]
+
+    def test_spill_limit(self, tmp_path):
+        buffer = BlockedBuffer(1, spill_dir=str(tmp_path), spill_max_bytes=200)
+
+        accepted = [buffer.put(*message(index, size=50)) for index in range(5)]
+
+        assert accepted[:2] == [True, True] and accepted[-1] is False
+        assert 0 < buffer.spilled < 4
+
+    def test_spill_file_is_compacted(self, tmp_path):
+        buffer = BlockedBuffer(1, spill_dir=str(tmp_path), spill_max_bytes=400)
+        expected = []
+        for index in range(60):  # Far more than fit at once; the buffer is drained as it fills.
+            while not buffer.put(*message(index, size=50)):
+                expected.append(buffer.pop()[3].headers['n'])
+        expected += [entry[3].headers['n'] for entry in drain(buffer)]
+
+        assert expected == list(range(60))
+
+    def test_clear_returns_the_futures(self, tmp_path):
+        buffer = BlockedBuffer(1, spill_dir=str(tmp_path))
+        buffer.put(*message(0))
+        buffer.put(*message(1))
+
+        assert buffer.clear() == ['future-0', 'future-1']
+        assert len(buffer) == 0
+
+    @pytest.mark.parametrize("params, error", [
+        ({'capacity': 0}, ValueError), ({'capacity': 1.5}, TypeError), ({'capacity': 1, 'policy': 'wait'}, ValueError),
+        ({'capacity': 1, 'spill_max_bytes': 0}, ValueError), ({'capacity': 1, 'spill_dir': 1}, TypeError),
+    ])
+    def test_validation(self, params, error):
+        with pytest.raises(error):
+            BlockedBuffer(**params)
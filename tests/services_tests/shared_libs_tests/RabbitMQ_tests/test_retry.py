@@ -0,0 +1,110 @@
+import pika
+import pytest
+
+from services.shared_libs.RabbitMQ import InMemoryBroker, RabbitMQProducer
+from services.shared_libs.RabbitMQ.retry import ERROR_HEADER, RETRY_COUNT_HEADER, RetryPolicy
+from services.shared_libs.metrics import MetricsRegistry
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_InMemoryBroker import Collector, consume_in_thread
+
+
+class TestRetryPolicy:
+    def test_delays_grow_exponentially_up_to_a_bound(self):
+        policy = RetryPolicy(3, delay_ms=1000)
+
+        assert [policy.delay(retry) for retry in (1, 2, 3)] == [1000, 2000, 4000]
+        assert RetryPolicy(30).delay(30) == RetryPolicy._MAX_DELAY_MS
+
+    def test_topology_declares_tiers_and_dead_letter_queue(self):
+        topology = RetryPolicy(2, delay_ms=500).topology(['jobs'])
+
+        assert [queue['queue'] for queue in topology.queues] == ['jobs.retry.500ms', 'jobs.retry.1000ms', 'jobs.dead']
+        assert topology.queues[1]['arguments'] == {'x-message-ttl': 1000, 'x-dead-letter-exchange': '',
+                                                   'x-dead-letter-routing-key': 'jobs'}
+
+    def test_next_counts_retries_in_the_headers(self):
+        policy = RetryPolicy(2)
+        properties = pika.BasicProperties(headers={'trace': 'abc'})
+
+        target, retried = policy.next('jobs', properties, ValueError("bad input"))
+
+        assert target == 'jobs.retry.1000ms'
+        assert retried.headers == {'trace': 'abc', RETRY_COUNT_HEADER: 1, ERROR_HEADER: 'ValueError: bad input'}
+        assert properties.headers == {'trace': 'abc'}  # The delivered properties are left alone.
+        assert policy.next('jobs', retried, ValueError())[0] == 'jobs.retry.2000ms'
+
+    def test_next_dead_letters_once_retries_are_exhausted(self):
+        properties = pika.BasicProperties(headers={RETRY_COUNT_HEADER: 2})
+
+        target, dead = RetryPolicy(2).next('jobs', properties, RuntimeError("still bad"))
+
+        assert target == 'jobs.dead'
+        assert dead.headers[RETRY_COUNT_HEADER] == 2 and dead.headers[ERROR_HEADER] == 'RuntimeError: still bad'
+
+    @pytest.mark.parametrize("params, error", [
+        ({'max_retries': -1}, ValueError), ({'max_retries': '3'}, TypeError), ({'max_retries': 1, 'delay_ms': 0},
+                                                                                ValueError),
+        ({'max_retries': 1, 'multiplier': 0}, ValueError),
+    ])
+    def test_validation(self, params, error):
+        with pytest.raises(error):
+            RetryPolicy(**params)
+
+
+class Producer(RabbitMQProducer):
+    def _setup(self):
+        self._channel.queue_declare(queue='jobs')
+
+
+class Failing(Collector):
+    """Raises for b'bad' messages and collects the others."""
+
+    def _callback(self, ch, method, properties, body):
+        if body == b'bad':
+            raise ValueError("bad input")
+        super()._callback(ch, method, properties, body)
+
+
+def run(broker, messages, **params):
+    producer = Producer(connection_manager=broker.connection_manager())
+    consumer = Failing('jobs', connection_manager=broker.connection_manager(), **params)
+    producer.connect()
+    consumer.connect()
+    for body, headers in messages:
+        producer.publish(body, 'jobs', properties=pika.BasicProperties(headers=headers))
+    consume_in_thread(consumer)()
+    producer.disconnect()
+    consumer.disconnect()
+    return consumer
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+class TestConsumerRetries:
+    def test_failing_callback_does_not_stop_consuming(self, workers):
+        broker = InMemoryBroker()
+
+        consumer = run(broker, [(b'bad', None), (b'good', None)], workers=workers)
+
+        assert consumer.received == [b'good']
+        assert broker.queue('jobs') == []  # Nacked without requeueing.
+
+    def test_failed_message_goes_to_the_next_retry_tier(self, workers):
+        broker = InMemoryBroker()
+
+        run(broker, [(b'bad', {RETRY_COUNT_HEADER: 1}), (b'good', None)], workers=workers, max_retries=3,
+            retry_delay_ms=100)
+
+        assert [body for _, body in broker.queue('jobs.retry.200ms')] == [b'bad']
+        properties, _ = broker.queue('jobs.retry.200ms')[0]
+        assert properties.headers[RETRY_COUNT_HEADER] == 2
+        assert broker.queue('jobs') == [] and broker.queue('jobs.dead') == []
+
+    def test_exhausted_message_is_dead_lettered(self, workers):
+        broker = InMemoryBroker()
+        metrics = MetricsRegistry()
+
+        run(broker, [(b'bad', {RETRY_COUNT_HEADER: 3}), (b'good', None)], workers=workers, max_retries=3,
+            metrics=metrics)
+
+        [(properties, body)] = broker.queue('jobs.dead')
+        assert body == b'bad' and properties.headers[ERROR_HEADER] == 'ValueError: bad input'
+        assert 'rmq_dead_lettered_total{client="Failing",queue="jobs"} 1' in metrics.render()
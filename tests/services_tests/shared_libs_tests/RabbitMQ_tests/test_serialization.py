@@ -0,0 +1,133 @@
+import os
+import pickle
+from unittest.mock import patch
+
+import pika
+import pytest
+
+from services.shared_libs.RabbitMQ import serialization
+from services.shared_libs.RabbitMQ.serialization import BINARY, DEFLATE, GZIP, JSON, LZ4, MSGPACK, TEXT, Codec, \
+    CodecRegistry, Compressor, JsonCodec, MsgpackCodec
+
+
+class TestCodecRegistry:
+    def test_default_codecs(self):
+        registry = CodecRegistry()
+        assert JSON in registry and TEXT in registry and BINARY in registry
+        assert (MSGPACK in registry) == (serialization.msgpack is not None)
+
+    def test_register_rejects_invalid_codecs(self):
+        registry = CodecRegistry([])
+        with pytest.raises(TypeError, match="codec must be a Codec instance."):
+            registry.register(object())
+        with pytest.raises(ValueError, match="codec must declare a content_type."):
+            registry.register(Codec())
+
+    def test_get_unknown_content_type(self):
+        with pytest.raises(ValueError, match="No codec registered for content type 'application/json'."):
+            CodecRegistry([]).get(JSON)
+
+    @pytest.mark.parametrize("message, content_type", [
+        ({"author": "joe", "content": "hé"}, JSON),
+        ([1, "two", None], JSON),
+        ("hé", TEXT),
+    ])
+    def test_round_trip(self, message, content_type):
+        registry = CodecRegistry()
+
+        body, properties = registry.encode(message)
+
+        assert isinstance(body, bytes)
+        assert properties.content_type == content_type
+        assert registry.decode(body, properties) == message
+
+    def test_bytes_are_passed_through(self):
+        registry = CodecRegistry()
+        message = b"x" * 1024
+        properties = pika.BasicProperties(content_type=JSON)
+
+        body, returned = registry.encode(message, properties)
+
+        assert body is message
+        assert returned is properties
+
+    def test_encode_without_properties_keeps_bytes_untagged(self):
+        assert CodecRegistry().encode(b"raw") == (b"raw", None)
+
+    def test_decode_without_content_type(self):
+        registry = CodecRegistry()
+        assert registry.decode(b"raw", pika.BasicProperties()) == b"raw"
+        assert registry.decode(b"raw", None) == b"raw"
+
+    def test_binary_decodes_to_memoryview_without_copy(self):
+        body = b"x" * 1024
+
+        decoded = CodecRegistry().decode(body, pika.BasicProperties(content_type=BINARY))
+
+        assert isinstance(decoded, memoryview)
+        assert decoded.obj is body
+
+    def test_registry_is_picklable(self):
+        registry = pickle.loads(pickle.dumps(CodecRegistry()))
+        assert registry.decode(b'{"a":1}', pika.BasicProperties(content_type=JSON)) == {"a": 1}
+
+    def test_json_is_compact(self):
+        assert JsonCodec().encode({"a": [1, 2]}) == b'{"a":[1,2]}'
+
+
+@pytest.mark.skipif(serialization.msgpack is None, reason="msgpack is not installed")
+class TestMsgpackCodec:
+    def test_round_trip(self):
+        codec = MsgpackCodec()
+        message = {"author": "joe", "audio": b"\x00\x01"}
+        assert codec.decode(codec.encode(message)) == message
+
+
+def test_msgpack_is_optional():
+    with patch.object(serialization, "msgpack", None):
+        assert MSGPACK not in CodecRegistry()
+
+
+class TestCompression:
+    @pytest.mark.parametrize("encoding", [DEFLATE, GZIP])
+    def test_round_trip(self, encoding):
+        registry = CodecRegistry()
+        message = {"text": "word " * 1000}
+        body, properties = registry.encode(message)
+
+        compressed, properties = registry.compress(body, properties, encoding)
+
+        assert len(compressed) < len(body)
+        assert properties.content_encoding == encoding
+        assert registry.decode(compressed, properties) == message
+
+    def test_incompressible_body_is_left_alone(self):
+        body = os.urandom(512)
+
+        compressed, properties = CodecRegistry().compress(body, None, DEFLATE)
+
+        assert compressed is body
+        assert properties is None
+
+    def test_already_encoded_body_is_left_alone(self):
+        body = b"a" * 4096
+        properties = pika.BasicProperties(content_encoding=GZIP)
+
+        assert CodecRegistry().compress(body, properties, DEFLATE) == (body, properties)
+
+    def test_unknown_encoding(self):
+        registry = CodecRegistry()
+        with pytest.raises(ValueError, match="No compressor registered for content encoding 'br'."):
+            registry.compress(b"a" * 4096, None, "br")
+        with pytest.raises(ValueError, match="No compressor registered for content encoding 'br'."):
+            registry.decode(b"...", pika.BasicProperties(content_encoding="br"))
+
+    def test_register_rejects_invalid_compressors(self):
+        registry = CodecRegistry(compressors=[])
+        with pytest.raises(TypeError, match="compressor must be a Compressor instance."):
+            registry.register_compressor(object())
+        with pytest.raises(ValueError, match="compressor must declare an encoding."):
+            registry.register_compressor(Compressor())
+
+    def test_lz4_is_optional(self):
+        assert (LZ4 in CodecRegistry()._compressors) == (serialization.lz4 is not None)
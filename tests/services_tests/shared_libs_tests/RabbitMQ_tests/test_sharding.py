@@ -0,0 +1,159 @@
+import threading
+import time
+
+import pytest
+
+from services.shared_libs.RabbitMQ import InMemoryBroker
+from services.shared_libs.RabbitMQ.sharding import ShardMembership, routing_key, shard_of, shard_queues, topology
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_InMemoryBroker import Collector, Producer
+
+
+class TestShardOf:
+    def test_keys_map_to_a_stable_shard_in_range(self):
+        shards = [shard_of(f'user-{index}', 8) for index in range(1000)]
+
+        assert shards == [shard_of(f'user-{index}', 8) for index in range(1000)]
+        assert set(shards) == set(range(8))
+        assert max(shards.count(shard) for shard in range(8)) < 2 * 1000 / 8
+
+    def test_adding_a_shard_only_moves_keys_to_it(self):
+        moved = [index for index in range(1000) if shard_of(index, 8) != shard_of(index, 9)]
+
+        assert all(shard_of(index, 9) == 8 for index in moved)
+        assert len(moved) < 2 * 1000 / 9
+
+    def test_routing_key(self):
+        assert routing_key('ear_to_brain', 42, 4) == f'ear_to_brain.shard.{shard_of(42, 4)}'
+        assert routing_key('ear_to_brain', 42, 0) == 'ear_to_brain'
+
+    def test_shard_queues_have_a_single_active_consumer(self):
+        declared = topology('jobs', 2)
+
+        assert [queue['queue'] for queue in declared.queues] == shard_queues('jobs', 2) == ['jobs.shard.0',
+                                                                                             'jobs.shard.1']
+        assert declared.queues[0]['arguments'] == {'x-single-active-consumer': True}
+        assert declared.exchanges[0]['exchange'] == 'jobs.members'
+
+
+class TestShardMembership:
+    def test_members_split_the_shards(self):
+        views = [ShardMembership(member, 16, timeout=10) for member in ('a', 'b', 'c')]
+        for view in views:
+            for member in ('a', 'b', 'c'):
+                view.seen(member)
+
+        assignments = [view.assignment() for view in views]
+
+        assert sorted(sum(assignments, [])) == list(range(16))
+        assert all(assignments)
+
+    def test_a_joining_member_only_takes_shards(self):
+        view = ShardMembership('a', 64, timeout=10)
+        view.seen('b')
+        before = {shard: view.owner(shard) for shard in range(64)}
+
+        assert view.seen('c') and not view.seen('c')
+        moved = [shard for shard in range(64) if view.owner(shard) != before[shard]]
+
+        assert moved and all(view.owner(shard) == 'c' for shard in moved)
+
+    def test_silent_members_expire(self):
+        view = ShardMembership('a', 4, timeout=0.01)
+        view.seen('b')
+        time.sleep(0.02)
+
+        assert view.expire() == ['b']
+        assert view.members == ['a'] and view.assignment() == [0, 1, 2, 3]
+
+    def test_validation(self):
+        with pytest.raises(ValueError):
+            ShardMembership('a', 0, timeout=1)
+
+
+class Replica(Collector):
+    """Collects the keys it received; announces itself often so that the tests converge quickly."""
+
+    _SHARD_HEARTBEAT_INTERVAL = 0.05
+    _SHARD_MEMBER_TIMEOUT = 0.5
+
+    def __init__(self, broker, **kwargs):
+        super().__init__('jobs', expected=0, shards=8, connection_manager=broker.connection_manager(), **kwargs)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out."
+        time.sleep(0.01)
+
+
+def converged(*replicas):
+    claimed = [queue for replica in replicas for queue in replica.queues]
+    return sorted(claimed) == sorted(shard_queues('jobs', 8))
+
+
+@pytest.fixture
+def replicas():
+    broker = InMemoryBroker()
+    started = []
+
+    def start():
+        replica = Replica(broker)
+        replica.connect()
+        replica.thread = threading.Thread(target=replica.consume)
+        replica.thread.start()
+        started.append(replica)
+        return replica
+
+    yield broker, start
+    for replica in started:
+        if replica.thread.is_alive():
+            replica._connection.add_callback_threadsafe(replica.stop_consuming)
+            replica.thread.join(5)
+        replica.disconnect()
+
+
+class TestShardedConsumer:
+    def test_replicas_split_the_shards_and_keep_keys_together(self, replicas):
+        broker, start = replicas
+        first, second = start(), start()
+        wait_for(lambda: converged(first, second))
+
+        producer = Producer(connection_manager=broker.connection_manager())
+        producer.connect()
+        for _ in range(2):
+            for key in range(20):
+                producer.publish(str(key).encode(), routing_key('jobs', key, 8))
+        producer.disconnect()
+        wait_for(lambda: len(first.received) + len(second.received) == 40)
+
+        assert first.received and second.received
+        assert not set(first.received) & set(second.received)
+
+    def test_a_leaving_replica_hands_its_shards_over(self, replicas):
+        _, start = replicas
+        first, second = start(), start()
+        wait_for(lambda: converged(first, second))
+
+        first._connection.add_callback_threadsafe(first.stop_consuming)
+        first.thread.join(5)
+
+        wait_for(lambda: converged(second))
+
+    def test_a_silent_replica_loses_its_shards(self, replicas):
+        _, start = replicas
+        first, second = start(), start()
+        wait_for(lambda: converged(first, second))
+
+        first._connection.add_callback_threadsafe(first._channel.stop_consuming)  # Stops without leaving.
+        first.thread.join(5)
+
+        wait_for(lambda: converged(second))
+
+    @pytest.mark.parametrize("params, error", [
+        ({'queue_name': 'jobs', 'shards': -1}, ValueError), ({'queue_name': 'jobs', 'shards': '8'}, TypeError),
+        ({'queue_name': ['a', 'b'], 'shards': 8}, ValueError),
+    ])
+    def test_validation(self, params, error):
+        with pytest.raises(error):
+            Collector(connection_manager=InMemoryBroker().connection_manager(), **params)
@@ -0,0 +1,91 @@
+import os
+
+import pika
+import pytest
+
+from services.shared_libs.RabbitMQ.spool import Spool
+
+
+def fill(spool, count, start=0):
+    return [spool.append('', 'jobs', str(index).encode(), pika.BasicProperties(headers={'n': index}))
+            for index in range(start, start + count)]
+
+
+def bodies(messages):
+    return [message[2] for _, message in messages]
+
+
+def segments(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.seg'))
+
+
+class TestSpool:
+    def test_messages_are_read_in_order_until_acknowledged(self, tmp_path):
+        spool = Spool(str(tmp_path))
+
+        assert fill(spool, 3) == [1, 2, 3]
+        assert len(spool) == 3
+        messages = spool.read(2)
+        assert [sequence for sequence, _ in messages] == [1, 2]
+        assert messages[0][1][:2] == ('', 'jobs') and messages[0][1][3].headers == {'n': 0}
+        assert bodies(spool.read(10)) == [b'0', b'1', b'2']  # Reading does not remove.
+
+        spool.ack(2)
+
+        assert len(spool) == 1
+        assert [(sequence, message[2]) for sequence, message in spool.read(10)] == [(3, b'2')]
+
+    def test_acknowledged_segments_are_deleted(self, tmp_path):
+        spool = Spool(str(tmp_path), segment_bytes=100)
+        fill(spool, 10)
+        assert len(segments(tmp_path)) > 2
+
+        spool.ack(5)
+        remaining = segments(tmp_path)
+        spool.ack(10)
+
+        assert 0 < len(remaining) < 10
+        assert segments(tmp_path) == [] and len(spool) == 0
+        fill(spool, 1, start=10)
+        assert [sequence for sequence, _ in spool.read(10)] == [11]
+
+    def test_unacknowledged_messages_survive_a_restart(self, tmp_path):
+        spool = Spool(str(tmp_path), segment_bytes=100)
+        fill(spool, 6)
+        spool.ack(4)
+        spool.close()
+
+        reopened = Spool(str(tmp_path), segment_bytes=100)
+
+        assert len(reopened) == 2
+        assert [(sequence, message[2]) for sequence, message in reopened.read(10)] == [(5, b'4'), (6, b'5')]
+        assert fill(reopened, 1, start=6) == [7]
+
+    def test_torn_record_is_cut_off(self, tmp_path):
+        spool = Spool(str(tmp_path))
+        fill(spool, 2)
+        spool.close()
+        with open(tmp_path / segments(tmp_path)[-1], 'ab') as segment:
+            segment.write(b'\x00\x01half a record')
+
+        reopened = Spool(str(tmp_path))
+
+        assert bodies(reopened.read(10)) == [b'0', b'1']
+        assert fill(reopened, 1, start=2) == [3]
+        assert bodies(reopened.read(10)) == [b'0', b'1', b'2']
+
+    def test_directory_is_locked(self, tmp_path):
+        spool = Spool(str(tmp_path))
+
+        with pytest.raises(RuntimeError):
+            Spool(str(tmp_path))
+        spool.close()
+        Spool(str(tmp_path)).close()
+
+    @pytest.mark.parametrize("params, error", [
+        ({'directory': ''}, TypeError), ({'segment_bytes': 0}, ValueError), ({'segment_bytes': 1.5}, TypeError),
+        ({'sync': 1}, TypeError),
+    ])
+    def test_validation(self, tmp_path, params, error):
+        with pytest.raises(error):
+            Spool(**{'directory': str(tmp_path), **params})
@@ -0,0 +1,148 @@
+import time
+
+import pika
+import pytest
+
+from services.shared_libs.RabbitMQ import InMemoryBroker
+from services.shared_libs.RabbitMQ.streaming import Chunk, Reassembler, chunk_of, chunk_properties, renewed
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_InMemoryBroker import Producer
+
+
+class TestChunkHeaders:
+    def test_chunk_properties_round_trip(self):
+        given = pika.BasicProperties(content_type='text/plain', headers={'other': 1})
+
+        properties = chunk_properties(Chunk('s', 3, True), given)
+
+        assert chunk_of(properties) == Chunk('s', 3, True)
+        assert properties.headers['other'] == 1 and properties.content_type == 'text/plain'
+        assert given.headers == {'other': 1}  # Copied, not changed.
+        assert chunk_of(given) is None and chunk_of(None) is None
+
+    def test_renewed_gives_every_stream_one_new_id(self):
+        stream_ids = {}
+        first = renewed(chunk_properties(Chunk('s', 0, False)), stream_ids)
+        second = renewed(chunk_properties(Chunk('s', 1, True)), stream_ids)
+        plain = pika.BasicProperties()
+
+        assert chunk_of(first).stream_id == chunk_of(second).stream_id != 's'
+        assert chunk_of(second) == Chunk(chunk_of(first).stream_id, 1, True)
+        assert renewed(plain, stream_ids) is plain
+
+
+def released(result):
+    return [item for _, item in result[0]]
+
+
+def dropped(result):
+    return [item for _, item in result[1]]
+
+
+class TestReassembler:
+    def test_chunks_in_order_are_handed_over_right_away(self):
+        reassembler = Reassembler()
+
+        assert released(reassembler.add(Chunk('s', 0, False), 'a')) == ['a']
+        assert released(reassembler.add(Chunk('s', 1, True), 'b')) == ['b']
+        assert len(reassembler) == 0
+
+    def test_early_chunks_wait_for_their_predecessors(self):
+        reassembler = Reassembler()
+
+        assert released(reassembler.add(Chunk('s', 2, True), 'c')) == []
+        assert released(reassembler.add(Chunk('s', 1, False), 'b')) == []
+        assert reassembler.waiting() and reassembler.held == 2
+        assert released(reassembler.add(Chunk('s', 0, False), 'a')) == ['a', 'b', 'c']
+        assert not reassembler.waiting()
+
+    def test_streams_are_independent(self):
+        reassembler = Reassembler()
+
+        assert released(reassembler.add(Chunk('s', 1, False), 's1')) == []
+        assert released(reassembler.add(Chunk('t', 0, False), 't0')) == ['t0']
+
+    def test_repeated_chunks_are_dropped(self):
+        reassembler = Reassembler()
+        reassembler.add(Chunk('s', 0, False), 'a')
+        reassembler.add(Chunk('s', 2, False), 'c')
+
+        assert dropped(reassembler.add(Chunk('s', 0, False), 'a again')) == ['a again']
+        assert dropped(reassembler.add(Chunk('s', 2, False), 'c again')) == ['c again']
+        reassembler.add(Chunk('s', 1, True), 'b')
+        assert dropped(reassembler.add(Chunk('s', 1, True), 'b again')) == ['b again']  # The stream ended.
+
+    def test_chunks_past_the_end_are_dropped(self):
+        reassembler = Reassembler()
+        reassembler.add(Chunk('s', 2, False), 'c')
+
+        result = reassembler.add(Chunk('s', 0, True), 'a')
+
+        assert released(result) == ['a'] and dropped(result) == ['c']
+        assert not reassembler.waiting()
+
+    def test_a_stalled_stream_skips_its_missing_chunks(self):
+        reassembler = Reassembler(timeout=0.01)
+        reassembler.add(Chunk('s', 0, False), 'a')
+        reassembler.add(Chunk('s', 2, False), 'c')
+        reassembler.add(Chunk('s', 4, False), 'e')
+        assert released(reassembler.expire()) == []  # Still within the timeout.
+        time.sleep(0.02)
+
+        assert released(reassembler.expire()) == ['c', 'e']
+        assert released(reassembler.add(Chunk('s', 5, True), 'f')) == ['f']
+        assert dropped(reassembler.add(Chunk('s', 1, False), 'b')) == ['b']
+
+    def test_silent_streams_are_forgotten(self):
+        reassembler = Reassembler(timeout=0.01)
+        reassembler.add(Chunk('s', 0, False), 'a')
+        time.sleep(0.02)
+
+        reassembler.expire()
+
+        assert len(reassembler) == 0
+
+    def test_dropping_held_chunks_keeps_the_progress(self):
+        reassembler = Reassembler()
+        reassembler.add(Chunk('s', 0, False), 'a')
+        reassembler.add(Chunk('s', 2, False), 'c')
+
+        assert [item for _, item in reassembler.drop_held()] == ['c']
+        assert not reassembler.waiting()
+        assert dropped(reassembler.add(Chunk('s', 0, False), 'a again')) == ['a again']
+        assert released(reassembler.add(Chunk('s', 1, False), 'b')) == ['b']
+
+    @pytest.mark.parametrize("timeout, error", [(0, ValueError), (True, TypeError), ('1', TypeError)])
+    def test_validation(self, timeout, error):
+        with pytest.raises(error):
+            Reassembler(timeout)
+
+
+class TestStream:
+    def test_chunks_are_numbered_and_the_last_one_ends_the_stream(self):
+        broker = InMemoryBroker()
+        producer = Producer(connection_manager=broker.connection_manager())
+        producer.connect()
+        with producer.stream('jobs', properties=pika.BasicProperties(headers={'conversation': 7})) as stream:
+            stream.send('Hello')
+            stream.send(', world')
+        producer.disconnect()
+
+        messages = broker.queue('jobs')
+
+        assert [body for _, body in messages] == [b'Hello', b', world', b'']
+        assert [chunk_of(properties) for properties, _ in messages] == [
+            Chunk(stream.stream_id, 0, False), Chunk(stream.stream_id, 1, False), Chunk(stream.stream_id, 2, True)]
+        assert all(properties.headers['conversation'] == 7 for properties, _ in messages)
+
+    def test_an_ended_stream_cannot_be_sent_to(self):
+        broker = InMemoryBroker()
+        producer = Producer(connection_manager=broker.connection_manager())
+        producer.connect()
+        stream = producer.stream('jobs', stream_id='reply-1')
+        stream.end('bye')
+
+        with pytest.raises(RuntimeError):
+            stream.send('more')
+        producer.disconnect()
+
+        assert chunk_of(broker.queue('jobs')[0][0]) == Chunk('reply-1', 0, True)
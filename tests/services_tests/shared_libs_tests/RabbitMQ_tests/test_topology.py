@@ -0,0 +1,177 @@
+import json
+from unittest.mock import MagicMock, call
+
+import pytest
+
+from services.shared_libs.RabbitMQ import InMemoryBroker, RabbitMQProducer, Topology
+from services.shared_libs.RabbitMQ.topology import get_topology
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_InMemoryBroker import Collector, consume_in_thread
+
+
+class Producer(RabbitMQProducer):
+    def _setup(self):
+        pass
+
+
+class Consumer(Collector):
+    def _setup(self):
+        for queue in self.queues:
+            if queue not in self._topology:
+                self._channel.queue_declare(queue=queue)
+
+FAN_OUT = {
+    'exchanges': [{'name': 'ear', 'type': 'fanout'}],
+    'queues': [{'name': 'brain_a', 'message_ttl': 60000, 'dead_letter_exchange': 'dead_letters'},
+               {'name': 'brain_b', 'durable': False}],
+    'bindings': [{'queue': 'brain_a', 'exchange': 'ear'}, {'queue': 'brain_b', 'exchange': 'ear'}],
+    'routes': {'ear_to_brain': {'exchange': 'ear', 'routing_key': ''}},
+}
+
+YAML = """
+exchanges:
+  - name: ear
+    type: fanout
+queues:
+  - name: brain_a
+    message_ttl: 60000
+    dead_letter_exchange: dead_letters
+  - name: brain_b
+    durable: false
+bindings:
+  - {queue: brain_a, exchange: ear}
+  - {queue: brain_b, exchange: ear}
+routes:
+  ear_to_brain: {exchange: ear, routing_key: ''}
+"""
+
+
+class TestTopology:
+    def test_declarations_in_dependency_order(self):
+        topology = Topology.from_dict(FAN_OUT)
+
+        assert [method for method, _ in topology.declarations()] == \
+            ['exchange_declare', 'queue_declare', 'queue_declare', 'queue_bind', 'queue_bind']
+        assert topology.exchanges[0] == {'exchange': 'ear', 'exchange_type': 'fanout', 'durable': True,
+                                         'auto_delete': False, 'internal': False, 'arguments': None}
+        assert topology.queues[0]['arguments'] == {'x-message-ttl': 60000, 'x-dead-letter-exchange': 'dead_letters'}
+        assert topology.queues[0]['durable'] and not topology.queues[1]['durable']
+        assert topology.bindings[0]['routing_key'] is None  # The queue name, like in pika.
+
+    def test_apply_calls_the_channel(self):
+        channel = MagicMock()
+
+        Topology.from_dict({'queues': [{'name': 'jobs', 'max_priority': 10}]}).apply(channel)
+
+        assert channel.mock_calls == [call.queue_declare(queue='jobs', durable=True, exclusive=False,
+                                                         auto_delete=False, arguments={'x-max-priority': 10})]
+
+    def test_routes_apply_to_the_default_exchange_only(self):
+        topology = Topology.from_dict(FAN_OUT)
+
+        assert topology.route('', 'ear_to_brain') == ('ear', '')
+        assert topology.route('', 'brain_to_mouth') == ('', 'brain_to_mouth')
+        assert topology.route('other', 'ear_to_brain') == ('other', 'ear_to_brain')
+
+    def test_contains_declared_queues(self):
+        topology = Topology.from_dict(FAN_OUT)
+
+        assert 'brain_a' in topology and 'ear_to_brain' not in topology
+        assert topology and not Topology()
+
+    def test_merge(self):
+        merged = Topology.from_dict(FAN_OUT).merge(Topology(queues=[{'name': 'extra'}], routes={'ear_to_brain': {
+            'exchange': 'other'}}))
+
+        assert [queue['queue'] for queue in merged.queues][-1] == 'extra'
+        assert 'extra' in merged and 'brain_a' in merged
+        assert merged.route('', 'ear_to_brain') == ('other', 'ear_to_brain')
+
+    def test_load_yaml_file(self, tmp_path):
+        path = tmp_path / 'topology.yml'
+        path.write_text(YAML)
+
+        assert Topology.load(str(path)).declarations() == Topology.from_dict(FAN_OUT).declarations()
+
+    def test_load_json_file_and_inline_json(self, tmp_path):
+        path = tmp_path / 'topology.json'
+        path.write_text(json.dumps(FAN_OUT))
+
+        assert Topology.load(str(path)).routes == {'ear_to_brain': ('ear', '')}
+        assert get_topology(json.dumps(FAN_OUT)).routes == {'ear_to_brain': ('ear', '')}
+
+    def test_get_topology(self):
+        topology = Topology()
+        assert get_topology(topology) is topology
+        assert not get_topology(None)
+
+    @pytest.mark.parametrize("spec, error", [
+        ({'queue': []}, ValueError),
+        ({'queues': {'name': 'jobs'}}, TypeError),
+        ({'queues': [{'durable': True}]}, ValueError),
+        ({'queues': [{'name': 'jobs', 'ttl': 5}]}, ValueError),
+        ({'queues': [{'name': 'jobs', 'durable': 'yes'}]}, TypeError),
+        ({'exchanges': [{'name': 'ear', 'type': 'broadcast'}]}, ValueError),
+        ({'bindings': [{'queue': 'jobs'}]}, ValueError),
+        ({'routes': {'jobs': {'queue': 'other'}}}, ValueError),
+        ([], TypeError),
+    ])
+    def test_validation(self, spec, error):
+        with pytest.raises(error):
+            Topology.from_dict(spec)
+
+
+class TestClientsApplyTheTopology:
+    def test_routes_fan_out_to_every_consumer(self):
+        broker = InMemoryBroker()
+        topology = Topology.from_dict(FAN_OUT)
+        producer = Producer(connection_manager=broker.connection_manager(), topology=topology)
+        brains = [Consumer(queue, connection_manager=broker.connection_manager(), topology=topology)
+                  for queue in ('brain_a', 'brain_b')]
+        producer.connect()
+        for brain in brains:
+            brain.connect()
+
+        producer.publish(b'hello', 'ear_to_brain')
+        for brain in brains:
+            consume_in_thread(brain)()
+
+        assert [brain.received for brain in brains] == [[b'hello'], [b'hello']]
+        producer.disconnect()
+        for brain in brains:
+            brain.disconnect()
+
+    def test_reapplied_on_reconnect(self):
+        broker = InMemoryBroker()
+        producer = Producer(connection_manager=broker.connection_manager(), topology=Topology.from_dict(FAN_OUT))
+        producer.connect()
+        producer.disconnect()
+
+        assert producer.connect()  # Declaring the same topology again is a no-op.
+        producer.publish(b'hello', 'ear_to_brain')
+
+        assert [body for _, body in broker.queue('brain_b')] == [b'hello']
+        producer.disconnect()
+
+    def test_consumer_consumes_several_queues_on_one_channel(self):
+        broker = InMemoryBroker()
+        topology = Topology.from_dict({'queues': [{'name': 'shard_0'}, {'name': 'shard_1'}]})
+        producer = Producer(connection_manager=broker.connection_manager(), topology=topology)
+        consumer = Consumer(['shard_0', 'shard_1'], expected=2, connection_manager=broker.connection_manager(),
+                             topology=topology)
+        producer.connect()
+        consumer.connect()
+        producer.publish(b'0', 'shard_0')
+        producer.publish(b'1', 'shard_1')
+
+        consume_in_thread(consumer)()
+
+        assert sorted(consumer.received) == [b'0', b'1']
+        assert consumer.queue == 'shard_0' and consumer.queues == ['shard_0', 'shard_1']
+        producer.disconnect()
+        consumer.disconnect()
+
+    @pytest.mark.parametrize("queue_name, error", [([], ValueError), (['jobs', ''], ValueError),
+                                                   ([1], TypeError), (None, TypeError)])
+    def test_invalid_queue_names(self, queue_name, error):
+        with pytest.raises(error):
+            Consumer(queue_name)
@@ -0,0 +1,132 @@
+import json
+from unittest.mock import patch
+
+import pika
+import pytest
+
+from services.shared_libs.RabbitMQ import tracing
+from services.shared_libs.RabbitMQ.tracing import TRACE_HOPS, TRACE_ID, TRACE_ORIGIN, TraceRecorder, call_in_trace, \
+    inject, percentile, summarise
+from services.shared_libs.metrics import MetricsRegistry
+
+
+def at(microseconds):
+    """Freezes the tracing clock."""
+    return patch.object(tracing, "now", return_value=microseconds)
+
+
+class TestInject:
+    def test_starts_a_trace(self):
+        with at(1_000_000):
+            properties = inject(None, "Ear")
+
+        assert len(properties.headers[TRACE_ID]) == 32
+        assert properties.headers[TRACE_ORIGIN] == 1_000_000
+        assert properties.headers[TRACE_HOPS] == [["Ear", None, 1_000_000]]
+
+    def test_uses_message_id_as_trace_id(self):
+        assert inject(pika.BasicProperties(message_id="m-1"), "Ear").headers[TRACE_ID] == "m-1"
+
+    def test_does_not_modify_given_properties(self):
+        properties = pika.BasicProperties(headers={"keep": 1})
+
+        stamped = inject(properties, "Ear")
+
+        assert properties.headers == {"keep": 1}
+        assert stamped.headers["keep"] == 1
+
+    def test_continues_the_trace_being_handled(self):
+        with at(1_000_000):
+            received = inject(None, "Ear")
+        published = []
+
+        def callback(ch, method, properties, body):
+            with at(1_500_000):
+                published.append(inject(None, "Brain"))
+
+        with at(1_200_000):
+            call_in_trace(callback, None, None, received, b"")
+
+        headers = published[0].headers
+        assert headers[TRACE_ID] == received.headers[TRACE_ID]
+        assert headers[TRACE_ORIGIN] == 1_000_000
+        assert headers[TRACE_HOPS] == [["Ear", None, 1_000_000], ["Brain", 1_200_000, 1_500_000]]
+        assert tracing.current() is None  # Reset after the callback.
+
+    def test_headers_survive_amqp_encoding(self):
+        properties = inject(None, "Ear")
+        decoded = pika.BasicProperties()
+        decoded.decode(b"".join(properties.encode()))
+        assert decoded.headers[TRACE_HOPS] == properties.headers[TRACE_HOPS]
+
+
+class TestTraceRecorder:
+    def traced(self):
+        properties = pika.BasicProperties(headers={
+            TRACE_ID: "t-1", TRACE_ORIGIN: 1_000_000,
+            TRACE_HOPS: [["Ear", None, 1_000_000], ["Brain", 1_200_000, 1_500_000]]})
+        return properties
+
+    def test_records_hop_service_and_total_latency(self):
+        record = TraceRecorder("Mouth").record(self.traced(), received=1_600_000)
+
+        assert record == {"trace_id": "t-1", "service": "Mouth", "total": 0.6,
+                          "stages": {"Brain → Mouth": 0.1, "Brain": 0.3}}
+
+    def test_untraced_delivery(self):
+        assert TraceRecorder("Mouth").record(pika.BasicProperties()) is None
+
+    def test_records_metrics(self):
+        registry = MetricsRegistry()
+
+        TraceRecorder("Mouth", registry).record(self.traced(), received=1_600_000)
+
+        rendered = registry.render()
+        assert 'rmq_trace_hop_seconds_count{hop="Brain → Mouth"} 1' in rendered
+        assert 'rmq_trace_service_seconds_sum{service="Brain"} 0.3' in rendered
+        assert 'rmq_trace_total_seconds_sum{service="Mouth"} 0.6' in rendered
+
+    def test_appends_to_trace_file(self, tmp_path):
+        path = str(tmp_path / "trace.jsonl")
+        recorder = TraceRecorder("Mouth", path=path)
+
+        recorder.record(self.traced(), received=1_600_000)
+        recorder.record(self.traced(), received=1_700_000)
+
+        lines = open(path, encoding="utf-8").read().splitlines()
+        assert [json.loads(line)["total"] for line in lines] == [0.6, 0.7]
+
+
+class TestReport:
+    def test_summarise_takes_the_largest_total_per_trace(self):
+        records = [
+            {"trace_id": "a", "service": "Brain", "stages": {"Ear → Brain": 0.1}, "total": 0.1},
+            {"trace_id": "a", "service": "Mouth", "stages": {"Brain → Mouth": 0.2, "Brain": 0.3}, "total": 0.6},
+        ]
+
+        stages = summarise(records)
+
+        assert stages == {"Ear → Brain": [0.1], "Brain → Mouth": [0.2], "Brain": [0.3], "total": [0.6]}
+
+    @pytest.mark.parametrize("fraction, expected", [(0.5, 50), (0.9, 90), (0.99, 99), (1.0, 100), (0.0, 1)])
+    def test_percentile(self, fraction, expected):
+        assert percentile(list(range(100, 0, -1)), fraction) == expected
+
+    def test_main_prints_percentiles(self, tmp_path, capsys):
+        path = tmp_path / "trace.jsonl"
+        path.write_text("\n".join(json.dumps({"trace_id": str(i), "service": "Mouth",
+                                              "stages": {"Brain → Mouth": i / 1000}, "total": i / 100})
+                                  for i in range(1, 101)) + "\n", encoding="utf-8")
+
+        tracing.main([str(path)])
+
+        # The log listener of earlier tests may still be writing to stdout.
+        lines = [line for line in capsys.readouterr().out.splitlines() if not line.startswith("[")]
+        assert lines[0].split() == ["stage", "count", "p50", "ms", "p90", "ms", "p99", "ms", "max", "ms"]
+        assert lines[1].split() == ["Brain", "→", "Mouth", "100", "50.0", "90.0", "99.0", "100.0"]
+        assert lines[2].split() == ["total", "100", "500.0", "900.0", "990.0", "1000.0"]
+
+    def test_main_requires_a_file(self, monkeypatch):
+        monkeypatch.delenv("RMQ_TRACE_FILE", raising=False)
+        with pytest.raises(SystemExit):
+            tracing.main([])
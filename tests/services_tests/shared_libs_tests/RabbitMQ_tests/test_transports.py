@@ -0,0 +1,66 @@
+import pytest
+
+from services.shared_libs.RabbitMQ import ConnectionManager, InMemoryBroker
+from services.shared_libs.RabbitMQ.IpcBroker import IpcConnectionManager
+from services.shared_libs.RabbitMQ.transports import AmqpTransport, InMemoryTransport, IpcTransport, get_transport, \
+    shared_broker
+from services_tests.shared_libs_tests.RabbitMQ_tests.test_InMemoryBroker import Collector, Producer, \
+    consume_in_thread
+
+
+class TestGetTransport:
+    @pytest.mark.parametrize("name, kind", [("amqp", AmqpTransport), ("memory", InMemoryTransport),
+                                            ("IPC", IpcTransport)])
+    def test_by_name(self, name, kind):
+        assert isinstance(get_transport(name), kind)
+
+    def test_instances_are_returned_as_is(self):
+        transport = IpcTransport("/tmp/other.sock")
+        assert get_transport(transport) is transport
+
+    def test_unknown_name(self):
+        with pytest.raises(ValueError):
+            get_transport("carrier-pigeon")
+
+    def test_wrong_type(self):
+        with pytest.raises(TypeError):
+            get_transport(None)
+
+
+class TestConnectionManagers:
+    def test_amqp_uses_the_parameters(self):
+        producer = Producer(host="rabbit", port=5673, transport="amqp")
+        assert type(producer._connection_manager) is ConnectionManager
+        assert producer._connection_manager.parameters.host == "rabbit"
+
+    def test_memory_shares_one_broker(self):
+        first, second = Producer(transport="memory"), Collector("jobs", transport="memory")
+        assert InMemoryTransport().broker is shared_broker()
+
+        first.connect()
+        first.publish(b"job", "jobs")
+        second.connect()
+        consume_in_thread(second)()
+
+        assert second.received == [b"job"]
+        first.disconnect()
+        second.disconnect()
+
+    def test_memory_with_own_broker(self):
+        broker = InMemoryBroker()
+        producer = Producer(transport=InMemoryTransport(broker))
+        producer.connect()
+        producer.publish(b"job", "jobs")
+
+        assert len(broker.queue("jobs")) == 1
+        producer.disconnect()
+
+    def test_ipc_uses_the_socket_path(self):
+        producer = Producer(transport=IpcTransport("/tmp/other.sock"))
+        assert isinstance(producer._connection_manager, IpcConnectionManager)
+        assert producer._connection_manager.path == "/tmp/other.sock"
+
+    def test_connection_manager_wins(self):
+        broker = InMemoryBroker()
+        producer = Producer(transport="ipc", connection_manager=broker.connection_manager())
+        assert producer._connection_manager.parameters.host == "in-memory"
@@ -1,7 +1,8 @@
+import asyncio
 from unittest.mock import patch, MagicMock
 
 import pytest
-from pika.exceptions import AMQPConnectionError, AMQPChannelError
+from pika.exceptions import AMQPConnectionError, AMQPChannelError, ConnectionClosedByClient
 
 
 def main():
@@ -41,4 +42,67 @@ def mock_pika():
         mock_connection.channel.return_value = mock_channel
         mock_blocking_connection.return_value = mock_connection
 
-        yield mock_blocking_connection, mock_connection, mock_channel
\ No newline at end of file
+        yield mock_blocking_connection, mock_connection, mock_channel
+
+@pytest.fixture
+def mock_async_pika():
+    """
+    A fixture to mock pika's AsyncioConnection and its channel.
+    Opening, closing and channel RPCs complete on the next iteration of the running event loop.
+    """
+
+    def reply(kwargs):
+        callback = kwargs.get('callback')
+        if callback is not None:
+            asyncio.get_running_loop().call_soon(callback, MagicMock())
+
+    with patch('services.shared_libs.RabbitMQ.AbstractAsyncRabbitMQ.AsyncioConnection') as mock_asyncio_connection:
+        mock_connection = MagicMock()
+        mock_connection.is_open = True
+
+        mock_channel = MagicMock()
+        mock_channel.is_open = True
+        mock_channel.basic_consume.return_value = 'ctag'
+        for rpc in ('queue_declare', 'basic_cancel', 'basic_qos', 'confirm_delivery'):
+            getattr(mock_channel, rpc).side_effect = lambda *args, **kwargs: reply(kwargs)
+
+        def create_connection(parameters, on_open_callback, on_open_error_callback, on_close_callback, custom_ioloop):
+            def close():
+                mock_connection.is_open = False
+                mock_channel.is_open = False
+                custom_ioloop.call_soon(on_close_callback, mock_connection, ConnectionClosedByClient(200, 'Normal'))
+
+            mock_connection.close.side_effect = close
+            mock_connection.channel.side_effect = lambda on_open_callback: custom_ioloop.call_soon(on_open_callback,
+                                                                                                   mock_channel)
+            custom_ioloop.call_soon(on_open_callback, mock_connection)
+            return mock_connection
+
+        mock_asyncio_connection.side_effect = create_connection
+
+        yield mock_asyncio_connection, mock_connection, mock_channel
+
+
+@pytest.fixture
+def reopening_pika(mock_pika):
+    """
+    Extends mock_pika so that every new pika.BlockingConnection reopens the mocked connection and channel.
+    `failures` holds the number of upcoming connection attempts that fail with AMQPConnectionError.
+    """
+    mock_blocking_connection, mock_connection, mock_channel = mock_pika
+    state = {'failures': 0}
+
+    def open_connection(parameters):
+        if state['failures']:
+            state['failures'] -= 1
+            raise AMQPConnectionError("Connection refused")
+        mock_connection.is_open = True
+        mock_channel.is_open = True
+        return mock_connection
+
+    def lose_connection():
+        mock_connection.is_open = False
+        mock_channel.is_open = False
+
+    mock_blocking_connection.side_effect = open_connection
+    yield state, lose_connection, mock_pika
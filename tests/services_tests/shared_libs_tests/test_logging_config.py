@@ -0,0 +1,87 @@
+import json
+import logging
+import logging.handlers
+import sys
+
+import pytest
+
+from services.shared_libs import logging_config
+from services.shared_libs.logging_config import JsonFormatter, setup_logging
+
+
+@pytest.fixture
+def fresh_logging(monkeypatch):
+    """Lets a test configure logging from scratch and restores the previous configuration afterwards."""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    monkeypatch.setattr(logging_config, "_configured", False)
+    monkeypatch.setattr(logging_config, "_listener", None)
+    monkeypatch.delenv("LOG_FORMAT", raising=False)
+    yield
+    if logging_config._listener is not None:
+        logging_config._listener.stop()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+class TestSetupLogging:
+    def test_handlers_are_installed_once(self, fresh_logging, monkeypatch):
+        monkeypatch.setenv("LOG_ASYNC", "false")
+        setup_logging("first")
+        handlers = list(logging.getLogger().handlers)
+
+        setup_logging("second")
+
+        assert logging.getLogger().handlers == handlers
+        assert len(handlers) == 1
+
+    def test_level_is_refreshed(self, fresh_logging, monkeypatch):
+        monkeypatch.setenv("LOG_ASYNC", "false")
+        monkeypatch.setenv("LOG_LEVEL", "WARNING")
+        setup_logging("service")
+        assert logging.getLogger().level == logging.WARNING
+
+        setup_logging("service", log_level="debug")
+        assert logging.getLogger().level == logging.DEBUG
+
+    def test_returns_service_logger(self, fresh_logging, monkeypatch):
+        monkeypatch.setenv("LOG_ASYNC", "false")
+        assert setup_logging("brain-llm") is logging.getLogger("brain-llm")
+
+    def test_records_are_written_by_background_thread(self, fresh_logging, monkeypatch, capsys):
+        monkeypatch.setenv("LOG_ASYNC", "true")
+        monkeypatch.setenv("LOG_LEVEL", "INFO")
+        logger = setup_logging("service")
+        assert isinstance(logging.getLogger().handlers[0], logging.handlers.QueueHandler)
+
+        logger.info("Published %s message(s)", 3)
+        logging_config._listener.stop()  # Drains the queue.
+        logging_config._listener = None
+
+        assert "[service] (service) [INFO]: Published 3 message(s)" in capsys.readouterr().out
+
+    def test_json_format(self, fresh_logging, monkeypatch, capsys):
+        monkeypatch.setenv("LOG_ASYNC", "false")
+        monkeypatch.setenv("LOG_FORMAT", "json")
+        logger = setup_logging("ear")
+
+        logger.warning('Quote " and newline \n in %s', "message")
+
+        entry = json.loads(capsys.readouterr().out)
+        assert entry["message"] == 'Quote " and newline \n in message'
+        assert entry["service"] == "ear"
+        assert entry["level"] == "WARNING"
+
+
+class TestJsonFormatter:
+    def test_includes_exception(self):
+        formatter = JsonFormatter("service")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.getLogger("test").makeRecord("test", logging.ERROR, __file__, 1, "failed", (),
+                                                          exc_info=sys.exc_info())
+
+        entry = json.loads(formatter.format(record))
+        assert entry["message"] == "failed"
+        assert "ValueError: boom" in entry["exception"]
@@ -0,0 +1,101 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from services.shared_libs import metrics
+from services.shared_libs.metrics import MetricsRegistry, setup_metrics
+
+
+class TestSetupMetrics:
+    @pytest.fixture(autouse=True)
+    def clean_env(self, monkeypatch):
+        for name in ("METRICS_ENABLED", "METRICS_PORT", "METRICS_HOST"):
+            monkeypatch.delenv(name, raising=False)
+        monkeypatch.setattr(metrics, "_server", None)
+
+    def test_disabled_by_default(self):
+        assert setup_metrics() is None
+
+    def test_enabled_without_exporter(self, monkeypatch):
+        monkeypatch.setenv("METRICS_ENABLED", "true")
+        assert setup_metrics() is metrics.registry
+        assert metrics._server is None
+
+    def test_exporter_is_started_once(self, monkeypatch):
+        monkeypatch.setenv("METRICS_PORT", "0")
+        monkeypatch.setenv("METRICS_HOST", "127.0.0.1")
+
+        assert setup_metrics() is metrics.registry
+        server = metrics._server
+        setup_metrics()
+
+        try:
+            assert metrics._server is server
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestMetricsRegistry:
+    def test_counter(self):
+        registry = MetricsRegistry()
+        published = registry.counter("rmq_published_total", "Messages published.", ("client",))
+
+        published.labels("Ear").inc()
+        published.labels("Ear").inc(2)
+
+        assert registry.render() == (
+            "# HELP rmq_published_total Messages published.\n"
+            "# TYPE rmq_published_total counter\n"
+            'rmq_published_total{client="Ear"} 3\n'
+        )
+
+    def test_histogram(self):
+        registry = MetricsRegistry()
+        latency = registry.histogram("rmq_publish_seconds", "Publish latency.", buckets=(0.1, 1))
+
+        latency.observe(0.05)
+        latency.observe(0.1)
+        latency.observe(5)
+
+        assert registry.render().splitlines()[2:] == [
+            'rmq_publish_seconds_bucket{le="0.1"} 2',
+            'rmq_publish_seconds_bucket{le="1"} 2',
+            'rmq_publish_seconds_bucket{le="+Inf"} 3',
+            "rmq_publish_seconds_sum 5.15",
+            "rmq_publish_seconds_count 3",
+        ]
+
+    def test_metrics_are_shared_by_name(self):
+        registry = MetricsRegistry()
+        assert registry.counter("a_total", "A.", ("x",)) is registry.counter("a_total", "A.", ("x",))
+        with pytest.raises(ValueError, match="already registered"):
+            registry.histogram("a_total", "A.", ("x",))
+        with pytest.raises(ValueError, match="already registered"):
+            registry.counter("a_total", "A.", ("y",))
+
+    def test_label_count_is_checked(self):
+        counter = MetricsRegistry().counter("a_total", "A.", ("x",))
+        with pytest.raises(ValueError, match="expects the labels"):
+            counter.labels("1", "2")
+
+    def test_label_values_are_escaped(self):
+        registry = MetricsRegistry()
+        registry.counter("a_total", "A.", ("queue",)).labels('say "hi"\\n').inc()
+        assert 'a_total{queue="say \\"hi\\"\\\\n"} 1' in registry.render()
+
+    def test_serve(self):
+        registry = MetricsRegistry()
+        registry.counter("a_total", "A.").inc()
+        server = registry.serve(0, "127.0.0.1")
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            with urllib.request.urlopen(url + "/metrics", timeout=5) as response:
+                assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+                assert "a_total 1" in response.read().decode()
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(url + "/other", timeout=5)
+        finally:
+            server.shutdown()
+            server.server_close()